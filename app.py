@@ -8,63 +8,254 @@ from flask import Flask
 from flask_cors import CORS
 # DB의 정보가 담긴 config 파일
 import config 
-# sqlalchemy의 엔진을 만드는 함수
-from sqlalchemy import create_engine
-# sqlalchemy를 통해 디비와 연결이 끊기지 않고, 트랜젝션을 관리하는 세션을 만드는 sessionmaker(세션공장).
-from sqlalchemy.orm import sessionmaker
+# 서버가 종료될 때 write-behind 큐에 남은 트윗들을 저장하기 위한 atexit
+import atexit
+# 검색 색인 파일이 있는지 확인하기 위한 os
+import os
 
 # 테이블ORM인 repository, 데이터를 저장하는 model layer
 # 비즈니스 로직을 담당하는 service layer
 # 클라이언트의 요청을 받는 view layer (route 기능 포함.)
-from repository import Users, Tweets, UsersFollowList, Base
-from model import UserDao, TweetDao
-from service import UserService, TweetService
+from repository import Users, Tweets, UsersFollowList, UserFollowCounts, TweetHashtags, TweetMentions, FollowSuggestions
+from model import UserDao, TweetDao, TimelineStore, SharedTimelineStore, FollowGraphCache, Database, QueryInspector, SearchIndex, TrendingTopics
+from service import UserService, TweetService, PasswordHasher, TweetWriter
 from view import create_endpoints
+from migrations import check_schema, upgrade
+from cache import LocalCache, RedisCache
+from metrics import Instrumentation, pool_metrics, cache_metrics, follow_cache_metrics, write_behind_metrics
 
 class Services:
     pass
 
-# 처음 파이썬이 구동될 때 실행되는 함수.
-# test_config 가 None일 경우 테스트버전이 아니므로, 실서버 config를 웹서버에 적용한다.
-def create_app(test_config = None):
+# config.py 의 설정(대문자 변수)들을 dict 로 가져옵니다.
+# test_config 가 None일 경우 테스트버전이 아니므로, 실서버 config를 사용하고, 아니면 test_config 를 사용한다.
+def load_config(test_config = None):
+    if test_config is not None:
+        return dict(test_config)
 
-    # 플라스크로 웹서버를 만듭니다.
-    app = Flask(__name__)
-    #CORS를 웹서버에 적용
-    CORS(app)
+    return {key : getattr(config, key) for key in dir(config) if key.isupper()}
 
-    # test_config가 None일 때는 실서버파일인 config.py파일을 app.config에 적용시킵니다.
-    if test_config is None:
-        app.config.from_pyfile("config.py")
+# config 의 CACHE_BACKEND 에 해당하는 캐시를 만드는 함수.
+# 'local' 은 worker(프로세스)마다 따로 저장하는 메모리 캐시, 'redis' 는 모든 worker 가 함께 사용하는 redis 서버입니다.
+def create_cache(config):
+    backend = config.get('CACHE_BACKEND', 'local')
 
-    else:
-        app.config.update(test_config)
+    if backend == 'redis':
+        return RedisCache(
+            url = config.get('CACHE_REDIS_URL', 'redis://localhost:6379/0'),
+            ttl = config.get('CACHE_TTL', 60),
+            pool_size = config.get('CACHE_REDIS_POOL_SIZE', 10),
+            timeout = config.get('CACHE_REDIS_TIMEOUT', 1.0)
+        )
+
+    if backend == 'local':
+        return LocalCache(max_size = config.get('CACHE_SIZE', 100000), ttl = config.get('CACHE_TTL', 60))
+
+    raise ValueError(f'unknown CACHE_BACKEND: {backend}')
+
+# config 의 SEARCH_INDEX_PATH 파일에서 검색 색인을 읽는 함수. 파일이 없으면 빈 색인을 만듭니다.
+# 파일 경로가 있으면 서버가 종료될 때 색인을 저장해서, 다음에 시작할 때 저장한 이후의 트윗만 DB 에서 가져옵니다.
+def create_search_index(config):
+    path = config.get('SEARCH_INDEX_PATH')
+    sync_interval = config.get('SEARCH_SYNC_INTERVAL', 1.0)
+    sync_overlap = config.get('SEARCH_SYNC_OVERLAP', 1000)
+
+    if not path:
+        return SearchIndex(sync_interval, sync_overlap)
 
-    
-    # 위에서 적용한 config에서 DB URL을 통해 sqlalchemy 엔진을 생성.
-    engine = create_engine(app.config['DB_URL'], encoding = 'utf-8', max_overflow = 0)
+    index = SearchIndex.load(path, sync_interval, sync_overlap) if os.path.exists(path) else SearchIndex(sync_interval, sync_overlap)
+    atexit.register(index.save, path)
 
-    # 위의 엔진을 통해 세션을 생성한다.
-    Session = sessionmaker(bind=engine)
+    return index
 
-    # Base를 상속받은 db class들을 mariaDB 관계형 디비 테이블들과 매핑하여 웹서버에 적용시킵니다.
-    Base.metadata.create_all(engine)
+# DB, model layer, service layer 를 만드는 함수.
+# flask 앱(create_app)과 ASGI 앱(asgi.create_asgi_app)이 같은 service layer 를 사용하도록 함께 사용합니다.
+# preload 이면 worker 들을 fork 할 부모 프로세스(serve.py)에서 만드는 것이므로, 백그라운드 스레드는 worker 에서 시작합니다. (start_worker)
+def create_services(config, preload = False):
+    # config에서 DB URL과 커넥션 풀 설정을 통해 sqlalchemy 엔진과 세션 레지스트리를 생성.
+    # 모든 DAO 가 하나의 엔진(커넥션 풀)과 세션 레지스트리를 공유합니다.
+    # 서비스 layer 가 함께 사용하는 캐시 (로그인 실패한 이메일, DB 에서 만든 타임라인, replica 로 읽기를 보내지 않는 최근에 쓰기를 한 유저)
+    cache = create_cache(config)
+    database = Database(config, cache)
+    Session = database.Session
+
+    # 테이블과 인덱스는 migrations 가 관리합니다. 시작할 때는 schema_version 으로 DB 가 최신 버전인지 한 번만 확인하고,
+    # DB_MIGRATE 이면 적용되지 않은 migration 들을 먼저 적용합니다. (python -m migrations upgrade 와 같습니다.)
+    if config.get('DB_MIGRATE', False):
+        upgrade(database.engine)
+    elif config.get('DB_CHECK_SCHEMA', True):
+        check_schema(database.engine)
 
     ## ORM Layer
     userORM = Users
     tweetsORM = Tweets
     user_follow_listORM = UsersFollowList
+    user_follow_countsORM = UserFollowCounts
+    tweet_hashtagsORM = TweetHashtags
+    tweet_mentionsORM = TweetMentions
+    follow_suggestionsORM = FollowSuggestions
+
+    ## 유저별 팔로우 목록을 메모리에 저장해두는 follow graph cache. 0 이면 사용하지 않습니다.
+    # 프로세스 메모리에 저장하기 때문에 다른 worker 에서 팔로우/언팔로우하면 캐시를 지울 수 없습니다.
+    # 그래서 worker 가 하나일 때만 사용합니다.
+    if config.get('FOLLOW_CACHE_BYTES') and config.get('SERVER_WORKERS', 1) == 1:
+        follow_cache = FollowGraphCache(
+            max_bytes = config.get('FOLLOW_CACHE_BYTES'),
+            ttl = config.get('FOLLOW_CACHE_TTL', 60)
+        )
+    else:
+        follow_cache = None
 
     ## Persistence Layer
-    user_dao = UserDao(Session, userORM, user_follow_listORM)
-    tweet_dao = TweetDao(Session, tweetsORM, user_follow_listORM)
+    # 읽기 쿼리는 database.router 를 통해 replica 로 보냅니다. (replica 가 없으면 primary)
+    # 두 DAO 가 같은 follow graph cache 를 사용해서, 팔로우/언팔로우를 하면 타임라인 쿼리도 바뀐 목록을 사용합니다.
+    # 팔로워/팔로잉 수는 user_follow_counts 테이블에 팔로우/언팔로우와 같은 트랜잭션으로 저장합니다.
+    # 팔로우 추천은 배치 작업(python -m model.follow_suggestions)이 follow_suggestions 테이블에 미리 계산해둔 결과를 읽습니다.
+    user_dao = UserDao(Session, userORM, user_follow_listORM, database.router, follow_cache, user_follow_countsORM, follow_suggestionsORM)
+    # 트윗의 해시태그와 멘션은 tweet_hashtags, tweet_mentions 테이블에 트윗과 같은 트랜잭션으로 저장합니다.
+    tweet_dao = TweetDao(
+        Session, tweetsORM, user_follow_listORM, config.get('TIMELINE_QUERY_MODE', 'union'), database.router, follow_cache,
+        tweet_hashtagsORM, tweet_mentionsORM
+    )
+
+    ## 유저별 타임라인을 미리 만들어두는 timeline store (fan-out-on-write)
+    # 여러 worker 가 함께 사용하는 캐시(redis)가 있으면 캐시에 저장해서 모든 worker 가 같은 타임라인을 사용합니다.
+    # 프로세스 메모리에 저장하는 TimelineStore 는 다른 worker 가 작성한 트윗이 보이지 않으므로 worker 가 하나일 때만 사용합니다.
+    if cache.shared:
+        timeline_store = SharedTimelineStore(
+            cache,
+            max_length = config.get('TIMELINE_STORE_SIZE', 800),
+            fanout_limit = config.get('TIMELINE_FANOUT_LIMIT', 10000),
+            ttl = config.get('TIMELINE_STORE_TTL', 60)
+        )
+    elif config.get('SERVER_WORKERS', 1) == 1:
+        timeline_store = TimelineStore(
+            max_length = config.get('TIMELINE_STORE_SIZE', 800),
+            fanout_limit = config.get('TIMELINE_FANOUT_LIMIT', 10000),
+            max_users = config.get('TIMELINE_STORE_USERS', 100000),
+            ttl = config.get('TIMELINE_STORE_TTL', 60)
+        )
+    else:
+        timeline_store = None
+
+    ## 비밀번호 해시(bcrypt)를 요청 스레드 대신 처리하는 프로세스 풀
+    password_hasher = PasswordHasher(
+        rounds = config.get('BCRYPT_ROUNDS', 12),
+        workers = config.get('PASSWORD_HASH_WORKERS', 0),
+        queue_size = config.get('PASSWORD_HASH_QUEUE_SIZE'),
+        queue_timeout = config.get('PASSWORD_HASH_QUEUE_TIMEOUT', 0.1)
+    )
 
     ## Business Layer
-    services = Services
-    services.user_service = UserService(user_dao, app.config)
-    services.tweet_service = TweetService(tweet_dao)
+    services = Services()
+    services.database = database
+    services.cache = cache
+    services.user_service = UserService(user_dao, config, timeline_store, password_hasher, cache)
+    services.tweet_service = TweetService(tweet_dao, timeline_store, config.get('TWEET_BULK_CHUNK_SIZE', 1000), cache)
+
+    ## write-behind 모드이면 트윗을 디스크 큐에 기록하고, 백그라운드 스레드가 모아서 DB 에 저장합니다.
+    # 시작할 때 이전에 죽은 프로세스가 남긴 큐의 트윗들도 저장합니다.
+    if config.get('WRITE_BEHIND_ENABLED', False):
+        writer = TweetWriter(
+            services.tweet_service,
+            directory = config.get('WRITE_BEHIND_DIR', 'write_behind'),
+            batch_size = config.get('WRITE_BEHIND_BATCH_SIZE', 500),
+            interval = config.get('WRITE_BEHIND_INTERVAL', 0.05),
+            segment_bytes = config.get('WRITE_BEHIND_SEGMENT_BYTES', 64 * 1024 * 1024),
+            fsync = config.get('WRITE_BEHIND_FSYNC', True)
+        )
+        if not preload:
+            writer.start()
+        # 서버가 종료될 때 큐에 남은 트윗들을 저장합니다. (저장하지 못한 트윗은 다음에 시작할 때 저장합니다.)
+        atexit.register(writer.stop)
+
+        services.tweet_service.writer = writer
+
+    ## 트윗 검색을 위한 메모리 역색인. 색인 파일이 있으면 읽고, 이후에 저장된 트윗은 검색할 때 DB 에서 가져와서 색인합니다.
+    if config.get('SEARCH_ENABLED', True):
+        services.tweet_service.search_index = create_search_index(config)
+
+    ## 최근 많이 쓰인 해시태그와 멘션을 메모리에서 세는 trending. 새로 저장된 해시태그와 멘션만 DB 에서 가져옵니다.
+    if config.get('TRENDING_ENABLED', True):
+        services.tweet_service.trending = TrendingTopics(
+            window = config.get('TRENDING_WINDOW', 3600),
+            buckets = config.get('TRENDING_BUCKETS', 12),
+            width = config.get('TRENDING_SKETCH_WIDTH', 4096),
+            depth = config.get('TRENDING_SKETCH_DEPTH', 4),
+            candidates = config.get('TRENDING_CANDIDATES', 200),
+            sync_interval = config.get('TRENDING_SYNC_INTERVAL', 1.0),
+            sync_overlap = config.get('TRENDING_SYNC_OVERLAP', 1000)
+        )
+
+    ## 요청별 처리시간과 SQL, bcrypt, json 인코딩 시간을 기록하는 instrumentation. INSTRUMENTATION_ENABLED 로 켭니다.
+    # 켜져 있으면 모든 엔진의 SQL 실행 시간을 기록하고, 커넥션 풀과 캐시, write-behind 큐의 상태를 /metrics 로 보여줍니다.
+    instrumentation = Instrumentation.from_config(config)
+    if instrumentation is not None:
+        for engine in database.engines():
+            instrumentation.instrument_engine(engine)
+
+        instrumentation.add_collector(pool_metrics(database))
+        instrumentation.add_collector(cache_metrics(cache))
+        if follow_cache is not None:
+            instrumentation.add_collector(follow_cache_metrics(follow_cache))
+        if services.tweet_service.writer is not None:
+            instrumentation.add_collector(write_behind_metrics(services.tweet_service.writer))
+
+    services.instrumentation = instrumentation
+
+    ## 개발/테스트용으로 요청마다 실행한 SQL 을 검사하는 query inspector. QUERY_INSPECTOR_ENABLED 로 켭니다.
+    # N+1 쿼리, 느린 쿼리(EXPLAIN 포함), 엔드포인트별 쿼리 예산(QUERY_BUDGETS)을 넘은 요청을 보고합니다.
+    query_inspector = QueryInspector.from_config(config)
+    if query_inspector is not None:
+        for engine in database.engines():
+            query_inspector.instrument_engine(engine)
+
+    services.query_inspector = query_inspector
+
+    return services
+
+# worker 들을 fork 하기 전에 부모 프로세스에서 호출하는 함수. (serve.py)
+# 검색 색인과 trending 을 미리 DB 와 맞춰두면 worker 들이 copy-on-write 로 함께 사용하고, 첫 요청에서 DB 의 트윗들을 읽지 않습니다.
+# 부모가 사용한 커넥션은 worker 들이 함께 쓰지 않도록 풀을 비웁니다.
+def prepare_fork(services):
+    tweet_service = services.tweet_service
+    if tweet_service.search_index is not None:
+        tweet_service.sync_search_index(force = True)
+    if tweet_service.trending is not None:
+        tweet_service.sync_trending(force = True)
+
+    services.database.dispose()
+
+# fork 된 worker 프로세스가 요청을 받기 전에 호출하는 함수. (serve.py)
+# 커넥션 풀에 커넥션을 DB_WARM_CONNECTIONS 개 미리 만들고, write-behind 스레드를 시작합니다.
+def start_worker(services, config):
+    services.database.warm_up(config.get('DB_WARM_CONNECTIONS', 1))
+
+    if services.tweet_service.writer is not None:
+        services.tweet_service.writer.start()
+
+# 처음 파이썬이 구동될 때 실행되는 함수.
+# test_config 가 None일 경우 테스트버전이 아니므로, 실서버 config를 웹서버에 적용한다.
+# preload 는 serve.py 가 worker 들을 fork 하기 전에 앱을 만들 때 사용합니다. (create_services 참고)
+def create_app(test_config = None, preload = False):
+
+    # 플라스크로 웹서버를 만듭니다.
+    app = Flask(__name__)
+    #CORS를 웹서버에 적용
+    CORS(app)
+
+    # 실서버 config.py 또는 test_config 를 app.config에 적용시킵니다.
+    app.config.update(load_config(test_config))
+
+    # DB 와 model, service layer 를 생성
+    services = create_services(app.config, preload)
+    app.extensions['database'] = services.database
+    app.extensions['services'] = services
+
+    # 요청이 끝날 때마다 해당 요청(스레드)의 세션을 정리합니다.
+    app.teardown_appcontext(services.database.remove_session)
 
     ## 엔드포인트들을 생성
     create_endpoints(app, services)
 
-    return app
\ No newline at end of file
+    return app
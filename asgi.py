@@ -0,0 +1,36 @@
+# 비동기(ASGI) 서버로 API 를 실행하는 파일입니다.
+# flask 앱(app.py)과 같은 엔드포인트와 service layer 를 사용하며, 하나의 프로세스가 많은 동시 요청을 받을 수 있습니다.
+#
+# 실행) uvicorn --factory asgi:create_asgi_app --host 0.0.0.0 --port 5000
+
+# starlette 로 ASGI 앱을 만들고, 다른 도메인에서 오는 요청을 위해 CORS 미들웨어를 추가합니다.
+from starlette.applications import Starlette
+from starlette.middleware import Middleware
+from starlette.middleware.cors import CORSMiddleware
+
+from app import load_config, create_services
+from view.asgi import create_asgi_endpoints, InstrumentationMiddleware, QueryInspectorMiddleware, EXCEPTION_HANDLERS
+
+# ASGI 앱을 만드는 함수. test_config 가 None일 경우 실서버 config를 적용한다.
+# preload 는 serve.py 가 worker 들을 fork 하기 전에 앱을 만들 때 사용합니다.
+def create_asgi_app(test_config = None, preload = False):
+    config = load_config(test_config)
+    services = create_services(config, preload)
+
+    middleware = [Middleware(CORSMiddleware, allow_origins = ['*'], allow_methods = ['*'], allow_headers = ['*'])]
+    # instrumentation 이 켜져 있으면 요청마다 처리시간을 기록하고 Server-Timing 헤더를 붙입니다.
+    if services.instrumentation is not None:
+        middleware.insert(0, Middleware(InstrumentationMiddleware, instrumentation = services.instrumentation))
+    # query inspector 가 켜져 있으면 요청마다 실행한 SQL 을 검사합니다.
+    if services.query_inspector is not None:
+        middleware.append(Middleware(QueryInspectorMiddleware, query_inspector = services.query_inspector))
+
+    app = Starlette(
+        routes = create_asgi_endpoints(services, config),
+        middleware = middleware,
+        exception_handlers = EXCEPTION_HANDLERS
+    )
+    app.state.config = config
+    app.state.services = services
+
+    return app
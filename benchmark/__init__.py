@@ -0,0 +1,2 @@
+# API 서버의 성능을 측정하는 benchmark 파일들입니다.
+# 실서버 DB 대신 SQLite(또는 로컬 MySQL)에 가상의 SNS 데이터를 만들어서 측정합니다.
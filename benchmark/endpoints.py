@@ -0,0 +1,209 @@
+# 모든 엔드포인트(/timeline, /login, /tweet, /follow)의 응답시간과 처리량을 측정하는 벤치마크입니다.
+# 가상의 SNS 데이터(power-law 팔로워)를 저장한 DB 로 앱을 만들고,
+# 1. flask 의 test_client 와 2. 실제 WSGI 서버(HTTP) 두 가지 방식으로 요청을 보내 p50/p95/p99 와 RPS 를 구합니다.
+#
+# 사용법) python -m benchmark.endpoints --users 10000 --requests 500 --output bench.json
+#        python -m benchmark.endpoints --compare bench.json       # 이전 결과와 비교
+#
+# --db-url 이 없으면 임시 폴더의 SQLite 파일 DB 를 사용합니다.
+
+import argparse
+import datetime
+import http.client
+import json
+import os
+import random
+import subprocess
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# 실제 HTTP 요청을 받는 WSGI 서버
+from werkzeug.serving import make_server
+
+from app import create_app
+from service import UserService
+from benchmark.seed import create_benchmark_engine, seed, PASSWORD
+
+# 각 엔드포인트로 보낼 요청을 만듭니다. (method, path, body) 를 반환합니다.
+def make_request(endpoint, rand, users):
+    user_id = rand.randint(1, users)
+
+    if endpoint == 'timeline':
+        return user_id, 'GET', '/timeline', None
+    if endpoint == 'timeline_page':
+        return user_id, 'GET', '/timeline?limit=50', None
+    if endpoint == 'login':
+        return None, 'POST', '/login', {'email' : f'user{user_id}@bench.com', 'password' : PASSWORD}
+    if endpoint == 'tweet':
+        return user_id, 'POST', '/tweet', {'tweet' : f'benchmark tweet {rand.random()}'}
+    if endpoint == 'follow':
+        return user_id, 'POST', '/follow', {'follow' : rand.randint(1, users)}
+
+    raise ValueError(endpoint)
+
+ENDPOINTS = ['timeline', 'timeline_page', 'login', 'tweet', 'follow']
+
+# 측정한 응답시간(ms)들의 백분위 값과 초당 요청 수를 구합니다.
+def summarize(latencies, errors, elapsed):
+    latencies = sorted(latencies)
+
+    def percentile(p):
+        return round(latencies[min(len(latencies) - 1, int(round(p / 100.0 * (len(latencies) - 1))))], 3)
+
+    return {
+        'requests' : len(latencies),
+        'errors' : errors,
+        'p50_ms' : percentile(50),
+        'p95_ms' : percentile(95),
+        'p99_ms' : percentile(99),
+        'rps' : round(len(latencies) / elapsed, 2)
+    }
+
+# flask 의 test_client 로 한 엔드포인트에 요청을 보내며 측정합니다. (네트워크, 서버 스레드 없이 앱만 측정)
+def run_test_client(app, tokens, endpoint, requests, users, rand):
+    api = app.test_client()
+    latencies = []
+    errors = 0
+
+    started = time.perf_counter()
+    for _ in range(requests):
+        user_id, method, path, body = make_request(endpoint, rand, users)
+        headers = {'Authorization' : tokens[user_id]} if user_id else {}
+
+        start = time.perf_counter()
+        if method == 'GET':
+            resp = api.get(path, headers = headers)
+        else:
+            resp = api.post(path, data = json.dumps(body), content_type = 'application/json', headers = headers)
+        latencies.append((time.perf_counter() - start) * 1000)
+
+        if resp.status_code >= 400:
+            errors += 1
+
+    return summarize(latencies, errors, time.perf_counter() - started)
+
+# 실제 WSGI 서버에 concurrency 개의 클라이언트 스레드로 HTTP 요청을 보내며 측정합니다.
+def run_wsgi(port, tokens, endpoint, requests, users, concurrency, rand):
+    plans = [make_request(endpoint, rand, users) for _ in range(requests)]
+
+    def send(plan):
+        user_id, method, path, body = plan
+        headers = {'Authorization' : tokens[user_id]} if user_id else {}
+        if body is not None:
+            body = json.dumps(body)
+            headers['Content-Type'] = 'application/json'
+
+        connection = http.client.HTTPConnection('127.0.0.1', port, timeout = 60)
+        start = time.perf_counter()
+        try:
+            connection.request(method, path, body = body, headers = headers)
+            status = connection.getresponse().status
+        except (OSError, http.client.HTTPException):
+            status = 599
+        finally:
+            connection.close()
+
+        return (time.perf_counter() - start) * 1000, status
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = concurrency) as clients:
+        results = list(clients.map(send, plans))
+    elapsed = time.perf_counter() - started
+
+    return summarize([latency for latency, _ in results], sum(1 for _, status in results if status >= 400), elapsed)
+
+# 현재 git commit 을 결과에 함께 저장해서, 어떤 commit 의 결과인지 비교할 수 있게 합니다.
+def git_commit():
+    try:
+        return subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], stderr = subprocess.DEVNULL).decode().strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+# 이전 결과와 비교해서 p95 와 RPS 의 변화율을 출력합니다.
+def compare(previous, current):
+    for driver, endpoints in current['results'].items():
+        for endpoint, stats in endpoints.items():
+            before = previous['results'].get(driver, {}).get(endpoint)
+            if not before:
+                continue
+
+            p95 = (stats['p95_ms'] - before['p95_ms']) / before['p95_ms'] * 100 if before['p95_ms'] else 0.0
+            rps = (stats['rps'] - before['rps']) / before['rps'] * 100 if before['rps'] else 0.0
+            print(f"{driver:12} {endpoint:14} p95 {before['p95_ms']:>9.3f} -> {stats['p95_ms']:>9.3f} ms ({p95:+.1f}%)  "
+                  f"rps {before['rps']:>9.2f} -> {stats['rps']:>9.2f} ({rps:+.1f}%)")
+
+def main():
+    parser = argparse.ArgumentParser(description = 'endpoint load test')
+    parser.add_argument('--db-url', help = '기본값은 임시 폴더의 SQLite 파일 DB 입니다.')
+    parser.add_argument('--users', type = int, default = 10000)
+    parser.add_argument('--follows-per-user', type = int, default = 10)
+    parser.add_argument('--tweets-per-user', type = int, default = 3)
+    parser.add_argument('--requests', type = int, default = 300, help = '엔드포인트마다 보내는 요청 수')
+    parser.add_argument('--concurrency', type = int, default = 8, help = 'WSGI 서버에 동시에 요청하는 클라이언트 수')
+    parser.add_argument('--endpoints', default = ','.join(ENDPOINTS))
+    parser.add_argument('--drivers', default = 'test_client,wsgi')
+    parser.add_argument('--skip-seed', action = 'store_true', help = '이미 데이터가 저장된 DB 를 사용합니다.')
+    parser.add_argument('--output', help = '결과를 저장할 json 파일 경로')
+    parser.add_argument('--compare', help = '비교할 이전 결과 json 파일 경로')
+    args = parser.parse_args()
+
+    db_url = args.db_url or 'sqlite:///' + os.path.join(tempfile.mkdtemp(), 'benchmark.db')
+    engine = create_benchmark_engine(db_url)
+    if not args.skip_seed:
+        seed(engine, args.users, args.follows_per_user, args.tweets_per_user)
+    engine.dispose()
+
+    app = create_app({
+        'DB_URL' : db_url,
+        'JWT_SECRET_KEY' : 'benchmark secret key',
+        'BCRYPT_ROUNDS' : 4
+    })
+
+    # 요청에 사용할 유저들의 액세스토큰을 미리 만들어둡니다.
+    token_service = UserService(None, app.config)
+    tokens = {user_id : token_service.generate_access_token(user_id) for user_id in range(1, args.users + 1)}
+
+    endpoints = args.endpoints.split(',')
+    drivers = args.drivers.split(',')
+    rand = random.Random(0)
+    results = {}
+
+    if 'test_client' in drivers:
+        results['test_client'] = {endpoint : run_test_client(app, tokens, endpoint, args.requests, args.users, rand) for endpoint in endpoints}
+
+    if 'wsgi' in drivers:
+        server = make_server('127.0.0.1', 0, app, threaded = True)
+        threading.Thread(target = server.serve_forever, daemon = True).start()
+        try:
+            results['wsgi'] = {endpoint : run_wsgi(server.server_port, tokens, endpoint, args.requests, args.users, args.concurrency, rand) for endpoint in endpoints}
+        finally:
+            server.shutdown()
+
+    result = {
+        'meta' : {
+            'commit' : git_commit(),
+            'timestamp' : datetime.datetime.utcnow().isoformat() + 'Z',
+            'db' : engine.dialect.name,
+            'users' : args.users,
+            'follows_per_user' : args.follows_per_user,
+            'tweets_per_user' : args.tweets_per_user,
+            'requests' : args.requests,
+            'concurrency' : args.concurrency
+        },
+        'results' : results
+    }
+
+    print(json.dumps(result, indent = 2))
+
+    if args.compare:
+        with open(args.compare) as f:
+            compare(json.load(f), result)
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent = 2)
+
+if __name__ == '__main__':
+    main()
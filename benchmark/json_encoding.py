@@ -0,0 +1,75 @@
+# 타임라인 응답(트윗 1k, 10k 개)을 json 으로 인코딩하는 시간을 encoder 별로 측정하는 벤치마크입니다.
+#
+# 사용법) python -m benchmark.json_encoding --repeat 50
+#
+# json 은 기존 CustomJSONEncoder(파이썬 json 모듈), orjson 은 orjson 이 설치되어 있을 때만 측정합니다.
+# jsonify 와 같은 옵션(sort_keys, 공백 없는 구분자)으로 인코딩합니다.
+
+import argparse
+import json
+import statistics
+import time
+from datetime import datetime
+
+from view.json_encoder import JSON_ENCODERS, orjson
+
+# 타임라인 응답과 같은 모양의 데이터를 만듭니다.
+# /timeline 은 user_id, tweet 만, 페이지 단위 /timeline 은 id 와 created_at(datetime) 도 응답합니다.
+def timeline_payload(tweets, shape):
+    timeline = []
+    for tweet_id in range(tweets):
+        tweet = {
+            'user_id' : tweet_id % 1000,
+            'tweet' : f'{tweet_id}번째 트윗입니다. Hello World! #python'
+        }
+        if shape == 'page':
+            tweet['id'] = tweet_id
+            tweet['created_at'] = datetime(2020, 1, 1, 12, 0, tweet_id % 60)
+
+        timeline.append(tweet)
+
+    return {'user_id' : 1, 'timeline' : timeline}
+
+def measure(backend, shape, payload, repeat):
+    encoder = JSON_ENCODERS[backend]
+    # 결과가 기존 json 모듈과 같은 값인지 먼저 확인합니다.
+    assert json.loads(json.dumps(payload, cls = encoder, sort_keys = True, separators = (',', ':'))) == \
+           json.loads(json.dumps(payload, cls = JSON_ENCODERS['json'], sort_keys = True, separators = (',', ':')))
+
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        body = json.dumps(payload, cls = encoder, sort_keys = True, separators = (',', ':'))
+        times.append((time.perf_counter() - start) * 1000)
+
+    return {
+        'backend' : backend,
+        'shape' : shape,
+        'tweets' : len(payload['timeline']),
+        'bytes' : len(body.encode('UTF-8')),
+        'p50_ms' : round(statistics.median(times), 3),
+        'min_ms' : round(min(times), 3)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description = 'timeline json encoding time by backend')
+    parser.add_argument('--repeat', type = int, default = 50)
+    parser.add_argument('--output', help = '결과를 저장할 json 파일 경로')
+    args = parser.parse_args()
+
+    backends = ['json'] + (['orjson'] if orjson is not None else [])
+
+    result = {
+        'repeat' : args.repeat,
+        'runs' : [measure(backend, shape, timeline_payload(tweets, shape), args.repeat)
+                  for shape in ['timeline', 'page'] for tweets in [1000, 10000] for backend in backends]
+    }
+
+    print(json.dumps(result, indent = 2))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent = 2)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,70 @@
+# CPU 코어 수(프로세스 풀 크기)에 따른 로그인(bcrypt.checkpw) 처리량을 측정하는 벤치마크입니다.
+#
+# 사용법) python -m benchmark.password_hashing --rounds 12 --logins 64
+#
+# workers 0 은 프로세스 풀 없이 요청 스레드에서 바로 bcrypt 를 실행하는 기존 방식입니다.
+
+import argparse
+import json
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from service import PasswordHasher, PasswordHasherBusy
+from service.password_hasher import hash_password
+
+# 여러 요청 스레드에서 동시에 로그인했을 때의 초당 로그인 수를 측정합니다.
+def measure(workers, rounds, logins, clients, hashed_password):
+    hasher = PasswordHasher(rounds = rounds, workers = workers, queue_size = clients, queue_timeout = 60, timeout = 60)
+    # 프로세스 풀을 미리 띄워서 프로세스 생성 시간은 측정에서 제외합니다.
+    hasher.check(b'test password', hashed_password)
+
+    def login(_):
+        try:
+            return hasher.check(b'test password', hashed_password)
+        except PasswordHasherBusy:
+            return None
+
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers = clients) as requests:
+        results = list(requests.map(login, range(logins)))
+    elapsed = time.perf_counter() - start
+
+    hasher.shutdown()
+
+    return {
+        'workers' : workers,
+        'logins' : logins,
+        'rejected' : results.count(None),
+        'seconds' : round(elapsed, 3),
+        'logins_per_second' : round(logins / elapsed, 2)
+    }
+
+def main():
+    parser = argparse.ArgumentParser(description = 'login throughput by password hash workers')
+    parser.add_argument('--rounds', type = int, default = 12)
+    parser.add_argument('--logins', type = int, default = 64)
+    parser.add_argument('--clients', type = int, default = 32, help = '동시에 로그인하는 요청 스레드 수')
+    parser.add_argument('--output', help = '결과를 저장할 json 파일 경로')
+    args = parser.parse_args()
+
+    hashed_password = hash_password(b'test password', args.rounds)
+
+    # 0(기존 방식), 1, 2, 4, ... 코어 수까지 프로세스 수를 늘려가며 측정합니다.
+    cpu_count = os.cpu_count() or 1
+    worker_counts = [0] + [count for count in [1, 2, 4, 8, 16, 32, 64] if count < cpu_count] + [cpu_count]
+
+    result = {
+        'rounds' : args.rounds,
+        'cpu_count' : cpu_count,
+        'runs' : [measure(workers, args.rounds, args.logins, args.clients, hashed_password) for workers in worker_counts]
+    }
+
+    print(json.dumps(result, indent = 2))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent = 2)
+
+if __name__ == '__main__':
+    main()
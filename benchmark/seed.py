@@ -0,0 +1,88 @@
+# 벤치마크에 사용할 가상의 SNS 데이터(유저, 팔로우, 트윗)를 DB에 저장하는 파일입니다.
+# 팔로워 수는 소수의 유저에게 몰리도록 power-law(멱법칙) 분포로 만듭니다.
+
+import random
+import itertools
+
+# sqlalchemy의 엔진을 만드는 함수
+from sqlalchemy import create_engine
+
+from repository import Users, Tweets, UsersFollowList
+# 테이블과 인덱스를 만드는 migration
+from migrations import upgrade
+
+# 벤치마크 유저들이 공통으로 사용하는 비밀번호와 bcrypt 해시값 (cost 4)
+PASSWORD = 'test password'
+HASHED_PASSWORD = '$2b$04$Ag118FAPzk68e9tOv.DDuugqmH06mPKBnQ5XGDIPQHVmcMNcWc3r6'
+
+# DB URL 로 엔진을 만들고 테이블을 생성합니다.
+def create_benchmark_engine(db_url):
+    engine = create_engine(db_url, encoding = 'utf-8')
+    create_schema(engine)
+
+    return engine
+
+# 서버와 같은 migration 으로 테이블과 인덱스를 생성합니다. (SQLite 도 같은 migration 을 사용합니다.)
+def create_schema(engine):
+    upgrade(engine)
+
+# 가상의 데이터를 저장합니다.
+# users            : 유저 수
+# follows_per_user : 유저 한 명이 팔로우하는 평균 유저 수 (파레토 분포)
+# tweets_per_user  : 유저 한 명이 작성한 평균 트윗 수
+# zipf_s           : 팔로우 받는 유저의 인기도 분포. 값이 클수록 소수의 유저에게 팔로워가 몰립니다.
+def seed(engine, users = 100000, follows_per_user = 10, tweets_per_user = 3, zipf_s = 1.1, random_seed = 0, chunk_size = 10000):
+    rand = random.Random(random_seed)
+
+    insert_chunks(engine, Users.__table__, ({
+        'name' : f'user{user_id}',
+        'email' : f'user{user_id}@bench.com',
+        'hashed_password' : HASHED_PASSWORD,
+        'profile' : 'benchmark profile'
+    } for user_id in range(1, users + 1)), chunk_size)
+
+    # 인기도가 1/rank^s 인 분포에서 팔로우할 유저를 뽑습니다.
+    cum_weights = list(itertools.accumulate(1.0 / (rank ** zipf_s) for rank in range(1, users + 1)))
+    popular_ids = list(range(1, users + 1))
+    rand.shuffle(popular_ids)
+
+    def follow_rows():
+        for user_id in range(1, users + 1):
+            # 평균이 follows_per_user 가 되는 파레토 분포로 팔로우 수를 정합니다.
+            count = min(users - 1, int(rand.paretovariate(2.0) * follows_per_user / 2))
+            follow_ids = set(rand.choices(popular_ids, cum_weights = cum_weights, k = count))
+            follow_ids.discard(user_id)
+
+            for follow_id in follow_ids:
+                yield {'user_id' : user_id, 'follow_user_id' : follow_id}
+
+    insert_chunks(engine, UsersFollowList.__table__, follow_rows(), chunk_size)
+
+    def tweet_rows():
+        for index in range(users * tweets_per_user):
+            yield {
+                'user_id' : rand.randint(1, users),
+                'tweet' : f'benchmark tweet {index}'
+            }
+
+    insert_chunks(engine, Tweets.__table__, tweet_rows(), chunk_size)
+
+# 행들을 chunk_size 개씩 나눠서 executemany 로 저장합니다.
+def insert_chunks(engine, table, rows, chunk_size):
+    rows = iter(rows)
+    with engine.begin() as connection:
+        while True:
+            chunk = list(itertools.islice(rows, chunk_size))
+            if not chunk:
+                break
+
+            connection.execute(table.insert(), chunk)
+
+# 팔로우 수가 많은 순서대로 유저 id 를 가져옵니다. 벤치마크에서 측정할 유저를 고를 때 사용합니다.
+def top_followers(engine, limit):
+    rows = engine.execute(text(
+        'SELECT user_id, COUNT(*) AS follows FROM users_follow_list '
+        'GROUP BY user_id ORDER BY follows DESC LIMIT :limit'
+    ), limit = limit).fetchall()
+
+    return [row.user_id for row in rows]
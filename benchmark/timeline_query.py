@@ -0,0 +1,101 @@
+# 타임라인 쿼리 방식('join', 'union')의 결과 행 수와 응답시간을 비교하는 벤치마크입니다.
+#
+# 사용법) python -m benchmark.timeline_query --users 100000
+#        python -m benchmark.timeline_query --db-url mysql+mysqldb://... --output timeline_query.json
+#
+# --db-url 이 없으면 SQLite 메모리 DB 에 가상의 데이터를 만들어 측정합니다.
+
+import argparse
+import json
+import random
+import time
+
+# sqlalchemy를 통해 디비와 연결이 끊기지 않고, 트랜젝션을 관리하는 세션을 만드는 sessionmaker(세션공장).
+from sqlalchemy import text
+from sqlalchemy.orm import sessionmaker
+
+from repository import Tweets, UsersFollowList
+from model import TweetDao
+from benchmark.seed import create_benchmark_engine, seed, top_followers
+
+# 측정한 시간들의 백분위 값을 구합니다.
+def percentile(values, p):
+    values = sorted(values)
+    index = min(len(values) - 1, int(round(p / 100.0 * (len(values) - 1))))
+
+    return values[index]
+
+# 한 가지 쿼리 방식으로 유저들의 타임라인을 가져오며 행 수와 응답시간을 측정합니다.
+def measure(tweet_dao, user_ids, repeat):
+    latencies = []
+    rows = 0
+    duplicates = 0
+
+    for _ in range(repeat):
+        for user_id in user_ids:
+            start = time.perf_counter()
+            timeline = tweet_dao.get_timeline(user_id)
+            latencies.append((time.perf_counter() - start) * 1000)
+
+            rows += len(timeline)
+            duplicates += len(timeline) - len({(tweet['user_id'], tweet['tweet']) for tweet in timeline})
+
+    return {
+        'rows' : rows // repeat,
+        'duplicate_rows' : duplicates // repeat,
+        'p50_ms' : round(percentile(latencies, 50), 3),
+        'p95_ms' : round(percentile(latencies, 95), 3),
+        'p99_ms' : round(percentile(latencies, 99), 3),
+        'total_ms' : round(sum(latencies), 3)
+    }
+
+# join 쿼리는 유저의 트윗 수 x 팔로우 수 만큼의 행을 만들기 때문에 후보 행 수를 함께 계산합니다.
+def join_candidate_rows(engine, user_ids):
+    tweets = engine.execute(text('SELECT COUNT(*) FROM tweets')).scalar()
+    total = 0
+    for user_id in user_ids:
+        follows = engine.execute(text('SELECT COUNT(*) FROM users_follow_list WHERE user_id = :user_id'), user_id = user_id).scalar()
+        total += tweets * max(1, follows)
+
+    return total
+
+def main():
+    parser = argparse.ArgumentParser(description = 'timeline query benchmark (join vs union)')
+    parser.add_argument('--db-url', default = 'sqlite://')
+    parser.add_argument('--users', type = int, default = 100000)
+    parser.add_argument('--follows-per-user', type = int, default = 10)
+    parser.add_argument('--tweets-per-user', type = int, default = 3)
+    parser.add_argument('--sample', type = int, default = 50, help = '측정할 유저 수 (팔로우가 많은 유저 절반 + 무작위 유저 절반)')
+    parser.add_argument('--repeat', type = int, default = 3)
+    parser.add_argument('--skip-seed', action = 'store_true', help = '이미 데이터가 저장된 DB 를 사용합니다.')
+    parser.add_argument('--output', help = '결과를 저장할 json 파일 경로')
+    args = parser.parse_args()
+
+    engine = create_benchmark_engine(args.db_url)
+
+    if not args.skip_seed:
+        start = time.perf_counter()
+        seed(engine, args.users, args.follows_per_user, args.tweets_per_user)
+        print(f'seeded {args.users} users in {time.perf_counter() - start:.1f}s')
+
+    user_ids = top_followers(engine, args.sample // 2)
+    user_ids += random.Random(0).sample(range(1, args.users + 1), args.sample - len(user_ids))
+
+    Session = sessionmaker(bind = engine)
+    result = {
+        'users' : args.users,
+        'sample' : len(user_ids),
+        'join_candidate_rows' : join_candidate_rows(engine, user_ids)
+    }
+
+    for query_mode in ['join', 'union']:
+        result[query_mode] = measure(TweetDao(Session, Tweets, UsersFollowList, query_mode), user_ids, args.repeat)
+
+    print(json.dumps(result, indent = 2))
+
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent = 2)
+
+if __name__ == '__main__':
+    main()
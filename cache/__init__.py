@@ -0,0 +1,18 @@
+# 서비스 layer 에서 사용하는 캐시 파일입니다.
+# LocalCache 는 프로세스 메모리에, RedisCache 는 모든 worker 가 함께 사용하는 redis 서버에 저장합니다.
+
+from .ttl_cache import TTLCache
+from .base_cache import BaseCache, MISSING
+from .local_cache import LocalCache
+from .redis_cache import RedisCache, RedisError
+from .fake_redis import FakeRedisServer
+
+__all__ = [
+    'TTLCache',
+    'BaseCache',
+    'MISSING',
+    'LocalCache',
+    'RedisCache',
+    'RedisError',
+    'FakeRedisServer'
+]
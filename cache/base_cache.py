@@ -0,0 +1,111 @@
+# 서비스 layer 가 사용하는 캐시 backend 들의 공통 인터페이스 파일입니다.
+# 모든 backend 는 get, get_many, set, set_many, delete, delete_many 와 get_or_build 를 제공합니다.
+
+# 같은 키의 값을 여러 스레드가 동시에 만들지 않도록 키마다 Lock 을 사용합니다.
+# 키의 Lock 을 잡은 상태에서 같은 키로 get_or_build 를 호출할 수 있도록 RLock 을 사용합니다.
+from threading import Lock, RLock
+from contextlib import contextmanager, ExitStack
+
+# 캐시에 값이 없다는 것을 나타내는 값. (None 도 캐시에 저장할 수 있기 때문에 따로 사용합니다.)
+MISSING = object()
+
+class BaseCache:
+    # 여러 프로세스(worker)가 함께 사용하는 캐시인지 여부
+    shared = False
+
+    def __init__(self):
+        self.build_locks = {}
+        self.build_locks_lock = Lock()
+
+    # 캐시된 값을 반환합니다. 없거나 만료되었으면 default 를 반환합니다.
+    def get(self, key, default = None):
+        raise NotImplementedError
+
+    # 값을 저장합니다. ttl 이 없으면 기본 ttl 을 사용합니다.
+    def set(self, key, value, ttl = None):
+        raise NotImplementedError
+
+    def delete(self, key):
+        raise NotImplementedError
+
+    # 여러 키의 값을 한 번에 가져옵니다. 캐시에 있는 키만 {key : value} 로 반환합니다.
+    def get_many(self, keys):
+        values = {}
+        for key in keys:
+            value = self.get(key, MISSING)
+            if value is not MISSING:
+                values[key] = value
+
+        return values
+
+    # 여러 값({key : value})을 같은 ttl 로 한 번에 저장합니다.
+    def set_many(self, values, ttl = None):
+        for key, value in values.items():
+            self.set(key, value, ttl)
+
+    def delete_many(self, keys):
+        for key in keys:
+            self.delete(key)
+
+    # 캐시된 값을 반환하고, 없으면 build() 로 값을 만들어 저장합니다.
+    # 인기 있는 키가 만료되었을 때 여러 요청이 동시에 같은 값을 만드는 것(cache stampede)을 막기 위해,
+    # 같은 프로세스에서는 키마다 한 스레드만 build() 를 실행하고 나머지 스레드는 기다렸다가 만들어진 값을 사용합니다.
+    def get_or_build(self, key, build, ttl = None):
+        value = self.get(key, MISSING)
+        if value is not MISSING:
+            return value
+
+        with self.build_lock(key):
+            # 기다리는 동안 다른 스레드가 값을 만들었으면 그 값을 사용합니다.
+            value = self.get(key, MISSING)
+            if value is not MISSING:
+                return value
+
+            return self.build(key, build, ttl)
+
+    # 값을 만들어 저장합니다. 여러 프로세스가 함께 쓰는 backend 는 한 프로세스만 만들도록 override 합니다.
+    def build(self, key, build, ttl):
+        value = build()
+        self.set(key, value, ttl)
+
+        return value
+
+    # 여러 worker 중 한 worker 만 key 의 값을 build() 로 만들고, 나머지 worker 는 ready() 가 값을 반환할 때까지 기다립니다.
+    # (ready() 는 값이 아직 없으면 MISSING 을 반환합니다.)
+    # 한 프로세스에서만 사용하는 캐시는 호출한 쪽이 잡은 build_lock 으로 충분하므로 바로 만듭니다.
+    def locked_build(self, key, build, ready):
+        return build()
+
+    # 키들의 lock 을 잡고 function(키 리스트) 를 실행합니다. lock 을 잡지 못한 키들을 반환합니다.
+    # 한 프로세스에서만 사용하는 캐시는 키마다 build_lock 을 같은 순서로 잡기 때문에 모든 키의 lock 을 잡습니다.
+    def run_locked(self, keys, function):
+        keys = list(keys)
+        with ExitStack() as stack:
+            for key in sorted(set(keys), key = str):
+                stack.enter_context(self.build_lock(key))
+
+            function(keys)
+
+        return []
+
+    # 키마다 하나씩 만드는 Lock. 기다리는 스레드가 없으면 지워서 키가 많아도 Lock 이 쌓이지 않게 합니다.
+    @contextmanager
+    def build_lock(self, key):
+        with self.build_locks_lock:
+            entry = self.build_locks.get(key)
+            if entry is None:
+                entry = self.build_locks[key] = [RLock(), 0]
+            entry[1] += 1
+
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self.build_locks_lock:
+                entry[1] -= 1
+                if entry[1] == 0:
+                    del self.build_locks[key]
+
+    # 캐시 상태를 반환합니다.
+    def stats(self):
+        return {}
@@ -0,0 +1,159 @@
+# redis 서버 대신 사용할 수 있는 작은 redis 프로토콜(RESP) 서버 파일입니다.
+# 테스트와 로컬 개발에서 redis 를 설치하지 않고 RedisCache 를 사용할 수 있도록
+# RedisCache 가 사용하는 명령(PING, GET, SET [NX] [EX|PX], MGET, DEL, EXISTS, FLUSHDB)만 구현합니다.
+# EVAL 은 lua 를 실행하지 않고, RedisCache 가 사용하는 script(UNLOCK_SCRIPT)만 같은 동작의 파이썬 함수로 실행합니다.
+#
+# 사용법) python -m cache.fake_redis --port 6379
+
+import argparse
+import socketserver
+import threading
+import time
+
+from .redis_cache import UNLOCK_SCRIPT
+
+class FakeRedisHandler (socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            try:
+                command = self.read_command()
+            except (OSError, ValueError):
+                return
+            if command is None:
+                return
+
+            self.wfile.write(self.server.execute(command))
+
+    # RESP 배열 하나(명령과 인자들)를 읽습니다.
+    def read_command(self):
+        line = self.rfile.readline()
+        if not line:
+            return None
+        if line[:1] != b'*':
+            raise ValueError('inline commands are not supported')
+
+        args = []
+        for _ in range(int(line[1:-2])):
+            length = int(self.rfile.readline()[1:-2])
+            args.append(self.rfile.read(length + 2)[:-2])
+
+        return args
+
+class FakeRedisServer (socketserver.ThreadingTCPServer):
+    daemon_threads = True
+    allow_reuse_address = True
+
+    def __init__(self, host = '127.0.0.1', port = 0):
+        socketserver.ThreadingTCPServer.__init__(self, (host, port), FakeRedisHandler)
+        self.data = {}
+        self.lock = threading.Lock()
+        self.thread = None
+
+    # 테스트에서 RedisCache 에 넘겨줄 서버 주소
+    @property
+    def url(self):
+        host, port = self.server_address[:2]
+        return f'redis://{host}:{port}/0'
+
+    # 백그라운드 스레드에서 서버를 실행합니다.
+    def start(self):
+        self.thread = threading.Thread(target = self.serve_forever, daemon = True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.shutdown()
+        self.server_close()
+
+    # lock 을 잡은 상태에서 호출합니다. 만료된 키는 없는 것으로 처리합니다.
+    def lookup(self, key):
+        item = self.data.get(key)
+        if item is not None and item[1] is not None and item[1] <= time.monotonic():
+            del self.data[key]
+            return None
+
+        return item[0] if item else None
+
+    def execute(self, args):
+        name = args[0].upper()
+
+        with self.lock:
+            if name == b'PING':
+                return b'+PONG\r\n'
+
+            if name in (b'SELECT', b'AUTH'):
+                return b'+OK\r\n'
+
+            if name == b'GET':
+                return bulk(self.lookup(args[1]))
+
+            if name == b'MGET':
+                return b'*%d\r\n' % (len(args) - 1) + b''.join(bulk(self.lookup(key)) for key in args[1:])
+
+            if name == b'SET':
+                return self.set(args[1], args[2], [arg.upper() for arg in args[3:]])
+
+            if name in (b'DEL', b'EXISTS'):
+                keys = [key for key in args[1:] if self.lookup(key) is not None]
+                if name == b'DEL':
+                    for key in keys:
+                        del self.data[key]
+                return b':%d\r\n' % len(keys)
+
+            if name == b'FLUSHDB':
+                self.data.clear()
+                return b'+OK\r\n'
+
+            # EVAL script numkeys key [key ...] arg [arg ...]
+            if name == b'EVAL':
+                script = SCRIPTS.get(args[1].decode('UTF-8'))
+                if script is None:
+                    return b'-ERR unsupported script\r\n'
+
+                numkeys = int(args[2])
+                return script(self, args[3:3 + numkeys], args[3 + numkeys:])
+
+        return b"-ERR unknown command '%s'\r\n" % name
+
+    # SET key value [NX] [EX seconds | PX milliseconds]
+    def set(self, key, value, options):
+        expires_at = None
+        if b'EX' in options:
+            expires_at = time.monotonic() + int(options[options.index(b'EX') + 1])
+        if b'PX' in options:
+            expires_at = time.monotonic() + int(options[options.index(b'PX') + 1]) / 1000
+
+        if b'NX' in options and self.lookup(key) is not None:
+            return b'$-1\r\n'
+
+        self.data[key] = (value, expires_at)
+        return b'+OK\r\n'
+
+def bulk(value):
+    return b'$-1\r\n' if value is None else b'$%d\r\n%s\r\n' % (len(value), value)
+
+# UNLOCK_SCRIPT : 키의 값이 ARGV[1] 일 때만 지웁니다.
+def compare_and_delete(server, keys, argv):
+    if server.lookup(keys[0]) != argv[0]:
+        return b':0\r\n'
+
+    del server.data[keys[0]]
+    return b':1\r\n'
+
+# EVAL 로 실행할 수 있는 script 들
+SCRIPTS = {
+    UNLOCK_SCRIPT : compare_and_delete
+}
+
+def main():
+    parser = argparse.ArgumentParser(description = 'fake redis server for local development')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 6379)
+    args = parser.parse_args()
+
+    server = FakeRedisServer(args.host, args.port)
+    print(f'fake redis listening on {server.url}')
+    server.serve_forever()
+
+if __name__ == '__main__':
+    main()
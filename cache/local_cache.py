@@ -0,0 +1,25 @@
+# 프로세스 메모리에 저장하는 캐시 backend 파일입니다.
+# 최대 크기(LRU)와 만료시간(TTL)이 있는 TTLCache 에 저장하며, 같은 프로세스의 요청 스레드들만 값을 공유합니다.
+
+from .base_cache import BaseCache
+from .ttl_cache import TTLCache
+
+class LocalCache (BaseCache):
+
+    # max_size : 저장하는 최대 항목 수
+    # ttl      : 항목을 유지하는 기본 시간(초)
+    def __init__(self, max_size = 10000, ttl = 60):
+        BaseCache.__init__(self)
+        self.items = TTLCache(max_size = max_size, ttl = ttl)
+
+    def get(self, key, default = None):
+        return self.items.get(key, default)
+
+    def set(self, key, value, ttl = None):
+        self.items.set(key, value, ttl)
+
+    def delete(self, key):
+        self.items.delete(key)
+
+    def stats(self):
+        return dict(self.items.stats(), backend = 'local')
@@ -0,0 +1,382 @@
+# redis 서버에 저장하는 캐시 backend 파일입니다.
+# 모든 프로세스(worker)와 서버가 같은 redis 를 사용하기 때문에, 한 worker 에서 지운 값은 다른 worker 에서도 지워집니다.
+# redis 프로토콜(RESP)로 직접 통신하는 작은 클라이언트를 사용하며,
+#   - 커넥션 풀 : 요청마다 연결하지 않고 연결을 재사용합니다.
+#   - pipeline  : 여러 명령을 한 번에 보내고 응답을 한 번에 읽습니다. (get_many 는 MGET 들을 한 번에 보냅니다.)
+#   - SET NX lock : 만료된 값을 여러 worker 중 한 worker 만 다시 만들게 합니다.
+# redis 서버에 연결할 수 없으면 캐시가 없는 것처럼 동작합니다. (get 은 default, set 은 무시)
+# 값은 json 으로 저장하기 때문에 json 으로 바꿀 수 있는 값만 저장할 수 있습니다.
+
+import json
+import os
+import socket
+import time
+import uuid
+from contextlib import contextmanager
+from threading import BoundedSemaphore, Lock
+from urllib.parse import urlparse
+
+from .base_cache import BaseCache, MISSING
+
+# lock 의 값이 내 token 일 때만 지우는 lua script. GET 과 DEL 사이에 다른 worker 가 lock 을 잡을 수 없도록 redis 에서 한 번에 실행합니다.
+UNLOCK_SCRIPT = "if redis.call('get', KEYS[1]) == ARGV[1] then return redis.call('del', KEYS[1]) else return 0 end"
+
+# redis 가 에러 응답을 보내거나, 커넥션 풀에서 연결을 빌리지 못했을 때 발생하는 예외
+class RedisError (Exception):
+    pass
+
+# 명령 하나를 RESP 배열로 인코딩합니다. 예) SET a 1 -> *3\r\n$3\r\nSET\r\n$1\r\na\r\n$1\r\n1\r\n
+def encode_command(args):
+    parts = [b'*%d\r\n' % len(args)]
+    for arg in args:
+        if not isinstance(arg, bytes):
+            arg = str(arg).encode('UTF-8')
+        parts.append(b'$%d\r\n%s\r\n' % (len(arg), arg))
+
+    return b''.join(parts)
+
+# redis 서버와의 연결 하나
+class RedisConnection:
+    def __init__(self, host, port, db = 0, password = None, timeout = 1.0):
+        self.sock = socket.create_connection((host, port), timeout)
+        self.sock.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+        self.reader = self.sock.makefile('rb')
+
+        if password:
+            self.execute('AUTH', password)
+        if db:
+            self.execute('SELECT', db)
+
+    # 여러 명령을 한 번에 보내고, 각 명령의 응답을 순서대로 반환합니다.
+    # 에러 응답은 예외를 바로 발생시키지 않고 RedisError 객체로 반환합니다.
+    def pipeline(self, commands):
+        self.sock.sendall(b''.join(encode_command(command) for command in commands))
+
+        return [self.read_reply() for _ in commands]
+
+    # 명령 하나를 실행합니다.
+    def execute(self, *args):
+        reply = self.pipeline([args])[0]
+        if isinstance(reply, RedisError):
+            raise reply
+
+        return reply
+
+    # RESP 응답 하나를 읽습니다.
+    def read_reply(self):
+        line = self.reader.readline()
+        if not line.endswith(b'\r\n'):
+            raise ConnectionError('redis connection closed')
+
+        kind, body = line[:1], line[1:-2]
+        if kind == b'+':
+            return body.decode('UTF-8')
+        if kind == b'-':
+            return RedisError(body.decode('UTF-8'))
+        if kind == b':':
+            return int(body)
+        if kind == b'$':
+            length = int(body)
+            if length < 0:
+                return None
+
+            data = self.reader.read(length + 2)
+            if len(data) != length + 2:
+                raise ConnectionError('redis connection closed')
+            return data[:-2]
+        if kind == b'*':
+            length = int(body)
+            return None if length < 0 else [self.read_reply() for _ in range(length)]
+
+        raise ConnectionError(f'unknown redis reply: {line!r}')
+
+    def close(self):
+        try:
+            self.reader.close()
+            self.sock.close()
+        except OSError:
+            pass
+
+# redis 연결들을 재사용하는 커넥션 풀
+# 최대 max_size 개의 연결을 동시에 사용할 수 있으며, 모두 사용 중이면 timeout 초까지 기다립니다.
+class RedisConnectionPool:
+    def __init__(self, connect, max_size = 10, timeout = 1.0):
+        self.connect = connect
+        self.timeout = timeout
+        self.slots = BoundedSemaphore(max_size)
+        self.idle = []
+        self.lock = Lock()
+        self.pid = os.getpid()
+
+    @contextmanager
+    def connection(self):
+        if not self.slots.acquire(timeout = self.timeout):
+            raise RedisError('redis connection pool timeout')
+
+        try:
+            connection = self.pop_idle() or self.connect()
+            try:
+                yield connection
+            # redis 의 에러 응답은 응답을 끝까지 읽은 것이므로 연결을 그대로 재사용합니다.
+            except RedisError:
+                self.push_idle(connection)
+                raise
+            # 통신 중에 다른 에러가 나면 응답을 다 읽지 못했을 수 있으므로 해당 연결은 버립니다.
+            except BaseException:
+                connection.close()
+                raise
+            else:
+                self.push_idle(connection)
+        finally:
+            self.slots.release()
+
+    def push_idle(self, connection):
+        with self.lock:
+            self.idle.append(connection)
+
+    def pop_idle(self):
+        with self.lock:
+            # fork 된 자식 프로세스는 부모의 연결을 함께 사용하지 않도록 새로 연결합니다.
+            if self.pid != os.getpid():
+                self.idle = []
+                self.pid = os.getpid()
+
+            return self.idle.pop() if self.idle else None
+
+    def close(self):
+        with self.lock:
+            for connection in self.idle:
+                connection.close()
+            self.idle = []
+
+class RedisCache (BaseCache):
+    shared = True
+
+    # url          : redis 서버 주소. 예) redis://:password@localhost:6379/0
+    # ttl          : 항목을 유지하는 기본 시간(초)
+    # prefix       : 다른 서비스와 같은 redis 를 사용할 때 키가 겹치지 않도록 붙이는 접두사
+    # pool_size    : 커넥션 풀의 최대 연결 수
+    # timeout      : 연결, 응답, 커넥션 풀에서 연결을 빌릴 때 기다리는 최대 시간(초)
+    # lock_timeout : 값을 만드는 worker 가 죽었을 때 lock 이 풀리는 시간(초)
+    # lock_wait    : 다른 worker 가 값을 만드는 것을 기다리는 최대 시간(초). 지나면 직접 만듭니다.
+    def __init__(self, url = 'redis://localhost:6379/0', ttl = 60, prefix = 'sns:', pool_size = 10, timeout = 1.0, lock_timeout = 10, lock_wait = 5):
+        BaseCache.__init__(self)
+        self.ttl = ttl
+        self.prefix = prefix
+        self.lock_timeout = lock_timeout
+        self.lock_wait = lock_wait
+        self.hits = 0
+        self.misses = 0
+        self.errors = 0
+
+        address = urlparse(url)
+        host = address.hostname or 'localhost'
+        port = address.port or 6379
+        db = int(address.path.lstrip('/') or 0)
+        password = address.password
+
+        self.pool = RedisConnectionPool(
+            lambda: RedisConnection(host, port, db, password, timeout),
+            max_size = pool_size,
+            timeout = timeout
+        )
+
+    def key(self, key):
+        return (self.prefix + str(key)).encode('UTF-8')
+
+    def dumps(self, value):
+        return json.dumps(value, separators = (',', ':')).encode('UTF-8')
+
+    def loads(self, value):
+        return json.loads(value)
+
+    # 명령 하나를 실행합니다.
+    def execute(self, *args):
+        with self.pool.connection() as connection:
+            return connection.execute(*args)
+
+    # 여러 명령을 한 번에 보내고 응답들을 반환합니다.
+    def pipeline(self, commands):
+        with self.pool.connection() as connection:
+            replies = connection.pipeline(commands)
+
+        for reply in replies:
+            if isinstance(reply, RedisError):
+                raise reply
+
+        return replies
+
+    def get(self, key, default = None):
+        try:
+            value = self.execute('GET', self.key(key))
+        except (OSError, RedisError):
+            self.errors += 1
+            return default
+
+        if value is None:
+            self.misses += 1
+            return default
+
+        self.hits += 1
+        return self.loads(value)
+
+    # 여러 키를 chunk_size 개씩 MGET 으로 나누고, MGET 들을 pipeline 으로 한 번에 보냅니다.
+    def get_many(self, keys, chunk_size = 500):
+        keys = list(keys)
+        if not keys:
+            return {}
+
+        chunks = [keys[start:start + chunk_size] for start in range(0, len(keys), chunk_size)]
+        try:
+            replies = self.pipeline([['MGET'] + [self.key(key) for key in chunk] for chunk in chunks])
+        except (OSError, RedisError):
+            self.errors += 1
+            return {}
+
+        values = {}
+        for chunk, reply in zip(chunks, replies):
+            for key, value in zip(chunk, reply):
+                if value is not None:
+                    values[key] = self.loads(value)
+
+        self.hits += len(values)
+        self.misses += len(keys) - len(values)
+        return values
+
+    def set(self, key, value, ttl = None):
+        ttl = self.ttl if ttl is None else ttl
+
+        try:
+            self.execute('SET', self.key(key), self.dumps(value), 'PX', max(1, int(ttl * 1000)))
+        except (OSError, RedisError):
+            self.errors += 1
+
+    # 여러 값을 SET 명령들의 pipeline 으로 한 번에 저장합니다.
+    def set_many(self, values, ttl = None):
+        ttl = self.ttl if ttl is None else ttl
+        if not values:
+            return
+
+        try:
+            self.pipeline([['SET', self.key(key), self.dumps(value), 'PX', max(1, int(ttl * 1000))] for key, value in values.items()])
+        except (OSError, RedisError):
+            self.errors += 1
+
+    def delete(self, key):
+        self.delete_many([key])
+
+    # 여러 키를 DEL 명령 하나(키가 많으면 chunk_size 개씩 나눈 DEL 들의 pipeline)로 지웁니다.
+    def delete_many(self, keys, chunk_size = 500):
+        keys = [self.key(key) for key in keys]
+        if not keys:
+            return
+
+        try:
+            self.pipeline([['DEL'] + keys[start:start + chunk_size] for start in range(0, len(keys), chunk_size)])
+        except (OSError, RedisError):
+            self.errors += 1
+
+    # 여러 worker 중 lock 을 잡은 worker 만 값을 만들고, 나머지 worker 는 값이 저장될 때까지 기다립니다.
+    def build(self, key, build, ttl):
+        return self.locked_build(key, lambda: BaseCache.build(self, key, build, ttl), lambda: self.get(key, MISSING))
+
+    # 여러 worker 중 key 의 lock 을 잡은 worker 만 build() 를 실행하고, 나머지 worker 는 ready() 가 값을 반환할 때까지 기다립니다.
+    # lock 은 lock_timeout 이 지나면 자동으로 풀리고, lock_wait 동안 값이 만들어지지 않으면 직접 만듭니다.
+    def locked_build(self, key, build, ready):
+        deadline = time.monotonic() + self.lock_wait
+        waited = False
+
+        while True:
+            tokens = self.lock_many([key])
+            # redis 를 사용할 수 없으면 lock 없이 만듭니다.
+            if tokens is None:
+                return build()
+
+            if tokens:
+                try:
+                    # 기다리는 동안 다른 worker 가 값을 만들고 lock 을 풀었으면 그 값을 사용합니다.
+                    value = ready() if waited else MISSING
+                    return build() if value is MISSING else value
+                finally:
+                    self.unlock_many(tokens)
+
+            time.sleep(0.02)
+            waited = True
+            value = ready()
+            if value is not MISSING:
+                return value
+
+            if time.monotonic() > deadline:
+                return build()
+
+    # 키들의 lock 을 잡고 function(잡은 키 리스트) 를 실행한 뒤 lock 을 풉니다.
+    # 다른 worker 가 잡고 있는 키는 기다렸다가 다시 잡아서 실행합니다. 기다리는 동안 다른 키의 lock 은 잡고 있지 않기 때문에,
+    # 여러 worker 가 겹치는 키들을 잡아도 서로를 기다리며 멈추지 않습니다.
+    # lock_wait 동안 잡지 못한 키들은 실행하지 않고 반환합니다. (redis 를 사용할 수 없으면 모든 키를 반환합니다.)
+    def run_locked(self, keys, function):
+        pending = list(keys)
+        deadline = time.monotonic() + self.lock_wait
+
+        while pending:
+            tokens = self.lock_many(pending)
+            if tokens is None:
+                return pending
+
+            if tokens:
+                try:
+                    function([key for key in pending if key in tokens])
+                finally:
+                    self.unlock_many(tokens)
+
+                pending = [key for key in pending if key not in tokens]
+            elif time.monotonic() > deadline:
+                return pending
+
+            if pending:
+                time.sleep(0.02)
+
+        return []
+
+    def lock_key(self, key):
+        return self.key(key) + b':lock'
+
+    # 여러 키의 SET NX lock 을 pipeline 으로 한 번에 잡고, 잡은 키들의 {key : token} 을 반환합니다.
+    # redis 를 사용할 수 없으면 None 을 반환합니다.
+    def lock_many(self, keys):
+        tokens = {key : uuid.uuid4().hex.encode('UTF-8') for key in keys}
+        if not tokens:
+            return {}
+
+        try:
+            replies = self.pipeline([
+                ['SET', self.lock_key(key), token, 'NX', 'PX', int(self.lock_timeout * 1000)] for key, token in tokens.items()
+            ])
+        except (OSError, RedisError):
+            self.errors += 1
+            return None
+
+        return {key : token for (key, token), reply in zip(tokens.items(), replies) if reply is not None}
+
+    # 내가 잡은 lock 일 때만 지웁니다. (lock_timeout 이 지나 다른 worker 가 잡은 lock 은 지우지 않습니다.)
+    def unlock_many(self, tokens):
+        if not tokens:
+            return
+
+        try:
+            self.pipeline([['EVAL', UNLOCK_SCRIPT, 1, self.lock_key(key), token] for key, token in tokens.items()])
+        except (OSError, RedisError):
+            self.errors += 1
+
+    def stats(self):
+        total = self.hits + self.misses
+
+        return {
+            'backend' : 'redis',
+            'hits' : self.hits,
+            'misses' : self.misses,
+            'errors' : self.errors,
+            'hit_rate' : self.hits / total if total else 0.0
+        }
+
+    def close(self):
+        self.pool.close()
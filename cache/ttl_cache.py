@@ -0,0 +1,68 @@
+# 최대 크기(LRU)와 만료시간(TTL)이 있는 메모리 캐시 파일입니다.
+# 가득 차면 가장 오래 안 쓰인 항목부터 지우고, 만료시간이 지난 항목은 읽을 때 지웁니다.
+
+# 가장 오래 안 쓰인 항목을 찾기 위한 OrderedDict
+from collections import OrderedDict
+# 여러 요청 스레드가 동시에 캐시를 읽고 쓰기 때문에 Lock 으로 보호합니다.
+from threading import Lock
+import time
+
+class TTLCache:
+
+    # max_size : 저장하는 최대 항목 수
+    # ttl      : 항목을 유지하는 기본 시간(초)
+    def __init__(self, max_size = 10000, ttl = 60):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.items = OrderedDict()
+        self.lock = Lock()
+        self.hits = 0
+        self.misses = 0
+
+    # 캐시된 값을 반환합니다. 없거나 만료되었으면 default 를 반환합니다.
+    def get(self, key, default = None):
+        with self.lock:
+            item = self.items.get(key)
+            if item is not None:
+                expires_at, value = item
+                if expires_at > time.monotonic():
+                    self.items.move_to_end(key)
+                    self.hits += 1
+                    return value
+
+                del self.items[key]
+
+            self.misses += 1
+            return default
+
+    # 값을 저장합니다. ttl 이 없으면 기본 ttl 을 사용합니다.
+    def set(self, key, value, ttl = None):
+        with self.lock:
+            self.items[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+            self.items.move_to_end(key)
+
+            while len(self.items) > self.max_size:
+                self.items.popitem(last = False)
+
+    def delete(self, key):
+        with self.lock:
+            self.items.pop(key, None)
+
+    def clear(self):
+        with self.lock:
+            self.items.clear()
+
+    def __len__(self):
+        return len(self.items)
+
+    # 캐시 적중 횟수와 적중률을 반환합니다.
+    def stats(self):
+        with self.lock:
+            total = self.hits + self.misses
+
+            return {
+                'size' : len(self.items),
+                'hits' : self.hits,
+                'misses' : self.misses,
+                'hit_rate' : self.hits / total if total else 0.0
+            }
@@ -1,5 +1,7 @@
 # 데이터베이스와 DB에 연결하는 URL 정보를 담은 config 파일.
 
+import os
+
 # DB를 연결하는 정보를 담은 배열
 db = {
     'user' : 'UserID',
@@ -12,8 +14,203 @@ db = {
 # DB URL
 DB_URL = f"mysql+mysqldb://{db['user']}:{db['password']}@{db['host']}:{db['port']}/{db['database']}?charset=utf8"
 
+# 커넥션 풀 설정
+# 풀에 유지하는 커넥션 수와 풀이 가득 찼을 때 추가로 만들 수 있는 커넥션 수
+DB_POOL_SIZE = 10
+DB_MAX_OVERFLOW = 10
+# 커넥션을 빌리기 위해 기다리는 최대 시간(초)
+DB_POOL_TIMEOUT = 10
+# 커넥션을 다시 만드는 주기(초). RDS 의 wait_timeout 보다 짧게 설정합니다.
+DB_POOL_RECYCLE = 3600
+# 커넥션을 빌려줄 때 연결이 살아있는지 확인합니다.
+DB_POOL_PRE_PING = True
+# worker 가 시작할 때 미리 만들어두는 커넥션 수. DB_POOL_SIZE 보다 크게 설정하지 않습니다.
+DB_WARM_CONNECTIONS = 1
+# ASGI 서버(asgi.py, serve.py --asgi)에서 동기식 service 함수를 실행하는 스레드 수.
+# None 이면 커넥션 풀의 최대 커넥션 수(DB_POOL_SIZE + DB_MAX_OVERFLOW)만큼 만듭니다.
+ASGI_THREADS = None
+# 테이블과 인덱스는 migrations 로 관리합니다. (python -m migrations upgrade)
+# 서버가 시작할 때 DB 의 schema 버전을 확인해서 적용되지 않은 migration 이 있으면 시작하지 않습니다.
+DB_CHECK_SCHEMA = True
+# 서버가 시작할 때 적용되지 않은 migration 들을 적용합니다. (개발 환경용. 운영 서버는 배포할 때 한 번 적용합니다.)
+DB_MIGRATE = False
+
+# 읽기 전용 DB(replica) 설정
+# 읽기 쿼리(타임라인, 로그인 정보 조회 등)를 보내는 replica 들의 DB URL 리스트. 비어있으면 primary 를 사용합니다.
+DB_REPLICA_URLS = []
+# replica 를 고르는 방식. 'round_robin' 또는 'least_connections'
+DB_REPLICA_STRATEGY = 'round_robin'
+# 쓰기를 한 뒤 해당 유저의 읽기를 primary 로 보내는 시간(초). replica 의 복제 지연보다 길게 설정합니다.
+# 여러 worker 로 실행하면 CACHE_BACKEND = 'redis' 로 모든 worker 가 쓰기 기록을 함께 사용해야 합니다.
+DB_READ_YOUR_WRITES_SECONDS = 5
+
+# 여러 worker 프로세스로 실행하는 서버(python serve.py) 설정
+# 앱을 실행하는 worker 프로세스 수. 1 보다 크면 프로세스 메모리의 timeline store 등을 사용하지 않습니다.
+# 한 프로세스로 실행하는 앱(flask run, 테스트)의 기본값이고, serve.py 는 --workers(기본값 cpu 수) 로 실제 worker 수를 설정합니다.
+SERVER_WORKERS = 1
+# worker 마다 요청을 처리하는 스레드 수 (gunicorn gthread worker).
+# None 이면 커넥션 풀의 최대 커넥션 수(DB_POOL_SIZE + DB_MAX_OVERFLOW)만큼 만듭니다.
+SERVER_THREADS = None
+# 종료할 때 worker 들이 처리중인 요청과 write-behind 큐를 마치기를 기다리는 최대 시간(초)
+SERVER_SHUTDOWN_TIMEOUT = 30
+
 # 유저의 비밀번호를 암/복호화를 위한 JWT secret 키
 JWT_SECRET_KEY = 'WriteSecretKey'
+# 검증한 액세스토큰을 만료시간까지 저장해두는 캐시의 최대 토큰 수
+TOKEN_CACHE_SIZE = 100000
+
+# 비밀번호 해시(bcrypt) 설정
+# bcrypt 의 cost. 1 증가할 때마다 해시 시간이 2배가 됩니다.
+BCRYPT_ROUNDS = 12
+# 해시를 처리하는 프로세스 수 (0 이면 요청 스레드에서 바로 처리)
+PASSWORD_HASH_WORKERS = os.cpu_count()
+# 동시에 처리중이거나 기다리는 해시 작업의 최대 수. 넘으면 로그인/회원가입에 503 으로 응답합니다.
+PASSWORD_HASH_QUEUE_SIZE = 64
+# queue 에 자리가 날 때까지 기다리는 최대 시간(초)
+PASSWORD_HASH_QUEUE_TIMEOUT = 0.1
+
+# 가입되지 않은 이메일로 로그인을 시도하면 DB 를 조회하지 않고 거절하는 시간(초)과 기억하는 최대 이메일 수
+# CACHE_BACKEND 가 'local' 이면 다른 worker 에서 가입한 이메일을 지울 수 없으므로 SERVER_WORKERS 가 1 일 때만 사용합니다.
+LOGIN_NEGATIVE_CACHE_TTL = 30
+LOGIN_NEGATIVE_CACHE_SIZE = 100000
+
+# /follow/batch, /unfollow/batch 로 한 번에 팔로우/언팔로우할 수 있는 최대 유저 수
+FOLLOW_BATCH_MAX = 100
+
+# /users/<id>/followers, /users/<id>/following?limit= 으로 한 번에 가져올 수 있는 최대 유저 수
+FOLLOW_PAGE_MAX = 100
+
+# /tweets/bulk 로 한 번에 저장할 수 있는 최대 트윗 수와, 한 번의 executemany 로 저장하는 트윗 수
+TWEET_BULK_MAX = 5000
+TWEET_BULK_CHUNK_SIZE = 1000
+
+# 타임라인 캐시(fan-out-on-write) 설정
+# CACHE_BACKEND 가 'redis' 이면 타임라인을 redis 에 저장해서 모든 worker 가 함께 사용합니다.
+# 'local' 이면 프로세스 메모리에 저장하기 때문에 SERVER_WORKERS 가 1 일 때만 사용합니다.
+# (worker 가 여러 개이면 다른 worker 가 작성한 트윗이 보이지 않으므로, 타임라인을 DB 에서 읽습니다.)
+# 유저 한 명의 타임라인에 저장하는 최대 트윗 수
+TIMELINE_STORE_SIZE = 800
+# 팔로워 수가 이 값보다 많은 유저는 fan-out 을 하지 않고, 타임라인을 읽을 때 트윗을 합칩니다.
+TIMELINE_FANOUT_LIMIT = 10000
+# 메모리에 저장하는 최대 타임라인 수 ('local' 일 때)
+TIMELINE_STORE_USERS = 100000
+# 저장된 타임라인을 DB 에서 다시 만들기까지의 시간(초)
+TIMELINE_STORE_TTL = 60
+# /timeline?limit= 으로 한 번에 가져올 수 있는 최대 트윗 수
+TIMELINE_PAGE_MAX = 100
+# 트윗 write-behind 설정
+# 켜면 /tweet 은 트윗을 디스크 큐(WRITE_BEHIND_DIR)에 기록하고 바로 202 로 응답하며,
+# 백그라운드 스레드가 큐의 트윗들을 WRITE_BEHIND_BATCH_SIZE 개씩 하나의 트랜잭션으로 DB 에 저장합니다.
+WRITE_BEHIND_ENABLED = False
+WRITE_BEHIND_DIR = 'write_behind'
+WRITE_BEHIND_BATCH_SIZE = 500
+# 큐가 비어있을 때 새로운 트윗을 기다리는 최대 시간(초)
+WRITE_BEHIND_INTERVAL = 0.05
+# segment 파일 하나의 최대 크기
+WRITE_BEHIND_SEGMENT_BYTES = 64 * 1024 * 1024
+# 트윗을 큐에 기록할 때마다 디스크에 기록(fsync)합니다. 끄면 빠르지만, 서버(OS)가 죽으면 최근 트윗을 잃을 수 있습니다.
+WRITE_BEHIND_FSYNC = True
+# 서비스 layer 의 캐시 설정 (로그인 실패한 이메일, 최근에 쓰기를 한 유저, 'redis' 일 때는 타임라인)
+# 'local' 은 worker(프로세스)마다 따로 저장하는 메모리 캐시, 'redis' 는 모든 worker 가 함께 사용하는 redis 서버
+# 로컬에서는 python -m cache.fake_redis 로 redis 대신 사용할 수 있는 서버를 실행할 수 있습니다.
+CACHE_BACKEND = 'local'
+CACHE_REDIS_URL = 'redis://localhost:6379/0'
+# redis 커넥션 풀의 최대 연결 수와 연결/응답을 기다리는 최대 시간(초)
+CACHE_REDIS_POOL_SIZE = 10
+CACHE_REDIS_TIMEOUT = 1.0
+# local 캐시의 최대 항목 수와 항목을 유지하는 기본 시간(초)
+CACHE_SIZE = 100000
+CACHE_TTL = 60
+# 유저별 팔로우 목록을 메모리에 저장해두는 follow graph cache 설정
+# 팔로우 목록들을 저장하는 최대 메모리(바이트, 0 이면 사용하지 않음)와 DB 에서 다시 읽기 전까지 유지하는 시간(초)
+# 프로세스 메모리에 저장하므로 다른 worker 의 팔로우/언팔로우를 알 수 없어서, SERVER_WORKERS 가 1 일 때만 사용합니다.
+FOLLOW_CACHE_BYTES = 64 * 1024 * 1024
+FOLLOW_CACHE_TTL = 60
+# 응답을 json 으로 인코딩하는 방식. 'auto' 는 orjson 이 설치되어 있으면 orjson, 없으면 파이썬 json 모듈을 사용합니다.
+# ('auto', 'orjson', 'json')
+JSON_BACKEND = 'auto'
+# /timeline?stream=1 로 타임라인을 나눠서 보낼 때, DB 에서 한 번에 가져오는 트윗 수
+TIMELINE_STREAM_BATCH_SIZE = 1000
+# instrumentation 설정
+# 켜면 응답에 구간별(db, bcrypt, json) 시간을 담은 Server-Timing 헤더를 붙이고,
+# /metrics 에서 Prometheus 형식으로 요청 수, 처리시간, SQL 실행 수와 시간, 커넥션 풀과 캐시 상태를 반환합니다.
+INSTRUMENTATION_ENABLED = False
+# 이 시간(초)보다 오래 걸린 요청의 스택을 sampling profiler 로 PROFILER_DIR 에 저장합니다. (0 이면 사용하지 않음)
+# 저장한 .folded 파일은 flamegraph.pl 이나 speedscope 로 볼 수 있습니다.
+PROFILER_SLOW_SECONDS = 0
+PROFILER_INTERVAL = 0.005
+PROFILER_DIR = 'profiles'
+PROFILER_MAX_FILES = 100
+# 개발/테스트용 query inspector 설정
+# 켜면 요청마다 실행한 SQL 을 검사해서 N+1 쿼리(값만 다른 같은 SQL 을 QUERY_REPEAT_THRESHOLD 번 이상 실행),
+# 느린 쿼리(QUERY_SLOW_SECONDS 초 이상, EXPLAIN 결과 포함), 엔드포인트별 쿼리 예산을 넘은 요청을 경고로 남기고,
+# 응답에 실행한 SQL 수(X-Query-Count)를 붙입니다. QUERY_BUDGET_STRICT 이면 예외가 발생합니다. (테스트가 실패합니다.)
+QUERY_INSPECTOR_ENABLED = False
+QUERY_BUDGET_STRICT = False
+QUERY_REPEAT_THRESHOLD = 5
+QUERY_SLOW_SECONDS = 0.1
+# 엔드포인트(함수 이름)별로 요청 하나가 실행할 수 있는 최대 SQL 수와, 목록에 없는 엔드포인트의 최대 SQL 수
+# 팔로우/언팔로우와 프로필은 카운터가 없는 유저의 팔로워/팔로잉 수를 처음 한 번 세는 SQL 까지 포함합니다.
+# 트윗은 해시태그와 멘션을 저장하는 SQL 까지 포함합니다.
+QUERY_BUDGETS = {
+    'login' : 1,
+    'sign_up' : 2,
+    'tweet' : 4,
+    'bulk_tweet' : 6,
+    'follow' : 7,
+    'unfollow' : 7,
+    'follow_batch' : 8,
+    'unfollow_batch' : 8,
+    'user_profile' : 6,
+    'followers' : 1,
+    'following' : 1,
+    'timeline' : 3,
+    'search' : 2,
+    'trending' : 1,
+    'suggestions' : 1
+}
+QUERY_DEFAULT_BUDGET = 10
+# 트윗 검색(/search?q=) 설정
+# 트윗의 단어(영어 단어, 한글은 두 글자씩)별 트윗 id 목록을 메모리 역색인에 저장해서 LIKE 검색 없이 최신 트윗부터 찾습니다.
+# SEARCH_INDEX_PATH 가 있으면 시작할 때 색인 파일을 읽고 종료할 때 저장합니다. 없으면 처음 검색할 때 DB 의 모든 트윗을 색인합니다.
+# 색인 파일은 python -m model.search_index --output search_index.bin 으로 미리 만들 수 있습니다.
+SEARCH_ENABLED = True
+SEARCH_INDEX_PATH = None
+# 다른 worker 나 write-behind 로 저장된 트윗을 DB 에서 가져와서 색인하는 주기(초)
+SEARCH_SYNC_INTERVAL = 1.0
+# sync 할 때 마지막으로 읽은 트윗 id 보다 이 수만큼 작은 id 부터 다시 읽습니다.
+# 트윗 id 는 저장(commit) 순서와 다를 수 있기 때문에, 먼저 id 를 받고 늦게 저장된 트윗(다른 worker, /tweets/bulk, write-behind)을 찾습니다.
+# 그 사이에 저장되는 트윗 수보다 크게 설정합니다.
+SEARCH_SYNC_OVERLAP = 1000
+# /search?limit= 으로 한 번에 가져올 수 있는 최대 트윗 수
+SEARCH_PAGE_MAX = 100
+# 해시태그/멘션 trending(/trending) 설정
+# 트윗을 저장할 때 #해시태그와 @멘션을 tweet_hashtags, tweet_mentions 테이블에 함께 저장하고,
+# 최근 TRENDING_WINDOW 초 동안 많이 쓰인 해시태그와 멘션을 메모리의 count-min sketch 로 셉니다.
+TRENDING_ENABLED = True
+TRENDING_WINDOW = 3600
+# window 를 나누는 구간 수. 구간이 끝날 때마다 가장 오래된 구간의 횟수가 빠집니다.
+TRENDING_BUCKETS = 12
+# count-min sketch 의 칸 수와 해시 함수 수. 메모리는 2(해시태그, 멘션) * BUCKETS * DEPTH * WIDTH * 4 바이트입니다.
+TRENDING_SKETCH_WIDTH = 4096
+TRENDING_SKETCH_DEPTH = 4
+# 순위 후보로 기억하는 최대 해시태그/멘션 수
+TRENDING_CANDIDATES = 200
+# 새로 저장된 해시태그와 멘션을 DB 에서 가져오는 주기(초)
+TRENDING_SYNC_INTERVAL = 1.0
+# sync 할 때 마지막으로 읽은 트윗 id 보다 이 수만큼 작은 id 부터 다시 읽어서, 늦게 저장된 트윗의 해시태그와 멘션도 셉니다. (SEARCH_SYNC_OVERLAP 과 같습니다.)
+TRENDING_SYNC_OVERLAP = 1000
+# /trending?limit= 으로 한 번에 가져올 수 있는 최대 수
+TRENDING_MAX = 50
+# 팔로우 추천(/suggestions) 설정
+# 배치 작업(python -m model.follow_suggestions)이 유저마다 SUGGESTIONS_PER_USER 명의 친구의 친구를 follow_suggestions 테이블에 저장합니다.
+SUGGESTIONS_PER_USER = 50
+# 이 수보다 많이 팔로우한 유저는 추천의 근거로 사용하지 않습니다.
+SUGGESTIONS_MAX_FANOUT = 5000
+# /suggestions?limit= 으로 한 번에 가져올 수 있는 최대 유저 수
+SUGGESTIONS_PAGE_MAX = 50
+# 타임라인 쿼리 방식. 'union' (내 트윗 UNION 팔로우한 유저들의 트윗) 또는 기존의 'join'
+TIMELINE_QUERY_MODE = 'union'
 
 # TEST DB를 연결하는 정보를 담은 배열
 test_db = {
@@ -27,6 +224,11 @@ test_db = {
 # TEST DB URL
 test_config = {
     'DB_URL' : f"mysql+mysqldb://{test_db['user']}:{test_db['password']}@{test_db['host']}:{test_db['port']}/{test_db['database']}?charset=utf8",
-    'JWT_SECRET_KEY' : 'WriteSecretKey'
+    'JWT_SECRET_KEY' : 'WriteSecretKey',
+    # 테스트에서는 N+1 쿼리나 쿼리 예산을 넘은 엔드포인트가 있으면 테스트가 실패합니다.
+    'QUERY_INSPECTOR_ENABLED' : True,
+    'QUERY_BUDGET_STRICT' : True,
+    'QUERY_BUDGETS' : QUERY_BUDGETS,
+    'QUERY_DEFAULT_BUDGET' : QUERY_DEFAULT_BUDGET
 }
 
@@ -0,0 +1,25 @@
+# 요청별 처리시간, SQL 과 bcrypt, json 인코딩 시간을 기록하고
+# Server-Timing 헤더, Prometheus 형식의 /metrics, 느린 요청의 sampling profile 로 보여주는 파일입니다.
+
+from .registry import MetricsRegistry, Counter, Histogram
+from .request_timing import RequestTiming, current_timing, record, timed
+from .profiler import SamplingProfiler, Profile
+from .instrumentation import Instrumentation
+from .collectors import pool_metrics, cache_metrics, follow_cache_metrics, write_behind_metrics
+
+__all__ = [
+    'MetricsRegistry',
+    'Counter',
+    'Histogram',
+    'RequestTiming',
+    'current_timing',
+    'record',
+    'timed',
+    'SamplingProfiler',
+    'Profile',
+    'Instrumentation',
+    'pool_metrics',
+    'cache_metrics',
+    'follow_cache_metrics',
+    'write_behind_metrics'
+]
@@ -0,0 +1,63 @@
+# 다른 곳에서 이미 세고 있는 값들을 /metrics 를 요청할 때 읽어오는 collector 함수들입니다.
+# 각 함수는 Instrumentation.add_collector 에 넘겨줄 collect() 함수를 반환합니다.
+
+# DB 커넥션 풀 상태 (Database.pool_status). replica 가 있으면 db="replica-N" label 로 함께 반환합니다.
+def pool_metrics(database):
+    def collect():
+        status = database.pool_status()
+        pools = [('primary', status)] + [(f'replica-{index}', replica) for index, replica in enumerate(status.get('replicas', []))]
+
+        metrics = [
+            ('sns_db_pool_checkouts_total', 'counter', '커넥션 풀에서 커넥션을 빌린 횟수', 'checkouts'),
+            ('sns_db_pool_timeouts_total', 'counter', '커넥션을 빌리지 못하고 시간이 초과된 횟수', 'timeouts'),
+            ('sns_db_pool_wait_seconds_total', 'counter', '커넥션을 빌리기 위해 기다린 시간(초)', 'wait_seconds_total'),
+            ('sns_db_pool_checked_out', 'gauge', '사용중인 커넥션 수', 'checked_out'),
+            ('sns_db_pool_overflow', 'gauge', '풀 크기를 넘어서 만든 커넥션 수', 'overflow')
+        ]
+
+        return [(name, kind, help, [({'db' : db}, pool[key]) for db, pool in pools if key in pool])
+                for name, kind, help, key in metrics]
+
+    return collect
+
+# 서비스 layer 캐시(LocalCache, RedisCache)의 적중 횟수
+def cache_metrics(cache):
+    def collect():
+        stats = cache.stats()
+        labels = {'backend' : stats.get('backend', '')}
+
+        return [
+            ('sns_cache_hits_total', 'counter', '캐시 적중 횟수', [(labels, stats.get('hits', 0))]),
+            ('sns_cache_misses_total', 'counter', '캐시에 없어서 찾지 못한 횟수', [(labels, stats.get('misses', 0))]),
+            ('sns_cache_errors_total', 'counter', '캐시 서버에 연결하지 못한 횟수', [(labels, stats.get('errors', 0))])
+        ]
+
+    return collect
+
+# 팔로우 목록 캐시(FollowGraphCache)의 사용중인 메모리와 적중 횟수
+def follow_cache_metrics(follow_cache):
+    def collect():
+        stats = follow_cache.stats()
+
+        return [
+            ('sns_follow_cache_users', 'gauge', '팔로우 목록을 저장한 유저 수', [({}, stats['users'])]),
+            ('sns_follow_cache_bytes', 'gauge', '팔로우 목록들이 사용중인 메모리(바이트)', [({}, stats['bytes'])]),
+            ('sns_follow_cache_hits_total', 'counter', '팔로우 목록 캐시 적중 횟수', [({}, stats['hits'])]),
+            ('sns_follow_cache_misses_total', 'counter', '팔로우 목록을 DB 에서 읽은 횟수', [({}, stats['misses'])])
+        ]
+
+    return collect
+
+# write-behind 큐(TweetWriter)에 쌓인 크기와 저장한 트윗 수
+def write_behind_metrics(writer):
+    def collect():
+        stats = writer.stats()
+
+        return [
+            ('sns_write_behind_backlog_bytes', 'gauge', '큐에 쌓여서 아직 DB 에 저장하지 않은 트윗들의 크기(바이트)', [({}, stats['backlog_bytes'])]),
+            ('sns_write_behind_written_total', 'counter', '큐에서 DB 에 저장한 트윗 수', [({}, stats['written'])]),
+            ('sns_write_behind_failures_total', 'counter', 'DB 에 저장하지 못한 횟수', [({}, stats['failures'])]),
+            ('sns_write_behind_dead_letters_total', 'counter', '저장할 수 없어서 dead letter 파일로 옮긴 트윗 수', [({}, stats['dead_letters'])])
+        ]
+
+    return collect
@@ -0,0 +1,119 @@
+# 요청별 처리시간과 SQL, bcrypt, json 인코딩 시간을 기록하는 instrumentation 파일입니다.
+# config 의 INSTRUMENTATION_ENABLED 로 켜며, 켜면
+#   - 모든 응답에 구간별 시간을 담은 Server-Timing 헤더를 붙이고,
+#   - /metrics 에서 Prometheus 텍스트 형식으로 요청 수, 처리시간, SQL 실행 수와 시간 등을 반환하고,
+#   - PROFILER_SLOW_SECONDS 가 주어지면 느린 요청의 스택을 sampling profiler 로 저장합니다.
+# flask(view.create_endpoints)와 ASGI(view.asgi) 가 같은 Instrumentation 을 사용합니다.
+
+import time
+
+# SQL 실행 시간을 측정하기 위한 sqlalchemy 엔진 이벤트
+from sqlalchemy import event
+
+from .registry import MetricsRegistry
+from .request_timing import start_request, finish_request, record
+from .profiler import SamplingProfiler
+
+class Instrumentation:
+
+    # profiler : 느린 요청의 스택을 저장하는 SamplingProfiler (없으면 사용하지 않음)
+    def __init__(self, profiler = None):
+        self.profiler = profiler
+        self.registry = MetricsRegistry()
+
+        self.requests = self.registry.counter(
+            'sns_requests_total', '처리한 요청 수', ('method', 'route', 'status'))
+        self.request_seconds = self.registry.histogram(
+            'sns_request_duration_seconds', '요청 처리시간(초)', ('method', 'route'))
+        self.phase_seconds = self.registry.counter(
+            'sns_request_phase_seconds_total', '요청을 처리하는 동안 구간(db, bcrypt, json)별로 사용한 시간(초)', ('phase',))
+        self.sql_statements = self.registry.counter(
+            'sns_sql_statements_total', '실행한 SQL 수', ())
+        self.sql_per_request = self.registry.histogram(
+            'sns_sql_statements_per_request', '요청 하나가 실행한 SQL 수', ('route',),
+            buckets = (0, 1, 2, 3, 5, 10, 20, 50, 100))
+
+    # config 의 INSTRUMENTATION_ENABLED 가 켜져 있으면 Instrumentation 을 만듭니다. 꺼져 있으면 None 을 반환합니다.
+    @classmethod
+    def from_config(cls, config):
+        if not config.get('INSTRUMENTATION_ENABLED', False):
+            return None
+
+        profiler = None
+        if config.get('PROFILER_SLOW_SECONDS'):
+            profiler = SamplingProfiler(
+                interval = config.get('PROFILER_INTERVAL', 0.005),
+                slow_seconds = config.get('PROFILER_SLOW_SECONDS'),
+                directory = config.get('PROFILER_DIR', 'profiles'),
+                max_files = config.get('PROFILER_MAX_FILES', 100)
+            )
+
+        return cls(profiler)
+
+    # 엔진이 실행하는 SQL 의 수와 시간을 현재 요청과 /metrics 에 기록합니다.
+    def instrument_engine(self, engine):
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            conn.info.setdefault('query_start', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            seconds = time.perf_counter() - conn.info['query_start'].pop()
+            record('db', seconds)
+            self.sql_statements.inc()
+
+    # 다른 곳에서 세고 있는 값들(커넥션 풀, 캐시, write-behind 큐 등)을 /metrics 에 함께 반환합니다.
+    def add_collector(self, collect):
+        self.registry.add_collector(collect)
+
+    # 요청을 시작할 때 호출합니다. 요청이 끝나면 반환된 (timing, token) 으로 end_request 를 호출합니다.
+    # thread 가 False 이면 현재 스레드의 스택은 읽지 않습니다. (ASGI 는 이벤트 루프 스레드가 여러 요청을 함께 처리하므로,
+    # 스레드 풀에서 실행할 때 attach_thread 로 해당 스레드만 읽습니다.)
+    def begin_request(self, thread = True):
+        timing, token = start_request()
+        if self.profiler is not None:
+            timing.profile = self.profiler.start()
+            if thread:
+                self.profiler.attach(timing.profile)
+
+        return timing, token
+
+    # 요청이 끝났을 때 처리시간과 구간별 시간을 기록합니다.
+    # route 는 /users/<int:user_id> 처럼 url 규칙을 사용해서, 유저마다 다른 label 이 생기지 않게 합니다.
+    def end_request(self, timing, token, method, route, status):
+        seconds = timing.elapsed()
+        finish_request(token)
+
+        self.requests.inc(method = method, route = route, status = status)
+        self.request_seconds.observe(seconds, method = method, route = route)
+        for name, (phase_seconds, count) in timing.phases.items():
+            self.phase_seconds.inc(phase_seconds, phase = name)
+        self.sql_per_request.observe(timing.phases.get('db', (0, 0))[1], route = route)
+
+        if timing.profile is not None:
+            self.profiler.detach()
+            self.profiler.finish(timing.profile, seconds, f'{method} {route}')
+
+    # 스레드 풀의 스레드가 요청을 처리하는 동안 profiler 가 해당 스레드의 스택도 읽게 합니다. (ASGI 의 run_sync)
+    def attach_thread(self, timing):
+        if timing is not None and timing.profile is not None:
+            self.profiler.attach(timing.profile)
+
+    def detach_thread(self, timing):
+        if timing is not None and timing.profile is not None:
+            self.profiler.detach()
+
+    # json 인코딩 시간을 현재 요청에 기록하는 encoder 클래스를 만듭니다.
+    def timed_json_encoder(self, encoder):
+        def encode(encoder_self, obj):
+            start = time.perf_counter()
+            try:
+                return encoder.encode(encoder_self, obj)
+            finally:
+                record('json', time.perf_counter() - start)
+
+        return type('Timed' + encoder.__name__, (encoder,), {'encode' : encode})
+
+    # Prometheus 텍스트 형식의 /metrics 응답
+    def render(self):
+        return self.registry.render()
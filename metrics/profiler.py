@@ -0,0 +1,139 @@
+# 처리시간이 긴(느린) 요청의 스택을 기록하는 sampling profiler 파일입니다.
+# 백그라운드 스레드가 interval 초마다 요청을 처리중인 스레드들의 스택(sys._current_frames)을 읽어서 횟수를 세고,
+# 요청이 slow_seconds 보다 오래 걸렸으면 스택들을 directory 에 folded 형식으로 저장합니다.
+# 요청 스레드의 코드를 바꾸지 않고 밖에서 읽기 때문에, 요청 처리시간에는 거의 영향을 주지 않습니다.
+#
+# folded 형식) 한 줄에 "함수1;함수2;함수3 샘플수" 이며, flamegraph.pl 이나 speedscope 로 flamegraph 를 볼 수 있습니다.
+#   flamegraph.pl profiles/20240101-120000-timeline-1234ms.folded > timeline.svg
+
+from collections import Counter
+from threading import Event, Lock, Thread, get_ident
+import os
+import re
+import sys
+import time
+
+# 요청 하나의 샘플들
+class Profile:
+    def __init__(self):
+        self.stacks = Counter()
+        self.samples = 0
+
+# 스택 하나를 "파일:함수;파일:함수" 로 만듭니다. 바깥쪽 함수부터 적습니다.
+def fold_stack(frame):
+    names = []
+    while frame is not None:
+        code = frame.f_code
+        names.append(f'{os.path.basename(code.co_filename)}:{code.co_name}')
+        frame = frame.f_back
+
+    return ';'.join(reversed(names))
+
+class SamplingProfiler:
+
+    # interval     : 스택을 읽는 주기(초)
+    # slow_seconds : 이 시간보다 오래 걸린 요청의 스택만 저장합니다.
+    # directory    : folded 파일을 저장하는 디렉토리
+    # max_files    : 저장하는 최대 파일 수. 넘으면 오래된 파일부터 지웁니다.
+    def __init__(self, interval = 0.005, slow_seconds = 1.0, directory = 'profiles', max_files = 100):
+        self.interval = interval
+        self.slow_seconds = slow_seconds
+        self.directory = directory
+        self.max_files = max_files
+
+        # 스레드 id -> 해당 스레드가 처리중인 요청의 Profile
+        self.threads = {}
+        self.lock = Lock()
+        self.active = Event()
+        self.thread = None
+        self.pid = None
+        self.dumped = 0
+
+    # 새로운 요청의 Profile 을 만듭니다.
+    def start(self):
+        self.ensure_thread()
+
+        return Profile()
+
+    # 현재 스레드가 profile 의 요청을 처리하는 동안 스택을 읽습니다.
+    # ASGI 는 요청 하나가 여러 스레드(스레드 풀)에서 실행되므로 스레드마다 attach/detach 합니다.
+    def attach(self, profile):
+        with self.lock:
+            self.threads[get_ident()] = profile
+        self.active.set()
+
+    def detach(self):
+        with self.lock:
+            self.threads.pop(get_ident(), None)
+
+    # 요청이 끝났을 때 호출합니다. 요청이 slow_seconds 보다 오래 걸렸으면 스택들을 파일로 저장하고 경로를 반환합니다.
+    def finish(self, profile, seconds, name):
+        if seconds < self.slow_seconds or not profile.samples:
+            return None
+
+        return self.dump(profile, seconds, name)
+
+    def dump(self, profile, seconds, name):
+        os.makedirs(self.directory, exist_ok = True)
+        name = re.sub(r'[^A-Za-z0-9_.-]+', '_', name).strip('_') or 'request'
+        path = os.path.join(self.directory, f"{time.strftime('%Y%m%d-%H%M%S')}-{name}-{int(seconds * 1000)}ms.folded")
+
+        with open(path, 'w') as f:
+            for stack, count in profile.stacks.most_common():
+                f.write(f'{stack} {count}\n')
+
+        self.dumped += 1
+        self.remove_old_files()
+
+        return path
+
+    def remove_old_files(self):
+        paths = sorted(
+            (os.path.join(self.directory, name) for name in os.listdir(self.directory) if name.endswith('.folded')),
+            key = os.path.getmtime
+        )
+        for path in paths[:max(0, len(paths) - self.max_files)]:
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+
+    # 스택을 읽는 백그라운드 스레드를 시작합니다. fork 된 자식 프로세스에서는 스레드를 새로 만듭니다.
+    def ensure_thread(self):
+        if self.pid == os.getpid():
+            return
+
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+
+            self.pid = os.getpid()
+            self.threads = {}
+            self.thread = Thread(target = self.run, name = 'sampling-profiler', daemon = True)
+            self.thread.start()
+
+    def run(self):
+        while True:
+            # 처리중인 요청이 없으면 다음 요청이 올 때까지 기다립니다.
+            with self.lock:
+                threads = dict(self.threads)
+                if not threads:
+                    self.active.clear()
+            if not threads:
+                self.active.wait()
+                continue
+
+            frames = sys._current_frames()
+            for thread_id, profile in threads.items():
+                frame = frames.get(thread_id)
+                if frame is not None:
+                    profile.stacks[fold_stack(frame)] += 1
+                    profile.samples += 1
+
+            time.sleep(self.interval)
+
+    def stats(self):
+        return {
+            'active_threads' : len(self.threads),
+            'dumped' : self.dumped
+        }
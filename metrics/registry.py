@@ -0,0 +1,135 @@
+# Prometheus 텍스트 형식(/metrics)으로 내보내는 counter, histogram 을 저장하는 파일입니다.
+# prometheus_client 없이, 이 서버가 사용하는 counter 와 histogram 만 구현합니다.
+#
+# 형식)
+#   # HELP sns_requests_total 처리한 요청 수
+#   # TYPE sns_requests_total counter
+#   sns_requests_total{method="GET",route="/timeline",status="200"} 3
+
+from threading import Lock
+
+# 요청 처리시간(초)을 나누는 기본 histogram 구간
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# label 값의 \, ", 줄바꿈을 이스케이프합니다.
+def escape_label(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+# {"a": 1, "b": 2} -> {a="1",b="2"}
+def format_labels(labels):
+    if not labels:
+        return ''
+
+    return '{' + ','.join(f'{name}="{escape_label(value)}"' for name, value in labels) + '}'
+
+def format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+# label 별로 증가하기만 하는 값 (요청 수, SQL 실행 시간의 합 등)
+class Counter:
+    kind = 'counter'
+
+    def __init__(self, name, help, labels = ()):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.values = {}
+        self.lock = Lock()
+
+    def inc(self, value = 1, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self.lock:
+            self.values[key] = self.values.get(key, 0) + value
+
+    def samples(self):
+        with self.lock:
+            values = list(self.values.items())
+
+        return [(self.name, list(zip(self.labels, key)), value) for key, value in sorted(values)]
+
+# label 별로 값들의 분포(구간별 개수, 합, 개수)를 저장합니다. (요청 처리시간 등)
+class Histogram:
+    kind = 'histogram'
+
+    def __init__(self, name, help, labels = (), buckets = DEFAULT_BUCKETS):
+        self.name = name
+        self.help = help
+        self.labels = tuple(labels)
+        self.buckets = tuple(sorted(buckets))
+        self.values = {}
+        self.lock = Lock()
+
+    def observe(self, value, **labels):
+        key = tuple(labels.get(name, '') for name in self.labels)
+        with self.lock:
+            item = self.values.get(key)
+            if item is None:
+                item = self.values[key] = [[0] * len(self.buckets), 0.0, 0]
+
+            for index, bound in enumerate(self.buckets):
+                if value <= bound:
+                    item[0][index] += 1
+                    break
+            item[1] += value
+            item[2] += 1
+
+    def samples(self):
+        with self.lock:
+            values = [(key, list(counts), total, count) for key, (counts, total, count) in self.values.items()]
+
+        samples = []
+        for key, counts, total, count in sorted(values):
+            labels = list(zip(self.labels, key))
+
+            # prometheus 의 histogram 구간은 해당 값 이하인 값들의 누적 개수입니다.
+            cumulative = 0
+            for bound, bucket_count in zip(self.buckets, counts):
+                cumulative += bucket_count
+                samples.append((self.name + '_bucket', labels + [('le', format_value(float(bound)))], cumulative))
+            samples.append((self.name + '_bucket', labels + [('le', '+Inf')], count))
+            samples.append((self.name + '_sum', labels, total))
+            samples.append((self.name + '_count', labels, count))
+
+        return samples
+
+# counter, histogram 과 /metrics 를 요청할 때 값을 읽어오는 collector 들을 모아서 텍스트로 만듭니다.
+class MetricsRegistry:
+    def __init__(self):
+        self.metrics = []
+        self.collectors = []
+
+    def counter(self, name, help, labels = ()):
+        metric = Counter(name, help, labels)
+        self.metrics.append(metric)
+        return metric
+
+    def histogram(self, name, help, labels = (), buckets = DEFAULT_BUCKETS):
+        metric = Histogram(name, help, labels, buckets)
+        self.metrics.append(metric)
+        return metric
+
+    # collect() 는 (이름, 종류('gauge', 'counter'), 설명, [(labels dict, 값), ...]) 리스트를 반환하는 함수입니다.
+    # 커넥션 풀, 캐시, write-behind 큐처럼 이미 다른 곳에서 세고 있는 값들을 /metrics 를 요청할 때 읽어옵니다.
+    def add_collector(self, collect):
+        self.collectors.append(collect)
+
+    def render(self):
+        lines = []
+
+        for metric in self.metrics:
+            lines.append(f'# HELP {metric.name} {metric.help}')
+            lines.append(f'# TYPE {metric.name} {metric.kind}')
+            for name, labels, value in metric.samples():
+                lines.append(f'{name}{format_labels(labels)} {format_value(value)}')
+
+        for collect in self.collectors:
+            for name, kind, help, values in collect():
+                lines.append(f'# HELP {name} {help}')
+                lines.append(f'# TYPE {name} {kind}')
+                for labels, value in values:
+                    lines.append(f'{name}{format_labels(sorted(labels.items()))} {format_value(value)}')
+
+        return '\n'.join(lines) + '\n'
@@ -0,0 +1,73 @@
+# 요청 하나를 처리하는 동안 구간별(SQL, bcrypt, json 인코딩) 시간을 모으는 파일입니다.
+# 현재 요청의 RequestTiming 은 contextvar 에 저장하기 때문에,
+# model, service layer 에서는 요청 객체를 넘겨받지 않고 record() 나 timed() 로 기록합니다.
+# (flask 는 요청 스레드마다, ASGI 는 요청 task 마다 따로 저장되며, 스레드 풀에서 실행한 함수에도 전달됩니다.)
+# 처리중인 요청이 없으면(instrumentation 을 끄거나 백그라운드 스레드에서 호출하면) 아무것도 기록하지 않습니다.
+
+from contextlib import contextmanager
+from contextvars import ContextVar
+import time
+
+current_timing = ContextVar('current_timing', default = None)
+
+class RequestTiming:
+    def __init__(self):
+        self.start = time.perf_counter()
+        # 구간 이름 -> [시간(초), 횟수]
+        self.phases = {}
+        # 요청을 sampling profiler 로 기록하고 있으면 해당 Profile
+        self.profile = None
+
+    def add(self, name, seconds):
+        phase = self.phases.get(name)
+        if phase is None:
+            phase = self.phases[name] = [0.0, 0]
+
+        phase[0] += seconds
+        phase[1] += 1
+
+    def elapsed(self):
+        return time.perf_counter() - self.start
+
+    # Server-Timing 헤더 값. 예) db;dur=3.1;desc="2 queries", bcrypt;dur=250.4, json;dur=0.2, total;dur=255.0
+    # 브라우저 개발자도구의 Network > Timing 에서 구간별 시간으로 볼 수 있습니다.
+    def server_timing(self):
+        parts = []
+        for name, (seconds, count) in self.phases.items():
+            part = f'{name};dur={seconds * 1000:.1f}'
+            if name == 'db':
+                part += f';desc="{count} queries"'
+            parts.append(part)
+        parts.append(f'total;dur={self.elapsed() * 1000:.1f}')
+
+        return ', '.join(parts)
+
+# 새로운 요청의 RequestTiming 을 만들어서 현재 요청으로 설정합니다.
+# 요청이 끝나면 반환된 token 으로 finish_request 를 호출합니다.
+def start_request():
+    timing = RequestTiming()
+
+    return timing, current_timing.set(timing)
+
+def finish_request(token):
+    current_timing.reset(token)
+
+# 현재 요청에 구간 시간을 더합니다.
+def record(name, seconds):
+    timing = current_timing.get()
+    if timing is not None:
+        timing.add(name, seconds)
+
+# with timed('bcrypt'): ... 로 감싼 코드의 시간을 현재 요청에 더합니다.
+@contextmanager
+def timed(name):
+    timing = current_timing.get()
+    if timing is None:
+        yield
+        return
+
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        timing.add(name, time.perf_counter() - start)
@@ -0,0 +1,104 @@
+# DB 테이블과 인덱스를 버전별 migration 으로 관리하는 파일입니다.
+# 서버가 시작할 때마다 create_all 로 모든 테이블을 DB 에서 확인하지 않고, schema_version 테이블의 버전만 한 번 조회합니다.
+#   python -m migrations status    : DB 의 버전과 적용되지 않은 migration 들을 출력합니다.
+#   python -m migrations upgrade   : 적용되지 않은 migration 들을 차례대로 적용합니다.
+#
+# - migration 하나는 v0001_core_tables.py 처럼 버전 순서대로 이름 붙인 모듈이며, version, description, upgrade(connection) 을 가집니다.
+#   테이블과 인덱스는 repository ORM 과 따로 migration 파일에 적어두기 때문에, 인덱스를 바꾸려면 새 migration 을 추가합니다.
+# - MySQL 은 DDL 을 트랜잭션으로 되돌릴 수 없기 때문에, migration 은 없는 테이블과 인덱스만 만들어서 여러 번 실행해도 안전하게 만듭니다.
+#   (create_all 로 테이블을 만들던 기존 DB 에도 그대로 적용할 수 있습니다.)
+# - 적용한 migration 마다 schema_version 에 버전을 기록합니다. DB 의 버전은 기록된 가장 큰 버전입니다.
+
+from sqlalchemy import MetaData, Table, Column, Integer, String, select, func, inspect, text, exc
+# SQLAlchemy에서 mysql에서 사용하는 TIMESTAMP 모듈을 불러옵니다.
+from sqlalchemy.dialects.mysql import TIMESTAMP
+
+# DB 에 적용한 migration 버전들을 기록하는 테이블
+schema_version = Table(
+    'schema_version', MetaData(),
+    Column('version', Integer, primary_key = True, autoincrement = False, nullable = False),
+    Column('description', String(255), nullable = False),
+    Column('applied_at', TIMESTAMP, nullable = False, server_default = text('CURRENT_TIMESTAMP'))
+)
+
+# DB 의 schema 버전이 코드가 필요로 하는 버전보다 낮을 때 발생하는 예외
+class SchemaVersionError(Exception):
+    pass
+
+# 테이블이 없으면 인덱스와 함께 만듭니다.
+def create_table(connection, table):
+    table.create(connection, checkfirst = True)
+
+# 인덱스가 없으면 만듭니다. 테이블이 이미 있던 DB 에 새 인덱스를 추가할 때 사용합니다.
+def create_index(connection, index):
+    names = {existing['name'] for existing in inspect(connection).get_indexes(index.table.name)}
+    if index.name not in names:
+        index.create(connection)
+
+# MySQL 에서만 사용하는 컬럼 기본값. SQLite(벤치마크, 로컬 테스트용)는 ON UPDATE 를 이해하지 못하므로 기본값 없이 만듭니다.
+def mysql_default(connection, default):
+    return text(default) if connection.dialect.name == 'mysql' else None
+
+from . import v0001_core_tables, v0002_user_follow_counts, v0003_tweet_entities, v0004_follow_suggestions
+
+# 버전 순서대로 정렬한 migration 들. 새 migration 은 모듈을 추가하고 여기에 등록합니다.
+MIGRATIONS = [
+    v0001_core_tables,
+    v0002_user_follow_counts,
+    v0003_tweet_entities,
+    v0004_follow_suggestions
+]
+
+# 코드가 필요로 하는 schema 버전
+LATEST_VERSION = MIGRATIONS[-1].version
+
+# DB 에 적용된 가장 큰 migration 버전. schema_version 테이블이 없으면 0 입니다.
+# 테이블이 있는지 먼저 확인하지 않고 바로 조회해서, 최신 DB 에서는 쿼리 한 번으로 끝납니다.
+def current_version(connection):
+    try:
+        return connection.execute(select([func.max(schema_version.c.version)])).scalar() or 0
+    except exc.DBAPIError:
+        if connection.dialect.has_table(connection, schema_version.name):
+            raise
+        return 0
+
+# DB 의 버전이 LATEST_VERSION 보다 낮으면 SchemaVersionError 를 발생시킵니다. 서버가 시작할 때 호출합니다.
+# (새 코드가 먼저 migration 을 적용한 DB 에서 이전 코드가 실행될 수 있도록, 버전이 더 높은 DB 는 허용합니다.)
+def check_schema(engine):
+    with engine.connect() as connection:
+        version = current_version(connection)
+
+    if version < LATEST_VERSION:
+        raise SchemaVersionError(
+            f'database schema is at version {version} but version {LATEST_VERSION} is required, run "python -m migrations upgrade"'
+        )
+
+    return version
+
+# 적용되지 않은 migration 들을 target 버전(None 이면 마지막 버전)까지 차례대로 적용하고, 적용한 migration 들을 반환합니다.
+# migration 마다 하나의 트랜잭션으로 적용하고 버전을 기록합니다.
+def upgrade(engine, target = None):
+    target = LATEST_VERSION if target is None else target
+
+    with engine.begin() as connection:
+        create_table(connection, schema_version)
+        version = current_version(connection)
+
+    applied = []
+    for migration in MIGRATIONS:
+        if version < migration.version <= target:
+            with engine.begin() as connection:
+                migration.upgrade(connection)
+                connection.execute(schema_version.insert(), version = migration.version, description = migration.description)
+            applied.append(migration)
+
+    return applied
+
+__all__ = [
+    'MIGRATIONS',
+    'LATEST_VERSION',
+    'SchemaVersionError',
+    'current_version',
+    'check_schema',
+    'upgrade'
+]
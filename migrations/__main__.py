@@ -0,0 +1,40 @@
+# DB 에 migration 을 적용하는 명령어 파일입니다.
+#   python -m migrations status  [--db-url ...]
+#   python -m migrations upgrade [--db-url ...] [--to VERSION]
+
+import argparse
+import time
+
+from sqlalchemy import create_engine
+
+from . import MIGRATIONS, LATEST_VERSION, current_version, upgrade
+
+def main():
+    import config
+
+    parser = argparse.ArgumentParser(prog = 'python -m migrations', description = 'show or apply database schema migrations')
+    parser.add_argument('command', choices = ['status', 'upgrade'])
+    parser.add_argument('--db-url', default = config.DB_URL)
+    parser.add_argument('--to', type = int, default = None, help = 'upgrade only up to this version')
+    args = parser.parse_args()
+
+    engine = create_engine(args.db_url, encoding = 'utf-8')
+
+    if args.command == 'status':
+        with engine.connect() as connection:
+            version = current_version(connection)
+
+        print(f'database schema version {version}, latest {LATEST_VERSION}')
+        for migration in MIGRATIONS:
+            if migration.version > version:
+                print(f'  pending {migration.version}: {migration.description}')
+        return
+
+    start = time.perf_counter()
+    applied = upgrade(engine, args.to)
+    for migration in applied:
+        print(f'applied {migration.version}: {migration.description}')
+    print(f'{len(applied)} migrations applied in {time.perf_counter() - start:.2f}s')
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+# 유저, 트윗, 팔로우 테이블과 로그인, 타임라인, 팔로워/팔로잉 목록 쿼리가 사용하는 인덱스를 만드는 migration.
+#   users             : 로그인은 email 의 unique 인덱스로 유저를 찾습니다.
+#   tweets            : 타임라인과 keyset 페이지네이션은 (user_id, id DESC) 인덱스로 유저별 최신 트윗을 찾습니다.
+#   users_follow_list : 팔로잉 목록은 기본키 (user_id, follow_user_id), 팔로워 목록은 (follow_user_id, user_id) 인덱스를 사용합니다.
+
+from sqlalchemy import MetaData, Table, Column, Integer, String, Index, text
+# SQLAlchemy에서 mysql에서 사용하는 TIMESTAMP 모듈을 불러옵니다.
+from sqlalchemy.dialects.mysql import TIMESTAMP
+
+from . import create_table, create_index, mysql_default
+
+version = 1
+description = 'users, tweets, users_follow_list'
+
+def upgrade(connection):
+    metadata = MetaData()
+
+    users = Table(
+        'users', metadata,
+        Column('id', Integer, primary_key = True, nullable = False),
+        Column('name', String(255), nullable = False),
+        Column('email', String(255), nullable = False, unique = True),
+        Column('hashed_password', String(255), nullable = False),
+        Column('profile', String(2000), nullable = False),
+        Column('created_at', TIMESTAMP, nullable = False, server_default = text('CURRENT_TIMESTAMP')),
+        Column('updated_at', TIMESTAMP, nullable = True, server_default = mysql_default(connection, 'NULL ON UPDATE CURRENT_TIMESTAMP'))
+    )
+
+    tweets = Table(
+        'tweets', metadata,
+        Column('id', Integer, primary_key = True, nullable = False),
+        Column('user_id', Integer, nullable = False),
+        Column('tweet', String(300), nullable = False),
+        Column('created_at', TIMESTAMP, nullable = False, server_default = text('CURRENT_TIMESTAMP'))
+    )
+    tweets_user_id_id_idx = Index('tweets_user_id_id_idx', tweets.c.user_id, tweets.c.id.desc())
+
+    users_follow_list = Table(
+        'users_follow_list', metadata,
+        Column('user_id', Integer, primary_key = True, nullable = False),
+        Column('follow_user_id', Integer, primary_key = True, nullable = False),
+        Column('created_at', TIMESTAMP, nullable = False, server_default = text('CURRENT_TIMESTAMP'))
+    )
+    users_follow_list_follow_user_id_user_id_idx = Index(
+        'users_follow_list_follow_user_id_user_id_idx', users_follow_list.c.follow_user_id, users_follow_list.c.user_id
+    )
+
+    for table in (users, tweets, users_follow_list):
+        create_table(connection, table)
+
+    # 인덱스가 추가되기 전에 만든 기존 DB 에는 인덱스만 추가합니다.
+    create_index(connection, tweets_user_id_id_idx)
+    create_index(connection, users_follow_list_follow_user_id_user_id_idx)
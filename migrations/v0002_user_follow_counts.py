@@ -0,0 +1,20 @@
+# 유저별 팔로워/팔로잉 수를 저장하는 user_follow_counts 테이블을 만드는 migration.
+# 프로필은 users_follow_list 의 COUNT(*) 대신 기본키(user_id)로 수를 가져옵니다.
+# 행이 없는 유저는 처음 팔로우/언팔로우하거나 프로필을 볼 때 한 번 세서 저장하므로 기존 데이터를 옮기지 않습니다.
+
+from sqlalchemy import MetaData, Table, Column, Integer, text
+
+from . import create_table
+
+version = 2
+description = 'user_follow_counts'
+
+def upgrade(connection):
+    user_follow_counts = Table(
+        'user_follow_counts', MetaData(),
+        Column('user_id', Integer, primary_key = True, autoincrement = False, nullable = False),
+        Column('followers', Integer, nullable = False, server_default = text('0')),
+        Column('following', Integer, nullable = False, server_default = text('0'))
+    )
+
+    create_table(connection, user_follow_counts)
@@ -0,0 +1,29 @@
+# 트윗의 #해시태그와 @멘션을 저장하는 tweet_hashtags, tweet_mentions 테이블을 만드는 migration.
+# 기본키 (tweet_id, 태그) 와 함께, 태그로 최신 트윗들을 찾을 수 있도록 (태그, tweet_id) 인덱스를 만듭니다.
+
+from sqlalchemy import MetaData, Table, Column, Integer, String, Index
+
+from . import create_table
+
+version = 3
+description = 'tweet_hashtags, tweet_mentions'
+
+def upgrade(connection):
+    metadata = MetaData()
+
+    tweet_hashtags = Table(
+        'tweet_hashtags', metadata,
+        Column('tweet_id', Integer, primary_key = True, autoincrement = False, nullable = False),
+        Column('tag', String(100), primary_key = True, nullable = False)
+    )
+    Index('tweet_hashtags_tag_tweet_id_idx', tweet_hashtags.c.tag, tweet_hashtags.c.tweet_id)
+
+    tweet_mentions = Table(
+        'tweet_mentions', metadata,
+        Column('tweet_id', Integer, primary_key = True, autoincrement = False, nullable = False),
+        Column('name', String(255), primary_key = True, nullable = False)
+    )
+    Index('tweet_mentions_name_tweet_id_idx', tweet_mentions.c.name, tweet_mentions.c.tweet_id)
+
+    for table in (tweet_hashtags, tweet_mentions):
+        create_table(connection, table)
@@ -0,0 +1,20 @@
+# 배치 작업(python -m model.follow_suggestions)이 계산한 팔로우 추천을 저장하는 follow_suggestions 테이블을 만드는 migration.
+# /suggestions 는 기본키 (user_id, rank) 로 유저의 추천을 순위대로 가져옵니다.
+
+from sqlalchemy import MetaData, Table, Column, Integer
+
+from . import create_table
+
+version = 4
+description = 'follow_suggestions'
+
+def upgrade(connection):
+    follow_suggestions = Table(
+        'follow_suggestions', MetaData(),
+        Column('user_id', Integer, primary_key = True, autoincrement = False, nullable = False),
+        Column('rank', Integer, primary_key = True, autoincrement = False, nullable = False),
+        Column('suggested_user_id', Integer, nullable = False),
+        Column('mutual_count', Integer, nullable = False)
+    )
+
+    create_table(connection, follow_suggestions)
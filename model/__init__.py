@@ -2,8 +2,28 @@
 
 from .user_dao import UserDao
 from .tweet_dao import TweetDao
+from .timeline_store import TimelineStore, SharedTimelineStore
+from .follow_graph_cache import FollowGraphCache
+from .database import Database, session_scope
+from .replica_router import ReplicaRouter
+from .query_inspector import QueryInspector, QueryBudgetExceeded
+from .search_index import SearchIndex, tokenize
+from .tweet_entities import extract_entities
+from .trending import TrendingTopics
 
 __all__ = [
     'UserDao',
-    'TweetDao'
-]
\ No newline at end of file
+    'TweetDao',
+    'TimelineStore',
+    'SharedTimelineStore',
+    'FollowGraphCache',
+    'Database',
+    'session_scope',
+    'ReplicaRouter',
+    'QueryInspector',
+    'QueryBudgetExceeded',
+    'SearchIndex',
+    'tokenize',
+    'extract_entities',
+    'TrendingTopics'
+]
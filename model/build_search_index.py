@@ -0,0 +1,37 @@
+# DB 의 모든 트윗으로 검색 색인 파일(SearchIndex)을 새로 만드는 파일입니다.
+# 트윗이 많으면 서버가 처음 검색할 때 모든 트윗을 색인하는 데 오래 걸리기 때문에, 서버를 시작하기 전에 실행해서
+# config 의 SEARCH_INDEX_PATH 에 저장해둡니다. 서버는 색인 파일을 읽고, 파일을 만든 이후의 트윗만 DB 에서 가져와서 색인합니다.
+#   python -m model.build_search_index --output search_index.bin
+
+import argparse
+import time
+
+import config
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+from repository import Tweets, UsersFollowList
+from .tweet_dao import TweetDao
+from .search_index import SearchIndex
+
+def main():
+    parser = argparse.ArgumentParser(description = 'rebuild the tweet search index file')
+    parser.add_argument('--db-url', default = config.DB_URL)
+    parser.add_argument('--output', default = config.SEARCH_INDEX_PATH or 'search_index.bin')
+    parser.add_argument('--batch-size', type = int, default = 10000)
+    args = parser.parse_args()
+
+    engine = create_engine(args.db_url, encoding = 'utf-8')
+    tweet_dao = TweetDao(sessionmaker(bind = engine), Tweets, UsersFollowList)
+
+    start = time.perf_counter()
+    index = SearchIndex()
+    index.sync(lambda after_id: tweet_dao.iter_tweets(after_id, args.batch_size), force = True)
+    index.save(args.output)
+
+    stats = index.stats()
+    print(f"indexed {stats['documents']} tweets, {stats['terms']} terms, {stats['bytes']} bytes "
+          f"in {time.perf_counter() - start:.1f}s -> {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,215 @@
+# DB 엔진과 커넥션 풀, 세션을 한 곳에서 만들고 관리하는 database 파일입니다.
+# create_app 에서 Database 를 한 번만 만들고, UserDao 와 TweetDao 가 같은 세션 레지스트리를 공유합니다.
+
+# contextmanager 를 통해서, 세션을 생성하구 커밋, 종료를 반복하지 않고
+# 재사용할 수 있게끔 사용해줍니다.
+from contextlib import contextmanager
+import os
+from threading import Lock
+import time
+
+# sqlalchemy의 엔진을 만드는 함수
+from sqlalchemy import create_engine, event, exc
+# 스레드마다 세션을 하나씩 만들어주는 scoped_session 과 세션공장인 sessionmaker
+from sqlalchemy.orm import sessionmaker, scoped_session
+# 커넥션을 빌려주는(checkout) 시간을 측정하기 위해 상속받는 커넥션 풀
+from sqlalchemy.pool import QueuePool
+
+# 읽기 쿼리를 replica 로 보내는 router
+from .replica_router import ReplicaRouter
+# query inspector 가 켜져 있으면 SQL 을 실행한 DAO 함수를 기록합니다.
+from .query_inspector import push_caller, pop_caller
+
+# contextmanager 데코레이션을 사용해 try/finally이 재사용가능한 
+# session_scope함수를 만들고, with 문을 통해서 해당 함수를 불러온다.
+# DAO 가 가지고 있는 세션공장(Session)을 받아서 세션을 생성합니다.
+# query inspector 가 켜져 있으면 세션에서 실행한 SQL 들을 해당 DAO 함수(with session_scope 를 연 함수)로 기록합니다.
+@contextmanager
+def session_scope(Session):
+    query_log = push_caller(2)
+    session = Session()
+    try:
+        #yield 로 생성한 session을 전달합니다.
+        yield session
+        session.commit()
+    except:
+        session.rollback()
+        raise
+    finally:
+        session.close()
+        pop_caller(query_log)
+
+# 커넥션 풀에서 커넥션을 빌리고(checkout) 반납(checkin)한 횟수와 기다린 시간을 기록합니다.
+class PoolMetrics:
+    def __init__(self):
+        self.lock = Lock()
+        self.checkouts = 0
+        self.checkins = 0
+        self.timeouts = 0
+        self.wait_seconds_total = 0.0
+        self.wait_seconds_max = 0.0
+
+    # 커넥션을 빌리기까지 기다린 시간을 기록합니다. 풀이 가득 차서 시간이 초과된 경우도 기록합니다.
+    def record_checkout(self, wait_seconds, timed_out = False):
+        with self.lock:
+            if timed_out:
+                self.timeouts += 1
+            else:
+                self.checkouts += 1
+
+            self.wait_seconds_total += wait_seconds
+            self.wait_seconds_max = max(self.wait_seconds_max, wait_seconds)
+
+    def record_checkin(self):
+        with self.lock:
+            self.checkins += 1
+
+    # 현재까지의 기록과 풀의 상태를 dict 로 반환합니다.
+    def snapshot(self, pool):
+        with self.lock:
+            status = {
+                'checkouts' : self.checkouts,
+                'checkins' : self.checkins,
+                'timeouts' : self.timeouts,
+                'wait_seconds_total' : self.wait_seconds_total,
+                'wait_seconds_max' : self.wait_seconds_max,
+                'wait_seconds_avg' : self.wait_seconds_total / self.checkouts if self.checkouts else 0.0
+            }
+
+        if isinstance(pool, QueuePool):
+            status.update({
+                'pool_size' : pool.size(),
+                'checked_out' : pool.checkedout(),
+                'checked_in' : pool.checkedin(),
+                'overflow' : pool.overflow()
+            })
+
+        return status
+
+# 커넥션을 빌려줄 때 기다린 시간을 PoolMetrics 에 기록하는 커넥션 풀
+class MeteredQueuePool(QueuePool):
+    metrics = None
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            connection = super()._do_get()
+        except exc.TimeoutError:
+            if self.metrics is not None:
+                self.metrics.record_checkout(time.perf_counter() - start, timed_out = True)
+            raise
+
+        if self.metrics is not None:
+            self.metrics.record_checkout(time.perf_counter() - start)
+
+        return connection
+
+    def _do_return_conn(self, conn):
+        if self.metrics is not None:
+            self.metrics.record_checkin()
+
+        super()._do_return_conn(conn)
+
+    # 엔진이 풀을 다시 만들 때(dispose 등)도 같은 metrics 에 기록하도록 넘겨줍니다.
+    def recreate(self):
+        pool = super().recreate()
+        pool.metrics = self.metrics
+
+        return pool
+
+# 엔진을 만듭니다. SQLite 가 아니면 PoolMetrics 에 기록하는 커넥션 풀을 config 설정으로 만듭니다.
+def create_pooled_engine(db_url, config, metrics):
+    options = {'encoding' : 'utf-8'}
+    # SQLite 는 커넥션 풀 설정을 사용하지 않습니다. (벤치마크, 로컬 테스트용)
+    if not db_url.startswith('sqlite'):
+        options.update(
+            poolclass = MeteredQueuePool,
+            pool_size = config.get('DB_POOL_SIZE', 10),
+            max_overflow = config.get('DB_MAX_OVERFLOW', 10),
+            pool_timeout = config.get('DB_POOL_TIMEOUT', 10),
+            pool_recycle = config.get('DB_POOL_RECYCLE', 3600),
+            pool_pre_ping = config.get('DB_POOL_PRE_PING', True)
+        )
+
+    engine = create_engine(db_url, **options)
+    if isinstance(engine.pool, MeteredQueuePool):
+        engine.pool.metrics = metrics
+
+    # fork 된 worker 프로세스가 부모 프로세스의 커넥션(소켓)을 함께 사용하지 않도록,
+    # 커넥션을 만든 프로세스를 기록해두고 다른 프로세스가 빌리려고 하면 닫지 않고 버린 뒤 새 커넥션을 만듭니다.
+    @event.listens_for(engine, 'connect')
+    def record_pid(dbapi_connection, connection_record):
+        connection_record.info['pid'] = os.getpid()
+
+    @event.listens_for(engine, 'checkout')
+    def check_pid(dbapi_connection, connection_record, connection_proxy):
+        if connection_record.info.get('pid') != os.getpid():
+            connection_record.connection = connection_proxy.connection = None
+            raise exc.DisconnectionError('connection was created by another process')
+
+    return engine
+
+# config 의 DB 설정으로 엔진과 커넥션 풀, 세션 레지스트리를 만듭니다.
+#   DB_POOL_SIZE      : 풀에 유지하는 커넥션 수
+#   DB_MAX_OVERFLOW   : 풀이 가득 찼을 때 추가로 만들 수 있는 커넥션 수
+#   DB_POOL_TIMEOUT   : 커넥션을 빌리기 위해 기다리는 최대 시간(초)
+#   DB_POOL_RECYCLE   : 커넥션을 다시 만드는 주기(초). DB 의 wait_timeout 보다 짧아야 합니다.
+#   DB_POOL_PRE_PING  : 커넥션을 빌려줄 때 연결이 살아있는지 확인합니다.
+# DB_REPLICA_URLS 가 있으면 replica 마다 같은 설정으로 엔진과 세션 레지스트리를 만들고,
+# 읽기 쿼리를 replica 로 보내는 ReplicaRouter 를 만듭니다.
+#   DB_REPLICA_STRATEGY         : replica 를 고르는 방식. 'round_robin' 또는 'least_connections'
+#   DB_READ_YOUR_WRITES_SECONDS : 쓰기를 한 뒤 해당 유저의 읽기를 primary 로 보내는 시간(초)
+# cache 가 여러 worker 가 함께 사용하는 캐시이면 쓰기 기록을 캐시에 저장해서 모든 worker 가 함께 사용합니다.
+class Database:
+    def __init__(self, config, cache = None):
+        self.metrics = PoolMetrics()
+        self.engine = create_pooled_engine(config['DB_URL'], config, self.metrics)
+
+        # 스레드(요청)마다 하나의 세션을 사용하는 세션 레지스트리
+        self.Session = scoped_session(sessionmaker(bind = self.engine))
+
+        self.replicas = []
+        for replica_url in config.get('DB_REPLICA_URLS', []):
+            metrics = PoolMetrics()
+            engine = create_pooled_engine(replica_url, config, metrics)
+            self.replicas.append((scoped_session(sessionmaker(bind = engine)), engine, metrics))
+
+        self.router = ReplicaRouter(
+            self.Session,
+            [(Session, engine) for Session, engine, _ in self.replicas],
+            strategy = config.get('DB_REPLICA_STRATEGY', 'round_robin'),
+            sticky_seconds = config.get('DB_READ_YOUR_WRITES_SECONDS', 5),
+            cache = cache
+        )
+
+    # primary 와 replica 들의 엔진
+    def engines(self):
+        return [self.engine] + [engine for _, engine, _ in self.replicas]
+
+    # 커넥션 풀들을 비웁니다. fork 하기 전에 부모 프로세스에서 호출해서, worker 들이 빈 풀로 시작하게 합니다.
+    def dispose(self):
+        self.remove_session()
+        for engine in self.engines():
+            engine.dispose()
+
+    # 커넥션 풀마다 커넥션을 size 개씩 미리 만들어둡니다. 첫 요청이 DB 에 연결하는 시간을 기다리지 않습니다.
+    # (SQLite 처럼 커넥션을 유지하지 않는 풀에서는 연결만 확인합니다.)
+    def warm_up(self, size = 1):
+        for engine in self.engines():
+            connections = [engine.connect() for _ in range(size)]
+            for connection in connections:
+                connection.close()
+
+    # 요청이 끝나면 해당 스레드의 세션을 정리합니다. (flask 의 teardown_appcontext 에 등록)
+    def remove_session(self, exception = None):
+        self.Session.remove()
+        for Session, _, _ in self.replicas:
+            Session.remove()
+
+    # 커넥션 풀의 상태와 checkout 기록을 반환합니다. replica 가 있으면 replica 들의 상태도 함께 반환합니다.
+    def pool_status(self):
+        status = self.metrics.snapshot(self.engine.pool)
+        if self.replicas:
+            status['replicas'] = [metrics.snapshot(engine.pool) for _, engine, metrics in self.replicas]
+
+        return status
@@ -0,0 +1,160 @@
+# 유저별로 팔로우한 유저 id 목록을 메모리에 저장해두는 follow graph cache 파일입니다.
+# 타임라인을 만들거나 팔로우 여부를 확인할 때마다 users_follow_list 를 조회하지 않고,
+# 처음 한 번 DB 에서 읽은 팔로우 목록을 작은 정수 배열(또는 비트맵)로 저장해두고 사용합니다.
+# 팔로우/언팔로우를 하면 해당 유저의 팔로우 목록을 지우고, 다음에 읽을 때 DB 에서 다시 가져옵니다.
+
+# 유저 id 를 4바이트 정수로 저장하는 array 와 정렬된 배열에서 id 를 찾는 bisect
+from array import array
+from bisect import bisect_left
+# 오래 안 쓰인 팔로우 목록부터 지우기 위한 OrderedDict
+from collections import OrderedDict
+# 여러 요청 스레드가 동시에 캐시를 읽고 쓰기 때문에 Lock 으로 보호합니다.
+from threading import Lock
+# 팔로우 목록의 만료시간을 계산하는 time 모듈
+import time
+
+# 팔로우 목록 하나를 저장할 때 배열 외에 드는 대략적인 메모리(객체, dict 항목 등)
+ENTRY_OVERHEAD = 200
+
+# 팔로우한 유저 id 들의 집합.
+# 정렬된 array('I')(id 하나에 4바이트)와 비트맵(가장 작은 id 부터 가장 큰 id 까지 id 하나에 1비트) 중
+# 메모리를 적게 쓰는 방식으로 저장합니다. 팔로우가 많은 유저는 보통 비트맵이 더 작습니다.
+class FollowIds:
+    def __init__(self, user_ids):
+        user_ids = sorted(set(user_ids))
+        self.count = len(user_ids)
+        self.offset = user_ids[0] if user_ids else 0
+        self.ids = None
+        self.bitmap = None
+
+        array_bytes = self.count * array('I').itemsize
+        bitmap_bytes = (user_ids[-1] - self.offset) // 8 + 1 if user_ids else 0
+
+        if user_ids and bitmap_bytes < array_bytes:
+            self.bitmap = bytearray(bitmap_bytes)
+            for user_id in user_ids:
+                index = user_id - self.offset
+                self.bitmap[index >> 3] |= 1 << (index & 7)
+        else:
+            self.ids = array('I', user_ids)
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, user_id):
+        if self.bitmap is not None:
+            index = user_id - self.offset
+            return 0 <= index < len(self.bitmap) * 8 and bool(self.bitmap[index >> 3] & (1 << (index & 7)))
+
+        position = bisect_left(self.ids, user_id)
+        return position < len(self.ids) and self.ids[position] == user_id
+
+    # 유저 id 들을 작은 id 부터 반환합니다.
+    def __iter__(self):
+        if self.bitmap is None:
+            return iter(self.ids)
+
+        return (self.offset + (byte_index << 3) + bit
+                for byte_index, byte in enumerate(self.bitmap) if byte
+                for bit in range(8) if byte & (1 << bit))
+
+    # 저장하는 데 사용하는 메모리(바이트)
+    @property
+    def nbytes(self):
+        if self.bitmap is not None:
+            return len(self.bitmap) + ENTRY_OVERHEAD
+
+        return len(self.ids) * self.ids.itemsize + ENTRY_OVERHEAD
+
+class FollowGraphCache:
+
+    # max_bytes : 팔로우 목록들을 저장하는 데 사용하는 최대 메모리(바이트). 넘으면 오래 안 쓰인 목록부터 지웁니다.
+    # ttl       : 팔로우 목록을 다시 DB 에서 읽기 전까지 유지하는 시간(초)
+    #             다른 프로세스에서 한 팔로우/언팔로우는 이 프로세스의 캐시를 지우지 못하기 때문에 ttl 이 지나면 다시 읽습니다.
+    def __init__(self, max_bytes = 64 * 1024 * 1024, ttl = 60):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.entries = OrderedDict()
+        self.size = 0
+        # invalidate 할 때마다 증가하는 값. DB 에서 읽는 동안 팔로우 목록이 바뀌었으면 읽은 목록을 저장하지 않습니다.
+        self.version = 0
+        self.hits = 0
+        self.misses = 0
+        self.lock = Lock()
+
+    # 유저가 팔로우한 유저 id 집합(FollowIds)을 반환합니다. 저장된 목록이 없거나 만료되었으면 None 을 반환합니다.
+    def get(self, user_id):
+        with self.lock:
+            item = self.entries.get(user_id)
+            if item is not None and item[0] < time.monotonic():
+                self.remove(user_id)
+                item = None
+
+            if item is None:
+                self.misses += 1
+                return None
+
+            self.hits += 1
+            self.entries.move_to_end(user_id)
+            return item[1]
+
+    # DB 에서 읽은 팔로우 목록을 저장하고, 저장한 FollowIds 를 반환합니다.
+    # version 은 DB 에서 읽기 전의 self.version 이며, 그 사이에 invalidate 가 있었으면 저장하지 않습니다.
+    def set(self, user_id, user_ids, version = None):
+        follow_ids = FollowIds(user_ids)
+
+        with self.lock:
+            if version is not None and version != self.version:
+                return follow_ids
+
+            # 하나의 목록이 최대 메모리보다 크면 저장하지 않습니다.
+            if follow_ids.nbytes > self.max_bytes:
+                return follow_ids
+
+            self.remove(user_id)
+            self.entries[user_id] = (time.monotonic() + self.ttl, follow_ids)
+            self.size += follow_ids.nbytes
+
+            # 최대 메모리를 넘으면 가장 오래 안 쓰인 목록부터 지웁니다.
+            while self.size > self.max_bytes:
+                _, (_, oldest) = self.entries.popitem(last = False)
+                self.size -= oldest.nbytes
+
+        return follow_ids
+
+    # 저장된 팔로우 목록을 반환하고, 없으면 load() 로 DB 에서 읽어서 저장합니다.
+    def get_or_load(self, user_id, load):
+        follow_ids = self.get(user_id)
+        if follow_ids is not None:
+            return follow_ids
+
+        with self.lock:
+            version = self.version
+
+        return self.set(user_id, load(), version)
+
+    # 팔로우/언팔로우로 팔로우 목록이 바뀐 유저의 목록을 지웁니다.
+    def invalidate(self, user_id):
+        with self.lock:
+            self.remove(user_id)
+            self.version += 1
+
+    # lock 을 잡은 상태에서 호출합니다.
+    def remove(self, user_id):
+        item = self.entries.pop(user_id, None)
+        if item is not None:
+            self.size -= item[1].nbytes
+
+    # 캐시 상태(저장된 유저 수, 사용 중인 메모리, 적중률)를 반환합니다.
+    def stats(self):
+        with self.lock:
+            requests = self.hits + self.misses
+
+            return {
+                'users' : len(self.entries),
+                'bytes' : self.size,
+                'max_bytes' : self.max_bytes,
+                'hits' : self.hits,
+                'misses' : self.misses,
+                'hit_rate' : round(self.hits / requests, 4) if requests else 0.0
+            }
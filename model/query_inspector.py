@@ -0,0 +1,200 @@
+# 개발/테스트용으로 요청마다 실행한 SQL 을 기록해서 N+1 쿼리와 느린 쿼리를 찾는 query inspector 파일입니다.
+# config 의 QUERY_INSPECTOR_ENABLED 로 켜며, 켜면 요청마다
+#   - 실행한 SQL 의 수와, 어떤 DAO 함수(session_scope 를 연 함수)에서 실행했는지를 기록하고,
+#   - 값만 다르고 모양이 같은 SQL 이 repeat_threshold 번 이상 실행되면 N+1 쿼리로 보고하고,
+#   - slow_seconds 보다 오래 걸린 SELECT 는 같은 커넥션에서 EXPLAIN 을 실행해서 실행계획을 함께 기록하고,
+#   - 엔드포인트별 쿼리 예산(QUERY_BUDGETS)을 넘으면 경고를 남깁니다. strict 이면 QueryBudgetExceeded 가 발생해서 테스트가 실패합니다.
+# 요청마다 기록하는 QueryLog 는 contextvar 에 저장하기 때문에, DAO 는 요청 객체를 넘겨받지 않습니다.
+
+from collections import Counter
+from contextvars import ContextVar
+import logging
+import re
+import sys
+import time
+
+# SQL 실행 전후로 호출되는 sqlalchemy 엔진 이벤트
+from sqlalchemy import event
+
+logger = logging.getLogger(__name__)
+
+current_query_log = ContextVar('current_query_log', default = None)
+
+# 엔드포인트의 쿼리 예산을 넘었거나 N+1 쿼리가 발견되었을 때 (strict 모드) 발생하는 예외
+class QueryBudgetExceeded (Exception):
+    def __init__(self, report):
+        Exception.__init__(self, report.describe())
+        self.report = report
+
+# SQL 의 값들을 ? 로 바꿔서 값만 다른 SQL 들이 같은 모양이 되게 합니다.
+# 예) SELECT ... WHERE id IN (%s, %s, %s) AND name = 'a'  ->  SELECT ... WHERE id IN (?) AND name = ?
+def statement_shape(statement):
+    shape = re.sub(r"'(?:[^']|'')*'", '?', statement)
+    shape = re.sub(r'\b\d+(\.\d+)?\b', '?', shape)
+    shape = re.sub(r'%\(\w+\)s|%s|:\w+', '?', shape)
+    shape = re.sub(r'\(\s*\?(\s*,\s*\?)*\s*\)', '(?)', shape)
+
+    return ' '.join(shape.split())
+
+# session_scope 를 연 DAO 함수의 이름. 예) UserDao.get_user
+def caller_name(depth):
+    frame = sys._getframe(depth + 1)
+    owner = frame.f_locals.get('self')
+
+    return f'{type(owner).__name__}.{frame.f_code.co_name}' if owner is not None else frame.f_code.co_name
+
+# 요청 하나가 실행한 SQL 들
+class QueryLog:
+    def __init__(self):
+        self.endpoint = None
+        # (모양, 실행시간(초), DAO 함수, EXPLAIN 결과)
+        self.statements = []
+        # 현재 SQL 을 실행하고 있는 DAO 함수들 (session_scope 가 중첩될 수 있어서 스택으로 저장)
+        self.callers = []
+
+    def add(self, shape, seconds, explain = None):
+        self.statements.append((shape, seconds, self.callers[-1] if self.callers else None, explain))
+
+# 요청이 끝난 뒤 QueryLog 를 검사한 결과
+class QueryReport:
+    def __init__(self, log, budget, repeat_threshold, slow_seconds):
+        self.endpoint = log.endpoint
+        self.count = len(log.statements)
+        self.budget = budget
+
+        shapes = Counter(shape for shape, _, _, _ in log.statements)
+        callers = {}
+        for shape, _, caller, _ in log.statements:
+            callers.setdefault(shape, caller)
+
+        # 같은 모양의 SQL 이 repeat_threshold 번 이상 실행되었으면 N+1 쿼리로 봅니다.
+        self.repeated = [(shape, count, callers[shape]) for shape, count in shapes.most_common() if count >= repeat_threshold]
+        self.slow = [(shape, seconds, caller, explain) for shape, seconds, caller, explain in log.statements if seconds >= slow_seconds]
+
+    @property
+    def over_budget(self):
+        return self.budget is not None and self.count > self.budget
+
+    # 예산을 넘었거나 N+1 쿼리가 있으면 True
+    @property
+    def failed(self):
+        return self.over_budget or bool(self.repeated)
+
+    def describe(self):
+        lines = [f'{self.endpoint}: {self.count} queries (budget {self.budget})']
+        for shape, count, caller in self.repeated:
+            lines.append(f'  repeated {count} times in {caller}: {shape}')
+        for shape, seconds, caller, explain in self.slow:
+            lines.append(f'  slow {seconds * 1000:.1f}ms in {caller}: {shape}')
+            for row in explain or []:
+                lines.append(f'    {row}')
+
+        return '\n'.join(lines)
+
+class QueryInspector:
+
+    # budgets          : 엔드포인트(함수 이름) -> 요청 하나가 실행할 수 있는 최대 SQL 수. 예) {'timeline' : 3}
+    # default_budget   : budgets 에 없는 엔드포인트의 최대 SQL 수 (None 이면 검사하지 않음)
+    # repeat_threshold : 같은 모양의 SQL 이 이 횟수 이상 실행되면 N+1 쿼리로 보고합니다.
+    # slow_seconds     : 이 시간(초)보다 오래 걸린 SELECT 는 EXPLAIN 을 실행해서 실행계획을 함께 보고합니다.
+    # strict           : True 이면 예산을 넘거나 N+1 쿼리가 있을 때 QueryBudgetExceeded 가 발생합니다. (테스트용)
+    def __init__(self, budgets = None, default_budget = None, repeat_threshold = 5, slow_seconds = 0.1, strict = False):
+        self.budgets = dict(budgets or {})
+        self.default_budget = default_budget
+        self.repeat_threshold = repeat_threshold
+        self.slow_seconds = slow_seconds
+        self.strict = strict
+        self.reports = 0
+        self.failures = 0
+
+    @classmethod
+    def from_config(cls, config):
+        if not config.get('QUERY_INSPECTOR_ENABLED', False):
+            return None
+
+        return cls(
+            budgets = config.get('QUERY_BUDGETS', {}),
+            default_budget = config.get('QUERY_DEFAULT_BUDGET'),
+            repeat_threshold = config.get('QUERY_REPEAT_THRESHOLD', 5),
+            slow_seconds = config.get('QUERY_SLOW_SECONDS', 0.1),
+            strict = config.get('QUERY_BUDGET_STRICT', False)
+        )
+
+    # 엔진이 실행하는 SQL 을 현재 요청의 QueryLog 에 기록합니다.
+    def instrument_engine(self, engine):
+        @event.listens_for(engine, 'before_cursor_execute')
+        def before_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            if current_query_log.get() is not None:
+                conn.info.setdefault('inspector_start', []).append(time.perf_counter())
+
+        @event.listens_for(engine, 'after_cursor_execute')
+        def after_cursor_execute(conn, cursor, statement, parameters, context, executemany):
+            log = current_query_log.get()
+            if log is None or not conn.info.get('inspector_start'):
+                return
+
+            seconds = time.perf_counter() - conn.info['inspector_start'].pop()
+            explain = None
+            if seconds >= self.slow_seconds and not executemany and statement.lstrip()[:6].upper() == 'SELECT':
+                explain = self.explain(conn, statement, parameters)
+
+            log.add(statement_shape(statement), seconds, explain)
+
+    # 같은 커넥션에서 EXPLAIN 을 실행해서 실행계획을 문자열 리스트로 반환합니다.
+    # DBAPI 커서로 직접 실행하기 때문에 엔진 이벤트가 다시 호출되지 않습니다.
+    def explain(self, conn, statement, parameters):
+        prefix = 'EXPLAIN QUERY PLAN ' if conn.dialect.name == 'sqlite' else 'EXPLAIN '
+        cursor = conn.connection.cursor()
+        try:
+            cursor.execute(prefix + statement, parameters)
+            return [' | '.join(str(value) for value in row) for row in cursor.fetchall()]
+        except Exception as error:
+            return [f'EXPLAIN failed: {error}']
+        finally:
+            cursor.close()
+
+    # 요청을 시작할 때 호출합니다. 요청이 끝나면 반환된 (log, token) 으로 end_request 를 호출합니다.
+    def begin_request(self):
+        log = QueryLog()
+
+        return log, current_query_log.set(log)
+
+    # 요청이 끝났을 때 QueryLog 를 검사해서 QueryReport 를 반환합니다.
+    # endpoint 는 flask 와 ASGI 가 같은 이름을 사용하는 엔드포인트 함수 이름입니다. 예) timeline, user_profile
+    # 예산을 넘었거나 N+1 쿼리가 있으면 경고를 남기고, strict 이면 QueryBudgetExceeded 가 발생합니다.
+    def end_request(self, log, token, endpoint):
+        current_query_log.reset(token)
+        log.endpoint = endpoint
+
+        report = QueryReport(log, self.budgets.get(log.endpoint, self.default_budget), self.repeat_threshold, self.slow_seconds)
+        self.reports += 1
+
+        if report.failed:
+            self.failures += 1
+            logger.warning('query budget exceeded\n%s', report.describe())
+            if self.strict:
+                raise QueryBudgetExceeded(report)
+        elif report.slow:
+            logger.warning('slow queries\n%s', report.describe())
+
+        return report
+
+    def stats(self):
+        return {
+            'reports' : self.reports,
+            'failures' : self.failures
+        }
+
+# session_scope 를 연 DAO 함수를 현재 요청의 QueryLog 에 기록합니다. 요청이 없으면 아무것도 하지 않습니다.
+# depth 는 이 함수를 호출한 함수(session_scope)로부터 DAO 함수까지의 거리입니다.
+def push_caller(depth):
+    log = current_query_log.get()
+    if log is None:
+        return None
+
+    log.callers.append(caller_name(depth + 1))
+    return log
+
+def pop_caller(log):
+    if log is not None:
+        log.callers.pop()
@@ -0,0 +1,65 @@
+# 읽기 전용 쿼리를 읽기 전용 DB(replica)로 보내는 replica router 파일입니다.
+# 쓰기는 항상 primary DB 로 보내고, 타임라인 조회처럼 읽기만 하는 쿼리는 replica 들에 나눠서 보냅니다.
+# replica 는 primary 의 데이터를 조금 늦게 받기 때문에, 유저가 쓰기를 한 뒤 sticky_seconds 동안은
+# 해당 유저의 읽기도 primary 로 보내서 자신이 쓴 데이터를 바로 볼 수 있게 합니다. (read-your-writes)
+# 여러 worker 가 함께 사용하는 캐시(RedisCache)가 주어지면 쓰기 기록을 캐시에 저장해서, 다른 worker 로 간 읽기도 primary 로 보냅니다.
+
+import itertools
+from threading import Lock
+
+# 최근에 쓰기를 한 유저를 sticky_seconds 동안 기억해두는 메모리 캐시
+from cache import TTLCache
+
+class ReplicaRouter:
+
+    # primary_session  : primary DB 의 세션공장
+    # replicas         : (세션공장, 엔진) 리스트
+    # strategy         : replica 를 고르는 방식. 'round_robin' 또는 'least_connections'(빌려준 커넥션이 가장 적은 replica)
+    # sticky_seconds   : 쓰기를 한 뒤 해당 키(유저)의 읽기를 primary 로 보내는 시간(초)
+    # cache            : 쓰기 기록을 저장하는 캐시 backend. 여러 worker 가 함께 사용하는 캐시가 아니면 프로세스 메모리에 기록합니다.
+    def __init__(self, primary_session, replicas, strategy = 'round_robin', sticky_seconds = 5, max_sticky_keys = 100000, cache = None):
+        self.primary_session = primary_session
+        self.replicas = replicas
+        self.strategy = strategy
+        self.sticky_seconds = sticky_seconds
+        self.cache = cache if cache is not None and cache.shared else None
+        self.recent_writes = TTLCache(max_size = max_sticky_keys, ttl = sticky_seconds)
+        self.counter = itertools.count()
+        self.lock = Lock()
+
+    # 읽기 쿼리에 사용할 세션공장을 반환합니다.
+    # key 로 최근에 쓰기를 했거나 replica 가 없으면 primary 를 사용합니다.
+    def reader(self, key = None):
+        if not self.replicas or (key is not None and self.recently_written(key)):
+            return self.primary_session
+
+        if self.strategy == 'least_connections':
+            return min(self.replicas, key = lambda replica : checked_out(replica[1]))[0]
+
+        with self.lock:
+            index = next(self.counter) % len(self.replicas)
+
+        return self.replicas[index][0]
+
+    # key 로 쓰기를 했다고 기록합니다.
+    def mark_write(self, key):
+        if not self.replicas:
+            return
+
+        if self.cache is not None:
+            self.cache.set(f'recent_write:{key}', True, self.sticky_seconds)
+        else:
+            self.recent_writes.set(key, True)
+
+    # key 로 sticky_seconds 안에 쓰기를 했는지 확인합니다.
+    def recently_written(self, key):
+        if self.cache is not None:
+            return self.cache.get(f'recent_write:{key}')
+
+        return self.recent_writes.get(key)
+
+# 엔진의 커넥션 풀이 빌려준 커넥션 수. 커넥션 수를 세지 않는 풀(SQLite 등)은 0 으로 봅니다.
+def checked_out(engine):
+    checkedout = getattr(engine.pool, 'checkedout', None)
+
+    return checkedout() if checkedout else 0
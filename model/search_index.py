@@ -0,0 +1,335 @@
+# 트윗을 검색어로 찾기 위한 메모리 역색인(inverted index) 파일입니다.
+# 트윗을 단어(term)들로 나누고, 단어마다 해당 단어가 들어있는 트윗 id 목록(posting list)을 저장합니다.
+# 검색할 때는 LIKE '%검색어%' 로 tweets 테이블 전체를 읽지 않고, 검색어의 단어들이 모두 들어있는 트윗 id 를 최신순으로 찾습니다.
+#
+# - 단어 나누기 : 영어와 숫자는 소문자 단어 그대로, 한글(과 한자, 가나)은 띄어쓰기 없이 붙는 조사나 합성어를 찾을 수 있도록
+#                두 글자씩(bigram) 나눕니다. 예) "서울에서 밥" -> 서울, 울에, 에서, 밥
+# - posting list : 트윗 id 들을 오름차순으로, 앞 id 와의 차이(delta)를 varint(7비트씩) 로 인코딩한 bytearray 에 저장합니다.
+#                  BLOCK_SIZE 개씩 block 으로 나눠서, 최신 트윗부터 찾을 때 필요한 block 만 디코딩합니다.
+# - 트윗 id 는 작성 순서대로 증가하기 때문에, 큰 id 부터 찾으면 최신순 top-k 가 됩니다.
+#
+# 새로운 트윗은 TweetService 가 바로 추가하고, 다른 worker 나 write-behind 로 저장된 트윗은 sync 로 DB 에서 가져와 추가합니다.
+# 테이블이 크면 서버를 시작하기 전에 색인 파일을 미리 만들어둘 수 있습니다.
+#   python -m model.build_search_index --output search_index.bin
+
+from array import array
+from bisect import bisect_left, bisect_right
+import os
+import re
+import struct
+from threading import Lock
+import time
+import unicodedata
+
+# 한 block 에 저장하는 최대 트윗 id 수
+BLOCK_SIZE = 128
+
+FILE_MAGIC = b'SNSIDX1\n'
+
+# 영어/숫자 단어, 한글 음절, 한자와 가나
+TOKEN = re.compile(r'[0-9a-z_]+|[가-힣]+|[぀-ヿ一-鿿]+')
+
+# 트윗이나 검색어를 단어들로 나눕니다.
+def tokenize(text):
+    text = unicodedata.normalize('NFKC', text).lower()
+
+    terms = []
+    for token in TOKEN.findall(text):
+        # 영어와 숫자는 단어 그대로 사용합니다.
+        if token[0] < '぀':
+            terms.append(token)
+        # 한글은 띄어쓰기 없이 조사가 붙기 때문에 두 글자씩 나눕니다. 한 글자 단어는 그대로 사용합니다.
+        elif len(token) == 1:
+            terms.append(token)
+        else:
+            terms.extend(token[index:index + 2] for index in range(len(token) - 1))
+
+    return terms
+
+# 0 이상의 정수를 7비트씩 나눠서 bytearray 에 추가합니다. (마지막 바이트가 아니면 가장 높은 비트가 1)
+def encode_varint(value, out):
+    while value >= 0x80:
+        out.append((value & 0x7f) | 0x80)
+        value >>= 7
+    out.append(value)
+
+# varint 들을 디코딩해서 first 부터 차이를 더한 id 들을 반환합니다.
+def decode_deltas(data, first):
+    ids = [first]
+    value = 0
+    shift = 0
+    current = first
+    for byte in data:
+        value |= (byte & 0x7f) << shift
+        if byte & 0x80:
+            shift += 7
+            continue
+
+        current += value
+        ids.append(current)
+        value = 0
+        shift = 0
+
+    return ids
+
+def encode_deltas(ids):
+    data = bytearray()
+    for previous, current in zip(ids, ids[1:]):
+        encode_varint(current - previous, data)
+
+    return data
+
+# 한 단어의 트윗 id 목록. 오름차순 id 들을 block 단위로 delta 인코딩해서 저장합니다.
+class PostingList:
+    __slots__ = ('firsts', 'lasts', 'counts', 'blocks')
+
+    def __init__(self):
+        # block 마다 첫 id, 마지막 id, id 수, 첫 id 이후의 delta 들
+        self.firsts = array('q')
+        self.lasts = array('q')
+        self.counts = array('i')
+        self.blocks = []
+
+    def __len__(self):
+        return sum(self.counts)
+
+    # 사용하는 메모리(바이트)
+    @property
+    def nbytes(self):
+        return sum(len(block) for block in self.blocks) + len(self.firsts) * 20
+
+    def block_ids(self, index):
+        return decode_deltas(self.blocks[index], self.firsts[index])
+
+    # 트윗 id 를 추가합니다. 이미 있으면 False 를 반환합니다.
+    def add(self, tweet_id):
+        # 대부분의 트윗은 가장 큰 id 이므로 마지막 block 의 끝에 delta 만 추가합니다.
+        if not self.blocks or tweet_id > self.lasts[-1]:
+            if not self.blocks or self.counts[-1] >= BLOCK_SIZE:
+                self.firsts.append(tweet_id)
+                self.lasts.append(tweet_id)
+                self.counts.append(1)
+                self.blocks.append(bytearray())
+            else:
+                encode_varint(tweet_id - self.lasts[-1], self.blocks[-1])
+                self.lasts[-1] = tweet_id
+                self.counts[-1] += 1
+            return True
+
+        # 늦게 색인되는 트윗(다른 worker 에서 작성된 트윗 등)은 해당 block 을 다시 인코딩합니다.
+        index = max(0, bisect_right(self.firsts, tweet_id) - 1)
+        ids = self.block_ids(index)
+        position = bisect_left(ids, tweet_id)
+        if position < len(ids) and ids[position] == tweet_id:
+            return False
+
+        ids.insert(position, tweet_id)
+        self.set_block(index, ids)
+
+        # block 이 너무 커지면 두 block 으로 나눕니다.
+        if len(ids) > BLOCK_SIZE * 2:
+            half = len(ids) // 2
+            self.set_block(index, ids[:half])
+            self.firsts.insert(index + 1, ids[half])
+            self.lasts.insert(index + 1, ids[-1])
+            self.counts.insert(index + 1, len(ids) - half)
+            self.blocks.insert(index + 1, encode_deltas(ids[half:]))
+
+        return True
+
+    def set_block(self, index, ids):
+        self.firsts[index] = ids[0]
+        self.lasts[index] = ids[-1]
+        self.counts[index] = len(ids)
+        self.blocks[index] = encode_deltas(ids)
+
+    # 모든 id 를 오름차순으로 반환합니다.
+    def __iter__(self):
+        for index in range(len(self.blocks)):
+            yield from self.block_ids(index)
+
+    # 큰 id 부터 찾는 cursor
+    def cursor(self):
+        return PostingCursor(self)
+
+# posting list 를 큰 id 부터 읽는 cursor.
+# seek(id) 는 id 이하인 가장 큰 id 로 이동하며, 중간의 block 들은 디코딩하지 않고 건너뜁니다.
+class PostingCursor:
+    def __init__(self, postings):
+        self.postings = postings
+        self.block = None
+        self.ids = []
+        self.position = -1
+
+    # target 이하인 가장 큰 id 를 반환합니다. 없으면 None 을 반환합니다.
+    def seek(self, target):
+        postings = self.postings
+
+        # 현재 block 안에 있으면 block 안에서만 찾습니다.
+        if self.block is not None and self.ids and self.ids[0] <= target:
+            self.position = bisect_right(self.ids, target, 0, self.position + 1) - 1
+            return self.ids[self.position]
+
+        index = bisect_right(postings.firsts, target) - 1
+        if index < 0:
+            self.block = None
+            return None
+
+        self.block = index
+        self.ids = postings.block_ids(index)
+        self.position = bisect_right(self.ids, target) - 1
+        return self.ids[self.position]
+
+class SearchIndex:
+
+    # sync_interval : 다른 worker 나 write-behind 로 저장된 트윗을 DB 에서 가져오는 주기(초)
+    # sync_overlap  : sync 할 때 마지막으로 읽은 id 보다 sync_overlap 만큼 작은 id 부터 다시 읽습니다.
+    #                 트윗 id 는 저장(commit)되는 순서와 다를 수 있어서, 먼저 id 를 받았지만 늦게 저장된 트윗을 다음 sync 에서 읽습니다.
+    def __init__(self, sync_interval = 1.0, sync_overlap = 1000):
+        self.postings = {}
+        self.lock = Lock()
+        # DB 에서 읽은 가장 큰 트윗 id
+        self.synced_id = 0
+        # 다시 읽는 범위(synced_id - sync_overlap 보다 큰 id) 안에서 sync 로 이미 색인한 트윗 id 들
+        self.synced_ids = set()
+        self.sync_interval = sync_interval
+        self.sync_overlap = sync_overlap
+        self.next_sync = 0.0
+        self.sync_lock = Lock()
+        self.documents = 0
+
+    # 트윗을 색인에 추가합니다.
+    def add(self, tweet_id, text):
+        terms = set(tokenize(text))
+        if not terms:
+            return
+
+        added = False
+        with self.lock:
+            for term in terms:
+                postings = self.postings.get(term)
+                if postings is None:
+                    postings = self.postings[term] = PostingList()
+                added = postings.add(tweet_id) or added
+
+            if added:
+                self.documents += 1
+
+    # 검색어의 단어들이 모두 들어있는 트윗 id 들을 최신순으로 최대 limit 개 반환합니다.
+    # before 가 주어지면 해당 id 보다 오래된 트윗만 찾습니다. (keyset 페이지네이션)
+    def search(self, query, limit = 20, before = None):
+        terms = set(tokenize(query))
+        if not terms:
+            return []
+
+        with self.lock:
+            lists = [self.postings.get(term) for term in terms]
+            if any(postings is None for postings in lists):
+                return []
+
+            # 트윗이 가장 적은 단어부터 확인합니다.
+            cursors = [postings.cursor() for postings in sorted(lists, key = len)]
+            target = before - 1 if before is not None else float('inf')
+
+            tweet_ids = []
+            while len(tweet_ids) < limit:
+                # 모든 단어의 cursor 가 같은 id 에 멈출 때까지, 가장 작은 id 로 다른 cursor 들을 이동시킵니다.
+                candidate = cursors[0].seek(target)
+                if candidate is None:
+                    break
+
+                matched = True
+                for cursor in cursors[1:]:
+                    found = cursor.seek(candidate)
+                    if found is None:
+                        return tweet_ids
+                    if found != candidate:
+                        target = found
+                        matched = False
+                        break
+
+                if matched:
+                    tweet_ids.append(candidate)
+                    target = candidate - 1
+
+            return tweet_ids
+
+    # 마지막 sync 이후에 저장된 트윗들을 load(after_id) 로 DB 에서 가져와서 색인합니다.
+    # load 는 after_id 보다 큰 (id, 트윗) 을 id 순서로 반환하는 함수입니다.
+    # 늦게 저장된 트윗을 건너뛰지 않도록 synced_id - sync_overlap 부터 다시 읽고, 이미 색인한 트윗은 건너뜁니다.
+    # (같은 트윗을 다시 추가해도 PostingList.add 가 중복된 id 를 추가하지 않습니다.)
+    # sync_interval 이 지나지 않았거나 다른 스레드가 sync 중이면 바로 반환합니다. force 이면 항상 sync 합니다.
+    def sync(self, load, force = False):
+        if not force and time.monotonic() < self.next_sync:
+            return
+        if not self.sync_lock.acquire(blocking = force):
+            return
+
+        try:
+            for tweet_id, text in load(max(0, self.synced_id - self.sync_overlap)):
+                if tweet_id in self.synced_ids:
+                    continue
+
+                self.add(tweet_id, text)
+                self.synced_ids.add(tweet_id)
+                self.synced_id = max(self.synced_id, tweet_id)
+
+            # 다시 읽는 범위를 벗어난 id 들은 지웁니다.
+            oldest = self.synced_id - self.sync_overlap
+            self.synced_ids = {tweet_id for tweet_id in self.synced_ids if tweet_id > oldest}
+            self.next_sync = time.monotonic() + self.sync_interval
+        finally:
+            self.sync_lock.release()
+
+    # 색인의 단어 수, 트윗 수와 사용중인 메모리(바이트)
+    def stats(self):
+        with self.lock:
+            return {
+                'terms' : len(self.postings),
+                'documents' : self.documents,
+                'postings' : sum(len(postings) for postings in self.postings.values()),
+                'bytes' : sum(postings.nbytes for postings in self.postings.values()),
+                'synced_id' : self.synced_id
+            }
+
+    # 색인을 파일로 저장합니다. 저장 중에 죽어도 이전 파일이 남도록 임시 파일에 쓴 뒤 바꿉니다.
+    # 여러 worker 가 같은 파일에 저장할 수 있으므로 임시 파일은 프로세스마다 따로 사용합니다.
+    # 형식) magic, synced_id, 트윗 수, 단어 수, [단어 길이, 단어, id 수, delta 길이, 0 부터의 delta 들] ...
+    def save(self, path):
+        with self.lock:
+            items = [(term, list(postings)) for term, postings in self.postings.items()]
+            header = struct.pack('>QQI', self.synced_id, self.documents, len(items))
+
+        temp_path = f'{path}.{os.getpid()}.tmp'
+        with open(temp_path, 'wb') as f:
+            f.write(FILE_MAGIC + header)
+            for term, ids in items:
+                term = term.encode('UTF-8')
+                data = encode_deltas([0] + ids)
+                f.write(struct.pack('>H', len(term)) + term + struct.pack('>II', len(ids), len(data)) + data)
+        os.replace(temp_path, path)
+
+    # 파일로 저장한 색인을 읽습니다.
+    @classmethod
+    def load(cls, path, sync_interval = 1.0, sync_overlap = 1000):
+        index = cls(sync_interval, sync_overlap)
+
+        with open(path, 'rb') as f:
+            if f.read(len(FILE_MAGIC)) != FILE_MAGIC:
+                raise ValueError(f'{path} is not a search index file')
+
+            index.synced_id, index.documents, term_count = struct.unpack('>QQI', f.read(20))
+            for _ in range(term_count):
+                term = f.read(struct.unpack('>H', f.read(2))[0]).decode('UTF-8')
+                count, length = struct.unpack('>II', f.read(8))
+                ids = decode_deltas(f.read(length), 0)[1:]
+
+                postings = index.postings[term] = PostingList()
+                for start in range(0, count, BLOCK_SIZE):
+                    block = ids[start:start + BLOCK_SIZE]
+                    postings.firsts.append(block[0])
+                    postings.lasts.append(block[-1])
+                    postings.counts.append(len(block))
+                    postings.blocks.append(encode_deltas(block))
+
+        return index
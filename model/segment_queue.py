@@ -0,0 +1,205 @@
+# 디스크에 저장되는 추가 전용(append-only) 큐 파일입니다.
+# 레코드들을 segment 파일(segment-00000001.log ...)의 끝에 이어서 쓰고,
+# 어디까지 처리했는지는 checkpoint 파일에 (segment 번호, offset) 으로 기록합니다.
+# 프로세스가 죽어도 checkpoint 이후의 레코드들은 segment 파일에 남아있기 때문에, 다시 시작하면 이어서 처리합니다.
+#
+# 레코드 형식 : [길이 4바이트][crc32 4바이트][json 데이터]
+# 쓰다가 죽어서 마지막 레코드가 중간까지만 쓰였으면(길이나 crc 가 맞지 않으면) 다시 열 때 잘라냅니다.
+
+import fcntl
+import glob
+import json
+import os
+import struct
+import zlib
+from threading import Lock
+
+HEADER = struct.Struct('>II')
+
+# 다른 프로세스가 사용하지 않는 큐 디렉토리를 잠급니다. 이미 다른 프로세스가 사용 중이면 None 을 반환합니다.
+# 잠금은 프로세스가 죽으면 운영체제가 풀어주기 때문에, 죽은 프로세스의 큐는 다른 프로세스가 가져갈 수 있습니다.
+def lock_directory(directory):
+    os.makedirs(directory, exist_ok = True)
+    lock_file = open(os.path.join(directory, 'lock'), 'a')
+    try:
+        fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        lock_file.close()
+        return None
+
+    return lock_file
+
+class SegmentQueue:
+
+    # directory     : segment 파일과 checkpoint 파일을 저장하는 디렉토리
+    # lock_file     : lock_directory 로 잠근 파일. 없으면 여기서 잠그며, 다른 프로세스가 사용 중이면 예외가 발생합니다.
+    # segment_bytes : segment 파일 하나의 최대 크기. 넘으면 새로운 segment 파일에 씁니다.
+    # fsync         : 레코드를 쓸 때마다 디스크에 기록(fsync)합니다. False 이면 운영체제가 죽을 때 최근 레코드를 잃을 수 있습니다.
+    def __init__(self, directory, lock_file = None, segment_bytes = 64 * 1024 * 1024, fsync = True):
+        self.directory = directory
+        self.lock_file = lock_file or lock_directory(directory)
+        if self.lock_file is None:
+            raise RuntimeError(f'{directory} is used by another process')
+
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.lock = Lock()
+
+        # 처리가 끝난 위치와 다음 레코드를 쓸 위치
+        self.checkpoint = self.load_checkpoint()
+        segments = self.segment_numbers()
+        self.write_segment = segments[-1] if segments else self.checkpoint[0]
+        self.write_offset = self.valid_end(self.write_segment)
+
+        # 마지막 segment 를 유효한 레코드의 끝까지 자르고, 그 뒤에 이어서 씁니다.
+        self.file = open(self.segment_path(self.write_segment), 'ab')
+        self.file.truncate(self.write_offset)
+
+    # 다른 프로세스가 사용하지 않는 base_directory/queue-N 디렉토리를 찾아서 큐를 엽니다.
+    # 여러 worker 프로세스가 각자의 큐를 사용하며, 다시 시작한 worker 는 죽은 worker 의 큐를 이어서 사용합니다.
+    @classmethod
+    def open_free(cls, base_directory, **options):
+        index = 0
+        while True:
+            directory = os.path.join(base_directory, f'queue-{index}')
+            lock_file = lock_directory(directory)
+            if lock_file is not None:
+                return cls(directory, lock_file, **options)
+
+            index += 1
+
+    def segment_path(self, number):
+        return os.path.join(self.directory, f'segment-{number:08d}.log')
+
+    def segment_numbers(self):
+        paths = glob.glob(os.path.join(self.directory, 'segment-*.log'))
+
+        return sorted(int(os.path.basename(path)[8:16]) for path in paths)
+
+    def load_checkpoint(self):
+        try:
+            with open(os.path.join(self.directory, 'checkpoint')) as f:
+                segment, offset = f.read().split()
+                return int(segment), int(offset)
+        except (OSError, ValueError):
+            segments = self.segment_numbers()
+            return (segments[0] if segments else 1), 0
+
+    # segment 파일에서 유효한(길이와 crc 가 맞는) 마지막 레코드가 끝나는 위치를 찾습니다.
+    def valid_end(self, number):
+        offset = 0
+        try:
+            with open(self.segment_path(number), 'rb') as f:
+                while self.read_record(f, offset) is not None:
+                    offset = f.tell()
+        except FileNotFoundError:
+            pass
+
+        return offset
+
+    # offset 위치의 레코드를 읽어서 json 데이터를 반환합니다. 유효한 레코드가 없으면 None 을 반환합니다.
+    def read_record(self, f, offset):
+        f.seek(offset)
+        header = f.read(HEADER.size)
+        if len(header) < HEADER.size:
+            return None
+
+        length, crc = HEADER.unpack(header)
+        data = f.read(length)
+        if len(data) < length or zlib.crc32(data) != crc:
+            return None
+
+        return data
+
+    # 레코드를 큐의 끝에 추가합니다.
+    def append(self, record):
+        data = json.dumps(record, separators = (',', ':')).encode('UTF-8')
+
+        with self.lock:
+            if self.write_offset >= self.segment_bytes:
+                self.roll()
+
+            self.file.write(HEADER.pack(len(data), zlib.crc32(data)) + data)
+            self.file.flush()
+            if self.fsync:
+                os.fsync(self.file.fileno())
+
+            self.write_offset += HEADER.size + len(data)
+
+    # 다음 segment 파일에 쓰기 시작합니다. lock 을 잡은 상태에서 호출합니다.
+    def roll(self):
+        self.file.close()
+        self.write_segment += 1
+        self.write_offset = 0
+        self.file = open(self.segment_path(self.write_segment), 'ab')
+
+    # checkpoint 부터 최대 max_records 개의 레코드를 읽습니다.
+    # 읽은 레코드들과, 레코드들을 처리한 뒤 commit 에 넘겨줄 위치를 반환합니다.
+    def read_batch(self, max_records):
+        with self.lock:
+            end = (self.write_segment, self.write_offset)
+
+        records = []
+        segment, offset = self.checkpoint
+        f = None
+        try:
+            while len(records) < max_records and (segment, offset) < end:
+                if f is None:
+                    f = open(self.segment_path(segment), 'rb')
+
+                data = self.read_record(f, offset)
+                if data is None:
+                    # 다 읽은(또는 끝이 손상된) 이전 segment 는 건너뛰고 다음 segment 를 읽습니다.
+                    if segment < end[0]:
+                        f.close()
+                        f = None
+                        segment, offset = segment + 1, 0
+                        continue
+                    break
+
+                records.append(json.loads(data))
+                offset = f.tell()
+        finally:
+            if f is not None:
+                f.close()
+
+        return records, (segment, offset)
+
+    # position 까지의 레코드를 처리했다고 checkpoint 파일에 기록하고, 다 처리한 segment 파일들을 지웁니다.
+    def commit(self, position):
+        path = os.path.join(self.directory, 'checkpoint')
+        with open(path + '.tmp', 'w') as f:
+            f.write(f'{position[0]} {position[1]}')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(path + '.tmp', path)
+
+        self.checkpoint = position
+
+        for number in self.segment_numbers():
+            if number < position[0]:
+                os.remove(self.segment_path(number))
+
+    # 아직 처리하지 않은 레코드들의 크기(바이트)
+    def backlog_bytes(self):
+        with self.lock:
+            end = (self.write_segment, self.write_offset)
+
+        segment, offset = self.checkpoint
+        if segment == end[0]:
+            return end[1] - offset
+
+        total = end[1] - offset
+        for number in range(segment, end[0]):
+            try:
+                total += os.path.getsize(self.segment_path(number))
+            except OSError:
+                pass
+
+        return total
+
+    # 파일들을 닫고 디렉토리 잠금을 풉니다.
+    def close(self):
+        with self.lock:
+            self.file.close()
+        self.lock_file.close()
@@ -0,0 +1,276 @@
+# 유저별 타임라인을 미리 만들어 메모리에 저장해두는 timeline store 파일입니다.
+# 트윗이 작성되면 작성자와 팔로워들의 타임라인에 트윗을 밀어넣고(fan-out-on-write),
+# 타임라인을 읽을 때는 tweets 와 users_follow_list 의 조인 없이 저장된 리스트를 그대로 사용합니다.
+# 팔로워가 너무 많은 유저(셀럽)는 fan-out 을 하지 않고, 타임라인을 읽을 때 트윗을 합칩니다(fan-out-on-read).
+# TimelineStore 는 프로세스 메모리에 저장하기 때문에 한 프로세스로 실행할 때만 사용합니다. (SERVER_WORKERS = 1)
+# 여러 worker 가 함께 사용하는 캐시(RedisCache)가 있으면 캐시에 타임라인을 저장하는 SharedTimelineStore 를 사용합니다.
+
+# 타임라인 길이를 제한하는 deque 와 오래 안 쓰인 타임라인부터 지우기 위한 OrderedDict
+from collections import deque, OrderedDict
+# 여러 요청 스레드가 동시에 타임라인을 읽고 쓰기 때문에 Lock 으로 보호합니다.
+from threading import Lock
+# 타임라인의 만료시간을 계산하는 time 모듈
+import time
+# 트윗 id 순서에 맞는 자리에 트윗을 넣는 bisect
+import bisect
+# 공유 캐시의 타임라인 버전을 만드는 uuid
+import uuid
+# 공유 캐시에 값이 아직 없다는 것을 나타내는 값
+from cache import MISSING
+
+class TimelineStore:
+
+    # max_length   : 유저 한 명의 타임라인에 저장하는 최대 트윗 수
+    # fanout_limit : 팔로워 수가 이 값을 넘으면 fan-out-on-write 대신 fan-out-on-read 를 사용합니다.
+    # max_users    : 메모리에 저장하는 최대 타임라인 수
+    # ttl          : 타임라인을 다시 DB 에서 만들기 전까지 유지하는 시간(초)
+    #                다른 프로세스에서 작성된 트윗은 push 되지 않기 때문에 ttl 이 지나면 다시 만듭니다.
+    def __init__(self, max_length = 800, fanout_limit = 10000, max_users = 100000, ttl = 60):
+        self.max_length = max_length
+        self.fanout_limit = fanout_limit
+        self.max_users = max_users
+        self.ttl = ttl
+        self.timelines = OrderedDict()
+        self.celebrities = set()
+        # DB 에서 타임라인을 만드는 중인 유저 -> [만드는 요청 수, 그 사이에 push 나 invalidate 가 있었는지]
+        # 만드는 동안 작성된 트윗은 아직 저장되지 않은 타임라인에 push 되지 않으므로, 만든 타임라인을 저장하지 않습니다.
+        self.loading = {}
+        self.lock = Lock()
+
+    # 유저의 타임라인을 오래된 트윗부터 반환합니다. 저장된 타임라인이 없거나 만료되었으면 None 을 반환합니다.
+    def get(self, user_id):
+        with self.lock:
+            item = self.timelines.get(user_id)
+            if item is None:
+                return None
+
+            expires_at, timeline = item
+            if expires_at < time.monotonic():
+                del self.timelines[user_id]
+                return None
+
+            self.timelines.move_to_end(user_id)
+            return list(timeline)
+
+    # DB 에서 만든 타임라인을 저장합니다. max_length 보다 길면 최신 트윗만 남깁니다.
+    def set(self, user_id, entries):
+        with self.lock:
+            self.store(user_id, entries)
+
+    # lock 을 잡은 상태에서 호출합니다.
+    def store(self, user_id, entries):
+        self.timelines[user_id] = (time.monotonic() + self.ttl, deque(entries, maxlen = self.max_length))
+        self.timelines.move_to_end(user_id)
+
+        # 저장된 타임라인이 너무 많으면 가장 오래 안 쓰인 타임라인부터 지웁니다.
+        while len(self.timelines) > self.max_users:
+            self.timelines.popitem(last = False)
+
+    # 새로운 트윗을 유저들의 타임라인에 밀어넣습니다.
+    # 메모리에 타임라인이 없는 유저는 다음에 읽을 때 DB 에서 만들기 때문에 건너뜁니다.
+    def push(self, user_ids, entry):
+        with self.lock:
+            for user_id in user_ids:
+                item = self.timelines.get(user_id)
+                if item is not None:
+                    item[1].append(entry)
+                self.mark_changed(user_id)
+
+    # DB 에서 build() 로 타임라인을 만들어 저장하고 반환합니다.
+    # 만드는 동안 해당 유저에게 push 나 invalidate 가 있었으면 빠진 트윗이 있을 수 있으므로 저장하지 않습니다.
+    def load(self, user_id, build):
+        with self.lock:
+            loading = self.loading.setdefault(user_id, [0, False])
+            loading[0] += 1
+
+        timeline = None
+        try:
+            timeline = build()
+        finally:
+            with self.lock:
+                loading[0] -= 1
+                if loading[0] == 0:
+                    del self.loading[user_id]
+
+                if timeline is not None and not loading[1]:
+                    self.store(user_id, timeline)
+
+        return timeline
+
+    # 팔로우/언팔로우로 팔로우 목록이 바뀐 유저의 타임라인을 지웁니다.
+    def invalidate(self, user_id):
+        self.invalidate_many([user_id])
+
+    # 여러 유저의 타임라인을 지웁니다.
+    def invalidate_many(self, user_ids):
+        with self.lock:
+            for user_id in user_ids:
+                self.timelines.pop(user_id, None)
+                self.mark_changed(user_id)
+
+    # lock 을 잡은 상태에서 호출합니다. 타임라인을 만드는 중인 유저이면 만든 타임라인을 저장하지 않게 합니다.
+    def mark_changed(self, user_id):
+        loading = self.loading.get(user_id)
+        if loading is not None:
+            loading[1] = True
+
+    # 팔로워 수를 보고 fan-out-on-write 를 할지 결정합니다.
+    # fan-out 을 하지 않는 유저는 셀럽으로 기록해두고, 타임라인을 읽을 때 따로 합쳐줍니다.
+    def should_fan_out(self, user_id, follower_count):
+        with self.lock:
+            if follower_count > self.fanout_limit:
+                self.celebrities.add(user_id)
+                return False
+
+            self.celebrities.discard(user_id)
+            return True
+
+    # 팔로우한 유저들 중 셀럽인 유저의 id 만 반환합니다.
+    def celebrities_in(self, user_ids):
+        with self.lock:
+            return [user_id for user_id in user_ids if user_id in self.celebrities]
+
+    # 셀럽이 한 명이라도 있는지 확인합니다. 없으면 팔로우 목록을 조회하지 않아도 됩니다.
+    def has_celebrities(self):
+        return len(self.celebrities) > 0
+
+# 여러 worker 가 함께 사용하는 캐시(RedisCache)에 타임라인을 저장하는 timeline store. TimelineStore 와 같은 함수들을 제공합니다.
+# 한 worker 에서 작성한 트윗이 다른 worker 의 타임라인에도 바로 보이도록, 캐시를 타임라인의 원본으로 사용합니다.
+# - 저장된 타임라인이 없으면 캐시의 SET NX lock 을 잡은 worker 만 DB 에서 만들고, 다른 worker 들은 저장될 때까지 기다립니다.
+# - 유저마다 타임라인 버전을 캐시에 저장하고, 타임라인은 DB 에서 만들기 전에 읽은 버전과 함께 저장합니다.
+# - 트윗을 작성하면 같은 lock 을 잡고 작성자와 팔로워들의 저장된 타임라인에 트윗을 넣은 뒤 새 버전으로 저장합니다. (fan-out-on-write)
+#   읽을 때 버전이 다른 타임라인은 없는 것으로 보고 DB 에서 다시 만듭니다.
+#   (lock 을 기다리다 lock_wait 가 지나 버전만 바꾼 경우에도, 만들기 전에 읽은 버전이 이미 바뀌었으므로 빠진 타임라인이 사용되지 않습니다.)
+# - 셀럽은 캐시에 ttl 동안 기록해서 모든 worker 가 타임라인을 읽을 때 셀럽의 트윗을 합칩니다.
+class SharedTimelineStore:
+
+    # cache : 여러 worker 가 함께 사용하는 캐시 backend (RedisCache)
+    # 나머지는 TimelineStore 와 같습니다. 저장하는 타임라인 수는 캐시가 제한합니다.
+    def __init__(self, cache, max_length = 800, fanout_limit = 10000, ttl = 60):
+        self.cache = cache
+        self.max_length = max_length
+        self.fanout_limit = fanout_limit
+        self.ttl = ttl
+
+    def key(self, user_id):
+        return f'timeline:{user_id}'
+
+    def version_key(self, user_id):
+        return f'timeline:{user_id}:version'
+
+    def celebrity_key(self, user_id):
+        return f'timeline:celebrity:{user_id}'
+
+    # 유저의 타임라인을 오래된 트윗부터 반환합니다. 저장된 타임라인이 없거나 버전이 바뀌었으면 default 를 반환합니다.
+    # 타임라인과 버전은 MGET 한 번으로 함께 읽습니다.
+    def get(self, user_id, default = None):
+        key, version_key = self.key(user_id), self.version_key(user_id)
+        values = self.cache.get_many([key, version_key])
+
+        item = values.get(key)
+        if not self.is_valid(item, values.get(version_key)):
+            return default
+
+        return item['tweets']
+
+    # DB 에서 build() 로 타임라인을 만들어 저장하고 반환합니다.
+    # 캐시의 SET NX lock 을 잡은 worker 만 DB 에서 만들고, 같은 유저의 타임라인을 읽으려는 다른 worker 들은
+    # lock 이 풀리거나 타임라인이 저장될 때까지 기다렸다가 저장된 타임라인을 사용합니다. (cache stampede 방지)
+    def load(self, user_id, build):
+        return self.cache.locked_build(
+            self.key(user_id),
+            lambda: self.build_timeline(user_id, build),
+            lambda: self.get(user_id, MISSING)
+        )
+
+    # lock 을 잡은 상태에서 호출합니다. 타임라인을 만들기 전에 읽은 버전과 함께 저장합니다.
+    def build_timeline(self, user_id, build):
+        version = self.cache.get(self.version_key(user_id))
+        timeline = build()
+        self.set(user_id, timeline, version)
+
+        return timeline
+
+    # 타임라인이 만료되는 시간(expires_at)을 함께 저장해서, 트윗을 넣을 때도 처음 만든 시간부터 ttl 이 지나면 만료되게 합니다.
+    def set(self, user_id, entries, version = None):
+        self.cache.set(self.key(user_id), {
+            'version' : version,
+            'tweets' : list(entries)[-self.max_length:],
+            'expires_at' : time.time() + self.ttl
+        }, self.ttl)
+
+    # 새로운 트윗을 유저들의 저장된 타임라인에 넣습니다. 저장된 타임라인이 없는 유저는 버전만 바꿉니다.
+    def push(self, user_ids, entry):
+        self.update(user_ids, lambda tweets: self.insert(tweets, entry))
+
+    def invalidate(self, user_id):
+        self.invalidate_many([user_id])
+
+    # 유저들의 타임라인 버전을 바꿔서 다음에 읽을 때 DB 에서 다시 만들게 합니다.
+    def invalidate_many(self, user_ids):
+        self.update(user_ids)
+
+    # 유저마다 타임라인을 만들 때와 같은 lock 을 잡고, 저장된 타임라인과 버전을 읽어서 modify(tweets) 로 바꾼 타임라인을 새 버전으로 저장합니다.
+    # modify 가 없으면 버전만 바꿉니다. lock 은 유저들의 키를 pipeline 으로 한 번에 잡고,
+    # 잡은 유저들의 읽기(MGET)와 쓰기(SET)도 pipeline 으로 보냅니다.
+    # lock_wait 동안 lock 을 잡지 못한 유저는 lock 없이 버전만 바꿉니다. (다음에 읽을 때 DB 에서 다시 만듭니다.)
+    def update(self, user_ids, modify = None):
+        users = {self.key(user_id) : user_id for user_id in user_ids}
+        unlocked = self.cache.run_locked(list(users), lambda keys: self.write([users[key] for key in keys], modify))
+
+        if unlocked:
+            self.write([users[key] for key in unlocked])
+
+    # lock 을 잡은 상태에서 호출합니다. 새 버전들과 바꾼 타임라인들은 SET 명령들의 pipeline 하나로 저장합니다.
+    # 버전은 타임라인보다 오래 남겨서, 버전이 만료되어 이전에 만든 타임라인이 다시 사용되지 않게 합니다.
+    # (트윗을 넣은 타임라인도 버전과 같이 저장하지만, 처음 만든 시간부터 ttl 이 지나면 expires_at 으로 사용하지 않습니다.)
+    def write(self, user_ids, modify = None):
+        values = {self.version_key(user_id) : uuid.uuid4().hex for user_id in user_ids}
+
+        if modify is not None:
+            items = self.cache.get_many([self.key(user_id) for user_id in user_ids] + [self.version_key(user_id) for user_id in user_ids])
+
+            for user_id in user_ids:
+                item = items.get(self.key(user_id))
+                if self.is_valid(item, items.get(self.version_key(user_id))):
+                    values[self.key(user_id)] = dict(
+                        item,
+                        version = values[self.version_key(user_id)],
+                        tweets = modify(item['tweets'])[-self.max_length:]
+                    )
+
+        self.cache.set_many(values, self.ttl * 2)
+
+    # 저장된 타임라인이 현재 버전으로 만들어졌고, 만료되지 않았는지 확인합니다.
+    def is_valid(self, item, version):
+        return item is not None and item['version'] == version and item.get('expires_at', 0) > time.time()
+
+    # 트윗을 트윗 id 순서에 맞게 넣습니다. 타임라인을 만들 때 DB 에서 이미 가져온 트윗이면 넣지 않습니다.
+    def insert(self, tweets, entry):
+        tweet_ids = [tweet['id'] for tweet in tweets]
+        if entry['id'] not in tweet_ids:
+            tweets.insert(bisect.bisect(tweet_ids, entry['id']), entry)
+
+        return tweets
+
+    # 팔로워 수를 보고 fan-out-on-write 를 할지 결정합니다.
+    # 셀럽이 트윗을 작성하기 전에 만든 타임라인은 ttl 이 지나면 만료되므로, 셀럽은 ttl 동안만 기록합니다.
+    def should_fan_out(self, user_id, follower_count):
+        if follower_count > self.fanout_limit:
+            self.cache.set_many({
+                self.celebrity_key(user_id) : True,
+                'timeline:celebrities' : True
+            }, self.ttl)
+            return False
+
+        return True
+
+    # 팔로우한 유저들 중 셀럽인 유저의 id 만 반환합니다.
+    def celebrities_in(self, user_ids):
+        celebrities = self.cache.get_many([self.celebrity_key(user_id) for user_id in user_ids])
+
+        return [user_id for user_id in user_ids if self.celebrity_key(user_id) in celebrities]
+
+    # ttl 안에 트윗을 작성한 셀럽이 있는지 확인합니다. 없으면 팔로우 목록을 조회하지 않아도 됩니다.
+    def has_celebrities(self):
+        return bool(self.cache.get('timeline:celebrities'))
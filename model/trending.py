@@ -0,0 +1,172 @@
+# 최근 window 초 동안 많이 쓰인 해시태그와 멘션을 메모리에서 세는 trending 파일입니다.
+# 트윗 테이블을 GROUP BY 로 세지 않고, tweet_hashtags, tweet_mentions 에 새로 저장된 행들만 DB 에서 가져와서 셉니다.
+#
+# - count-min sketch : 태그마다 카운터를 두지 않고, depth 개의 해시 함수로 width 칸 배열 depth 개에 더합니다.
+#                      태그 종류가 아무리 많아도 메모리는 depth * width 개의 카운터로 일정하며,
+#                      추정값은 실제 값보다 작지 않습니다. (다른 태그와 칸이 겹치면 조금 크게 나옵니다.)
+# - sliding window   : window 를 buckets 개의 구간으로 나눠서 구간마다 sketch 를 두고, 오래된 구간의 sketch 는 비워서 다시 씁니다.
+#                      태그의 최근 window 동안의 횟수는 모든 구간의 추정값을 더한 값입니다.
+# - top-k            : 추정값이 큰 태그 candidates 개만 후보로 기억하고(heapq 로 작은 후보부터 버림),
+#                      sync 할 때마다 후보들을 다시 추정해서 순위를 만들어두기 때문에 /trending 은 순위의 앞 k 개만 반환합니다.
+# 여러 worker 가 저장한 트윗도 DB 에서 가져오기 때문에 모든 worker 가 같은 순위를 보여줍니다.
+
+from array import array
+import heapq
+from threading import Lock
+import time
+
+# 최근 window 초 동안의 횟수를 세는 count-min sketch
+class SlidingCountMinSketch:
+
+    # window  : 횟수를 세는 시간(초)
+    # buckets : window 를 나누는 구간 수. 구간이 끝날 때마다 가장 오래된 구간의 횟수가 빠집니다.
+    # width, depth : sketch 하나의 칸 수와 해시 함수 수. 메모리는 buckets * depth * width * 4 바이트입니다.
+    def __init__(self, window = 3600, buckets = 12, width = 4096, depth = 4):
+        self.bucket_seconds = window / buckets
+        self.width = width
+        self.depth = depth
+        # 구간마다 (구간 번호, depth * width 칸의 카운터)
+        self.epochs = [None] * buckets
+        self.tables = [array('I', bytes(4 * depth * width)) for _ in range(buckets)]
+
+    @property
+    def nbytes(self):
+        return sum(table.itemsize * len(table) for table in self.tables)
+
+    # 각 해시 함수가 가리키는 칸의 위치들
+    def cells(self, key):
+        return [row * self.width + hash((row, key)) % self.width for row in range(self.depth)]
+
+    # at(초) 시간에 key 가 count 번 쓰였다고 더합니다. window 보다 오래된 시간이면 무시합니다.
+    def add(self, key, at, now, count = 1):
+        epoch = int(at // self.bucket_seconds)
+        if epoch <= int(now // self.bucket_seconds) - len(self.tables):
+            return
+
+        slot = epoch % len(self.tables)
+        if self.epochs[slot] != epoch:
+            # 오래된 구간이 끝났으므로 비워서 다시 사용합니다.
+            if self.epochs[slot] is not None and self.epochs[slot] > epoch:
+                return
+            self.tables[slot] = array('I', bytes(4 * self.depth * self.width))
+            self.epochs[slot] = epoch
+
+        table = self.tables[slot]
+        for cell in self.cells(key):
+            table[cell] += count
+
+    # now(초) 까지 최근 window 동안 key 가 쓰인 횟수의 추정값
+    def estimate(self, key, now):
+        oldest = int(now // self.bucket_seconds) - len(self.tables)
+        cells = self.cells(key)
+
+        total = 0
+        for epoch, table in zip(self.epochs, self.tables):
+            if epoch is not None and epoch > oldest:
+                total += min(table[cell] for cell in cells)
+
+        return total
+
+# 최근 window 동안 많이 쓰인 키(해시태그, 멘션) 들의 순위
+class TrendingCounter:
+
+    # candidates : 순위 후보로 기억하는 최대 키 수. /trending 으로 가져올 수 있는 최대 수보다 충분히 크게 잡습니다.
+    def __init__(self, window = 3600, buckets = 12, width = 4096, depth = 4, candidates = 200):
+        self.sketch = SlidingCountMinSketch(window, buckets, width, depth)
+        self.max_candidates = candidates
+        # 키 -> 마지막으로 추정한 횟수
+        self.candidates = {}
+        # (키, 횟수) 를 횟수가 큰 순서로 정렬한 순위
+        self.ranking = []
+
+    def add(self, key, at, now):
+        self.sketch.add(key, at, now)
+        self.candidates[key] = self.sketch.estimate(key, now)
+
+        # 후보가 너무 많아지면 추정값이 작은 후보들을 버립니다.
+        if len(self.candidates) > self.max_candidates * 2:
+            self.candidates = dict(heapq.nlargest(self.max_candidates, self.candidates.items(), key = lambda item: item[1]))
+
+    # 후보들의 횟수를 다시 추정해서 순위를 만듭니다. window 가 지나 횟수가 0 이 된 후보는 버립니다.
+    def rank(self, now):
+        estimates = ((key, self.sketch.estimate(key, now)) for key in self.candidates)
+        self.candidates = dict(heapq.nlargest(self.max_candidates, ((key, count) for key, count in estimates if count > 0), key = lambda item: item[1]))
+        self.ranking = sorted(self.candidates.items(), key = lambda item: (-item[1], item[0]))
+
+    # 횟수가 많은 키 limit 개
+    def top(self, limit):
+        return self.ranking[:limit]
+
+class TrendingTopics:
+
+    # window, buckets, width, depth, candidates : TrendingCounter 설정
+    # sync_interval : 새로 저장된 해시태그와 멘션을 DB 에서 가져오는 주기(초)
+    # sync_overlap  : sync 할 때 마지막으로 읽은 트윗 id 보다 sync_overlap 만큼 작은 id 부터 다시 읽습니다.
+    #                 트윗 id 는 저장(commit)되는 순서와 다를 수 있어서, 먼저 id 를 받았지만 늦게 저장된 트윗을 다음 sync 에서 셉니다.
+    # clock : 현재 시간(초)을 반환하는 함수 (DB 의 created_at 과 같은 기준)
+    def __init__(self, window = 3600, buckets = 12, width = 4096, depth = 4, candidates = 200, sync_interval = 1.0, sync_overlap = 1000, clock = time.time):
+        self.window = window
+        self.hashtags = TrendingCounter(window, buckets, width, depth, candidates)
+        self.mentions = TrendingCounter(window, buckets, width, depth, candidates)
+        self.sync_interval = sync_interval
+        self.sync_overlap = sync_overlap
+        self.clock = clock
+        # DB 에서 읽은 가장 큰 트윗 id
+        self.synced_id = 0
+        # 다시 읽는 범위(synced_id - sync_overlap 보다 큰 id) 안에서 이미 센 트윗 id 들. 다시 읽은 트윗은 세지 않습니다.
+        self.counted_ids = set()
+        self.next_sync = 0.0
+        self.lock = Lock()
+
+    # 마지막 sync 이후에 저장된 해시태그와 멘션들을 load(after_id, since) 로 DB 에서 가져와서 세고, 순위를 다시 만듭니다.
+    # load 는 after_id 보다 큰 트윗 중 since(초) 이후에 작성된 트윗의 (트윗 id, 작성시간(초), 해시태그 또는 None, 멘션 또는 None) 을
+    # 트윗 id 순서로 반환하는 함수입니다.
+    # 늦게 저장된 트윗을 건너뛰지 않도록 synced_id - sync_overlap 부터 다시 읽고, 이전 sync 에서 센 트윗의 행들은 건너뜁니다.
+    # sync_interval 이 지나지 않았거나 다른 스레드가 sync 중이면 바로 반환합니다.
+    def sync(self, load, force = False):
+        if not force and time.monotonic() < self.next_sync:
+            return
+        if not self.lock.acquire(blocking = force):
+            return
+
+        try:
+            now = self.clock()
+            # 트윗 하나의 해시태그와 멘션은 여러 행이므로, 이번 sync 에서 센 트윗 id 들은 끝난 뒤에 counted_ids 에 추가합니다.
+            counted_ids = set()
+            for tweet_id, at, tag, name in load(max(0, self.synced_id - self.sync_overlap), now - self.window):
+                if tweet_id in self.counted_ids:
+                    continue
+                counted_ids.add(tweet_id)
+
+                # 서버 시간이 조금 달라도 미래의 구간에 더하지 않습니다.
+                at = min(at, now)
+                if tag is not None:
+                    self.hashtags.add(tag, at, now)
+                if name is not None:
+                    self.mentions.add(name, at, now)
+                self.synced_id = max(self.synced_id, tweet_id)
+
+            # 다시 읽는 범위를 벗어난 id 들은 지웁니다.
+            oldest = self.synced_id - self.sync_overlap
+            self.counted_ids = {tweet_id for tweet_id in self.counted_ids | counted_ids if tweet_id > oldest}
+
+            self.hashtags.rank(now)
+            self.mentions.rank(now)
+            self.next_sync = time.monotonic() + self.sync_interval
+        finally:
+            self.lock.release()
+
+    # 최근 window 동안 많이 쓰인 해시태그와 멘션 limit 개씩
+    def top(self, limit = 10):
+        return {
+            'hashtags' : [{'tag' : tag, 'count' : count} for tag, count in self.hashtags.top(limit)],
+            'mentions' : [{'name' : name, 'count' : count} for name, count in self.mentions.top(limit)]
+        }
+
+    def stats(self):
+        return {
+            'synced_id' : self.synced_id,
+            'hashtag_candidates' : len(self.hashtags.candidates),
+            'mention_candidates' : len(self.mentions.candidates),
+            'bytes' : self.hashtags.sketch.nbytes + self.mentions.sketch.nbytes
+        }
@@ -1,49 +1,220 @@
 # 유저의 트윗을 저장하고 불러오는 modle layer 파일입니다.
 
 # sqlalchemy 를 사용하는데 필요한 or 문과 별칭인 aliased 를 추가합니다.
-from sqlalchemy import or_
+from sqlalchemy import or_, null, Float
 from sqlalchemy.orm import aliased
+# DB 마다 다른 SQL 로 바뀌는 함수를 만드는 FunctionElement 와 compiles
+from sqlalchemy.sql.expression import FunctionElement
+from sqlalchemy.ext.compiler import compiles
 
-# contextmanager 를 통해서, 세션을 생성하구 커밋, 종료를 반복하지 않고
-# 재사용할 수 있게끔 사용해줍니다.
-from contextlib import contextmanager
-
-Session = None
-
-# contextmanager 데코레이션을 사용해 try/finally이 재사용가능한 
-# session_scope함수를 만들고, with 문을 통해서 해당 함수를 불러온다.
-@contextmanager
-def session_scope():
-    # SQLAlchemy 의 세션을 global하게 사용안하게끔 멀티스레드처럼 세션들을 생성한다.
-    session = Session()
-    try:
-        #yield 로 생성한 session을 전달합니다.
-        yield session
-        session.commit()
-    except:
-        session.rollback()
-        raise
-    finally:
-        session.close()
+# 여러 DAO 가 함께 사용하는 세션 관리 함수
+from .database import session_scope
+
+# 초 단위 시간(unix time)을 TIMESTAMP 로 바꾸는 SQL 함수.
+# created_at 은 DB 의 time zone 으로 읽히기 때문에 파이썬에서 바꾸지 않고 DB 에서 바꿔서 비교합니다.
+class from_unix_time(FunctionElement):
+    name = 'from_unix_time'
+
+@compiles(from_unix_time)
+def compile_from_unix_time(element, compiler, **kw):
+    return 'FROM_UNIXTIME(%s)' % compiler.process(element.clauses, **kw)
+
+# SQLite 의 CURRENT_TIMESTAMP 는 UTC 입니다.
+@compiles(from_unix_time, 'sqlite')
+def compile_from_unix_time_sqlite(element, compiler, **kw):
+    return "datetime(%s, 'unixepoch')" % compiler.process(element.clauses, **kw)
+
+# TIMESTAMP 를 초 단위 시간(unix time)으로 바꾸는 SQL 함수
+class unix_time(FunctionElement):
+    type = Float()
+    name = 'unix_time'
+
+@compiles(unix_time)
+def compile_unix_time(element, compiler, **kw):
+    return 'UNIX_TIMESTAMP(%s)' % compiler.process(element.clauses, **kw)
+
+@compiles(unix_time, 'sqlite')
+def compile_unix_time_sqlite(element, compiler, **kw):
+    return "CAST(strftime('%%s', %s) AS REAL)" % compiler.process(element.clauses, **kw)
 
 # 해당 트윗 로직에 필요한 tweet, followList ORM 을 상속받습니다. 
+# query_mode 는 타임라인 쿼리 방식입니다.
+#   - 'union' : "내 트윗" 과 "팔로우한 유저들의 트윗(IN 서브쿼리)" 을 UNION 으로 합칩니다. 각 쿼리가 인덱스를 사용합니다.
+#   - 'join'  : 기존의 outerjoin + or_ 쿼리. 트윗 x 팔로우 행의 곱을 만들고, 중복된 행이 나올 수 있습니다.
+# router(ReplicaRouter)가 주어지면 읽기 쿼리는 replica 로 보내고, 쓰기를 한 유저는 잠시 primary 에서 읽게 합니다.
+# follow_cache(FollowGraphCache)가 주어지면 팔로우 목록을 캐시에서 가져와서,
+# 타임라인 쿼리에서 users_follow_list 서브쿼리 대신 작성자 id 들의 IN (...) 조건을 사용합니다.
+# tweet_hashtagsORM, tweet_mentionsORM 이 주어지면 트윗의 해시태그와 멘션을 트윗과 같은 트랜잭션으로 저장합니다.
 class TweetDao:
-    def __init__(self, session, tweetsORM, user_follow_listORM):
-        global Session
-        Session =  session
+    def __init__(self, session, tweetsORM, user_follow_listORM, query_mode = 'union', router = None, follow_cache = None, tweet_hashtagsORM = None, tweet_mentionsORM = None):
+        self.Session = session
         self.Tweets = tweetsORM
         self.UsersFollowList = user_follow_listORM
+        self.query_mode = query_mode
+        self.router = router
+        self.follow_cache = follow_cache
+        self.TweetHashtags = tweet_hashtagsORM
+        self.TweetMentions = tweet_mentionsORM
+
+    # 읽기 쿼리에 사용할 세션공장. key 는 최근 쓰기 여부를 확인하는 키입니다. (예: ('user', 1))
+    def read_session(self, key = None):
+        return self.router.reader(key) if self.router else self.Session
+
+    # key 로 쓰기를 했다고 router 에 기록합니다.
+    def mark_write(self, key):
+        if self.router:
+            self.router.mark_write(key)
+
+    # 해당 유저가 팔로우한 유저 id 들을 DB 에서 가져옵니다.
+    def load_follow_ids(self, session, user_id):
+        rows = session.query(self.UsersFollowList.follow_user_id).\
+                    filter(self.UsersFollowList.user_id == user_id).all()
+
+        return [row.follow_user_id for row in rows]
+
+    # 타임라인에 보여줄 트윗의 작성자 조건 (내 트윗 + 팔로우한 유저들의 트윗)
+    # follow_cache 가 있으면 캐시의 팔로우 목록으로 IN (...) 조건을 만들기 때문에 users_follow_list 를 조회하지 않고,
+    # 없으면 users_follow_list 의 IN 서브쿼리를 사용합니다.
+    def timeline_authors(self, session, t, user_id):
+        if self.follow_cache is not None:
+            follow_ids = self.follow_cache.get_or_load(user_id, lambda: self.load_follow_ids(session, user_id))
+            return t.user_id.in_([user_id] + list(follow_ids))
+
+        ufl = aliased(self.UsersFollowList)
+        follow_ids = session.query(ufl.follow_user_id).filter(ufl.user_id == user_id)
+
+        return or_(t.user_id == user_id, t.user_id.in_(follow_ids))
+
+    # 내 트윗과 팔로우한 유저들의 트윗을 각각 가져와 UNION 으로 합치는 타임라인 쿼리
+    # 내 트윗은 tweets 의 (user_id, id) 인덱스를, 팔로우 목록은 users_follow_list 의 기본키를 사용하기 때문에
+    # 트윗 x 팔로우 행의 곱을 만들지 않고, UNION 으로 중복된 트윗도 제거합니다.
+    # follow_cache 가 있으면 작성자 id 들의 IN (...) 조건 하나로 가져오기 때문에 UNION 이 필요 없습니다.
+    def timeline_query(self, session, t, user_id):
+        if self.follow_cache is not None:
+            return session.query(t.id, t.user_id, t.tweet).filter(self.timeline_authors(session, t, user_id))
+
+        ufl = aliased(self.UsersFollowList)
+        follow_ids = session.query(ufl.follow_user_id).filter(ufl.user_id == user_id)
+        my_tweets = session.query(t.id, t.user_id, t.tweet).filter(t.user_id == user_id)
+        follow_tweets = session.query(t.id, t.user_id, t.tweet).filter(t.user_id.in_(follow_ids))
+
+        return my_tweets.union(follow_tweets)
 
     # 사용자의 트윗을 저장하는 함수
-    def insert_tweet(self, user_id, tweet):
-        with session_scope() as session:        
+    # flush 를 통해 저장한 트윗의 id 값을 가져와서 반환합니다. (타임라인 캐시에서 트윗을 구분하는 키로 사용)
+    # 트윗의 해시태그와 멘션들은 같은 트랜잭션에서 함께 저장합니다.
+    def insert_tweet(self, user_id, tweet, hashtags = (), mentions = ()):
+        with session_scope(self.Session) as session:        
             tweet = self.Tweets(user_id, tweet)
             session.add(tweet)
+            session.flush()
+            self.insert_entities(session, [(tweet.id, hashtags, mentions)])
+            self.mark_write(('user', user_id))
+
+            return tweet.id
 
-            return True
+    # 트윗들의 (트윗 id, 해시태그들, 멘션들) 을 테이블마다 여러 행을 한 번에 저장하는 INSERT IGNORE 로 저장합니다.
+    # 이미 저장된 행은 건너뜁니다.
+    def insert_entities(self, session, entities):
+        if self.TweetHashtags is None:
+            return
+
+        for table, column, index in [(self.TweetHashtags.__table__, 'tag', 1), (self.TweetMentions.__table__, 'name', 2)]:
+            rows = [{'tweet_id' : entity[0], column : value} for entity in entities for value in entity[index]]
+            if rows:
+                session.execute(table.insert().\
+                                    prefix_with('IGNORE', dialect = 'mysql').\
+                                    prefix_with('OR IGNORE', dialect = 'sqlite').\
+                                    values(rows))
+
+    # 여러 트윗을 한 번에 저장하는 함수
+    # rows 는 {'user_id', 'tweet'} 의 리스트이며, 먼저 전체 트윗의 300자 제한을 한 번에 검사합니다.
+    # 통과한 트윗들은 ORM 객체를 만들지 않고 Core insert 의 executemany 로 chunk_size 개씩 나눠서
+    # 하나의 트랜잭션에 저장합니다. 각 행의 저장 결과('created', 'too_long', 'invalid')를 순서대로 반환합니다.
+    # 행에 'hashtags', 'mentions' 가 있으면 insert_chunk_with_ids 로 트윗의 id 를 알아내서 같은 트랜잭션에서 함께 저장합니다.
+    def insert_tweets(self, rows, chunk_size = 1000):
+        statuses = [
+            'invalid' if not isinstance(row['tweet'], str) else
+            'too_long' if len(row['tweet']) > 300 else
+            'created'
+        for row in rows]
+        valid_rows = [row for row, status in zip(rows, statuses) if status == 'created']
+
+        if valid_rows:
+            statement = self.Tweets.__table__.insert()
+            with session_scope(self.Session) as session:
+                for start in range(0, len(valid_rows), chunk_size):
+                    chunk = valid_rows[start:start + chunk_size]
+                    values = [{
+                        'user_id' : row['user_id'],
+                        'tweet' : row['tweet']
+                    } for row in chunk]
+
+                    if self.TweetHashtags is not None and any(row.get('hashtags') or row.get('mentions') for row in chunk):
+                        tweet_ids = self.insert_chunk_with_ids(session, statement, values)
+                        self.insert_entities(session, [
+                            (tweet_id, row.get('hashtags', ()), row.get('mentions', ()))
+                        for tweet_id, row in zip(tweet_ids, chunk)])
+                    else:
+                        session.execute(statement, values)
+
+                for user_id in {row['user_id'] for row in valid_rows}:
+                    self.mark_write(('user', user_id))
+
+        return statuses
+
+    # 트윗들을 하나의 INSERT ... VALUES (...), (...) 로 저장하고, 저장한 순서대로 트윗 id 들을 반환합니다.
+    # 행 수를 아는 하나의 INSERT 는 다른 요청이 동시에 저장해도 연속된 id 를 받습니다. (InnoDB 의 simple insert)
+    # lastrowid 는 MySQL 에서는 첫 번째 행의 id, SQLite 에서는 마지막 행의 id 입니다.
+    def insert_chunk_with_ids(self, session, statement, values):
+        result = session.execute(statement.values(values))
+
+        first_id = result.lastrowid
+        if session.get_bind().dialect.name == 'sqlite':
+            first_id -= len(values) - 1
+
+        return range(first_id, first_id + len(values))
 
     # 사용자의 타임라인을 가져오는 함수
     def get_timeline(self, user_id):
+        if self.query_mode == 'join':
+            return self.get_timeline_join(user_id)
+
+        return self.get_timeline_union(user_id)
+
+    # timeline_query 로 타임라인을 가져옵니다. (query_mode = 'union')
+    def get_timeline_union(self, user_id):
+        t = aliased(self.Tweets)
+
+        with session_scope(self.read_session(('user', user_id))) as session:
+            timeline = self.timeline_query(session, t, user_id).order_by(t.id).all()
+
+            return [{
+                'user_id' : tweet.user_id,
+                'tweet' : tweet.tweet
+            } for tweet in timeline]
+
+    # 타임라인을 리스트로 만들지 않고 트윗을 하나씩 반환하는 generator 함수
+    # yield_per 와 stream_results(서버사이드 커서)를 사용해서 batch_size 개씩만 DB 에서 가져오기 때문에,
+    # 타임라인의 트윗이 아무리 많아도 메모리에는 batch_size 개의 트윗만 올라갑니다.
+    # generator 는 읽을 때마다 다른 스레드에서 실행될 수 있기 때문에(starlette 의 스레드 풀), 스레드마다 하나인 세션 레지스트리의
+    # 세션 대신 이 generator 만 사용하는 세션을 새로 만듭니다. 세션은 generator 가 끝나거나 닫힐 때 정리됩니다.
+    def iter_timeline(self, user_id, batch_size = 1000):
+        t = aliased(self.Tweets)
+        Session = self.read_session(('user', user_id))
+
+        with session_scope(getattr(Session, 'session_factory', Session)) as session:
+            timeline = self.timeline_query(session, t, user_id).order_by(t.id).\
+                        execution_options(stream_results = True).yield_per(batch_size)
+
+            for tweet in timeline:
+                yield {
+                    'user_id' : tweet.user_id,
+                    'tweet' : tweet.tweet
+                }
+
+    # 기존의 outerjoin 을 사용하는 타임라인 쿼리 (query_mode = 'join')
+    def get_timeline_join(self, user_id):
         # 깔끔한 쿼리문을 위해, 두 테이블에 별칭을 달아줍니다.
         t = aliased(self.Tweets)
         ufl = aliased(self.UsersFollowList)
@@ -52,13 +223,138 @@ class TweetDao:
         # 왼쪽 조인으로 해당 유저가 팔로우리스트가 비었어도 
         # 해당 유저의 트윗은 전부 가져올 수 있도록 전체 트윗 데이터를 가져옵니다.
         # 이때, where절에 해당 유저의 id와 팔로우한 유저의 id로만 트윗을 가져오게 설정합니다.
-        with session_scope() as session:
-            timeline = session.query(t.user_id, t.tweet).\
+        # 팔로우 수만큼 중복되는 내 트윗은 DISTINCT 로 한 번만 가져오고, union 쿼리와 같이 트윗 id 순서로 정렬합니다.
+        with session_scope(self.read_session(('user', user_id))) as session:
+            timeline = session.query(t.id, t.user_id, t.tweet).\
                         outerjoin(ufl, ufl.user_id == user_id).\
-                        filter(or_(t.user_id == user_id, t.user_id == ufl.follow_user_id)).all()
+                        filter(or_(t.user_id == user_id, t.user_id == ufl.follow_user_id)).\
+                        distinct().order_by(t.id).all()
         
             # 가져온 트윗 데이터를 타임라인배열로 매핑한 뒤, 클라이언트에 반환해줍니다.
             return [{
                 'user_id' : tweet.user_id,
                 'tweet' : tweet.tweet
             } for tweet in timeline]
+
+    # 사용자의 타임라인을 최신 트윗부터 한 페이지(limit 개)씩 가져오는 함수
+    # before 가 주어지면 해당 트윗 id 보다 오래된 트윗만 가져오는 keyset 페이지네이션을 사용하며,
+    # (user_id, id DESC) 인덱스를 사용하기 때문에 트윗이 많아도 한 페이지를 가져오는 비용이 일정합니다.
+    # 다음 페이지가 있으면 마지막 트윗의 id 를 next_cursor 로 함께 반환합니다.
+    def get_timeline_page(self, user_id, before = None, limit = 50):
+        t = aliased(self.Tweets)
+
+        with session_scope(self.read_session(('user', user_id))) as session:
+            query = session.query(t.id, t.user_id, t.tweet, t.created_at).\
+                        filter(self.timeline_authors(session, t, user_id))
+
+            if before is not None:
+                query = query.filter(t.id < before)
+
+            # 다음 페이지가 있는지 알기 위해 limit 보다 하나 더 가져옵니다.
+            rows = query.order_by(t.id.desc()).limit(limit + 1).all()
+            next_cursor = rows[limit - 1].id if len(rows) > limit else None
+
+            return [{
+                'id' : tweet.id,
+                'user_id' : tweet.user_id,
+                'tweet' : tweet.tweet,
+                'created_at' : tweet.created_at
+            } for tweet in rows[:limit]], next_cursor
+
+    # 타임라인 캐시를 채우기 위해 해당 유저와 팔로우한 유저들의 최신 트윗을 limit 개만 가져오는 함수
+    # 캐시에서 트윗을 구분할 수 있도록 트윗 id 를 함께 반환하며, 오래된 트윗부터 정렬합니다.
+    def get_recent_timeline(self, user_id, limit):
+        t = aliased(self.Tweets)
+
+        with session_scope(self.read_session(('user', user_id))) as session:
+            timeline = session.query(t.id, t.user_id, t.tweet).\
+                        filter(self.timeline_authors(session, t, user_id)).\
+                        order_by(t.id.desc()).limit(limit).all()
+
+            return [{
+                'id' : tweet.id,
+                'user_id' : tweet.user_id,
+                'tweet' : tweet.tweet
+            } for tweet in reversed(timeline)]
+
+    # 여러 유저들의 최신 트윗을 limit 개만 가져오는 함수
+    # 팔로워가 너무 많아 fan-out 을 하지 않은 유저들의 트윗을 타임라인을 읽을 때 합치기 위해 사용합니다.
+    def get_recent_tweets(self, user_ids, limit):
+        with session_scope(self.read_session()) as session:
+            tweets = session.query(self.Tweets.id, self.Tweets.user_id, self.Tweets.tweet).\
+                        filter(self.Tweets.user_id.in_(user_ids)).\
+                        order_by(self.Tweets.id.desc()).limit(limit).all()
+
+            return [{
+                'id' : tweet.id,
+                'user_id' : tweet.user_id,
+                'tweet' : tweet.tweet
+            } for tweet in reversed(tweets)]
+
+    # 해당 유저를 팔로우하는 유저들의 id 를 최대 limit 개까지 가져오는 함수
+    def get_follower_ids(self, user_id, limit):
+        with session_scope(self.read_session(('user', user_id))) as session:
+            rows = session.query(self.UsersFollowList.user_id).\
+                        filter(self.UsersFollowList.follow_user_id == user_id).limit(limit).all()
+
+            return [row.user_id for row in rows]
+
+    # 해당 유저가 팔로우한 유저들의 id 를 가져오는 함수
+    # follow_cache 가 있으면 캐시에 저장된 팔로우 목록을 사용합니다.
+    def get_follow_ids(self, user_id):
+        with session_scope(self.read_session(('user', user_id))) as session:
+            if self.follow_cache is not None:
+                return list(self.follow_cache.get_or_load(user_id, lambda: self.load_follow_ids(session, user_id)))
+
+            return self.load_follow_ids(session, user_id)
+
+    # 트윗 id 들로 트윗들을 가져오는 함수 (검색 결과를 보여주기 위해 사용합니다.)
+    # 기본키로 한 번에 가져오며, 주어진 id 의 순서대로 반환합니다. 지워진 트윗은 빠집니다.
+    def get_tweets(self, tweet_ids):
+        if not tweet_ids:
+            return []
+
+        with session_scope(self.read_session()) as session:
+            rows = session.query(self.Tweets.id, self.Tweets.user_id, self.Tweets.tweet, self.Tweets.created_at).\
+                        filter(self.Tweets.id.in_(tweet_ids)).all()
+            tweets = {row.id : row for row in rows}
+
+            return [{
+                'id' : tweet.id,
+                'user_id' : tweet.user_id,
+                'tweet' : tweet.tweet,
+                'created_at' : tweet.created_at
+            } for tweet in (tweets.get(tweet_id) for tweet_id in tweet_ids) if tweet is not None]
+
+    # after_id 보다 큰 트윗들의 (id, 트윗) 을 id 순서로 하나씩 반환하는 generator 함수 (검색 색인을 채우기 위해 사용합니다.)
+    # iter_timeline 처럼 batch_size 개씩만 DB 에서 가져오며, replica 에 아직 없는 트윗을 건너뛰지 않도록 primary 에서 읽습니다.
+    def iter_tweets(self, after_id = 0, batch_size = 1000):
+        with session_scope(self.Session) as session:
+            rows = session.query(self.Tweets.id, self.Tweets.tweet).\
+                        filter(self.Tweets.id > after_id).order_by(self.Tweets.id).\
+                        execution_options(stream_results = True).yield_per(batch_size)
+
+            for row in rows:
+                yield row.id, row.tweet
+
+    # after_id 보다 큰 트윗 중 since(초) 이후에 작성된 트윗들의 해시태그와 멘션을 트윗 id 순서로 하나씩 반환하는 generator 함수 (trending 용)
+    # (트윗 id, 작성시간(초), 해시태그 또는 None, 멘션 또는 None) 을 반환하며,
+    # 두 테이블을 UNION ALL 하나로 읽기 때문에 그 사이에 저장된 트윗 때문에 한 테이블의 행만 건너뛰는 일이 없습니다.
+    # 처음 읽을 때(after_id = 0)는 window 안의 행을 찾기 위해 두 테이블을 한 번 모두 읽습니다.
+    def iter_tweet_entities(self, after_id = 0, since = 0, batch_size = 1000):
+        t = self.Tweets
+        h = self.TweetHashtags
+        m = self.TweetMentions
+        # 작성시간은 DB 에서 초 단위 시간과 바꿔서, DB 와 서버의 time zone 이 달라도 같은 기준으로 비교합니다.
+        since = from_unix_time(since)
+
+        with session_scope(self.Session) as session:
+            hashtags = session.query(h.tweet_id.label('tweet_id'), unix_time(t.created_at).label('created_at'), h.tag.label('tag'), null().label('name')).\
+                        join(t, t.id == h.tweet_id).filter(h.tweet_id > after_id, t.created_at >= since)
+            mentions = session.query(m.tweet_id, unix_time(t.created_at), null(), m.name).\
+                        join(t, t.id == m.tweet_id).filter(m.tweet_id > after_id, t.created_at >= since)
+            rows = hashtags.union_all(mentions).order_by('tweet_id').\
+                        execution_options(stream_results = True).yield_per(batch_size)
+
+            for row in rows:
+                yield row[0], float(row[1]), row[2], row[3]
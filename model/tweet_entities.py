@@ -0,0 +1,28 @@
+# 트윗에서 #해시태그와 @멘션을 찾는 파일입니다.
+# 트윗을 저장할 때 TweetService 가 찾아서 트윗과 같은 트랜잭션으로 tweet_hashtags, tweet_mentions 테이블에 저장합니다.
+#
+# - 해시태그 : # 뒤의 글자, 숫자, _ (한글 포함). 숫자로만 된 태그(#1)는 제외합니다. 예) #파이썬, #flask_study
+# - 멘션     : @ 뒤의 글자, 숫자, _. 이메일 주소(a@b.com)처럼 앞에 글자가 붙어있는 @ 는 제외합니다.
+# 같은 트윗에서 대소문자만 다른 태그는 하나로 저장합니다.
+
+import re
+import unicodedata
+
+HASHTAG = re.compile(r'(?<![\w#])#(\w*[^\W\d]\w*)')
+MENTION = re.compile(r'(?<![\w@])@(\w+)')
+
+# 테이블 컬럼 길이를 넘는 태그와 이름은 저장하지 않습니다.
+MAX_TAG_LENGTH = 100
+MAX_NAME_LENGTH = 255
+
+# 트윗에서 해시태그와 멘션들을 찾아서, 소문자로 바꾼 (해시태그 리스트, 멘션 리스트) 를 트윗에 나온 순서대로 반환합니다.
+def extract_entities(tweet):
+    tweet = unicodedata.normalize('NFKC', tweet)
+
+    hashtags = unique(tag.lower() for tag in HASHTAG.findall(tweet) if len(tag) <= MAX_TAG_LENGTH)
+    mentions = unique(name.lower() for name in MENTION.findall(tweet) if len(name) <= MAX_NAME_LENGTH)
+
+    return hashtags, mentions
+
+def unique(values):
+    return list(dict.fromkeys(values))
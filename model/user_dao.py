@@ -1,35 +1,41 @@
 # 유저에 대한 정보를 저장하고 불러오는 modle layer 파일입니다.
 
-# contextmanager 를 통해서, 세션을 생성하구 커밋, 종료를 반복하지 않고
-# 재사용할 수 있게끔 사용해줍니다.
-from contextlib import contextmanager
-
-Session = None
-
-# contextmanager 데코레이션을 사용해 try/finally이 재사용가능한 
-# session_scope함수를 만들고, with 문을 통해서 해당 함수를 불러온다.
-@contextmanager
-def session_scope():
-    # SQLAlchemy 의 세션을 global하게 사용안하게끔 멀티스레드처럼 세션들을 생성한다.
-    session = Session()
-    try:
-        #yield 로 생성한 session을 전달합니다.
-        yield session
-        session.commit()
-    except:
-        session.rollback()
-        raise
-    finally:
-        session.close()
+# 여러 행을 한 번에 삭제할 때 조건을 묶어주는 and_, 팔로워/팔로잉 수를 세는 func
+from sqlalchemy import and_, func
+
+# 여러 DAO 가 함께 사용하는 세션 관리 함수
+from .database import session_scope
 
 # 해당 유저 로직에 필요한 user, followList ORM 을 상속받습니다. 
+# router(ReplicaRouter)가 주어지면 읽기 쿼리는 replica 로 보내고, 쓰기를 한 유저는 잠시 primary 에서 읽게 합니다.
+# follow_cache(FollowGraphCache)가 주어지면 팔로우/언팔로우를 저장한 뒤 해당 유저의 캐시된 팔로우 목록을 지웁니다.
+# user_follow_countsORM 이 주어지면 팔로우/언팔로우를 저장하는 트랜잭션에서 팔로워/팔로잉 수도 함께 증가/감소시키고,
+# 프로필의 팔로워/팔로잉 수를 COUNT(*) 없이 가져옵니다. (없으면 users_follow_list 에서 COUNT(*) 로 셉니다.)
+# follow_suggestionsORM 은 배치 작업이 미리 계산해둔 팔로우 추천을 가져오는 테이블입니다.
 class UserDao:
-    def __init__(self, session, userORM, user_follow_listORM):
+    def __init__(self, session, userORM, user_follow_listORM, router = None, follow_cache = None, user_follow_countsORM = None, follow_suggestionsORM = None):
 
-        global Session
-        Session =  session
+        self.Session = session
         self.Users = userORM
         self.UsersFollowList = user_follow_listORM
+        self.router = router
+        self.follow_cache = follow_cache
+        self.UserFollowCounts = user_follow_countsORM
+        self.FollowSuggestions = follow_suggestionsORM
+
+    # 읽기 쿼리에 사용할 세션공장. key 는 최근 쓰기 여부를 확인하는 키입니다. (예: ('user', 1))
+    def read_session(self, key = None):
+        return self.router.reader(key) if self.router else self.Session
+
+    # key 로 쓰기를 했다고 router 에 기록합니다.
+    def mark_write(self, key):
+        if self.router:
+            self.router.mark_write(key)
+
+    # 팔로우 목록이 바뀐 유저의 캐시된 팔로우 목록을 지웁니다. 트랜잭션이 커밋된 뒤에 호출합니다.
+    def invalidate_follows(self, user_id):
+        if self.follow_cache is not None:
+            self.follow_cache.invalidate(user_id)
 
     # 새로운 유저를 DB에 저장하는 함수
     def insert_user(self, user):
@@ -38,15 +44,18 @@ class UserDao:
         
         # DB 세션을 통해 새로운 유저데이터를 저장.
         # flush 를 통해 add한 데이터를 DB에 적용시켜서, 해당 데이터에 대한 last row id 값을 가져옵니다.
-        with session_scope() as session:        
+        with session_scope(self.Session) as session:        
             session.add(new_user)
             session.flush()
+            if self.UserFollowCounts is not None:
+                session.add(self.UserFollowCounts(new_user.id))
+            self.mark_write(('email', user['email']))
 
             return new_user.id
 
     # 이메일을 통해 id 와 pw 를 가져오는 함수
     def get_user_id_and_password(self, email):
-        with session_scope() as session:
+        with session_scope(self.read_session(('email', email))) as session:
             # 로그인하는 유저의 이메일과 매칭되는 DB에 저장된 유저의 데이터를 가져온다.
             row = session.query(self.Users.id, self.Users.hashed_password).filter(self.Users.email == email).first()
 
@@ -56,19 +65,258 @@ class UserDao:
             } if row else None
 
     # 유저의 팔로우 요청을 저장합니다.
+    # 같은 트랜잭션에서 내 팔로잉 수와 상대의 팔로워 수를 1 씩 증가시킵니다.
     def insert_follow(self, user_id, follow_id):
-        with session_scope() as session:        
+        with session_scope(self.Session) as session:        
             newFollow = self.UsersFollowList(user_id, follow_id)
             session.add(newFollow)
+            # 이미 팔로우한 유저면 여기서 에러가 발생해서 팔로워/팔로잉 수를 바꾸지 않습니다.
+            session.flush()
+            self.update_follow_counts(session, user_id, [follow_id], 1)
+            self.mark_write(('user', user_id))
 
-            return True
+        self.invalidate_follows(user_id)
+        return True
 
     # 사용자가 언팔로우한 요청을 찾아 삭제 후 저장.
+    # 실제로 삭제된 행이 있을 때만, 같은 트랜잭션에서 팔로워/팔로잉 수를 1 씩 감소시킵니다.
+    # (동시에 같은 언팔로우 요청이 와도 DELETE 의 rowcount 로 확인하기 때문에 두 번 감소시키지 않습니다.)
     def insert_unfollow(self, user_id, unfollow_id):
-        with session_scope() as session:
-            user = session.query(self.UsersFollowList).filter(self.UsersFollowList.user_id == user_id, self.UsersFollowList.follow_user_id == unfollow_id).first()
-            if user:
-                session.delete(user)
-                return True
+        table = self.UsersFollowList.__table__
+        statement = table.delete().where(and_(
+                        table.c.user_id == user_id,
+                        table.c.follow_user_id == unfollow_id))
+
+        with session_scope(self.Session) as session:
+            deleted = session.execute(statement).rowcount == 1
+            if deleted:
+                self.update_follow_counts(session, user_id, [unfollow_id], -1)
+                self.mark_write(('user', user_id))
+
+        if deleted:
+            self.invalidate_follows(user_id)
+            return True
+        else:
+            return False
+
+    # 여러 유저를 한 번에 팔로우합니다.
+    # 하나의 트랜잭션에서 여러 행을 한 번에 저장하는 INSERT IGNORE 를 사용하며, 이미 팔로우한 유저는 건너뜁니다.
+    # 새로 팔로우한 유저 수를 반환합니다.
+    def insert_follows(self, user_id, follow_ids):
+        follow_ids = sorted(set(follow_ids))
+        if not follow_ids:
+            return 0
+
+        table = self.UsersFollowList.__table__
+
+        with session_scope(self.Session) as session:
+            self.mark_write(('user', user_id))
+
+            # 팔로워 수를 증가시킬 유저를 알기 위해, 이미 팔로우한 유저들을 빼고 저장합니다.
+            if self.UserFollowCounts is not None:
+                followed = {row.follow_user_id for row in session.query(table.c.follow_user_id).filter(
+                                table.c.user_id == user_id,
+                                table.c.follow_user_id.in_(follow_ids))}
+                follow_ids = [follow_id for follow_id in follow_ids if follow_id not in followed]
+                if not follow_ids:
+                    return 0
+
+            statement = table.insert().\
+                            prefix_with('IGNORE', dialect = 'mysql').\
+                            prefix_with('OR IGNORE', dialect = 'sqlite').\
+                            values([{'user_id' : user_id, 'follow_user_id' : follow_id} for follow_id in follow_ids])
+            count = session.execute(statement).rowcount
+
+            if count == len(follow_ids):
+                self.update_follow_counts(session, user_id, follow_ids, 1)
+            # 그 사이에 다른 요청이 같은 유저를 팔로우했으면, 어떤 행이 무시됐는지 알 수 없으므로 수를 다시 셉니다.
+            elif count:
+                self.recount_follow_counts(session, [user_id] + follow_ids)
+
+        self.invalidate_follows(user_id)
+        return count
+
+    # 여러 유저를 한 번에 언팔로우합니다.
+    # 하나의 DELETE ... WHERE follow_user_id IN (...) 으로 삭제하며, 언팔로우한 유저 수를 반환합니다.
+    def insert_unfollows(self, user_id, unfollow_ids):
+        unfollow_ids = sorted(set(unfollow_ids))
+        if not unfollow_ids:
+            return 0
+
+        table = self.UsersFollowList.__table__
+        statement = table.delete().where(and_(
+                        table.c.user_id == user_id,
+                        table.c.follow_user_id.in_(unfollow_ids)))
+
+        with session_scope(self.Session) as session:
+            self.mark_write(('user', user_id))
+
+            # 팔로워 수를 감소시킬 유저를 알기 위해, 삭제하기 전에 잠금을 걸고(FOR UPDATE) 팔로우한 유저들을 가져옵니다.
+            if self.UserFollowCounts is not None:
+                unfollow_ids = [row.follow_user_id for row in session.query(table.c.follow_user_id).filter(
+                                    table.c.user_id == user_id,
+                                    table.c.follow_user_id.in_(unfollow_ids)).with_for_update()]
+                if not unfollow_ids:
+                    return 0
+
+            count = session.execute(statement).rowcount
+
+            if count == len(unfollow_ids):
+                self.update_follow_counts(session, user_id, unfollow_ids, -1)
+            elif count:
+                self.recount_follow_counts(session, [user_id] + unfollow_ids)
+
+        self.invalidate_follows(user_id)
+        return count
+
+    # user_id 의 팔로잉 수를 len(follow_ids) * delta 만큼, follow_ids 유저들의 팔로워 수를 delta 만큼 바꿉니다.
+    # 팔로우/언팔로우를 저장하는 트랜잭션(session) 안에서 호출하며, 값을 읽지 않고 UPDATE ... SET following = following + 1 로 바꿉니다.
+    # user_follow_counts 에 행이 없는 유저(카운터를 추가하기 전에 가입한 유저)는 현재 팔로워/팔로잉 수를 세서 행을 만듭니다.
+    def update_follow_counts(self, session, user_id, follow_ids, delta):
+        if self.UserFollowCounts is None:
+            return
+
+        table = self.UserFollowCounts.__table__
+        updates = [
+            (table.c.following, [user_id], delta * len(follow_ids)),
+            (table.c.followers, follow_ids, delta)
+        ]
+
+        missing = set()
+        for column, user_ids, amount in updates:
+            statement = table.update().\
+                            where(table.c.user_id.in_(user_ids)).\
+                            values({column : column + amount})
+            if session.execute(statement).rowcount < len(user_ids):
+                missing.update(user_ids)
+
+        # 행이 없던 유저들의 행을 만듭니다. (이미 행이 있던 유저는 센 값으로 덮어쓰며, 같은 트랜잭션이므로 방금 바꾼 값과 같습니다.)
+        if missing:
+            self.recount_follow_counts(session, missing)
+
+    # 유저들의 팔로워/팔로잉 수를 users_follow_list 에서 다시 세서 user_follow_counts 에 저장합니다.
+    # 행이 없는 유저들은 하나의 INSERT IGNORE 로 만들고, 이미 행이 있는 유저들은 센 값으로 덮어씁니다.
+    def recount_follow_counts(self, session, user_ids):
+        user_ids = sorted(set(user_ids))
+        if not user_ids:
+            return
+
+        counts = self.count_follows(session, user_ids)
+        table = self.UserFollowCounts.__table__
+        existing = {row.user_id for row in session.query(table.c.user_id).filter(table.c.user_id.in_(user_ids))}
+
+        rows = [{'user_id' : user_id, 'followers' : counts[user_id][0], 'following' : counts[user_id][1]}
+                for user_id in user_ids if user_id not in existing]
+        if rows:
+            statement = table.insert().\
+                            prefix_with('IGNORE', dialect = 'mysql').\
+                            prefix_with('OR IGNORE', dialect = 'sqlite').\
+                            values(rows)
+            # 그 사이에 다른 요청이 먼저 행을 만들었으면 아래에서 덮어씁니다.
+            if session.execute(statement).rowcount < len(rows):
+                existing = set(user_ids)
+
+        for user_id in sorted(existing):
+            followers, following = counts[user_id]
+            session.execute(table.update().\
+                where(table.c.user_id == user_id).\
+                values(followers = followers, following = following))
+
+    # 유저들의 팔로워/팔로잉 수를 users_follow_list 에서 COUNT(*) 로 셉니다. {user_id : (followers, following)} 를 반환합니다.
+    def count_follows(self, session, user_ids):
+        table = self.UsersFollowList.__table__
+        counts = {user_id : [0, 0] for user_id in user_ids}
+
+        for row in session.query(table.c.follow_user_id, func.count()).\
+                        filter(table.c.follow_user_id.in_(user_ids)).\
+                        group_by(table.c.follow_user_id):
+            counts[row[0]][0] = row[1]
+        for row in session.query(table.c.user_id, func.count()).\
+                        filter(table.c.user_id.in_(user_ids)).\
+                        group_by(table.c.user_id):
+            counts[row[0]][1] = row[1]
+
+        return {user_id : tuple(count) for user_id, count in counts.items()}
+
+    # 유저의 프로필(id, 이름, 프로필)과 팔로워/팔로잉 수를 가져옵니다. 없는 유저면 None 을 반환합니다.
+    # 팔로워/팔로잉 수는 user_follow_counts 에서 바로 가져오며, 행이 없는 유저는 한 번 세서 저장합니다.
+    def get_user(self, user_id):
+        with session_scope(self.read_session(('user', user_id))) as session:
+            columns = [self.Users.id, self.Users.name, self.Users.profile]
+            query = session.query(*columns)
+            if self.UserFollowCounts is not None:
+                query = session.query(*columns, self.UserFollowCounts.followers, self.UserFollowCounts.following).\
+                            outerjoin(self.UserFollowCounts, self.UserFollowCounts.user_id == self.Users.id)
+            row = query.filter(self.Users.id == user_id).first()
+            if row is None:
+                return None
+
+            if self.UserFollowCounts is not None and row.followers is not None:
+                followers, following = row.followers, row.following
             else:
-                return False
\ No newline at end of file
+                followers, following = self.count_follows(session, [user_id])[user_id]
+
+        # 카운터 행이 없는 유저는 다음 요청부터 COUNT(*) 를 하지 않도록 저장합니다.
+        if self.UserFollowCounts is not None and row.followers is None:
+            with session_scope(self.Session) as session:
+                self.recount_follow_counts(session, [user_id])
+
+        return {
+            'id' : row.id,
+            'name' : row.name,
+            'profile' : row.profile,
+            'followers' : followers,
+            'following' : following
+        }
+
+    # 해당 유저를 팔로우하는 유저들을 유저 id 순서로 한 페이지(limit 개)씩 가져오는 함수
+    # after 가 주어지면 해당 유저 id 보다 큰 유저들만 가져오는 keyset 페이지네이션을 사용하며,
+    # (follow_user_id, user_id) 인덱스를 순서대로 읽기 때문에 뒤쪽 페이지도 OFFSET 없이 가져옵니다.
+    # 다음 페이지가 있으면 마지막 유저의 id 를 next_cursor 로 함께 반환합니다.
+    def get_followers(self, user_id, after = None, limit = 50):
+        f = self.UsersFollowList
+        return self.get_follow_page(user_id, f.follow_user_id, f.user_id, after, limit)
+
+    # 해당 유저가 팔로우하는 유저들을 유저 id 순서로 한 페이지(limit 개)씩 가져오는 함수
+    # 기본키 (user_id, follow_user_id) 를 순서대로 읽습니다.
+    def get_following(self, user_id, after = None, limit = 50):
+        f = self.UsersFollowList
+        return self.get_follow_page(user_id, f.user_id, f.follow_user_id, after, limit)
+
+    # key 컬럼이 user_id 인 팔로우들을 value 컬럼(유저 id) 순서로 한 페이지 가져옵니다.
+    def get_follow_page(self, user_id, key, value, after, limit):
+        with session_scope(self.read_session(('user', user_id))) as session:
+            query = session.query(value.label('id'), self.Users.name).\
+                        join(self.Users, self.Users.id == value).\
+                        filter(key == user_id)
+            if after is not None:
+                query = query.filter(value > after)
+
+            # 다음 페이지가 있는지 알기 위해 limit 보다 하나 더 가져옵니다.
+            rows = query.order_by(value).limit(limit + 1).all()
+            next_cursor = rows[limit - 1].id if len(rows) > limit else None
+
+            return [{
+                'id' : row.id,
+                'name' : row.name
+            } for row in rows[:limit]], next_cursor
+
+    # 배치 작업이 미리 계산해둔 팔로우 추천(친구의 친구)을 순위대로 최대 limit 명 가져오는 함수
+    # 기본키 (user_id, rank) 로 한 번에 가져오며, 배치 작업 이후에 팔로우한 유저는 같은 쿼리에서 뺍니다.
+    def get_suggestions(self, user_id, limit = 20):
+        fs = self.FollowSuggestions
+        ufl = self.UsersFollowList
+
+        with session_scope(self.read_session(('user', user_id))) as session:
+            followed = session.query(ufl.follow_user_id).\
+                        filter(ufl.user_id == user_id, ufl.follow_user_id == fs.suggested_user_id).exists()
+            rows = session.query(fs.suggested_user_id, fs.mutual_count, self.Users.name).\
+                        join(self.Users, self.Users.id == fs.suggested_user_id).\
+                        filter(fs.user_id == user_id, ~followed).\
+                        order_by(fs.rank).limit(limit).all()
+
+            return [{
+                'id' : row.suggested_user_id,
+                'name' : row.name,
+                'mutual_count' : row.mutual_count
+            } for row in rows]
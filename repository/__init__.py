@@ -9,9 +9,17 @@ Base = declarative_base()
 from .users import Users
 from .tweets import Tweets
 from .users_follow_list import UsersFollowList
+from .user_follow_counts import UserFollowCounts
+from .tweet_hashtags import TweetHashtags
+from .tweet_mentions import TweetMentions
+from .follow_suggestions import FollowSuggestions
 
 __all__ = [
     'Users',
     'Tweets',
-    'UsersFollowList'
+    'UsersFollowList',
+    'UserFollowCounts',
+    'TweetHashtags',
+    'TweetMentions',
+    'FollowSuggestions'
 ]
\ No newline at end of file
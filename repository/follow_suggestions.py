@@ -0,0 +1,31 @@
+# SQLAlchemy를 통해 mariaDB연결과 
+# ORM으로 DB테이블들을 파이썬 클래스와 매핑시킵니다.
+
+# SQLAlchemy에서 컬럼, 인트 등의 모듈들을 불러옵니다.
+from sqlalchemy import Column, Integer, ForeignKeyConstraint
+# 기존에 연결해놓은 DB를 불러옵니다.
+from . import Base
+
+# 유저별로 팔로우를 추천하는 유저들(친구의 친구)을 순위대로 저장하는 테이블.
+# 배치 작업(python -m model.follow_suggestions)이 users_follow_list 전체로 미리 계산해서 저장하며,
+# /suggestions 는 기본키 (user_id, rank) 로 한 번에 가져옵니다.
+class FollowSuggestions(Base):
+    __tablename__ = 'follow_suggestions'
+
+    # 추천 순위, 추천하는 유저, 내가 팔로우한 유저 중 추천하는 유저를 팔로우한 유저의 수
+    user_id = Column('user_id', Integer, primary_key=True, autoincrement=False, nullable=False)
+    rank = Column('rank', Integer, primary_key=True, autoincrement=False, nullable=False)
+    suggested_user_id = Column('suggested_user_id', Integer, nullable=False)
+    mutual_count = Column('mutual_count', Integer, nullable=False)
+    follow_suggestions_user_id_fkey = ForeignKeyConstraint(
+                                    ['user_id'], ['users.id'],
+                                    name = 'follow_suggestions_user_id_fkey')
+    follow_suggestions_suggested_user_id_fkey = ForeignKeyConstraint(
+                                    ['suggested_user_id'], ['users.id'],
+                                    name = 'follow_suggestions_suggested_user_id_fkey')
+
+    def __init__(self, user_id, rank, suggested_user_id, mutual_count):
+        self.user_id = user_id
+        self.rank = rank
+        self.suggested_user_id = suggested_user_id
+        self.mutual_count = mutual_count
@@ -0,0 +1,27 @@
+# SQLAlchemy를 통해 mariaDB연결과 
+# ORM으로 DB테이블들을 파이썬 클래스와 매핑시킵니다.
+
+# SQLAlchemy에서 컬럼, 스트링, 인트 등의 모듈들을 불러옵니다.
+from sqlalchemy import Column, String, Integer, ForeignKeyConstraint, Index
+# 기존에 연결해놓은 DB를 불러옵니다.
+from . import Base
+
+# 트윗에 들어있는 #해시태그들을 저장하는 테이블.
+# 트윗을 저장할 때 같은 트랜잭션에서 함께 저장하며, 해시태그는 소문자로 저장합니다.
+class TweetHashtags(Base):
+    __tablename__ = 'tweet_hashtags'
+
+    tweet_id = Column('tweet_id', Integer, primary_key=True, autoincrement=False, nullable=False)
+    tag = Column('tag', String(100), primary_key=True, nullable=False)
+    tweet_hashtags_tweet_id_fkey = ForeignKeyConstraint(
+                                    ['tweet_id'], ['tweets.id'],
+                                    name = 'tweet_hashtags_tweet_id_fkey')
+
+    # 해시태그로 최신 트윗들을 찾을 수 있도록 (tag, tweet_id) 인덱스를 설정한다.
+    __table_args__ = (
+        Index('tweet_hashtags_tag_tweet_id_idx', tag, tweet_id),
+    )
+
+    def __init__(self, tweet_id, tag):
+        self.tweet_id = tweet_id
+        self.tag = tag
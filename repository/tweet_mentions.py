@@ -0,0 +1,27 @@
+# SQLAlchemy를 통해 mariaDB연결과 
+# ORM으로 DB테이블들을 파이썬 클래스와 매핑시킵니다.
+
+# SQLAlchemy에서 컬럼, 스트링, 인트 등의 모듈들을 불러옵니다.
+from sqlalchemy import Column, String, Integer, ForeignKeyConstraint, Index
+# 기존에 연결해놓은 DB를 불러옵니다.
+from . import Base
+
+# 트윗에 들어있는 @멘션(유저 이름)들을 저장하는 테이블.
+# 유저 이름은 중복될 수 있기 때문에 유저 id 대신 트윗에 쓰인 이름을 소문자로 저장합니다.
+class TweetMentions(Base):
+    __tablename__ = 'tweet_mentions'
+
+    tweet_id = Column('tweet_id', Integer, primary_key=True, autoincrement=False, nullable=False)
+    name = Column('name', String(255), primary_key=True, nullable=False)
+    tweet_mentions_tweet_id_fkey = ForeignKeyConstraint(
+                                    ['tweet_id'], ['tweets.id'],
+                                    name = 'tweet_mentions_tweet_id_fkey')
+
+    # 멘션된 이름으로 최신 트윗들을 찾을 수 있도록 (name, tweet_id) 인덱스를 설정한다.
+    __table_args__ = (
+        Index('tweet_mentions_name_tweet_id_idx', name, tweet_id),
+    )
+
+    def __init__(self, tweet_id, name):
+        self.tweet_id = tweet_id
+        self.name = name
@@ -2,7 +2,7 @@
 # ORM으로 DB테이블들을 파이썬 클래스와 매핑시킵니다.
 
 # SQLAlchemy에서 컬럼, 스트링, 인트 등의 모듈들을 불러옵니다.
-from sqlalchemy import Column, String, Integer, text, ForeignKeyConstraint
+from sqlalchemy import Column, String, Integer, text, ForeignKeyConstraint, Index
 # SQLAlchemy에서 mysql에서 사용하는 TIMESTAMP 모듈을 불러옵니다.
 from sqlalchemy.dialects.mysql import TIMESTAMP
  # SQLAlchemy에서 테이블간의 관계를 파이썬이 이해할 수있도록 클래스 연결 모듈들을 불러옵니다.
@@ -30,7 +30,10 @@ class Tweets(Base):
                                     user_id==Users.id,
                                     foreign_keys=user_id)
 
-                                    
+    # 타임라인 페이지네이션(keyset)을 위해 유저아이디와 트윗 id(최신순)로 복합 인덱스를 설정한다.
+    __table_args__ = (
+        Index('tweets_user_id_id_idx', user_id, id.desc()),
+    )
     
     def __init__(self, user_id, tweet):
         self.user_id = user_id
@@ -0,0 +1,25 @@
+# SQLAlchemy를 통해 mariaDB연결과 
+# ORM으로 DB테이블들을 파이썬 클래스와 매핑시킵니다.
+
+# SQLAlchemy에서 컬럼, 인트 등의 모듈들을 불러옵니다.
+from sqlalchemy import Column, Integer, text, ForeignKeyConstraint
+# 기존에 연결해놓은 DB를 불러옵니다.
+from . import Base
+
+# 유저별 팔로워 수와 팔로잉 수를 저장하는 테이블.
+# 프로필의 팔로워/팔로잉 수를 users_follow_list 의 COUNT(*) 없이 바로 가져오기 위해,
+# 팔로우/언팔로우를 저장할 때 같은 트랜잭션에서 함께 증가/감소시킵니다.
+class UserFollowCounts(Base):
+    __tablename__ = 'user_follow_counts'
+
+    user_id = Column('user_id', Integer, primary_key=True, autoincrement=False, nullable=False)
+    followers = Column('followers', Integer, nullable=False, server_default=text('0'))
+    following = Column('following', Integer, nullable=False, server_default=text('0'))
+    user_follow_counts_user_id_fkey = ForeignKeyConstraint(
+                                    ['user_id'], ['users.id'],
+                                    name = 'user_follow_counts_user_id_fkey')
+
+    def __init__(self, user_id, followers = 0, following = 0):
+        self.user_id = user_id
+        self.followers = followers
+        self.following = following
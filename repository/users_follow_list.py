@@ -2,7 +2,7 @@
 # ORM으로 DB테이블들을 파이썬 클래스와 매핑시킵니다.
 
 # SQLAlchemy에서 컬럼, 스트링, 인트 등의 모듈들을 불러옵니다.
-from sqlalchemy import Column, String, Integer, text, ForeignKeyConstraint
+from sqlalchemy import Column, String, Integer, text, ForeignKeyConstraint, Index
 # SQLAlchemy에서 mysql에서 사용하는 TIMESTAMP 모듈을 불러옵니다.
 from sqlalchemy.dialects.mysql import TIMESTAMP
  # SQLAlchemy에서 테이블간의 관계를 파이썬이 이해할 수있도록 클래스 연결 모듈들을 불러옵니다.
@@ -35,6 +35,12 @@ class UsersFollowList(Base):
                                     follow_user_id==Users.id,
                                     foreign_keys=follow_user_id)
 
+    # 팔로워 목록(follow_user_id 로 찾기)의 keyset 페이지네이션을 위해 (follow_user_id, user_id) 역방향 인덱스를 설정한다.
+    # 팔로잉 목록은 기본키 (user_id, follow_user_id) 를 사용한다.
+    __table_args__ = (
+        Index('users_follow_list_follow_user_id_user_id_idx', follow_user_id, user_id),
+    )
+
     def __init__(self, user_id, follow_user_id):
         self.user_id = user_id
         self.follow_user_id = follow_user_id
\ No newline at end of file
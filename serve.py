@@ -0,0 +1,251 @@
+# 여러 worker 프로세스로 API 서버를 실행하는 파일입니다.
+# 부모 프로세스가 앱(모듈 import, service layer, 검색 색인과 trending)을 한 번만 만들고 포트를 연 뒤 worker 들을 fork 합니다.
+# worker 들은 부모가 만든 객체들을 copy-on-write 로 함께 사용하기 때문에, 앱을 다시 만들지 않고 fork 하자마자 같은 소켓에서 요청을 받습니다.
+#
+# 실행) python serve.py --host 0.0.0.0 --port 5000 --workers 4
+#       python serve.py --asgi                   (uvicorn 으로 ASGI 앱을 실행)
+#       python serve.py --migrate                (적용되지 않은 migration 들을 적용한 뒤 실행)
+#
+# - flask 앱은 gunicorn(preload_app, gthread worker)으로 실행하고, ASGI 앱은 PreforkServer 가 fork 한 worker 에서 uvicorn 으로 실행합니다.
+# - fork 하기 전에 gc.freeze() 로 부모의 객체들을 GC 대상에서 빼서, GC 가 객체를 건드려 메모리 페이지가 복사되지 않게 합니다.
+# - fork 하기 전에 부모의 커넥션 풀을 비우고, worker 는 자신의 커넥션을 DB_WARM_CONNECTIONS 개 미리 만든 뒤 요청을 받습니다.
+# - worker 가 죽으면 부모가 다시 fork 합니다. 부모가 SIGTERM 을 받으면 worker 들에게 SIGTERM 을 보내고,
+#   worker 는 요청 받기를 멈추고 처리중인 요청을 마친 뒤, write-behind 큐와 검색 색인을 저장하고 종료합니다.
+
+import argparse
+import gc
+import logging
+import os
+import signal
+import socket
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+
+# 부모 프로세스가 worker 들을 fork 하고, 죽은 worker 를 다시 fork 하는 prefork 서버
+class PreforkServer:
+
+    # listener  : 부모 프로세스가 연 소켓. 모든 worker 가 함께 요청을 받습니다.
+    # serve     : worker 에서 serve(listener) 로 요청을 받는 함수. SIGTERM 을 받아 멈출 때까지 반환하지 않습니다.
+    # workers   : worker 프로세스 수
+    # post_fork : worker 가 요청을 받기 전에 호출하는 함수
+    # shutdown_timeout : 종료할 때 worker 들을 기다리는 최대 시간(초). 지나면 SIGKILL 로 종료합니다.
+    def __init__(self, listener, serve, workers = 1, post_fork = None, shutdown_timeout = 30, poll_interval = 0.1):
+        self.listener = listener
+        self.serve = serve
+        self.workers = workers
+        self.post_fork = post_fork
+        self.shutdown_timeout = shutdown_timeout
+        self.poll_interval = poll_interval
+
+        # worker pid -> 시작한 시간
+        self.children = {}
+        self.stopping = False
+
+    # worker 들을 fork 하고 종료 신호를 받을 때까지 관리합니다.
+    # 부모 프로세스에서는 모든 worker 가 종료된 뒤, worker 프로세스에서는 요청 받기를 멈춘 뒤 종료 코드를 반환합니다.
+    def run(self):
+        signal.signal(signal.SIGTERM, self.stop)
+        signal.signal(signal.SIGINT, self.stop)
+
+        while not self.stopping:
+            while len(self.children) < self.workers and not self.stopping:
+                if self.fork() == 0:
+                    return self.run_worker()
+
+            self.reap()
+            time.sleep(self.poll_interval)
+
+        return self.shutdown()
+
+    def stop(self, signum, frame):
+        self.stopping = True
+
+    # worker 를 fork 합니다. worker 프로세스에서는 0 을 반환합니다.
+    def fork(self):
+        pid = os.fork()
+        if pid:
+            self.children[pid] = time.monotonic()
+            logger.info('started worker %d', pid)
+
+        return pid
+
+    def run_worker(self):
+        # worker 의 종료 신호는 serve 가 처리합니다.
+        signal.signal(signal.SIGTERM, signal.SIG_DFL)
+        signal.signal(signal.SIGINT, signal.SIG_DFL)
+        self.children = {}
+
+        try:
+            if self.post_fork is not None:
+                self.post_fork()
+            self.serve(self.listener)
+        except Exception:
+            logger.exception('worker %d failed', os.getpid())
+            return 1
+
+        return 0
+
+    # 종료된 worker 들을 정리합니다. 시작하자마자 죽은 worker 는 바로 다시 fork 하지 않고 잠시 기다립니다.
+    def reap(self):
+        while self.children:
+            pid, status = os.waitpid(-1, os.WNOHANG)
+            if not pid:
+                return
+
+            started = self.children.pop(pid, None)
+            if started is None:
+                continue
+
+            if not self.stopping:
+                logger.warning('worker %d exited with status %d', pid, os.waitstatus_to_exitcode(status))
+                if time.monotonic() - started < 1:
+                    time.sleep(1)
+
+    # worker 들에게 SIGTERM 을 보내고 shutdown_timeout 동안 기다립니다. 남은 worker 는 SIGKILL 로 종료합니다.
+    def shutdown(self):
+        for pid in self.children:
+            self.kill(pid, signal.SIGTERM)
+
+        deadline = time.monotonic() + self.shutdown_timeout
+        while self.children and time.monotonic() < deadline:
+            self.reap()
+            time.sleep(self.poll_interval)
+
+        for pid in list(self.children):
+            logger.warning('killing worker %d', pid)
+            self.kill(pid, signal.SIGKILL)
+            os.waitpid(pid, 0)
+            del self.children[pid]
+
+        self.listener.close()
+
+        return 0
+
+    def kill(self, pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+# 부모 프로세스가 연 소켓으로 요청을 받는 소켓. SO_REUSEADDR 로 재시작할 때 바로 같은 포트를 열 수 있습니다.
+def create_listener(host, port, backlog = 2048):
+    return socket.create_server((host, port), backlog = backlog)
+
+# flask 앱을 gunicorn 으로 실행하는 서버를 만듭니다. run() 은 종료할 때 SystemExit 을 발생시킵니다.
+# gunicorn 의 부모 프로세스(arbiter)가 worker 들을 fork 하고 죽은 worker 를 다시 fork 하며, SIGTERM 을 받으면
+# worker 들이 처리중인 요청을 shutdown_timeout 동안 마치게 한 뒤 종료합니다. (SIGINT 는 기다리지 않고 바로 종료합니다.)
+# listener  : 부모 프로세스가 연 소켓. gunicorn 은 fd:// 로 이 소켓을 그대로 사용합니다.
+# threads   : worker 마다 요청을 처리하는 스레드 수 (gthread worker). 나머지 연결은 스레드가 날 때까지 기다립니다.
+# post_fork : worker 가 요청을 받기 전에 호출하는 함수
+def wsgi_server(app, listener, workers = 1, threads = 20, post_fork = None, shutdown_timeout = 30, access_log = False):
+    from gunicorn.app.base import BaseApplication
+
+    class Application(BaseApplication):
+        def load_config(self):
+            # 앱은 부모 프로세스에서 이미 만들었으므로 fork 하기 전에 한 번만 load 합니다.
+            self.cfg.set('preload_app', True)
+            self.cfg.set('bind', [f'fd://{listener.fileno()}'])
+            self.cfg.set('workers', workers)
+            self.cfg.set('worker_class', 'gthread')
+            self.cfg.set('threads', threads)
+            self.cfg.set('graceful_timeout', shutdown_timeout)
+            if access_log:
+                self.cfg.set('accesslog', '-')
+            if post_fork is not None:
+                self.cfg.set('post_fork', lambda arbiter, worker: post_fork())
+
+        def load(self):
+            return app
+
+    return Application()
+
+# ASGI 앱을 uvicorn 으로 실행하는 serve 함수를 만듭니다. uvicorn 이 SIGTERM 을 받으면 처리중인 요청을 마치고 멈춥니다.
+def asgi_server(app, access_log = False):
+    import uvicorn
+
+    def serve(listener):
+        uvicorn.Server(uvicorn.Config(app, lifespan = 'off', access_log = access_log)).run(sockets = [listener])
+
+    return serve
+
+def main():
+    import config
+    from app import load_config, create_app, prepare_fork, start_worker
+    from asgi import create_asgi_app
+
+    parser = argparse.ArgumentParser(description = 'run the API server with preforked worker processes')
+    parser.add_argument('--host', default = '127.0.0.1')
+    parser.add_argument('--port', type = int, default = 5000)
+    parser.add_argument('--workers', type = int, default = os.cpu_count() or 1)
+    parser.add_argument('--db-url', default = config.DB_URL)
+    parser.add_argument('--asgi', action = 'store_true', help = 'serve the ASGI app with uvicorn instead of the flask app')
+    parser.add_argument('--migrate', action = 'store_true', help = 'apply pending schema migrations once before forking')
+    parser.add_argument('--access-log', action = 'store_true')
+    parser.add_argument('--shutdown-timeout', type = float, default = config.SERVER_SHUTDOWN_TIMEOUT)
+    args = parser.parse_args()
+
+    logging.basicConfig(level = logging.INFO, format = '%(asctime)s [%(process)d] %(levelname)s %(message)s')
+    start = time.perf_counter()
+
+    app_config = load_config()
+    app_config['DB_URL'] = args.db_url
+    # migration 은 부모 프로세스에서 한 번만 적용합니다. (create_services 참고)
+    app_config['DB_MIGRATE'] = args.migrate
+    # worker 가 여러 개이면 프로세스 메모리에 저장하는 timeline store 를 사용하지 않습니다. (create_services 참고)
+    app_config['SERVER_WORKERS'] = args.workers
+
+    # 앱은 부모 프로세스에서 한 번만 만듭니다.
+    if args.asgi:
+        app = create_asgi_app(app_config, preload = True)
+        services = app.state.services
+    else:
+        app = create_app(app_config, preload = True)
+        services = app.extensions['services']
+
+    prepare_fork(services)
+    listener = create_listener(args.host, args.port)
+    logger.info('preloaded app in %.2fs, listening on %s:%d', time.perf_counter() - start, args.host, args.port)
+
+    if args.asgi:
+        server = PreforkServer(
+            listener,
+            asgi_server(app, args.access_log),
+            workers = args.workers,
+            post_fork = lambda: start_worker(services, app_config),
+            shutdown_timeout = args.shutdown_timeout
+        )
+    else:
+        # 요청을 처리하는 스레드마다 커넥션을 하나씩 사용하므로, SERVER_THREADS 가 없으면 커넥션 풀의 최대 커넥션 수만큼 만듭니다.
+        server = wsgi_server(
+            app,
+            listener,
+            workers = args.workers,
+            threads = app_config.get('SERVER_THREADS') or app_config.get('DB_POOL_SIZE', 10) + app_config.get('DB_MAX_OVERFLOW', 10),
+            post_fork = lambda: start_worker(services, app_config),
+            shutdown_timeout = args.shutdown_timeout,
+            access_log = args.access_log
+        )
+
+    # 지금까지 만든 객체들을 GC 대상에서 빼서 worker 들이 부모의 메모리 페이지를 복사하지 않고 함께 사용하게 합니다.
+    gc.collect()
+    gc.freeze()
+
+    parent = os.getpid()
+    try:
+        code = server.run()
+    except SystemExit as exit:
+        # gunicorn 은 부모 프로세스와 worker 모두 sys.exit 으로 종료합니다.
+        code = exit.code or 0
+
+    # 부모의 검색 색인은 fork 한 뒤로 바뀌지 않았으므로, worker 들이 저장한 색인을 덮어쓰지 않도록 atexit 을 실행하지 않고 종료합니다.
+    # worker 는 그대로 반환해서 atexit 으로 write-behind 큐와 검색 색인을 저장합니다.
+    if os.getpid() == parent:
+        logging.shutdown()
+        os._exit(code)
+
+    return code
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -1,7 +1,13 @@
-from .user_service import UserService
+from .user_service import UserService, LoginResult
 from .tweet_service import TweetService
+from .password_hasher import PasswordHasher, PasswordHasherBusy
+from .tweet_writer import TweetWriter
 
 __all__ = [
     'UserService',
-    'TweetService'
+    'LoginResult',
+    'TweetService',
+    'PasswordHasher',
+    'PasswordHasherBusy',
+    'TweetWriter'
 ]
\ No newline at end of file
@@ -0,0 +1,92 @@
+# 비밀번호 해시(bcrypt)를 요청 스레드가 아닌 별도의 프로세스 풀에서 처리하는 파일입니다.
+# bcrypt 는 한 번에 수백 ms 의 CPU 를 사용하기 때문에, 요청 스레드에서 실행하면 다른 요청들까지 밀리게 됩니다.
+# 처리중인 작업 수를 queue_size 로 제한해서, 로그인 요청이 몰리면 기다리지 않고 PasswordHasherBusy 를 발생시킵니다.
+
+import multiprocessing
+import os
+from threading import BoundedSemaphore, Lock
+from concurrent.futures import ProcessPoolExecutor, TimeoutError
+
+# 사용자의 비밀번호를 단방향 암호화하기 위해 bcrypt 해시 함수를 추가한다.
+import bcrypt
+
+# 프로세스 풀에서 실행되는 함수들입니다. 다른 프로세스로 넘겨야 하기 때문에 모듈 함수로 만듭니다.
+# hashpw : 암호화로 만드는 함수. 1. 암호화하고자하는 byte와 2. cost(rounds)를 적용한 salting을 추가하여 암호화시킨다.
+def hash_password(password, rounds):
+    return bcrypt.hashpw(password, bcrypt.gensalt(rounds))
+
+# checkpw : 입력한 비밀번호를 암호화하여, 저장된 해시값과 일치하는지 비교한다.
+def check_password(password, hashed_password):
+    return bcrypt.checkpw(password, hashed_password)
+
+# 해시 작업이 너무 많이 쌓여서 더 이상 받을 수 없을 때 발생하는 예외. view 에서 503 으로 응답합니다.
+class PasswordHasherBusy(Exception):
+    pass
+
+class PasswordHasher:
+
+    # rounds        : bcrypt 의 cost. 1 증가할 때마다 해시 시간이 2배가 됩니다.
+    # workers       : 해시를 처리하는 프로세스 수. 0 이면 프로세스 풀 없이 호출한 스레드에서 바로 처리합니다.
+    # queue_size    : 동시에 처리중이거나 기다리는 해시 작업의 최대 수
+    # queue_timeout : queue 에 자리가 날 때까지 기다리는 최대 시간(초). 넘으면 PasswordHasherBusy 를 발생시킵니다.
+    # timeout       : 해시 작업 하나를 기다리는 최대 시간(초)
+    def __init__(self, rounds = 12, workers = 0, queue_size = None, queue_timeout = 0.1, timeout = 10):
+        self.rounds = rounds
+        self.workers = workers
+        self.queue_size = queue_size or max(1, workers) * 4
+        self.queue_timeout = queue_timeout
+        self.timeout = timeout
+        self.slots = BoundedSemaphore(self.queue_size)
+        self.lock = Lock()
+        self.executor = None
+        self.pid = None
+
+    # 비밀번호(bytes)를 해시합니다.
+    def hash(self, password):
+        return self.run(hash_password, password, self.rounds)
+
+    # 비밀번호(bytes)가 해시값(bytes)과 일치하는지 확인합니다.
+    def check(self, password, hashed_password):
+        return self.run(check_password, password, hashed_password)
+
+    def run(self, function, *args):
+        if not self.workers:
+            return function(*args)
+
+        # queue 가 가득 차 있으면 queue_timeout 만큼만 기다리고, 자리가 없으면 요청을 거절합니다.
+        if not self.slots.acquire(timeout = self.queue_timeout):
+            raise PasswordHasherBusy()
+
+        # 기다리다 timeout 이 지나도 작업은 프로세스 풀에서 계속 실행되므로, 자리는 작업이 끝났을 때 반환합니다.
+        try:
+            future = self.get_executor().submit(function, *args)
+        except BaseException:
+            self.slots.release()
+            raise
+
+        future.add_done_callback(lambda future: self.slots.release())
+
+        try:
+            return future.result(timeout = self.timeout)
+        except TimeoutError:
+            raise PasswordHasherBusy()
+
+    # 프로세스 풀은 처음 사용할 때 만듭니다.
+    # fork 된 자식 프로세스에서는 부모의 프로세스 풀을 사용할 수 없기 때문에 pid 가 바뀌면 다시 만듭니다.
+    # 요청 스레드들이 실행중인 서버 프로세스를 그대로 fork 하지 않도록, 해시 프로세스는 forkserver 에서 만듭니다.
+    # (서버의 소켓이나 signal handler 를 물려받지 않아서, 서버 프로세스가 죽어도 포트를 잡고 남지 않습니다.)
+    def get_executor(self):
+        with self.lock:
+            if self.executor is None or self.pid != os.getpid():
+                self.executor = ProcessPoolExecutor(max_workers = self.workers, mp_context = multiprocessing.get_context('forkserver'))
+                self.pid = os.getpid()
+
+            return self.executor
+
+    # 프로세스 풀을 종료합니다.
+    def shutdown(self):
+        with self.lock:
+            if self.executor is not None and self.pid == os.getpid():
+                self.executor.shutdown()
+
+            self.executor = None
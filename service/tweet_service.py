@@ -1,17 +1,203 @@
 # 트윗을 저장하고 타임라인 리스트를 가져오는 트윗 service layer입니다.
 
+# 트윗에서 #해시태그와 @멘션을 찾는 함수
+from model.tweet_entities import extract_entities
+
 class TweetService:
 
-    def __init__(self, tweet_dao):
+    # timeline_store 가 주어지면 트윗을 작성할 때 팔로워들의 타임라인에 미리 저장(fan-out-on-write)하고,
+    # 타임라인을 읽을 때 DB 조인 대신 저장된 타임라인을 사용합니다.
+    # bulk_chunk_size 는 여러 트윗을 한 번에 저장할 때 한 번의 executemany 로 저장하는 트윗 수입니다.
+    # (여러 worker 로 실행하면 캐시에 타임라인을 저장하는 SharedTimelineStore 를 사용합니다.)
+    # cache(LocalCache, RedisCache)가 주어지면 같은 타임라인을 여러 요청이 동시에 DB 에서 만들지 않고 한 번만 만들게 합니다.
+    def __init__(self, tweet_dao, timeline_store = None, bulk_chunk_size = 1000, cache = None):
         self.tweet_dao = tweet_dao
+        self.timeline_store = timeline_store
+        self.bulk_chunk_size = bulk_chunk_size
+        self.cache = cache
+        # write-behind 모드에서 트윗을 디스크 큐에 기록하고 모아서 저장하는 TweetWriter (create_services 에서 설정)
+        self.writer = None
+        # 트윗을 검색어로 찾기 위한 메모리 역색인 SearchIndex (create_services 에서 설정)
+        self.search_index = None
+        # 최근 많이 쓰인 해시태그와 멘션을 세는 TrendingTopics (create_services 에서 설정)
+        self.trending = None
 
     # 트윗이 300자가 넘을 떄, None을 반환합니다.
+    # 트윗의 해시태그와 멘션을 찾아서 트윗과 함께 저장합니다.
     def tweet(self, user_id, tweet):
         if len(tweet) > 300:
             return None
-        
-        return self.tweet_dao.insert_tweet(user_id, tweet)
+
+        hashtags, mentions = extract_entities(tweet)
+        tweet_id = self.tweet_dao.insert_tweet(user_id, tweet, hashtags, mentions)
+
+        if self.search_index is not None:
+            self.search_index.add(tweet_id, tweet)
+
+        if self.timeline_store is not None:
+            self.fan_out(user_id, {
+                'id' : tweet_id,
+                'user_id' : user_id,
+                'tweet' : tweet
+            })
+
+        return tweet_id
+
+    # write-behind 모드에서 트윗을 DB 대신 디스크 큐에 기록합니다. 트윗은 writer 의 백그라운드 스레드가 저장합니다.
+    # 300자가 넘으면 None 을 반환합니다.
+    def queue_tweet(self, user_id, tweet):
+        if len(tweet) > 300:
+            return None
+
+        self.writer.append(user_id, tweet)
+
+        return True
+
+    # 큐에 기록된 트윗들({'user_id', 'tweet'} 리스트)을 하나의 트랜잭션으로 저장합니다. (writer 의 백그라운드 스레드에서 호출)
+    # 저장한 트윗들의 id 는 알 수 없기 때문에, 작성자와 팔로워들의 저장된 타임라인을 지워서 다시 만들게 합니다.
+    def write_tweets(self, records):
+        statuses = self.tweet_dao.insert_tweets(self.with_entities(records), self.bulk_chunk_size)
+
+        if self.timeline_store is not None:
+            for user_id in {record['user_id'] for record, status in zip(records, statuses) if status == 'created'}:
+                self.invalidate_followers(user_id)
+
+        return statuses
+
+    # 여러 트윗을 한 번에 저장합니다. 300자를 넘거나 문자열이 아닌 트윗은 저장하지 않으며,
+    # 각 트윗의 저장 결과를 {'index', 'status'} 리스트로 반환합니다.
+    def bulk_tweet(self, user_id, tweets):
+        statuses = self.tweet_dao.insert_tweets(self.with_entities([{
+            'user_id' : user_id,
+            'tweet' : tweet
+        } for tweet in tweets]), self.bulk_chunk_size)
+
+        # 한 번에 저장한 트윗들은 id 를 알 수 없기 때문에, 저장된 타임라인에 넣는 대신 지워서 다시 만들게 합니다.
+        if self.timeline_store is not None and 'created' in statuses:
+            self.invalidate_followers(user_id)
+
+        return [{
+            'index' : index,
+            'status' : status
+        } for index, status in enumerate(statuses)]
+
+    # 트윗들({'user_id', 'tweet'} 리스트)에 해시태그와 멘션을 찾아서 'hashtags', 'mentions' 로 추가한 리스트를 반환합니다.
+    # 문자열이 아닌 트윗은 insert_tweets 가 저장하지 않으므로 그대로 둡니다.
+    def with_entities(self, records):
+        rows = []
+        for record in records:
+            if isinstance(record['tweet'], str):
+                hashtags, mentions = extract_entities(record['tweet'])
+                record = dict(record, hashtags = hashtags, mentions = mentions)
+            rows.append(record)
+
+        return rows
+
+    # 작성자와 팔로워들의 저장된 타임라인을 지웁니다.
+    # 셀럽의 트윗은 타임라인을 읽을 때 DB 에서 합쳐지기 때문에 작성자의 타임라인만 지웁니다.
+    def invalidate_followers(self, user_id):
+        store = self.timeline_store
+        follower_ids = self.tweet_dao.get_follower_ids(user_id, store.fanout_limit + 1)
+
+        if store.should_fan_out(user_id, len(follower_ids)):
+            store.invalidate_many([user_id] + follower_ids)
+        else:
+            store.invalidate(user_id)
+
+    # 작성한 트윗을 작성자와 팔로워들의 타임라인에 밀어넣습니다.
+    # 팔로워가 fanout_limit 보다 많으면 작성자의 타임라인에만 넣고, 팔로워들은 타임라인을 읽을 때 합칩니다.
+    def fan_out(self, user_id, entry):
+        store = self.timeline_store
+        follower_ids = self.tweet_dao.get_follower_ids(user_id, store.fanout_limit + 1)
+
+        if store.should_fan_out(user_id, len(follower_ids)):
+            store.push([user_id] + follower_ids, entry)
+        else:
+            store.push([user_id], entry)
 
     # 타임라인 리스트를 반환합니다.
     def get_timeline(self, user_id):
-        return self.tweet_dao.get_timeline(user_id)
\ No newline at end of file
+        store = self.timeline_store
+        if store is None:
+            return self.tweet_dao.get_timeline(user_id)
+
+        # 저장된 타임라인이 없으면 DB 에서 최신 트윗들로 타임라인을 만들어 저장합니다.
+        timeline = store.get(user_id)
+        if timeline is None:
+            timeline = self.load_timeline(user_id)
+
+        # 팔로우한 유저 중 fan-out 을 하지 않은 셀럽이 있으면 셀럽의 최신 트윗을 합칩니다.
+        elif store.has_celebrities():
+            celebrity_ids = store.celebrities_in(self.tweet_dao.get_follow_ids(user_id))
+            if celebrity_ids:
+                timeline = self.merge_timeline(timeline, self.tweet_dao.get_recent_tweets(celebrity_ids, store.max_length), store.max_length)
+
+        return [{
+            'user_id' : tweet['user_id'],
+            'tweet' : tweet['tweet']
+        } for tweet in timeline]
+
+    # DB 에서 최신 트윗들로 타임라인을 만들어 timeline store 에 저장합니다.
+    # 같은 worker 에서는 같은 유저의 타임라인을 한 요청만 만들고, 동시에 요청한 다른 요청들은 기다렸다가 저장된 타임라인을 사용합니다.
+    # 여러 worker 가 함께 사용하는 캐시(SharedTimelineStore)는 load 가 캐시의 SET NX lock 으로 모든 worker 중 한 요청만 만들게 합니다.
+    def load_timeline(self, user_id):
+        store = self.timeline_store
+        build = lambda: self.tweet_dao.get_recent_timeline(user_id, store.max_length)
+
+        if self.cache is None:
+            return store.load(user_id, build)
+
+        with self.cache.build_lock(f'timeline:{user_id}'):
+            timeline = store.get(user_id)
+            if timeline is None:
+                timeline = store.load(user_id, build)
+
+        return timeline
+
+    # 타임라인의 트윗을 하나씩 반환하는 generator 를 반환합니다. (응답을 나눠서 보내는 streaming 용)
+    def iter_timeline(self, user_id, batch_size = 1000):
+        return self.tweet_dao.iter_timeline(user_id, batch_size)
+
+    # 타임라인을 최신 트윗부터 한 페이지씩 반환합니다.
+    # limit 은 1 부터 max_limit 사이로 제한하며, 다음 페이지를 요청할 때 사용할 next_cursor 를 함께 반환합니다.
+    def get_timeline_page(self, user_id, before = None, limit = 50, max_limit = 100):
+        limit = max(1, min(limit, max_limit))
+
+        return self.tweet_dao.get_timeline_page(user_id, before, limit)
+
+    # 검색어의 단어들이 모두 들어있는 트윗들을 최신 트윗부터 한 페이지씩 반환합니다.
+    # 다른 worker 나 write-behind, bulk_tweet 으로 저장된 트윗은 검색하기 전에 DB 에서 가져와서 색인합니다. (sync_interval 마다 한 번)
+    def search(self, query, before = None, limit = 20, max_limit = 100):
+        limit = max(1, min(limit, max_limit))
+
+        self.sync_search_index()
+
+        # 다음 페이지가 있는지 알기 위해 limit 보다 하나 더 찾습니다.
+        tweet_ids = self.search_index.search(query, limit + 1, before)
+        next_cursor = tweet_ids[limit - 1] if len(tweet_ids) > limit else None
+
+        return self.tweet_dao.get_tweets(tweet_ids[:limit]), next_cursor
+
+    # 색인에 없는 트윗들을 DB 에서 가져와서 색인합니다. force 이면 sync_interval 과 관계없이 바로 가져옵니다.
+    def sync_search_index(self, force = False):
+        self.search_index.sync(self.tweet_dao.iter_tweets, force)
+
+    # 최근 많이 쓰인 해시태그와 멘션을 limit 개씩 반환합니다.
+    # 새로 저장된 해시태그와 멘션만 DB 에서 가져와서 세고(sync_interval 마다 한 번), 순위는 메모리에서 가져옵니다.
+    def get_trending(self, limit = 10, max_limit = 50):
+        limit = max(1, min(limit, max_limit))
+
+        self.sync_trending()
+
+        return self.trending.top(limit)
+
+    # 새로 저장된 해시태그와 멘션을 DB 에서 가져와서 셉니다. force 이면 sync_interval 과 관계없이 바로 가져옵니다.
+    def sync_trending(self, force = False):
+        self.trending.sync(self.tweet_dao.iter_tweet_entities, force)
+
+    # 두 타임라인을 트윗 id 기준으로 중복없이 합치고, 최신 트윗 limit 개만 남깁니다.
+    def merge_timeline(self, timeline, tweets, limit):
+        merged = {tweet['id'] : tweet for tweet in timeline}
+        merged.update((tweet['id'], tweet) for tweet in tweets)
+
+        return [merged[tweet_id] for tweet_id in sorted(merged)][-limit:]
@@ -0,0 +1,189 @@
+# 트윗을 바로 DB 에 저장하지 않고 디스크 큐(SegmentQueue)에 기록한 뒤,
+# 백그라운드 스레드가 모아서 저장하는 write-behind 파일입니다.
+# 요청 스레드는 큐에 기록(append + fsync)만 하고 바로 응답하기 때문에, 트윗이 몰려도 응답시간이 DB 에 밀리지 않습니다.
+#
+# - 백그라운드 스레드는 큐에서 batch_size 개씩 읽어서 하나의 트랜잭션으로 저장하고, 저장한 위치를 checkpoint 에 기록합니다.
+# - DB 에 저장하지 못하면 기다렸다가 다시 시도하며(최대 max_backoff 초), 그동안 트윗은 큐에 쌓입니다.
+# - 프로세스가 죽으면 checkpoint 이후의 트윗들을 다음에 시작한 프로세스가 이어서 저장합니다.
+#   DB 에 저장한 뒤 checkpoint 를 기록하기 전에 죽으면 해당 batch 가 한 번 더 저장될 수 있습니다. (at-least-once)
+
+import json
+import logging
+import os
+import time
+from threading import Event, Lock, Thread
+
+from model.segment_queue import SegmentQueue, lock_directory
+# DB 에 연결할 수 없을 때 발생하는 sqlalchemy 예외들
+from sqlalchemy.exc import InterfaceError, OperationalError, TimeoutError
+
+logger = logging.getLogger(__name__)
+
+# DB 에 연결할 수 없어서 발생한 에러인지 확인합니다. (트윗 자체의 문제가 아니므로 다시 시도하면 저장됩니다.)
+def is_unavailable(error):
+    return isinstance(error, (OSError, InterfaceError, OperationalError, TimeoutError))
+
+class TweetWriter:
+
+    # directory     : 큐 디렉토리들을 만드는 디렉토리. worker 프로세스마다 directory/queue-N 을 하나씩 사용합니다.
+    # batch_size    : 하나의 트랜잭션으로 저장하는 최대 트윗 수
+    # interval      : 큐가 비어있을 때 새로운 트윗을 기다리는 최대 시간(초)
+    # max_retries   : batch 저장이 (DB 연결 문제가 아닌 에러로) 이 횟수만큼 실패하면 트윗을 하나씩 저장해서,
+    #                 저장할 수 없는 트윗만 dead letter 파일로 옮깁니다.
+    # max_backoff   : 저장에 실패했을 때 다시 시도하기 전에 기다리는 최대 시간(초)
+    def __init__(self, tweet_service, directory, batch_size = 500, interval = 0.05, segment_bytes = 64 * 1024 * 1024, fsync = True, max_retries = 5, max_backoff = 5):
+        self.tweet_service = tweet_service
+        self.directory = directory
+        self.batch_size = batch_size
+        self.interval = interval
+        self.segment_bytes = segment_bytes
+        self.fsync = fsync
+        self.max_retries = max_retries
+        self.max_backoff = max_backoff
+
+        self.queue = None
+        self.thread = None
+        self.pid = None
+        self.lock = Lock()
+        self.wakeup = Event()
+        self.stopping = Event()
+
+        self.written = 0
+        self.failures = 0
+        self.dead_letters = 0
+
+    # 큐를 열고 백그라운드 스레드를 시작합니다.
+    # fork 된 자식 프로세스에는 스레드가 없기 때문에, 프로세스가 바뀌었으면 자신의 큐와 스레드를 새로 만듭니다.
+    def start(self):
+        with self.lock:
+            if self.pid == os.getpid():
+                return
+
+            self.pid = os.getpid()
+            self.stopping.clear()
+            self.queue = SegmentQueue.open_free(self.directory, segment_bytes = self.segment_bytes, fsync = self.fsync)
+            self.thread = Thread(target = self.run, name = 'tweet-writer', daemon = True)
+            self.thread.start()
+
+    # 트윗을 큐에 기록합니다. 기록이 끝나면 트윗은 DB 에 저장되지 않았어도 잃어버리지 않습니다.
+    def append(self, user_id, tweet):
+        self.start()
+        self.queue.append({
+            'user_id' : user_id,
+            'tweet' : tweet
+        })
+
+        # 큐가 batch_size 만큼 쌓이기 전이라도 백그라운드 스레드를 깨워서 바로 저장하게 합니다.
+        self.wakeup.set()
+
+    # 큐에 남은 트윗들을 모두 저장하고 스레드를 멈춥니다.
+    def stop(self, timeout = 10):
+        self.stopping.set()
+        self.wakeup.set()
+        if self.thread is not None:
+            self.thread.join(timeout)
+
+    def run(self):
+        # 먼저 죽은 worker 들이 남긴 큐를 저장합니다.
+        self.recover(self.queue.directory)
+
+        while True:
+            if self.drain(self.queue):
+                continue
+
+            if self.stopping.is_set():
+                return
+
+            self.wakeup.wait(self.interval)
+            self.wakeup.clear()
+
+    # 다른 프로세스가 사용하지 않는 큐들을 잠그고, 남은 트윗들을 모두 저장한 뒤 잠금을 풉니다.
+    def recover(self, own_directory):
+        for name in sorted(os.listdir(self.directory)):
+            directory = os.path.join(self.directory, name)
+            if directory == own_directory or not name.startswith('queue-'):
+                continue
+
+            lock_file = lock_directory(directory)
+            if lock_file is None:
+                continue
+
+            queue = SegmentQueue(directory, lock_file, segment_bytes = self.segment_bytes, fsync = self.fsync)
+            try:
+                while self.drain(queue):
+                    pass
+            finally:
+                queue.close()
+
+    # 큐에서 batch 하나를 읽어서 저장합니다. 저장할 트윗이 없으면 False 를 반환합니다.
+    def drain(self, queue):
+        records, position = queue.read_batch(self.batch_size)
+        if not records:
+            return False
+
+        self.write(queue, records)
+        queue.commit(position)
+
+        return True
+
+    # batch 를 하나의 트랜잭션으로 저장합니다. 실패하면 기다렸다가 다시 시도합니다.
+    # DB 에 연결할 수 없는 에러는 트윗의 문제가 아니므로 저장될 때까지 계속 다시 시도하고(그동안 트윗은 큐에 쌓입니다),
+    # 그 외의 에러로 max_retries 번 실패하면 트윗을 하나씩 저장해서 저장할 수 없는 트윗만 dead letter 파일로 옮깁니다.
+    def write(self, queue, records):
+        records = list(records)
+        retries = 0
+        attempt = 0
+
+        while True:
+            try:
+                if attempt < self.max_retries:
+                    self.tweet_service.write_tweets(records)
+                    self.written += len(records)
+                else:
+                    self.write_each(queue, records)
+                return
+            except Exception as error:
+                self.failures += 1
+                retries += 1
+                if not is_unavailable(error):
+                    attempt += 1
+                logger.exception('failed to write %d queued tweets (retry %d)', len(records), retries)
+
+            time.sleep(min(self.max_backoff, 0.1 * 2 ** retries))
+
+    # 트윗을 하나씩 저장하고, 저장할 수 없는 트윗은 dead letter 파일로 옮깁니다.
+    # 중간에 DB 에 연결할 수 없게 되면 저장한 트윗들을 records 에서 빼고 에러를 다시 발생시킵니다.
+    def write_each(self, queue, records):
+        while records:
+            try:
+                self.tweet_service.write_tweets(records[:1])
+                self.written += 1
+            except Exception as error:
+                if is_unavailable(error):
+                    raise
+                self.dead_letter(queue, records[:1])
+
+            del records[0]
+
+    # 저장할 수 없는 트윗들을 큐 디렉토리의 dead-letter.log 파일에 json 한 줄씩 기록합니다.
+    def dead_letter(self, queue, records):
+        if not records:
+            return
+
+        with open(os.path.join(queue.directory, 'dead-letter.log'), 'a') as f:
+            for record in records:
+                f.write(json.dumps(record) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+
+        self.dead_letters += len(records)
+        logger.error('moved %d queued tweets to the dead letter file', len(records))
+
+    # 큐에 쌓인 크기와 저장한 트윗 수 등을 반환합니다.
+    def stats(self):
+        return {
+            'backlog_bytes' : self.queue.backlog_bytes() if self.queue else 0,
+            'written' : self.written,
+            'failures' : self.failures,
+            'dead_letters' : self.dead_letters
+        }
@@ -1,48 +1,88 @@
 # 사용자를 저장하고 로그인, 보안인증, 액세스토큰 생성, 언/팔로우를 할 수 있는 유저 service layer입니다.
 
-# 사용자의 비밀번호를 단방향 암호화하기 위해 bcrypt 해시 함수를 추가한다.
-import bcrypt
+# 사용자의 비밀번호를 단방향 암호화하는 bcrypt 해시를 프로세스 풀에서 처리하는 PasswordHasher
+from .password_hasher import PasswordHasher
 # 사용자의 access token을 json 데이터로 보내기 위한 jwt 모듈을 추가한다.
 import jwt
 
 # 토큰을 생성할 때 토큰 유효기간을 지정하는 datetime 라이브러리
 from _datetime import datetime, timedelta
 
+# bcrypt 해시 시간을 현재 요청의 처리시간(Server-Timing, /metrics)에 기록하는 timed
+from metrics import timed
+
+# 존재하지 않는 이메일을 잠시 기억해두는 캐시 (cache 가 주어지지 않으면 프로세스 메모리 캐시를 사용)
+from cache import LocalCache
+
+# 로그인 결과. 로그인에 성공하면 유저의 id 를 함께 담고 있어서, 다시 DB 에서 유저를 찾지 않아도 됩니다.
+# 기존처럼 if 문에서 로그인 성공 여부(authorized)로 사용할 수 있습니다.
+class LoginResult:
+    def __init__(self, authorized, user_id = None):
+        self.authorized = authorized
+        self.user_id = user_id
+
+    def __bool__(self):
+        return self.authorized
+
 class UserService:
 
     # 유저의 데이터를 저장해주는 model layer를 상속받습니다.
-    def __init__(self, user_dao, config):
+    # timeline_store 가 주어지면 팔로우 목록이 바뀔 때 해당 유저의 저장된 타임라인을 지웁니다.
+    # password_hasher 가 없으면 요청 스레드에서 바로 bcrypt 를 실행하는 PasswordHasher 를 사용합니다.
+    # cache 는 TweetService 와 함께 사용하는 캐시 backend(LocalCache, RedisCache)이며,
+    # 없으면 이 서비스만 사용하는 LocalCache 를 만듭니다.
+    def __init__(self, user_dao, config, timeline_store = None, password_hasher = None, cache = None):
         self.user_dao = user_dao
         self.config = config
+        self.timeline_store = timeline_store
+        self.password_hasher = password_hasher or PasswordHasher(rounds = config.get('BCRYPT_ROUNDS', 12))
+
+        # 가입되지 않은 이메일로 로그인을 시도하면 잠시 기억해두고, 같은 이메일은 DB 를 조회하지 않고 바로 거절합니다.
+        # (존재하지 않는 계정으로 무작위 로그인을 시도하는 요청이 DB 까지 가지 않게 합니다.)
+        # redis 를 사용하면 다른 worker 에서 가입한 이메일도 바로 지워집니다.
+        # 프로세스 메모리 캐시는 다른 worker 에서 가입해도 지워지지 않으므로, worker 가 하나일 때만 사용합니다.
+        self.cache = cache or LocalCache(max_size = config.get('LOGIN_NEGATIVE_CACHE_SIZE', 100000))
+        self.unknown_email_ttl = config.get('LOGIN_NEGATIVE_CACHE_TTL', 30)
+        self.remember_unknown_emails = self.cache.shared or config.get('SERVER_WORKERS', 1) == 1
 
     # 유저를 생성하는 함수
     def create_new_user(self, new_user):
         # 유저의 비밀번호를 단방향 암호화기능인 bcrypt를 사용해 암호화시킵니다.
-        # hashpw : 암호화로 만드는 함수. 1. 암호화하고자하는 byte와 2. 암호화하고자하는 salting을 추가하여 함호화시킨다.
-        # encode('UTF-8') : string 데이터를 UTF-8로 인코딩하여 byte로 변경합니다.
-        new_user['password'] = bcrypt.hashpw(
-            new_user['password'].encode('UTF-8'), 
-            bcrypt.gensalt()
-        )
+        # 해시는 password_hasher 의 프로세스 풀에서 처리되며, 작업이 밀려있으면 PasswordHasherBusy 가 발생합니다.
+        # encode('UTF-8') : string 데이터를 UTF-8로 인코딩하여 byte로 변경하고, 해시값은 다시 string 으로 저장합니다.
+        with timed('bcrypt'):
+            new_user['password'] = self.password_hasher.hash(new_user['password'].encode('UTF-8')).decode('UTF-8')
 
         new_user_id = self.user_dao.insert_user(new_user)
 
+        # 가입한 이메일이 존재하지 않는 이메일로 기억되어 있으면 지워줍니다.
+        self.cache.delete('unknown_email:' + new_user['email'])
+
         return new_user_id
 
     # 로그인 함수
+    # 로그인 성공 여부와 유저의 id 를 담은 LoginResult 를 반환합니다.
     def login(self, credential):
         email = credential['email']
         password = credential['password']
 
-        print(f"유저가 입력한 {email} 과 {password}")
+        # 최근에 없는 이메일로 확인된 이메일이면 DB 를 조회하지 않고 거절합니다.
+        if self.cache.get('unknown_email:' + email):
+            return LoginResult(False)
+
         # 로그인하는 유저의 이메일과 매칭되는 DB에 저장된 유저의 데이터를 가져온다.
         user_credential = self.user_dao.get_user_id_and_password(email)
+        if user_credential is None:
+            if self.remember_unknown_emails:
+                self.cache.set('unknown_email:' + email, True, self.unknown_email_ttl)
+            return LoginResult(False)
 
         # 매칭되는 유저가 있으면 해당 유저의 비밀번호와 로그인한 유저의 비밀번호값이 일치하는지 비교한다.
-        # bcrypt.checkpw로 로그인한 비밀번호를 암호화하여, DB에서 꺼내온 유저의 비밀번호와 일치하는지 bcrypt이 기능을 수행해준다. 
-        authorized = user_credential and bcrypt.checkpw(password.encode('UTF-8'), user_credential['hashed_password'].encode('UTF-8'))
+        # bcrypt.checkpw로 로그인한 비밀번호를 암호화하여, DB에서 꺼내온 유저의 비밀번호와 일치하는지 password_hasher 의 프로세스 풀에서 비교한다. 
+        with timed('bcrypt'):
+            authorized = self.password_hasher.check(password.encode('UTF-8'), user_credential['hashed_password'].encode('UTF-8'))
         
-        return authorized
+        return LoginResult(authorized, user_credential['id'] if authorized else None)
 
     # 찾고자하는 유저정보를 이메일 정보를 통해 꺼내온다.
     def get_user_id_and_password(self, email):
@@ -64,8 +104,50 @@ class UserService:
 
     # 팔로우 기능
     def follow(self, user_id, follow_id):
-        return self.user_dao.insert_follow(user_id, follow_id)
+        result = self.user_dao.insert_follow(user_id, follow_id)
+        self.invalidate_timeline(user_id)
+
+        return result
         
     #언팔로우 기능
     def unfollow(self, user_id, unfollow_id):
-        return self.user_dao.insert_unfollow(user_id, unfollow_id)
\ No newline at end of file
+        result = self.user_dao.insert_unfollow(user_id, unfollow_id)
+        self.invalidate_timeline(user_id)
+
+        return result
+
+    # 여러 유저를 한 번에 팔로우합니다. 새로 팔로우한 유저 수를 반환합니다.
+    def follow_many(self, user_id, follow_ids):
+        count = self.user_dao.insert_follows(user_id, follow_ids)
+        self.invalidate_timeline(user_id)
+
+        return count
+
+    # 여러 유저를 한 번에 언팔로우합니다. 언팔로우한 유저 수를 반환합니다.
+    def unfollow_many(self, user_id, unfollow_ids):
+        count = self.user_dao.insert_unfollows(user_id, unfollow_ids)
+        self.invalidate_timeline(user_id)
+
+        return count
+
+    # 유저의 프로필과 팔로워/팔로잉 수를 가져옵니다. 없는 유저면 None 을 반환합니다.
+    def get_user(self, user_id):
+        return self.user_dao.get_user(user_id)
+
+    # 해당 유저를 팔로우하는 유저들을 한 페이지씩 가져옵니다.
+    # limit 은 1 부터 max_limit 사이로 제한하며, 다음 페이지를 요청할 때 사용할 next_cursor 를 함께 반환합니다.
+    def get_followers(self, user_id, after = None, limit = 50, max_limit = 100):
+        return self.user_dao.get_followers(user_id, after, max(1, min(limit, max_limit)))
+
+    # 해당 유저가 팔로우하는 유저들을 한 페이지씩 가져옵니다.
+    def get_following(self, user_id, after = None, limit = 50, max_limit = 100):
+        return self.user_dao.get_following(user_id, after, max(1, min(limit, max_limit)))
+
+    # 팔로우할 만한 유저(친구의 친구)들을 추천 순위대로 가져옵니다. limit 은 1 부터 max_limit 사이로 제한합니다.
+    def get_suggestions(self, user_id, limit = 20, max_limit = 50):
+        return self.user_dao.get_suggestions(user_id, max(1, min(limit, max_limit)))
+
+    # 팔로우 목록이 바뀐 유저의 저장된 타임라인을 지워, 다음 요청에서 DB 로부터 다시 만들게 합니다.
+    def invalidate_timeline(self, user_id):
+        if self.timeline_store is not None:
+            self.timeline_store.invalidate(user_id)
\ No newline at end of file
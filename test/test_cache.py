@@ -0,0 +1,135 @@
+# 서비스 layer 의 캐시 backend(LocalCache, RedisCache)를 확인하는 TEST cache unit 파일.
+# RedisCache 는 redis 대신 같은 프로토콜을 사용하는 FakeRedisServer 에 연결해서 테스트한다.
+
+# 유닛테스트에 필요한 pytest 라이브러리
+import pytest
+# 여러 요청(스레드)이 동시에 캐시를 사용하는 상황을 만드는 threading 과 time
+import threading
+import time
+# 테스트할 캐시 backend 들
+from cache import LocalCache, RedisCache, RedisError, FakeRedisServer
+
+# 테스트마다 새로운 가짜 redis 서버를 실행하고, 테스트가 끝나면 종료한다.
+@pytest.fixture
+def redis_server():
+    server = FakeRedisServer().start()
+    yield server
+    server.stop()
+
+# 같은 테스트를 두 backend 로 실행한다.
+@pytest.fixture(params = ['local', 'redis'])
+def cache(request, redis_server):
+    if request.param == 'local':
+        return LocalCache(max_size = 100, ttl = 60)
+
+    return RedisCache(redis_server.url, ttl = 60)
+
+def test_get_set_delete(cache):
+    cache.set('a', {'user_id' : 1, 'tweet' : 'Hello World!'})
+    cache.set('b', [1, 2, 3])
+
+    assert cache.get('a') == {'user_id' : 1, 'tweet' : 'Hello World!'}
+    assert cache.get('none', 'default') == 'default'
+    assert cache.get_many(['a', 'b', 'none']) == {
+        'a' : {'user_id' : 1, 'tweet' : 'Hello World!'},
+        'b' : [1, 2, 3]
+    }
+
+    cache.delete_many(['a', 'b'])
+
+    assert cache.get_many(['a', 'b']) == { }
+
+    cache.set_many({'c' : 1, 'd' : [2]})
+
+    assert cache.get_many(['c', 'd']) == {'c' : 1, 'd' : [2]}
+
+def test_ttl(cache):
+    ## ttl 이 지난 값은 캐시에서 사라진다.
+    cache.set('a', 1, ttl = 0.05)
+    time.sleep(0.1)
+
+    assert cache.get('a') is None
+
+# 캐시에 없는 값을 여러 요청이 동시에 요청해도, 값은 한 번만 만들어지는지 테스트
+def test_get_or_build(cache):
+    builds = []
+
+    def build():
+        builds.append(1)
+        time.sleep(0.1)
+        return [1, 2, 3]
+
+    results = []
+    threads = [threading.Thread(target = lambda: results.append(cache.get_or_build('timeline', build))) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(builds) == 1
+    assert results == [[1, 2, 3]] * 8
+
+# 같은 redis 를 사용하는 여러 worker(RedisCache) 중 하나만 값을 만드는지 테스트
+def test_redis_get_or_build_across_workers(redis_server):
+    workers = [RedisCache(redis_server.url) for _ in range(4)]
+    builds = []
+
+    def build():
+        builds.append(1)
+        time.sleep(0.1)
+        return 'timeline'
+
+    results = []
+    threads = [threading.Thread(target = lambda worker = worker: results.append(worker.get_or_build('timeline', build))) for worker in workers]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(builds) == 1
+    assert results == ['timeline'] * 4
+
+    ## 한 worker 에서 지운 값은 다른 worker 에서도 지워진다.
+    workers[0].delete('timeline')
+
+    assert workers[1].get('timeline') is None
+
+# lock 은 한 worker 만 잡을 수 있고, lock 을 잡은 token 으로만 풀리는지 테스트
+def test_redis_unlock(redis_server):
+    cache = RedisCache(redis_server.url)
+    other = RedisCache(redis_server.url)
+
+    tokens = other.lock_many(['a', 'b'])
+    assert set(tokens) == {'a', 'b'}
+    assert cache.lock_many(['a', 'c']).keys() == {'c'}
+
+    ## 다른 worker 가 잡은 lock 은 지우지 않는다.
+    cache.unlock_many({'a' : b'my token'})
+    assert cache.execute('GET', cache.lock_key('a')) == tokens['a']
+
+    other.unlock_many(tokens)
+    assert cache.execute('GET', cache.lock_key('a')) is None
+    assert cache.execute('GET', cache.lock_key('b')) is None
+    assert cache.stats()['errors'] == 0
+
+# redis 가 에러로 응답한 연결은 커넥션 풀에 돌려주어 다시 사용하는지 테스트
+def test_redis_error_reply(redis_server):
+    cache = RedisCache(redis_server.url, pool_size = 1)
+
+    with pytest.raises(RedisError):
+        cache.execute('UNKNOWN')
+
+    assert len(cache.pool.idle) == 1
+    cache.set('a', 1)
+    assert cache.get('a') == 1
+
+# redis 서버에 연결할 수 없으면 캐시가 없는 것처럼 동작하는지 테스트
+def test_redis_unavailable(redis_server):
+    cache = RedisCache(redis_server.url, timeout = 0.2)
+    redis_server.stop()
+
+    cache.set('a', 1)
+
+    assert cache.get('a', 'default') == 'default'
+    assert cache.get_or_build('a', lambda: 2) == 2
+    assert cache.stats()['errors'] > 0
@@ -0,0 +1,64 @@
+# 커넥션 풀의 checkout 기록(PoolMetrics)과 이를 기록하는 MeteredQueuePool 을 확인하는 TEST unit 파일.
+# MySQL 대신 임시 SQLite 파일 DB 를 사용한다.
+
+# 유닛테스트에 필요한 pytest 라이브러리
+import pytest
+# sqlalchemy의 엔진과 커넥션을 빌리지 못했을 때의 에러
+from sqlalchemy import create_engine, exc
+# 테스트할 커넥션 풀과 기록
+from model.database import PoolMetrics, MeteredQueuePool
+
+@pytest.fixture
+def engine(tmp_path):
+    engine = create_engine(
+        f"sqlite:///{tmp_path / 'test.db'}",
+        poolclass = MeteredQueuePool,
+        pool_size = 1,
+        max_overflow = 1,
+        pool_timeout = 0.1
+    )
+    engine.pool.metrics = PoolMetrics()
+
+    yield engine
+    engine.dispose()
+
+# 커넥션을 빌리고 반납한 횟수, 풀이 가득 차서 시간이 초과된 횟수와 기다린 시간, overflow 를 기록하는지 테스트
+def test_pool_metrics(engine):
+    metrics = engine.pool.metrics
+
+    first = engine.connect()
+    second = engine.connect()
+
+    status = metrics.snapshot(engine.pool)
+    assert status['checkouts'] == 2
+    assert status['checked_out'] == 2
+    assert status['overflow'] == 1
+    assert status['timeouts'] == 0
+
+    ## pool_size + max_overflow 개를 모두 빌려준 상태라 pool_timeout 만큼 기다린 뒤 시간이 초과된다.
+    with pytest.raises(exc.TimeoutError):
+        engine.connect()
+
+    first.close()
+    second.close()
+
+    status = metrics.snapshot(engine.pool)
+    assert status['checkouts'] == 2
+    assert status['checkins'] == 2
+    assert status['timeouts'] == 1
+    assert status['checked_out'] == 0
+    assert status['pool_size'] == 1
+    assert status['wait_seconds_max'] >= 0.1
+    assert status['wait_seconds_total'] >= 0.1
+    assert status['wait_seconds_avg'] == status['wait_seconds_total'] / 2
+
+# 엔진이 풀을 다시 만들어도(dispose) 같은 PoolMetrics 에 계속 기록하는지 테스트
+def test_pool_metrics_after_dispose(engine):
+    metrics = engine.pool.metrics
+    engine.connect().close()
+
+    engine.dispose()
+    engine.connect().close()
+
+    assert engine.pool.metrics is metrics
+    assert metrics.snapshot(engine.pool)['checkouts'] == 2
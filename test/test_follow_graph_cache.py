@@ -0,0 +1,21 @@
+# 유저별 팔로우 목록을 메모리에 저장하는 follow graph cache 의 팔로우 id 집합(FollowIds)을 확인하는 TEST unit 파일.
+# DB 없이 메모리에서만 확인한다.
+
+# 유닛테스트에 필요한 pytest 라이브러리
+import pytest
+# 테스트할 팔로우 id 집합
+from model.follow_graph_cache import FollowIds
+
+# 팔로우 목록을 작은 id 부터 반환하고, 팔로우 여부를 확인할 수 있는지 테스트
+# 듬성듬성한 id 는 정렬된 배열로, 촘촘한 id 는 비트맵으로 저장된다.
+@pytest.mark.parametrize('follow_ids, bitmap', [
+    ([30, 10, 2000000], False),
+    (list(range(100, 1000, 2)), True)
+])
+def test_follow_ids(follow_ids, bitmap):
+    follows = FollowIds(follow_ids)
+
+    assert (follows.bitmap is not None) == bitmap
+    assert list(follows) == sorted(follow_ids)
+    assert all(follow_id in follows for follow_id in follow_ids)
+    assert 11 not in follows
@@ -0,0 +1,39 @@
+# 팔로우 그래프(CSR)로 친구의 친구를 추천하는 배치 작업의 계산을 확인하는 TEST unit 파일.
+# DB 를 사용하지 않으며, numpy 가 설치되어 있지 않으면 건너뛴다.
+
+# 유닛테스트에 필요한 pytest 라이브러리
+import pytest
+
+np = pytest.importorskip('numpy')
+
+# 테스트할 팔로우 그래프
+from model.follow_suggestions import FollowGraph
+
+@pytest.fixture
+def graph():
+    # 1 -> 2, 3 / 2 -> 1, 4, 5 / 3 -> 4, 5, 6 / 4 -> 6 (중복 간선과 자기 자신을 팔로우한 간선은 빠진다.)
+    edges = [(1, 2), (1, 3), (1, 1), (2, 1), (2, 4), (2, 5), (3, 4), (3, 5), (3, 6), (4, 6), (4, 6)]
+
+    return FollowGraph.from_edges([edge[0] for edge in edges], [edge[1] for edge in edges])
+
+def test_follow_graph(graph):
+    assert graph.edges == 9
+    assert graph.following(1).tolist() == [2, 3]
+    assert graph.following(6).tolist() == []
+    assert graph.following(100).tolist() == []
+
+def test_suggest(graph):
+    ## 팔로우한 유저들이 많이 팔로우한 유저부터 추천하고, 같으면 id 가 작은 유저부터 추천한다.
+    ## 자기 자신과 이미 팔로우한 유저는 추천하지 않는다.
+    suggested_ids, counts = graph.suggest(1)
+    assert list(zip(suggested_ids.tolist(), counts.tolist())) == [(4, 2), (5, 2), (6, 1)]
+
+    suggested_ids, counts = graph.suggest(1, limit = 1)
+    assert suggested_ids.tolist() == [4]
+
+    ## max_fanout 보다 많이 팔로우한 유저(2, 3)는 추천의 근거로 사용하지 않는다.
+    suggested_ids, counts = graph.suggest(1, max_fanout = 2)
+    assert suggested_ids.tolist() == []
+
+    suggested_ids, counts = graph.suggest(6)
+    assert suggested_ids.tolist() == []
@@ -0,0 +1,24 @@
+# 응답을 json 으로 인코딩하는 encoder(get_json_encoder)를 확인하는 TEST unit 파일.
+# json 모듈과 orjson 모두 기존 flask 의 json encoder 와 같은 json 을 만드는지 테스트한다.
+
+# 유닛테스트에 필요한 pytest 라이브러리
+import pytest
+import json
+# 테스트할 json encoder 와 encoder 가 인코딩할 datetime
+from view import get_json_encoder
+from datetime import datetime
+
+@pytest.mark.parametrize('backend', ['json', 'orjson'])
+def test_json_encoder(backend):
+    pytest.importorskip(backend)
+    encoder = get_json_encoder(backend)
+
+    ## set 은 list 로, datetime 은 기존 json 모듈과 같은 http date 문자열로 인코딩한다.
+    data = {'follow' : {1}, 'created_at' : datetime(2020, 1, 1, 12, 0, 0), 'tweet' : '안녕하세요'}
+    body = json.dumps(data, cls = encoder, sort_keys = True, separators = (',', ':'))
+
+    assert json.loads(body) == {
+        'created_at' : 'Wed, 01 Jan 2020 12:00:00 GMT',
+        'follow' : [1],
+        'tweet' : '안녕하세요'
+    }
@@ -0,0 +1,84 @@
+# 요청별 처리시간 기록(instrumentation)과 /metrics 텍스트, sampling profiler 를 확인하는 TEST unit 파일.
+# DB 대신 메모리에서 실행하는 sqlite 엔진을 사용한다.
+
+import time
+import json
+# 테스트할 instrumentation
+from metrics import Instrumentation, MetricsRegistry, SamplingProfiler, timed
+from sqlalchemy import create_engine
+
+def test_registry_render():
+    registry = MetricsRegistry()
+    requests = registry.counter('requests_total', '요청 수', ('route',))
+    seconds = registry.histogram('seconds', '처리시간', buckets = (0.1, 1))
+    registry.add_collector(lambda: [('backlog_bytes', 'gauge', '큐 크기', [({}, 10)])])
+
+    requests.inc(route = '/users/"1"')
+    requests.inc(2, route = '/users/"1"')
+    seconds.observe(0.5)
+    seconds.observe(5)
+
+    assert registry.render().splitlines() == [
+        '# HELP requests_total 요청 수',
+        '# TYPE requests_total counter',
+        'requests_total{route="/users/\\"1\\""} 3',
+        '# HELP seconds 처리시간',
+        '# TYPE seconds histogram',
+        'seconds_bucket{le="0.1"} 0',
+        'seconds_bucket{le="1.0"} 1',
+        'seconds_bucket{le="+Inf"} 2',
+        'seconds_sum 5.5',
+        'seconds_count 2',
+        '# HELP backlog_bytes 큐 크기',
+        '# TYPE backlog_bytes gauge',
+        'backlog_bytes 10'
+    ]
+
+def test_request_timing():
+    instrumentation = Instrumentation()
+    engine = create_engine('sqlite://')
+    instrumentation.instrument_engine(engine)
+
+    ## 요청 밖에서 실행한 SQL 은 요청의 처리시간에 기록하지 않는다.
+    engine.execute('SELECT 1')
+
+    timing, token = instrumentation.begin_request()
+    engine.execute('SELECT 1')
+    engine.execute('SELECT 2')
+    with timed('bcrypt'):
+        pass
+    encoder = instrumentation.timed_json_encoder(json.JSONEncoder)
+    assert encoder().encode({'a' : 1}) == '{"a": 1}'
+    instrumentation.end_request(timing, token, 'GET', '/timeline', 200)
+
+    assert timing.phases['db'][1] == 2
+    assert set(timing.phases) == {'db', 'bcrypt', 'json'}
+    assert timing.server_timing().startswith('db;dur=')
+    assert '2 queries' in timing.server_timing()
+
+    text = instrumentation.render()
+    assert 'sns_requests_total{method="GET",route="/timeline",status="200"} 1' in text
+    assert 'sns_sql_statements_total 3' in text
+    assert 'sns_sql_statements_per_request_count{route="/timeline"} 1' in text
+
+def test_profiler_dumps_slow_requests(tmp_path):
+    profiler = SamplingProfiler(interval = 0.001, slow_seconds = 0.05, directory = str(tmp_path))
+    instrumentation = Instrumentation(profiler)
+
+    ## 빠른 요청은 저장하지 않는다.
+    timing, token = instrumentation.begin_request()
+    instrumentation.end_request(timing, token, 'GET', '/ping', 200)
+    assert list(tmp_path.iterdir()) == [ ]
+
+    timing, token = instrumentation.begin_request()
+    deadline = time.perf_counter() + 0.1
+    while time.perf_counter() < deadline:
+        pass
+    instrumentation.end_request(timing, token, 'GET', '/timeline', 200)
+
+    ## 느린 요청의 스택을 "함수;함수 샘플수" 형식으로 저장한다.
+    paths = list(tmp_path.iterdir())
+    assert len(paths) == 1 and 'GET_timeline' in paths[0].name
+    stack, count = paths[0].read_text().splitlines()[0].rsplit(' ', 1)
+    assert 'test_profiler_dumps_slow_requests' in stack
+    assert int(count) > 0
@@ -0,0 +1,67 @@
+# 테이블과 인덱스를 만드는 migration 들과 schema 버전 확인을 확인하는 TEST unit 파일.
+# MySQL 대신 임시 SQLite 파일 DB 를 사용한다.
+
+# 유닛테스트에 필요한 pytest 라이브러리
+import pytest
+# sqlalchemy의 엔진을 만드는 함수와 DB 의 테이블, 인덱스를 읽는 inspect
+from sqlalchemy import create_engine, inspect
+# ORM 테이블들과 테스트할 migration
+from repository import Base
+from migrations import MIGRATIONS, LATEST_VERSION, SchemaVersionError, current_version, check_schema, upgrade
+
+@pytest.fixture
+def engine(tmp_path):
+    return create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+
+def get_version(engine):
+    with engine.connect() as connection:
+        return current_version(connection)
+
+def get_indexes(engine, table):
+    return {index['name'] for index in inspect(engine).get_indexes(table)}
+
+def test_upgrade(engine):
+    ## 빈 DB 는 버전 0 이며, 서버가 시작할 때 확인하면 실패한다.
+    assert get_version(engine) == 0
+    with pytest.raises(SchemaVersionError):
+        check_schema(engine)
+
+    ## 모든 migration 을 차례대로 적용하고, 다시 실행하면 아무것도 적용하지 않는다.
+    assert [migration.version for migration in upgrade(engine)] == list(range(1, LATEST_VERSION + 1))
+    assert check_schema(engine) == LATEST_VERSION
+    assert upgrade(engine) == []
+
+def test_upgrade_to_version(engine):
+    assert [migration.version for migration in upgrade(engine, 2)] == [1, 2]
+    assert get_version(engine) == 2
+    assert 'tweet_hashtags' not in inspect(engine).get_table_names()
+
+    assert [migration.version for migration in upgrade(engine)] == list(range(3, LATEST_VERSION + 1))
+
+def test_migrations_match_orm(engine):
+    upgrade(engine)
+    inspector = inspect(engine)
+
+    ## migration 으로 만든 테이블, 컬럼, 인덱스가 repository ORM 과 같아야 한다.
+    assert set(inspector.get_table_names()) == set(Base.metadata.tables) | {'schema_version'}
+    for name, table in Base.metadata.tables.items():
+        assert [column['name'] for column in inspector.get_columns(name)] == [column.name for column in table.columns]
+        assert get_indexes(engine, name) == {index.name for index in table.indexes}
+
+def test_upgrade_existing_database(engine):
+    ## create_all 로 테이블을 만들던 기존 DB 에서, 인덱스가 추가되기 전에 만든 tweets 테이블을 흉내낸다.
+    with engine.begin() as connection:
+        connection.execute('CREATE TABLE users (id INTEGER NOT NULL PRIMARY KEY, name VARCHAR(255) NOT NULL, email VARCHAR(255) NOT NULL UNIQUE, hashed_password VARCHAR(255) NOT NULL, profile VARCHAR(2000) NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL, updated_at TIMESTAMP)')
+        connection.execute('CREATE TABLE tweets (id INTEGER NOT NULL PRIMARY KEY, user_id INTEGER NOT NULL, tweet VARCHAR(300) NOT NULL, created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP NOT NULL)')
+        connection.execute("INSERT INTO tweets (user_id, tweet) VALUES (1, 'Hello World!')")
+
+    ## 기존 테이블과 데이터는 그대로 두고, 없는 테이블과 인덱스만 만든다.
+    upgrade(engine)
+    assert get_indexes(engine, 'tweets') == {'tweets_user_id_id_idx'}
+    assert 'users_follow_list' in inspect(engine).get_table_names()
+    with engine.connect() as connection:
+        assert connection.execute('SELECT tweet FROM tweets').fetchall() == [('Hello World!',)]
+
+def test_migration_versions():
+    ## migration 버전은 1 부터 빠짐없이 순서대로 등록되어 있어야 한다.
+    assert [migration.version for migration in MIGRATIONS] == list(range(1, len(MIGRATIONS) + 1))
@@ -12,14 +12,18 @@ import config
 import bcrypt
 # 유닛테스트에 필요한 pytest 라이브러리
 import pytest
+# 타임라인 generator 를 다른 스레드에서 읽는 threading
+import threading
 # DBORM 들을 불러온다.
-from repository import Base, Users, Tweets, UsersFollowList
+from repository import Users, Tweets, UsersFollowList, UserFollowCounts, TweetHashtags, TweetMentions
+# 테이블과 인덱스를 만드는 migration
+from migrations import upgrade
 # DB에 데이터를 저장하는 로직들
-from model import UserDao, TweetDao
+from model import UserDao, TweetDao, FollowGraphCache
 # sqlalchemy의 엔진을 만드는 함수
 from sqlalchemy import create_engine
 # sqlalchemy를 통해 디비와 연결이 끊기지 않고, 트랜젝션을 관리하는 세션을 만드는 sessionmaker(세션공장).
-from sqlalchemy.orm import sessionmaker
+from sqlalchemy.orm import sessionmaker, scoped_session
 
 # contextmanager 를 통해서, 세션을 생성하구 커밋, 종료를 반복하지 않고
 # 재사용할 수 있게끔 사용해줍니다.
@@ -31,8 +35,8 @@ engine = create_engine(config.test_config['DB_URL'], encoding = 'utf-8', max_ove
 # 위의 엔진을 통해 세션을 생성한다.
 Session = sessionmaker(bind=engine)
 
-# Base를 상속받은 db class들을 mariaDB 관계형 디비 테이블들과 매핑하여 웹서버에 적용시킵니다.
-Base.metadata.create_all(engine)
+# 적용되지 않은 migration 들을 적용해서 테이블들을 만듭니다. 이미 최신 버전이면 schema_version 만 확인합니다.
+upgrade(engine)
 
 # contextmanager 데코레이션을 사용해 try/finally이 재사용가능한 
 # session_scope함수를 만들고, with 문을 통해서 해당 함수를 불러온다.
@@ -86,6 +90,9 @@ def teardown_function():
         session.execute('''TRUNCATE TABLE users''')
         session.execute('''TRUNCATE TABLE tweets''')
         session.execute('''TRUNCATE TABLE users_follow_list''')
+        session.execute('''TRUNCATE TABLE user_follow_counts''')
+        session.execute('''TRUNCATE TABLE tweet_hashtags''')
+        session.execute('''TRUNCATE TABLE tweet_mentions''')
         session.execute('''SET FOREIGN_KEY_CHECKS=1''')
 
 # 유저의 id로 유저정보를 가져온다.
@@ -155,6 +162,50 @@ def test_insert_unfollow(user_dao):
 
     assert follow_list == [ ]
 
+def test_insert_follows(user_dao):
+    ## insert_follows 메소드를 사용하여 사용자 1이 사용자 2를 한 번에 팔로우한다.
+    ## 중복된 id 와 이미 팔로우한 유저는 건너뛴다.
+    assert user_dao.insert_follows(user_id = 1, follow_ids = [2, 2]) == 1
+    assert user_dao.insert_follows(user_id = 1, follow_ids = [2]) == 0
+
+    assert get_follow_list(1) == [2]
+
+def test_insert_unfollows(user_dao):
+    ## insert_unfollows 메소드를 사용하여 사용자 1이 팔로우한 유저들을 한 번에 언팔로우한다.
+    ## 팔로우하지 않은 유저(3)는 건너뛴다.
+    user_dao.insert_follows(user_id = 1, follow_ids = [2])
+
+    assert user_dao.insert_unfollows(user_id = 1, unfollow_ids = [2, 3]) == 1
+    assert get_follow_list(1) == [ ]
+
+def test_follow_counts():
+    ## user_follow_counts 를 사용하면 팔로우/언팔로우할 때 팔로워/팔로잉 수가 함께 바뀐다.
+    ## setup_function 에서 만든 사용자들은 카운터 행이 없으므로 처음 한 번 세서 저장한다.
+    user_dao = UserDao(Session, Users, UsersFollowList, user_follow_countsORM = UserFollowCounts)
+
+    assert user_dao.get_user(1)['following'] == 0
+
+    user_dao.insert_follow(user_id = 1, follow_id = 2)
+    user_dao.insert_follows(user_id = 2, follow_ids = [1, 2])
+    assert (user_dao.get_user(1)['followers'], user_dao.get_user(1)['following']) == (1, 1)
+    assert (user_dao.get_user(2)['followers'], user_dao.get_user(2)['following']) == (2, 2)
+
+    ## 이미 언팔로우한 유저를 다시 언팔로우해도 수가 줄어들지 않는다.
+    assert user_dao.insert_unfollow(user_id = 1, unfollow_id = 2) is True
+    assert user_dao.insert_unfollow(user_id = 1, unfollow_id = 2) is False
+    assert user_dao.insert_unfollows(user_id = 2, unfollow_ids = [1, 3]) == 1
+    assert (user_dao.get_user(2)['followers'], user_dao.get_user(2)['following']) == (1, 1)
+    assert user_dao.get_user(3) is None
+
+def test_follow_pages(user_dao):
+    ## 팔로잉/팔로워 목록을 유저 id 순서로 한 페이지씩 가져온다.
+    user_dao.insert_follows(user_id = 1, follow_ids = [1, 2])
+
+    assert user_dao.get_following(1, limit = 1) == ([{'id' : 1, 'name' : '송은우'}], 1)
+    assert user_dao.get_following(1, after = 1, limit = 1) == ([{'id' : 2, 'name' : '김철수'}], None)
+    assert user_dao.get_followers(2) == ([{'id' : 1, 'name' : '송은우'}], None)
+    assert user_dao.get_followers(1, after = 1) == ([ ], None)
+
 # 트윗이 제대로 저장되는지, 불러와지는지 테스트
 def test_insert_tweet(tweet_dao):
     tweet_dao.insert_tweet(1, "tweet test")
@@ -167,6 +218,31 @@ def test_insert_tweet(tweet_dao):
         }
     ]
 
+# 트윗과 함께 해시태그와 멘션이 저장되고, 트윗 id 순서로 불러와지는지 테스트
+def test_tweet_entities():
+    tweet_dao = TweetDao(Session, Tweets, UsersFollowList, tweet_hashtagsORM = TweetHashtags, tweet_mentionsORM = TweetMentions)
+
+    tweet_id = tweet_dao.insert_tweet(1, '#python @kim', ['python'], ['kim'])
+    ## 한 번에 저장한 트윗들도 각 트윗의 id 로 해시태그와 멘션을 저장한다.
+    tweet_dao.insert_tweets([
+        {'user_id' : 1, 'tweet' : '#flask', 'hashtags' : ['flask'], 'mentions' : []},
+        {'user_id' : 2, 'tweet' : 'no tags'},
+        {'user_id' : 2, 'tweet' : '#flask @lee', 'hashtags' : ['flask'], 'mentions' : ['lee']}
+    ])
+
+    entities = [(row[0], row[2] or '', row[3] or '') for row in tweet_dao.iter_tweet_entities()]
+    assert sorted(entities) == [
+        (tweet_id, '', 'kim'),
+        (tweet_id, 'python', ''),
+        (tweet_id + 1, 'flask', ''),
+        (tweet_id + 3, '', 'lee'),
+        (tweet_id + 3, 'flask', '')
+    ]
+    assert [row[0] for row in entities] == sorted(row[0] for row in entities)
+
+    ## after_id 이후의 트윗만 불러온다.
+    assert [row[0] for row in tweet_dao.iter_tweet_entities(after_id = tweet_id + 1)] == [tweet_id + 3, tweet_id + 3]
+
 # 유저 1과 2가 트윗을 입력 후, 1이 2를 팔로우한 뒤,
 # 미리 입력했던 유저 2의 트윗과 새로입력한 1과 2의 트윗을 잘 불러오는지 테스트.
 def test_timeline(user_dao, tweet_dao):
@@ -189,4 +265,54 @@ def test_timeline(user_dao, tweet_dao):
             'user_id' : 2,
             'tweet' : 'tweet test 2'
         }
-    ]
\ No newline at end of file
+    ]
+
+# 타임라인을 나눠서 읽는 generator 가 스레드마다 하나인 세션 레지스트리의 세션을 사용하지 않는지 테스트
+# (starlette 는 generator 를 읽을 때마다 다른 스레드에서 실행하고, 요청을 처리한 스레드의 세션을 정리합니다.)
+def test_iter_timeline_session():
+    registry = scoped_session(Session)
+    tweet_dao = TweetDao(registry, Tweets, UsersFollowList)
+    for index in range(5):
+        tweet_dao.insert_tweet(1, f'tweet {index}')
+
+    tweets = tweet_dao.iter_timeline(1, batch_size = 2)
+    timeline = [next(tweets)]
+
+    ## 다른 스레드에서 읽은 뒤 해당 스레드와 현재 스레드의 세션을 정리해도 끝까지 읽을 수 있다.
+    def read():
+        timeline.append(next(tweets))
+        registry.remove()
+
+    thread = threading.Thread(target = read)
+    thread.start()
+    thread.join()
+    registry.remove()
+    timeline.extend(tweets)
+
+    assert [tweet['tweet'] for tweet in timeline] == [f'tweet {index}' for index in range(5)]
+
+# follow graph cache 를 사용하는 DAO 들이 팔로우/언팔로우 후에 바뀐 팔로우 목록으로 타임라인을 가져오는지 테스트
+def test_timeline_with_follow_cache():
+    follow_cache = FollowGraphCache(max_bytes = 1024 * 1024, ttl = 60)
+    user_dao = UserDao(Session, Users, UsersFollowList, follow_cache = follow_cache)
+    tweet_dao = TweetDao(Session, Tweets, UsersFollowList, follow_cache = follow_cache)
+
+    assert tweet_dao.get_timeline(1) == [ ]
+    assert tweet_dao.get_follow_ids(1) == [ ]
+
+    ## 팔로우하면 캐시된 팔로우 목록이 지워지고, 팔로우한 유저 2의 트윗이 타임라인에 나온다.
+    user_dao.insert_follow(1, 2)
+
+    assert tweet_dao.get_follow_ids(1) == [2]
+    assert tweet_dao.get_timeline(1) == [
+        {
+            'user_id' : 2,
+            'tweet' : 'Hello World!'
+        }
+    ]
+
+    ## 한 번에 언팔로우해도 캐시된 팔로우 목록이 지워진다.
+    user_dao.insert_unfollows(1, [2])
+
+    assert tweet_dao.get_follow_ids(1) == [ ]
+    assert tweet_dao.get_timeline(1) == [ ]
@@ -0,0 +1,36 @@
+# 비밀번호 해시를 처리하는 프로세스 풀(PasswordHasher)을 확인하는 TEST unit 파일.
+# bcrypt 대신 오래 걸리는 작업으로 time.sleep 을 실행한다.
+
+# 유닛테스트에 필요한 pytest 라이브러리
+import pytest
+import time
+# 테스트할 PasswordHasher
+from service.password_hasher import PasswordHasher, PasswordHasherBusy
+
+@pytest.fixture
+def hasher():
+    hasher = PasswordHasher(rounds = 4, workers = 1, queue_size = 1, queue_timeout = 0.01, timeout = 5)
+    yield hasher
+    hasher.shutdown()
+
+def test_hash_and_check(hasher):
+    hashed_password = hasher.hash(b'password')
+    assert hasher.check(b'password', hashed_password)
+    assert not hasher.check(b'wrong password', hashed_password)
+
+def test_timeout_keeps_slot(hasher):
+    ## 프로세스 풀을 미리 시작해둔다.
+    hasher.run(time.sleep, 0)
+
+    ## 기다리다 timeout 이 지나도 작업이 끝날 때까지 자리를 반환하지 않는다.
+    hasher.timeout = 0.05
+    with pytest.raises(PasswordHasherBusy):
+        hasher.run(time.sleep, 1)
+
+    hasher.timeout = 5
+    with pytest.raises(PasswordHasherBusy):
+        hasher.run(time.sleep, 0)
+
+    ## 작업이 끝나면 자리를 반환한다.
+    hasher.queue_timeout = 5
+    assert hasher.run(time.sleep, 0) is None
@@ -0,0 +1,56 @@
+# 요청마다 실행한 SQL 을 검사하는 query inspector(N+1 쿼리, 쿼리 예산, 느린 쿼리의 EXPLAIN)를 확인하는 TEST unit 파일.
+# DB 대신 메모리에서 실행하는 sqlite 엔진을 사용한다.
+
+# 유닛테스트에 필요한 pytest 라이브러리
+import pytest
+# 테스트할 query inspector 와 DAO 가 사용하는 session_scope
+from model import QueryInspector, QueryBudgetExceeded, session_scope
+from model.query_inspector import statement_shape
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+
+# 유저를 한 명씩 조회하는(N+1) DAO
+class UserNameDao:
+    def __init__(self, Session):
+        self.Session = Session
+
+    def get_names(self, user_ids):
+        with session_scope(self.Session) as session:
+            return [session.execute('SELECT :id', {'id' : user_id}).scalar() for user_id in user_ids]
+
+@pytest.fixture
+def dao_and_inspector():
+    engine = create_engine('sqlite://')
+    inspector = QueryInspector(budgets = {'profile' : 2}, repeat_threshold = 3, slow_seconds = 0, strict = True)
+    inspector.instrument_engine(engine)
+
+    return UserNameDao(sessionmaker(bind = engine)), inspector
+
+def test_statement_shape():
+    assert statement_shape("SELECT * FROM users WHERE id IN (%s, %s, %s) AND name = 'it''s'\n LIMIT 10") == \
+        'SELECT * FROM users WHERE id IN (?) AND name = ? LIMIT ?'
+
+def test_query_budget(dao_and_inspector):
+    dao, inspector = dao_and_inspector
+
+    ## 예산 안에서 실행한 요청은 통과하고, 느린 쿼리(slow_seconds = 0)는 EXPLAIN 결과와 DAO 함수를 함께 기록한다.
+    log, token = inspector.begin_request()
+    dao.get_names([1, 2])
+    report = inspector.end_request(log, token, 'profile')
+
+    assert report.count == 2 and not report.failed
+    assert report.slow[0][2] == 'UserNameDao.get_names'
+    assert report.slow[0][3]
+
+    ## 같은 모양의 SQL 을 3번 실행하면 N+1 쿼리로 보고하고, strict 모드이면 예외가 발생한다.
+    log, token = inspector.begin_request()
+    dao.get_names([1, 2, 3])
+    with pytest.raises(QueryBudgetExceeded) as error:
+        inspector.end_request(log, token, 'profile')
+
+    assert error.value.report.over_budget
+    assert error.value.report.repeated == [('SELECT ?', 3, 'UserNameDao.get_names')]
+
+    ## 요청 밖에서 실행한 SQL 은 기록하지 않는다.
+    dao.get_names([1])
+    assert inspector.stats() == {'reports' : 2, 'failures' : 1}
@@ -0,0 +1,45 @@
+# 읽기 쿼리를 replica 로 보내는 ReplicaRouter 를 확인하는 TEST unit 파일.
+# DB 대신 세션공장 자리에 이름(문자열)을 넣어서, 어느 DB 로 읽기를 보내는지 확인한다.
+
+# 유닛테스트에 필요한 pytest 라이브러리
+import pytest
+# 테스트할 ReplicaRouter 와 쓰기 기록을 저장하는 캐시 backend 들
+from model.replica_router import ReplicaRouter
+from cache import LocalCache, RedisCache, FakeRedisServer
+
+@pytest.fixture
+def redis_server():
+    server = FakeRedisServer().start()
+    yield server
+    server.stop()
+
+def create_router(cache = None):
+    return ReplicaRouter('primary', [('replica', None)], sticky_seconds = 5, cache = cache)
+
+def test_read_your_writes():
+    router = create_router()
+    assert router.reader(1) == 'replica'
+
+    ## 쓰기를 한 유저의 읽기만 primary 로 보낸다.
+    router.mark_write(1)
+    assert router.reader(1) == 'primary'
+    assert router.reader(2) == 'replica'
+    assert router.reader() == 'replica'
+
+def test_read_your_writes_across_workers(redis_server):
+    ## 여러 worker 가 함께 사용하는 캐시이면 다른 worker 에서 한 쓰기도 primary 로 읽는다.
+    first = create_router(RedisCache(redis_server.url))
+    second = create_router(RedisCache(redis_server.url))
+
+    first.mark_write(1)
+    assert second.reader(1) == 'primary'
+    assert second.reader(2) == 'replica'
+
+def test_local_cache_is_not_shared():
+    ## 프로세스 메모리 캐시는 worker 마다 따로 기록한다.
+    first = create_router(LocalCache())
+    second = create_router(LocalCache())
+
+    first.mark_write(1)
+    assert first.reader(1) == 'primary'
+    assert second.reader(1) == 'replica'
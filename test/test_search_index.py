@@ -0,0 +1,81 @@
+# 트윗 검색에 사용하는 메모리 역색인(SearchIndex)의 단어 나누기, 최신순 검색, DB 동기화, 파일 저장을 확인하는 TEST unit 파일.
+# DB 를 사용하지 않는다.
+
+# 테스트할 검색 색인과 단어 나누기 함수
+from model import SearchIndex, tokenize
+from model.search_index import PostingList, BLOCK_SIZE
+
+def test_tokenize():
+    ## 영어는 소문자 단어로, 한글은 두 글자씩 나누고, 한 글자 단어는 그대로 사용한다.
+    assert tokenize('Hello, WORLD! 서울에서 밥') == ['hello', 'world', '서울', '울에', '에서', '밥']
+
+def test_posting_list():
+    ## 순서가 섞인 id 와 중복된 id 를 추가해도 오름차순으로 중복없이 저장한다.
+    postings = PostingList()
+    tweet_ids = list(range(1, BLOCK_SIZE * 5, 2))
+    for tweet_id in reversed(tweet_ids):
+        assert postings.add(tweet_id)
+    assert not postings.add(tweet_ids[10])
+
+    assert list(postings) == tweet_ids
+    assert len(postings) == len(tweet_ids)
+
+def test_search():
+    index = SearchIndex()
+    for tweet_id in range(1, 1001):
+        index.add(tweet_id, 'python flask' if tweet_id % 10 == 0 else 'python 파이썬')
+
+    ## 검색어의 단어가 모두 들어있는 트윗 id 를 최신순으로 limit 개 리턴한다.
+    assert index.search('Python Flask', 3) == [1000, 990, 980]
+    assert index.search('python flask', 2, before = 980) == [970, 960]
+    assert index.search('파이썬', 2) == [999, 998]
+    assert index.search('flask 파이썬') == []
+    assert index.search('django') == []
+    assert index.search('!!') == []
+
+def test_sync_and_save(tmp_path):
+    tweets = [(1, 'hello 서울'), (2, 'hello world'), (3, '서울 여행')]
+    index = SearchIndex(sync_interval = 60)
+
+    ## sync 는 synced_id 이후의 트윗들을 가져와서 색인하고, sync_interval 이 지나기 전에는 가져오지 않는다.
+    index.sync(lambda after_id: [tweet for tweet in tweets if tweet[0] > after_id])
+    tweets.append((4, 'hello again'))
+    index.sync(lambda after_id: [tweet for tweet in tweets if tweet[0] > after_id])
+
+    assert index.synced_id == 3
+    assert index.search('hello') == [2, 1]
+
+    index.sync(lambda after_id: [tweet for tweet in tweets if tweet[0] > after_id], force = True)
+    assert index.search('hello') == [4, 2, 1]
+
+    ## 파일로 저장한 색인을 읽으면 같은 결과를 리턴한다.
+    path = str(tmp_path / 'search_index.bin')
+    index.save(path)
+    loaded = SearchIndex.load(path)
+
+    assert loaded.synced_id == 4
+    assert loaded.search('서울') == [3, 1]
+    assert loaded.stats()['documents'] == index.stats()['documents']
+
+# id 를 먼저 받았지만 늦게 저장된 트윗도 다음 sync 에서 색인하고, 다시 읽은 트윗은 두 번 색인하지 않는지 테스트
+def test_sync_out_of_order():
+    tweets = [(1, 'hello'), (3, 'hello')]
+    load = lambda after_id: [tweet for tweet in sorted(tweets) if tweet[0] > after_id]
+    index = SearchIndex(sync_interval = 0, sync_overlap = 10)
+
+    index.sync(load)
+    assert index.search('hello') == [3, 1]
+
+    ## 2번 트윗이 3번 트윗보다 늦게 저장되었다.
+    tweets.append((2, 'hello world'))
+    index.sync(load)
+
+    assert index.synced_id == 3
+    assert index.search('hello') == [3, 2, 1]
+    assert index.stats()['documents'] == 3
+    assert index.stats()['postings'] == 4
+
+    ## 다시 읽는 범위보다 오래된 id 는 기억하지 않는다.
+    tweets.append((20, 'hello'))
+    index.sync(load)
+    assert index.synced_ids == {20}
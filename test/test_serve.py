@@ -0,0 +1,96 @@
+# 여러 worker 프로세스로 요청을 받는 서버(serve.py)를 확인하는 TEST unit 파일.
+# DB 대신 요청을 처리한 worker 의 pid 를 응답하는 WSGI(gunicorn), ASGI(PreforkServer + uvicorn) 앱을 사용한다.
+
+# 유닛테스트에 필요한 pytest 라이브러리
+import pytest
+import os
+import signal
+import time
+import urllib.request
+# 테스트할 prefork 서버
+from serve import PreforkServer, create_listener, wsgi_server, asgi_server
+
+# worker 에서 post_fork 가 호출되었는지 기록한다.
+started = {}
+
+def post_fork():
+    started['pid'] = os.getpid()
+
+# 요청을 처리한 worker 의 pid 와 post_fork 를 호출한 pid 를 응답하는 앱
+def pid_app(environ, start_response):
+    start_response('200 OK', [('Content-Type', 'text/plain')])
+    return [f"{os.getpid()} {started.get('pid')}".encode()]
+
+async def pid_asgi_app(scope, receive, send):
+    await send({'type' : 'http.response.start', 'status' : 200, 'headers' : [(b'content-type', b'text/plain')]})
+    await send({'type' : 'http.response.body', 'body' : f"{os.getpid()} {started.get('pid')}".encode()})
+
+def get_pids(port, timeout = 5):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            with urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout = 1) as response:
+                return [int(pid) for pid in response.read().split()]
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.05)
+
+# create_server(listener) 로 만든 서버를 fork 한 프로세스에서 실행한다. 서버의 run 은 종료 코드를 반환하거나 SystemExit 을 발생시킨다.
+def fork_server(create_server):
+    listener = create_listener('127.0.0.1', 0)
+    port = listener.getsockname()[1]
+
+    ## 부모 프로세스를 fork 해서 서버를 실행한다.
+    pid = os.fork()
+    if pid == 0:
+        code = 1
+        try:
+            code = create_server(listener).run()
+        except SystemExit as exit:
+            code = exit.code
+        finally:
+            os._exit(code)
+
+    listener.close()
+    return pid, port
+
+def kill_server(pid):
+    try:
+        os.kill(pid, signal.SIGKILL)
+        os.waitpid(pid, 0)
+    except (ProcessLookupError, ChildProcessError):
+        pass
+
+@pytest.fixture(params = ['wsgi', 'asgi'])
+def server(request):
+    if request.param == 'wsgi':
+        create_server = lambda listener: wsgi_server(pid_app, listener, workers = 2, threads = 2, post_fork = post_fork, shutdown_timeout = 5)
+    else:
+        create_server = lambda listener: PreforkServer(listener, asgi_server(pid_asgi_app), workers = 2, post_fork = post_fork, shutdown_timeout = 5)
+
+    pid, port = fork_server(create_server)
+    yield pid, port
+    kill_server(pid)
+
+def test_prefork_workers(server):
+    pid, port = server
+
+    ## worker 가 요청을 처리하고, 요청을 받기 전에 post_fork 를 호출한다.
+    worker, post_fork_pid = get_pids(port)
+    assert worker != pid
+    assert worker == post_fork_pid
+
+    ## 죽은 worker 대신 새 worker 를 fork 한다.
+    os.kill(worker, signal.SIGKILL)
+    time.sleep(0.3)
+    pids = {get_pids(port)[0] for _ in range(20)}
+    assert worker not in pids
+
+    ## 부모가 SIGTERM 을 받으면 worker 들을 종료하고 종료 코드 0 으로 끝난다.
+    os.kill(pid, signal.SIGTERM)
+    _, status = os.waitpid(pid, 0)
+    assert os.waitstatus_to_exitcode(status) == 0
+
+    with pytest.raises(OSError):
+        urllib.request.urlopen(f'http://127.0.0.1:{port}/', timeout = 1)
@@ -15,9 +15,11 @@ import jwt
 # 유닛테스트에 필요한 pytest 라이브러리
 import pytest
 # DBORM 들을 불러온다.
-from repository import Base, Users, Tweets, UsersFollowList
+from repository import Users, Tweets, UsersFollowList
+# 테이블과 인덱스를 만드는 migration
+from migrations import upgrade
 # DB에 데이터를 저장하는 로직들
-from model import UserDao, TweetDao
+from model import UserDao, TweetDao, TimelineStore
 # 데이터를 받아서 가공하는 비즈니스 로직들
 from service import UserService, TweetService
 # sqlalchemy의 엔진을 만드는 함수
@@ -34,8 +36,8 @@ engine = create_engine(config.test_config['DB_URL'], encoding = 'utf-8', max_ove
 # 위의 엔진을 통해 세션을 생성한다.
 Session = sessionmaker(bind=engine)
 
-# Base를 상속받은 db class들을 mariaDB 관계형 디비 테이블들과 매핑하여 웹서버에 적용시킵니다.
-Base.metadata.create_all(engine)
+# 적용되지 않은 migration 들을 적용해서 테이블들을 만듭니다. 이미 최신 버전이면 schema_version 만 확인합니다.
+upgrade(engine)
 
 # contextmanager 데코레이션을 사용해 try/finally이 재사용가능한 
 # session_scope함수를 만들고, with 문을 통해서 해당 함수를 불러온다.
@@ -141,6 +143,48 @@ def test_login(user_service):
         'password':'test1234'
     })
 
+def test_login_result(user_service):
+    ## 로그인에 성공하면 로그인 결과에 사용자의 아이디가 담겨있다.
+    login_result = user_service.login({
+        'email':'songew@gmail.com',
+        'password':'test password'
+    })
+    assert login_result.user_id == 1
+
+    ## 가입되지 않은 이메일은 로그인에 실패하고, 해당 이메일로 가입하면 바로 로그인할 수 있다.
+    credential = {
+        'email':'hong@test.com',
+        'password':'test1234'
+    }
+    assert not user_service.login(credential)
+
+    new_user_id = user_service.create_new_user({
+        'name':'홍길동', 
+        'email':'hong@test.com',
+        'profile':'서쪽에서 번쩍, 동쪽에서 번쩍', 
+        'password':'test1234'
+    })
+    assert user_service.login(credential).user_id == new_user_id
+
+def test_login_unknown_email_workers():
+    ## worker 가 여러 개이면, 한 worker 에서 로그인에 실패한 이메일로 다른 worker 에서 가입해도 바로 로그인할 수 있다.
+    worker_config = dict(config.test_config, SERVER_WORKERS = 2)
+    first = UserService(UserDao(Session, Users, UsersFollowList), worker_config)
+    second = UserService(UserDao(Session, Users, UsersFollowList), worker_config)
+    credential = {
+        'email':'hong@test.com',
+        'password':'test1234'
+    }
+    assert not first.login(credential)
+
+    new_user_id = second.create_new_user({
+        'name':'홍길동',
+        'email':'hong@test.com',
+        'profile':'서쪽에서 번쩍, 동쪽에서 번쩍',
+        'password':'test1234'
+    })
+    assert first.login(credential).user_id == new_user_id
+
 def test_generate_access_token(user_service):
     ## token 생성 후 decode해서 동일한 사용자 아이디가 나오는지 테스트
     token = user_service.generate_access_token(1)
@@ -178,6 +222,22 @@ def test_tweet(tweet_service):
         }
     ]
 
+# 여러 트윗을 한 번에 저장하고, 300자를 넘는 트윗은 저장하지 않는지 테스트
+def test_bulk_tweet(tweet_service):
+    results = tweet_service.bulk_tweet(1, ["tweet test", "a" * 301, "tweet test 2"])
+
+    assert [result['status'] for result in results] == ['created', 'too_long', 'created']
+    assert tweet_service.get_timeline(1) == [
+        {
+            'user_id' : 1,
+            'tweet' : 'tweet test'
+        },
+        {
+            'user_id' : 1,
+            'tweet' : 'tweet test 2'
+        }
+    ]
+
 # 유저 1과 2가 트윗을 입력 후, 1이 2를 팔로우한 뒤,
 # 미리 입력했던 유저 2의 트윗과 새로입력한 1과 2의 트윗을 잘 불러오는지 테스트.
 def test_timeline(user_service, tweet_service):
@@ -200,4 +260,48 @@ def test_timeline(user_service, tweet_service):
             'user_id' : 2,
             'tweet' : 'tweet test 2'
         }
-    ]
\ No newline at end of file
+    ]
+
+# 타임라인 캐시(fan-out-on-write)를 사용할 때도 팔로우한 유저의 트윗을 잘 불러오는지 테스트.
+# fanout_limit 을 0 으로 두면 모든 유저가 셀럽이 되어 fan-out-on-read 로 트윗을 합치는지도 확인한다.
+@pytest.mark.parametrize('fanout_limit', [10000, 0])
+def test_timeline_store(fanout_limit):
+    timeline_store = TimelineStore(fanout_limit = fanout_limit)
+    user_service = UserService(UserDao(Session, Users, UsersFollowList), config.test_config, timeline_store)
+    tweet_service = TweetService(TweetDao(Session, Tweets, UsersFollowList), timeline_store)
+
+    user_service.follow(1, 2)
+    assert tweet_service.get_timeline(1) == [
+        {
+            'user_id' : 2,
+            'tweet' : 'Hello World!'
+        }
+    ]
+
+    ## 타임라인이 저장된 뒤에 작성한 트윗도 타임라인에 들어가는지 확인
+    tweet_service.tweet(2, "tweet test 2")
+    tweet_service.tweet(1, "tweet test")
+
+    assert tweet_service.get_timeline(1) == [
+        {
+            'user_id' : 2,
+            'tweet' : 'Hello World!'
+        },
+        {
+            'user_id' : 2,
+            'tweet' : 'tweet test 2'
+        },
+        {
+            'user_id' : 1,
+            'tweet' : 'tweet test'
+        }
+    ]
+
+    ## 언팔로우하면 저장된 타임라인이 지워져 유저 2의 트윗이 더 이상 리턴되지 않는다.
+    user_service.unfollow(1, 2)
+    assert tweet_service.get_timeline(1) == [
+        {
+            'user_id' : 1,
+            'tweet' : 'tweet test'
+        }
+    ]
@@ -0,0 +1,54 @@
+# TweetDao 의 타임라인 쿼리 방식(query_mode) 'union' 과 'join' 이 같은 타임라인을 반환하는지 확인하는 TEST unit 파일.
+# MySQL 대신 임시 SQLite 파일 DB 를 사용한다.
+
+# 유닛테스트에 필요한 pytest 라이브러리
+import pytest
+# sqlalchemy의 엔진과 세션공장
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+# DBORM 들과 테이블을 만드는 migration
+from repository import Users, Tweets, UsersFollowList
+from migrations import upgrade
+# 테스트할 DAO 들
+from model import UserDao, TweetDao
+
+@pytest.fixture
+def Session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    upgrade(engine)
+
+    return sessionmaker(bind = engine)
+
+# 팔로우와 트윗을 저장한 뒤, 두 쿼리 방식이 같은 트윗들을 같은 순서(트윗 id 순)로 반환하는지 테스트
+def test_query_modes_same_timeline(Session):
+    user_dao = UserDao(Session, Users, UsersFollowList)
+    for user_id in [1, 2, 3, 4]:
+        user_dao.insert_user({
+            'name' : f'user{user_id}',
+            'email' : f'user{user_id}@gmail.com',
+            'profile' : 'test profile',
+            'password' : 'password'
+        })
+
+    # 1번 유저는 2, 3번 유저를 팔로우하고, 4번 유저는 팔로우하지 않습니다.
+    user_dao.insert_follow(1, 2)
+    user_dao.insert_follow(1, 3)
+    user_dao.insert_follow(2, 1)
+
+    union_dao = TweetDao(Session, Tweets, UsersFollowList, query_mode = 'union')
+    join_dao = TweetDao(Session, Tweets, UsersFollowList, query_mode = 'join')
+    for user_id, tweet in [(3, 'c1'), (1, 'a1'), (4, 'd1'), (2, 'b1'), (1, 'a2'), (3, 'c2')]:
+        union_dao.insert_tweet(user_id, tweet)
+
+    expected = [
+        {'user_id' : 3, 'tweet' : 'c1'},
+        {'user_id' : 1, 'tweet' : 'a1'},
+        {'user_id' : 2, 'tweet' : 'b1'},
+        {'user_id' : 1, 'tweet' : 'a2'},
+        {'user_id' : 3, 'tweet' : 'c2'}
+    ]
+    assert union_dao.get_timeline(1) == expected
+    assert join_dao.get_timeline(1) == expected
+
+    # 팔로우가 없는 유저도 두 방식 모두 자신의 트윗만 반환합니다.
+    assert union_dao.get_timeline(4) == join_dao.get_timeline(4) == [{'user_id' : 4, 'tweet' : 'd1'}]
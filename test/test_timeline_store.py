@@ -0,0 +1,173 @@
+# 프로세스 메모리에 타임라인을 저장하는 TimelineStore 와
+# 여러 worker 가 함께 사용하는 캐시에 타임라인을 저장하는 SharedTimelineStore 를 확인하는 TEST unit 파일.
+# redis 대신 FakeRedisServer 를, MySQL 대신 임시 SQLite 파일 DB 를 사용한다.
+# worker 마다 캐시 연결과 service layer 를 따로 만들어서, 한 worker 에서 쓰고 다른 worker 에서 읽는다.
+
+# 유닛테스트에 필요한 pytest 라이브러리
+import pytest
+import threading
+import time
+# sqlalchemy의 엔진과 스레드마다 하나의 세션을 사용하는 세션 레지스트리
+from sqlalchemy import create_engine
+from sqlalchemy.orm import scoped_session, sessionmaker
+# DBORM 들과 테이블을 만드는 migration
+from repository import Users, Tweets, UsersFollowList
+from migrations import upgrade
+# 테스트할 timeline store 와 worker 의 service layer
+from cache import RedisCache, FakeRedisServer
+from model import UserDao, TweetDao, TimelineStore, SharedTimelineStore
+from service import UserService, TweetService
+
+@pytest.fixture
+def redis_server():
+    server = FakeRedisServer().start()
+    yield server
+    server.stop()
+
+# 유저 1, 2 와 유저 2의 트윗 하나가 저장된 DB
+@pytest.fixture
+def Session(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    upgrade(engine)
+
+    Session = scoped_session(sessionmaker(bind = engine))
+    session = Session()
+    session.add_all([
+        Users('송은우', 'songew@gmail.com', 'hashed password', 'test profile'),
+        Users('김철수', 'tet@gmail.com', 'hashed password', 'test profile')
+    ])
+    session.add(Tweets(2, 'Hello World!'))
+    session.commit()
+    Session.remove()
+
+    return Session
+
+# worker 하나의 user service 와 tweet service
+def create_worker(redis_server, Session, fanout_limit):
+    cache = RedisCache(redis_server.url)
+    timeline_store = SharedTimelineStore(cache, fanout_limit = fanout_limit)
+
+    return (
+        UserService(UserDao(Session, Users, UsersFollowList), {}, timeline_store, cache = cache),
+        TweetService(TweetDao(Session, Tweets, UsersFollowList), timeline_store, cache = cache)
+    )
+
+def get_tweets(tweet_service, user_id):
+    return [tweet['tweet'] for tweet in tweet_service.get_timeline(user_id)]
+
+# 한 worker 에서 작성한 트윗과 팔로우/언팔로우가 다른 worker 의 타임라인에 바로 보이는지 테스트
+# fanout_limit 을 0 으로 두면 모든 유저가 셀럽이 되어 fan-out-on-read 로 트윗을 합치는지도 확인한다.
+@pytest.mark.parametrize('fanout_limit', [10000, 0])
+def test_timeline_across_workers(redis_server, Session, fanout_limit):
+    first_users, first_tweets = create_worker(redis_server, Session, fanout_limit)
+    second_users, second_tweets = create_worker(redis_server, Session, fanout_limit)
+
+    first_users.follow(1, 2)
+    assert get_tweets(second_tweets, 1) == ['Hello World!']
+
+    ## 다른 worker 가 타임라인을 저장한 뒤에 작성한 트윗도 보인다.
+    first_tweets.tweet(2, 'tweet test 2')
+    assert get_tweets(second_tweets, 1) == ['Hello World!', 'tweet test 2']
+
+    second_tweets.tweet(1, 'tweet test')
+    assert get_tweets(first_tweets, 1) == ['Hello World!', 'tweet test 2', 'tweet test']
+    assert get_tweets(second_tweets, 1) == ['Hello World!', 'tweet test 2', 'tweet test']
+
+    ## 여러 트윗을 한 번에 저장해도 다른 worker 의 타임라인이 다시 만들어진다.
+    first_tweets.bulk_tweet(2, ['bulk 1', 'bulk 2'])
+    assert get_tweets(second_tweets, 1)[-2:] == ['bulk 1', 'bulk 2']
+
+    ## 언팔로우하면 다른 worker 에서도 유저 2의 트윗이 더 이상 보이지 않는다.
+    second_users.unfollow(1, 2)
+    assert get_tweets(first_tweets, 1) == ['tweet test']
+
+# 여러 worker 가 같은 유저의 저장되지 않은 타임라인을 동시에 읽어도, DB 에서는 한 worker 만 만드는지 테스트
+def test_load_across_workers(redis_server):
+    timeline_stores = [SharedTimelineStore(RedisCache(redis_server.url)) for _ in range(2)]
+    builds = []
+
+    def build():
+        builds.append(1)
+        time.sleep(0.1)
+        return [{'id' : 1, 'user_id' : 1, 'tweet' : 'tweet'}]
+
+    results = []
+    threads = [
+        threading.Thread(target = lambda timeline_store = timeline_store: results.append(timeline_store.load(1, build)))
+        for timeline_store in timeline_stores for _ in range(2)
+    ]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(builds) == 1
+    assert results == [[{'id' : 1, 'user_id' : 1, 'tweet' : 'tweet'}]] * 4
+    assert timeline_stores[1].get(1) == [{'id' : 1, 'user_id' : 1, 'tweet' : 'tweet'}]
+
+# 다른 worker 에서 작성한 트윗을 저장된 타임라인에 트윗 id 순서로 넣고, DB 에서 다시 만들지 않는지 테스트
+def test_push_across_workers(redis_server):
+    first, second = [SharedTimelineStore(RedisCache(redis_server.url), ttl = 0.5) for _ in range(2)]
+    first.load(1, lambda: [{'id' : 1, 'user_id' : 2, 'tweet' : 'tweet 1'}, {'id' : 3, 'user_id' : 2, 'tweet' : 'tweet 3'}])
+
+    second.push([1, 2], {'id' : 4, 'user_id' : 1, 'tweet' : 'tweet 4'})
+    ## 먼저 저장되었지만 늦게 push 된 트윗도 id 순서에 맞게 들어가고, 이미 있는 트윗은 다시 넣지 않는다.
+    second.push([1], {'id' : 2, 'user_id' : 2, 'tweet' : 'tweet 2'})
+    second.push([1], {'id' : 3, 'user_id' : 2, 'tweet' : 'tweet 3'})
+
+    assert [tweet['id'] for tweet in first.get(1)] == [1, 2, 3, 4]
+    ## 저장된 타임라인이 없는 유저는 다음에 읽을 때 DB 에서 만든다.
+    assert first.get(2) is None
+
+    ## 트윗을 넣어도 처음 만든 시간부터 ttl 이 지나면 만료된다.
+    time.sleep(0.3)
+    second.push([1], {'id' : 5, 'user_id' : 1, 'tweet' : 'tweet 5'})
+    time.sleep(0.3)
+    assert first.get(1) is None
+
+# 타임라인을 DB 에서 만드는 동안 다른 worker 가 트윗을 작성하면, 만든 타임라인이 저장될 때까지 기다렸다가 트윗을 넣는지 테스트
+# lock_wait 동안 lock 을 잡지 못하면 버전만 바꿔서, 트윗이 빠졌을 수 있는 만든 타임라인을 사용하지 않는지도 확인한다.
+@pytest.mark.parametrize('lock_wait, expected', [
+    (5, [{'id' : 1, 'user_id' : 1, 'tweet' : 'old tweet'}, {'id' : 2, 'user_id' : 1, 'tweet' : 'new tweet'}]),
+    (0.05, None)
+])
+def test_load_during_write(redis_server, lock_wait, expected):
+    timeline_store = SharedTimelineStore(RedisCache(redis_server.url))
+    writer = SharedTimelineStore(RedisCache(redis_server.url, lock_wait = lock_wait))
+    building = threading.Event()
+
+    def build():
+        building.set()
+        time.sleep(0.3)
+        return [{'id' : 1, 'user_id' : 1, 'tweet' : 'old tweet'}]
+
+    def push():
+        building.wait()
+        writer.push([1], {'id' : 2, 'user_id' : 1, 'tweet' : 'new tweet'})
+
+    thread = threading.Thread(target = push)
+    thread.start()
+    assert timeline_store.load(1, build) == [{'id' : 1, 'user_id' : 1, 'tweet' : 'old tweet'}]
+    thread.join()
+
+    assert timeline_store.get(1) == expected
+
+# 프로세스 메모리의 타임라인을 DB 에서 만드는 동안 트윗이 작성되거나 팔로우 목록이 바뀌면, 만든 타임라인을 저장하지 않는지 테스트
+@pytest.mark.parametrize('change', [
+    lambda timeline_store: timeline_store.push([1], {'id' : 2, 'user_id' : 1, 'tweet' : 'new tweet'}),
+    lambda timeline_store: timeline_store.invalidate(1)
+])
+def test_local_load_during_write(change):
+    timeline_store = TimelineStore()
+
+    def build():
+        change(timeline_store)
+        return [{'id' : 1, 'user_id' : 1, 'tweet' : 'old tweet'}]
+
+    assert timeline_store.load(1, build) == [{'id' : 1, 'user_id' : 1, 'tweet' : 'old tweet'}]
+    assert timeline_store.get(1) is None
+
+    ## 다른 유저의 변경은 영향을 주지 않는다.
+    timeline_store.load(1, lambda: timeline_store.invalidate(2) or [{'id' : 2, 'user_id' : 1, 'tweet' : 'new tweet'}])
+    assert timeline_store.get(1) == [{'id' : 2, 'user_id' : 1, 'tweet' : 'new tweet'}]
+    assert timeline_store.loading == {}
@@ -0,0 +1,57 @@
+# 트윗의 해시태그와 멘션 찾기, 최근 window 동안 많이 쓰인 해시태그와 멘션을 세는 trending 을 확인하는 TEST unit 파일.
+# DB 를 사용하지 않는다.
+
+# 테스트할 해시태그/멘션 찾기 함수와 trending
+from model import extract_entities, TrendingTopics
+
+def test_extract_entities():
+    ## 해시태그와 멘션을 소문자로 중복없이 찾고, 숫자만 있는 태그와 이메일 주소는 제외한다.
+    assert extract_entities('#Python #파이썬 공부 #python #1 @Kim mail@example.com @kim_2') == \
+        (['python', '파이썬'], ['kim', 'kim_2'])
+    assert extract_entities('no tags') == ([], [])
+
+def test_trending_window():
+    now = [10000.0]
+    trending = TrendingTopics(window = 60, buckets = 6, width = 256, depth = 4, candidates = 10, sync_interval = 0, clock = lambda: now[0])
+    rows = []
+    load = lambda after_id, since: [row for row in rows if row[0] > after_id and row[1] >= since]
+
+    ## 많이 쓰인 해시태그와 멘션부터 limit 개를 가져온다.
+    rows += [(1, now[0], 'python', None), (1, now[0], None, 'kim'), (2, now[0], 'python', None), (3, now[0], 'flask', None)]
+    trending.sync(load)
+
+    assert trending.top(1) == {'hashtags' : [{'tag' : 'python', 'count' : 2}], 'mentions' : [{'name' : 'kim', 'count' : 1}]}
+    assert trending.synced_id == 3
+
+    ## 이미 센 트윗은 다시 세지 않고, window 가 지난 횟수는 빠진다.
+    now[0] += 30
+    rows += [(4, now[0], 'flask', None), (5, now[0], 'flask', None)]
+    trending.sync(load)
+    assert trending.top(2)['hashtags'] == [{'tag' : 'flask', 'count' : 3}, {'tag' : 'python', 'count' : 2}]
+
+    now[0] += 40
+    trending.sync(load)
+    assert trending.top(10)['hashtags'] == [{'tag' : 'flask', 'count' : 2}]
+    assert trending.top(10)['mentions'] == []
+
+def test_sync_out_of_order():
+    now = [10000.0]
+    trending = TrendingTopics(window = 60, buckets = 6, width = 256, depth = 4, candidates = 10, sync_interval = 0, sync_overlap = 10, clock = lambda: now[0])
+    rows = []
+    load = lambda after_id, since: sorted((row for row in rows if row[0] > after_id and row[1] >= since), key = lambda row: row[0])
+
+    ## id 2 보다 id 3 이 먼저 저장되어도, 다음 sync 에서 id 2 를 센다.
+    rows += [(1, now[0], 'python', None), (3, now[0], 'python', None)]
+    trending.sync(load)
+    assert trending.synced_id == 3
+
+    rows += [(2, now[0], 'python', None), (2, now[0], None, 'kim')]
+    trending.sync(load)
+    assert trending.top(1) == {'hashtags' : [{'tag' : 'python', 'count' : 3}], 'mentions' : [{'name' : 'kim', 'count' : 1}]}
+
+    ## 다시 읽은 트윗은 두 번 세지 않고, 다시 읽는 범위를 벗어난 id 는 지운다.
+    rows += [(20, now[0], 'flask', None)]
+    trending.sync(load)
+    trending.sync(load)
+    assert trending.top(2)['hashtags'] == [{'tag' : 'python', 'count' : 3}, {'tag' : 'flask', 'count' : 1}]
+    assert trending.counted_ids == {20}
@@ -0,0 +1,57 @@
+# 트윗과 함께 저장한 해시태그와 멘션을 trending 에서 읽는 TweetDao 함수들을 확인하는 TEST unit 파일.
+# MySQL 대신 임시 SQLite 파일 DB 를 사용한다.
+
+# 유닛테스트에 필요한 pytest 라이브러리
+import pytest
+import time
+# sqlalchemy의 엔진과 세션공장
+from sqlalchemy import create_engine
+from sqlalchemy.orm import sessionmaker
+# DBORM 들과 테이블을 만드는 migration
+from repository import Tweets, UsersFollowList, TweetHashtags, TweetMentions
+from migrations import upgrade
+# 테스트할 TweetDao
+from model import TweetDao
+
+@pytest.fixture
+def tweet_dao(tmp_path):
+    engine = create_engine(f"sqlite:///{tmp_path / 'test.db'}")
+    upgrade(engine)
+
+    return TweetDao(sessionmaker(bind = engine), Tweets, UsersFollowList, tweet_hashtagsORM = TweetHashtags, tweet_mentionsORM = TweetMentions)
+
+# 여러 트윗을 한 번에 저장해도 같은 내용의 트윗들이 각자의 id 로 해시태그와 멘션을 저장하는지 테스트
+def test_insert_tweets_entities(tweet_dao):
+    tweet_dao.insert_tweets([
+        {'user_id' : 1, 'tweet' : '#flask', 'hashtags' : ['flask'], 'mentions' : []},
+        {'user_id' : 1, 'tweet' : 'no tags'},
+        {'user_id' : 1, 'tweet' : 'x' * 301, 'hashtags' : ['long']},
+        {'user_id' : 1, 'tweet' : '#flask', 'hashtags' : ['flask'], 'mentions' : []},
+        {'user_id' : 2, 'tweet' : '@lee', 'hashtags' : [], 'mentions' : ['lee']}
+    ], chunk_size = 2)
+
+    assert [row[0] for row in tweet_dao.iter_tweets()] == [1, 2, 3, 4]
+    assert [(row[0], row[2], row[3]) for row in tweet_dao.iter_tweet_entities()] == [
+        (1, 'flask', None),
+        (3, 'flask', None),
+        (4, None, 'lee')
+    ]
+
+# 작성시간을 서버의 time zone 과 관계없이 time.time() 과 같은 기준의 초로 반환하는지 테스트
+@pytest.mark.parametrize('timezone', ['UTC', 'Asia/Seoul', 'America/New_York'])
+def test_tweet_entities_time(tweet_dao, monkeypatch, timezone):
+    monkeypatch.setenv('TZ', timezone)
+    time.tzset()
+    try:
+        tweet_dao.insert_tweet(1, '#python', ['python'], [])
+        now = time.time()
+
+        rows = list(tweet_dao.iter_tweet_entities(since = now - 60))
+        assert [row[2] for row in rows] == ['python']
+        assert abs(rows[0][1] - now) < 5
+
+        ## window 이전에 작성된 트윗은 읽지 않는다.
+        assert list(tweet_dao.iter_tweet_entities(since = now + 60)) == []
+    finally:
+        monkeypatch.undo()
+        time.tzset()
@@ -13,11 +13,19 @@ import bcrypt
 # 유닛테스트에 필요한 pytest 라이브러리
 import pytest
 # 메인인 app에서 생성했던 create_app을 가져와서 해당 라우터들을 사용한다.
-from app import create_app
+from app import create_app, create_services
+# 같은 라우터들을 비동기(ASGI) 서버로 만드는 create_asgi_app 과 ASGI 앱에 가상의 HTTP 요청을 보내는 TestClient
+from asgi import create_asgi_app
+from starlette.testclient import TestClient
 # 유닛테스트에서 사용할 데이터들을 json으로 매핑시켜주는 json 모듈
 import json
+# 액세스토큰 캐시를 테스트하기 위해 만료시간을 정해서 토큰을 직접 만드는 jwt 와 time
+import jwt
+import time
 # model 파일에서 데이터베이스를 매핑한 클래스들을 불러온다.
-from repository import Base, Users, Tweets, UsersFollowList
+from repository import Users, Tweets, UsersFollowList, FollowSuggestions
+# 테이블과 인덱스를 만드는 migration
+from migrations import upgrade
 # sqlalchemy의 엔진을 만드는 함수
 from sqlalchemy import create_engine
 # sqlalchemy를 통해 디비와 연결이 끊기지 않고, 트랜젝션을 관리하는 세션을 만드는 sessionmaker(세션공장).
@@ -33,8 +41,8 @@ engine = create_engine(config.test_config['DB_URL'], encoding = 'utf-8', max_ove
 # 위의 엔진을 통해 세션을 생성한다.
 Session = sessionmaker(bind=engine)
 
-# Base를 상속받은 db class들을 mariaDB 관계형 디비 테이블들과 매핑하여 웹서버에 적용시킵니다.
-Base.metadata.create_all(engine)
+# 적용되지 않은 migration 들을 적용해서 테이블들을 만듭니다. 이미 최신 버전이면 schema_version 만 확인합니다.
+upgrade(engine)
 
 # contextmanager 데코레이션을 사용해 try/finally이 재사용가능한 
 # session_scope함수를 만들고, with 문을 통해서 해당 함수를 불러온다.
@@ -55,9 +63,17 @@ def session_scope():
 # 유닛 테스트에서는 실제 서비스가 동작되지 않아서, test 함수들에 인자를 넘겨줄 수 없지만,
 # pytest.fixture를 사용하면, pytest가 자동으로 지정된 인자와 동일한 이름에 
 # pytest.fixture decorator가 적용된 함수를 찾아서 리턴 값을 test 함수에 적용시켜준다.
-@pytest.fixture
-def api():
-    app = create_app(config.test_config)
+# flask 앱(wsgi)과 ASGI 앱(asgi) 두 가지로 같은 테스트들을 실행한다.
+@pytest.fixture(params = ['wsgi', 'asgi'])
+def api(request):
+    return create_client(request.param, config.test_config)
+
+# server 가 'wsgi' 이면 flask 앱의 test_client, 'asgi' 이면 ASGI 앱의 TestClient 를 만든다.
+def create_client(server, test_config):
+    if server == 'asgi':
+        return ASGITestClient(create_asgi_app(test_config))
+
+    app = create_app(test_config)
     app.config['TEST'] = True
 
     # 가상의 HTTP 요청을 만든다. 
@@ -66,6 +82,27 @@ def api():
 
     return api
 
+# ASGI 앱의 TestClient 를 flask 의 test_client 처럼 사용할 수 있게 감싸주는 클래스.
+# 응답의 data 와 status_code, 요청의 content_type 인자를 flask 와 같게 맞춰준다.
+class ASGITestClient:
+    def __init__(self, app):
+        self.client = TestClient(app)
+
+    def get(self, path, headers = None):
+        return ASGITestResponse(self.client.get(path, headers = headers))
+
+    def post(self, path, data = None, content_type = None, headers = None):
+        headers = dict(headers or {})
+        if content_type is not None:
+            headers['Content-Type'] = content_type
+
+        return ASGITestResponse(self.client.post(path, data = data, headers = headers))
+
+class ASGITestResponse:
+    def __init__(self, response):
+        self.data = response.content
+        self.status_code = response.status_code
+
 # 테스트 함수가 실행되기 전 먼저 시작되는 함수
 # 각 test 함수들이 실행 되기 전에 필요한 데이터들을 생성 (회원가입)
 def setup_function():
@@ -90,6 +127,10 @@ def teardown_function():
         session.execute('''TRUNCATE TABLE users''')
         session.execute('''TRUNCATE TABLE tweets''')
         session.execute('''TRUNCATE TABLE users_follow_list''')
+        session.execute('''TRUNCATE TABLE user_follow_counts''')
+        session.execute('''TRUNCATE TABLE tweet_hashtags''')
+        session.execute('''TRUNCATE TABLE tweet_mentions''')
+        session.execute('''TRUNCATE TABLE follow_suggestions''')
         session.execute('''SET FOREIGN_KEY_CHECKS=1''')
 
 # 핑퐁 엔드포인트로 테스트.
@@ -97,6 +138,29 @@ def test_ping(api):
     resp = api.get('/ping')
     assert b'pong' in resp.data
 
+# DB 커넥션 풀의 상태와 checkout 기록을 반환하는지 테스트
+def test_pool_stats(api):
+    ## 로그인으로 DB 커넥션을 한 번 이상 빌리고 반납한다.
+    resp = api.post(
+        '/login',
+        data = json.dumps({'email' : 'songew@gmail.com', 'password' : 'test password'}),
+        content_type = 'application/json'
+    )
+    assert resp.status_code == 200
+
+    resp = api.get('/stats/pool')
+    assert resp.status_code == 200
+    status = json.loads(resp.data.decode('utf-8'))
+
+    assert status['checkouts'] >= 1
+    assert status['checkins'] == status['checkouts']
+    assert status['timeouts'] == 0
+    assert status['checked_out'] == 0
+    assert status['pool_size'] == 10
+    assert status['overflow'] <= 0
+    assert 0 <= status['wait_seconds_avg'] <= status['wait_seconds_max']
+    assert 'replicas' not in status
+
 # 가상의 유저가 로그인되는지 확인.
 def test_login(api):
     
@@ -132,6 +196,58 @@ def test_unauthorized(api):
     )
     assert resp.status_code == 401
 
+# 만료시간(exp)과 secret 키를 정해서 액세스토큰을 만드는 함수
+def encode_token(user_id, exp, secret_key = config.test_config['JWT_SECRET_KEY']):
+    return jwt.encode({'user_id' : user_id, 'exp' : exp}, secret_key, 'HS256').decode('UTF-8')
+
+# 액세스토큰 캐시의 적중 횟수를 가져오는 함수
+def get_auth_stats(api):
+    return json.loads(api.get('/stats/auth').data.decode('UTF-8'))
+
+# 같은 액세스토큰으로 다시 요청하면 복호화하지 않고 토큰 캐시에서 가져오는지 /stats/auth 로 테스트
+def test_token_cache_hit(api):
+    access_token = encode_token(1, int(time.time()) + 60)
+
+    for _ in range(3):
+        resp = api.get('/timeline', headers = {'Authorization' : access_token})
+        assert resp.status_code == 200
+
+    stats = get_auth_stats(api)
+    assert stats['size'] == 1
+    assert stats['misses'] == 1
+    assert stats['hits'] == 2
+
+# 캐시에 저장한 액세스토큰도 만료시간이 지나면 401 응답을 리턴하는지 테스트
+def test_token_cache_expired(api):
+    exp = int(time.time()) + 1
+    access_token = encode_token(1, exp)
+
+    resp = api.get('/timeline', headers = {'Authorization' : access_token})
+    assert resp.status_code == 200
+    assert get_auth_stats(api)['size'] == 1
+
+    ## 토큰의 만료시간이 지날 때까지 기다린다. (jwt 는 만료시간을 초 단위로 비교한다.)
+    time.sleep(max(0, exp + 1 - time.time()) + 0.1)
+
+    resp = api.get('/timeline', headers = {'Authorization' : access_token})
+    assert resp.status_code == 401
+    stats = get_auth_stats(api)
+    assert stats['size'] == 0
+    assert stats['hits'] == 0
+
+# 서명이 올바르지 않은 액세스토큰은 401 응답을 리턴하고, 토큰 캐시에 저장하지 않는지 테스트
+def test_token_cache_bad_signature(api):
+    access_token = encode_token(1, int(time.time()) + 60, secret_key = 'WrongSecretKey')
+
+    for _ in range(2):
+        resp = api.get('/timeline', headers = {'Authorization' : access_token})
+        assert resp.status_code == 401
+
+    stats = get_auth_stats(api)
+    assert stats['size'] == 0
+    assert stats['hits'] == 0
+    assert stats['misses'] == 2
+
 # 로그인 후 트윗을 작성할 수 있는지 테스트
 def test_tweet(api):
     
@@ -270,4 +386,320 @@ def test_unfollow(api):
     assert tweets == {
         'user_id' : 1,
         'timeline' : [ ]
-    }
\ No newline at end of file
+    }
+
+# follow graph cache 는 프로세스 메모리에 저장하므로, worker 가 하나일 때만 두 DAO 가 함께 사용하는지 테스트
+@pytest.mark.parametrize('workers', [1, 2])
+def test_follow_cache_workers(workers):
+    services = create_services(dict(config.test_config, FOLLOW_CACHE_BYTES = 1024 * 1024, SERVER_WORKERS = workers))
+    follow_cache = services.user_service.user_dao.follow_cache
+
+    assert (follow_cache is not None) == (workers == 1)
+    assert services.tweet_service.tweet_dao.follow_cache is follow_cache
+
+# follow graph cache(FOLLOW_CACHE_BYTES)를 켜고, 팔로우/언팔로우 후에 바뀐 팔로우 목록으로 타임라인을 가져오는지 테스트
+@pytest.mark.parametrize('server', ['wsgi', 'asgi'])
+def test_timeline_with_follow_cache(server):
+    api = create_client(server, dict(config.test_config, FOLLOW_CACHE_BYTES = 1024 * 1024))
+
+    # 로그인
+    resp = api.post(
+        '/login',
+        data = json.dumps({'email' : 'songew@gmail.com',
+        'password' : 'test password'}),
+        content_type = 'application/json'
+    )
+    access_token = json.loads(resp.data.decode('UTF-8'))['access_token']
+
+    ## 팔로우 목록이 캐시된 뒤에 팔로우해도 사용자 2의 tweet이 리턴되는 것을 확인
+    resp = api.get('/timeline', headers = {'Authorization' : access_token})
+    assert json.loads(resp.data.decode('UTF-8'))['timeline'] == [ ]
+
+    resp = api.post(
+        '/follow',
+        data = json.dumps({'follow':2}),
+        content_type = 'application/json',
+        headers = {'Authorization' : access_token}
+    )
+    assert resp.status_code == 200
+
+    resp = api.get('/timeline', headers = {'Authorization' : access_token})
+    assert json.loads(resp.data.decode('UTF-8'))['timeline'] == [
+        {
+            'user_id' : 2,
+            'tweet' : "Hello World!"
+        }
+    ]
+
+    ## 언팔로우하면 사용자 2의 tweet이 더 이상 리턴되지 않는 것을 확인
+    resp = api.post(
+        '/unfollow',
+        data = json.dumps({'unfollow':2}),
+        content_type = 'application/json',
+        headers = {'Authorization' : access_token}
+    )
+    assert resp.status_code == 200
+
+    resp = api.get('/timeline', headers = {'Authorization' : access_token})
+    assert json.loads(resp.data.decode('UTF-8'))['timeline'] == [ ]
+
+# 로그인 후 다른 유저를 팔로우하고, 프로필의 팔로워/팔로잉 수와 목록을 한 페이지씩 가져오는지 테스트
+def test_follow_list(api):
+    ##로그인
+    resp = api.post(
+        '/login',
+        data = json.dumps({'email' : 'songew@gmail.com',
+        'password' : 'test password'}),
+        content_type = 'application/json'
+    )
+    resp_json = json.loads(resp.data.decode('UTF-8'))
+    access_token = resp_json['access_token']
+
+    ## 사용자 1이 자신과 사용자 2를 팔로우
+    resp = api.post(
+        '/follow/batch',
+        data = json.dumps({'follow' : [1, 2]}),
+        content_type = 'application/json',
+        headers = {'Authorization' : access_token}
+    )
+    assert resp.status_code == 200
+
+    resp = api.get('/users/2', headers = {'Authorization' : access_token})
+    assert resp.status_code == 200
+    assert json.loads(resp.data.decode('UTF-8')) == {
+        'id' : 2,
+        'name' : '김철수',
+        'profile' : 'test profile',
+        'followers' : 1,
+        'following' : 0
+    }
+
+    ## 팔로잉 목록의 첫 페이지는 유저 1과 다음 페이지 cursor를 리턴한다.
+    resp = api.get('/users/1/following?limit=1', headers = {'Authorization' : access_token})
+    page = json.loads(resp.data.decode('UTF-8'))
+
+    assert resp.status_code == 200
+    assert page == {'user_id' : 1, 'following' : [{'id' : 1, 'name' : '송은우'}], 'next_cursor' : 1}
+
+    resp = api.get(f"/users/1/following?limit=1&after={page['next_cursor']}", headers = {'Authorization' : access_token})
+    page = json.loads(resp.data.decode('UTF-8'))
+
+    assert page == {'user_id' : 1, 'following' : [{'id' : 2, 'name' : '김철수'}], 'next_cursor' : None}
+
+    resp = api.get('/users/2/followers', headers = {'Authorization' : access_token})
+    assert json.loads(resp.data.decode('UTF-8'))['followers'] == [{'id' : 1, 'name' : '송은우'}]
+
+    ## 없는 유저와 숫자가 아닌 cursor
+    assert api.get('/users/3', headers = {'Authorization' : access_token}).status_code == 404
+    assert api.get('/users/1/followers?after=a', headers = {'Authorization' : access_token}).status_code == 400
+
+# 배치 작업이 저장한 팔로우 추천을 순위대로 가져오고, 이미 팔로우한 유저는 빼는지 테스트
+def test_suggestions(api):
+    with session_scope() as session:
+        session.add(Users('이영희','lee@gmail.com','hashed password','test profile'))
+        session.flush()
+        session.add_all([FollowSuggestions(1, 1, 3, 5), FollowSuggestions(1, 2, 2, 1)])
+
+    ##로그인
+    resp = api.post(
+        '/login',
+        data = json.dumps({'email' : 'songew@gmail.com',
+        'password' : 'test password'}),
+        content_type = 'application/json'
+    )
+    resp_json = json.loads(resp.data.decode('UTF-8'))
+    access_token = resp_json['access_token']
+
+    resp = api.get('/suggestions', headers = {'Authorization' : access_token})
+    assert resp.status_code == 200
+    assert json.loads(resp.data.decode('UTF-8'))['suggestions'] == [
+        {'id' : 3, 'name' : '이영희', 'mutual_count' : 5},
+        {'id' : 2, 'name' : '김철수', 'mutual_count' : 1}
+    ]
+
+    ## 추천된 유저를 팔로우하면 다음 배치 작업 전이라도 추천에서 빠진다.
+    resp = api.post(
+        '/follow',
+        data = json.dumps({'follow' : 3}),
+        content_type = 'application/json',
+        headers = {'Authorization' : access_token}
+    )
+    resp = api.get('/suggestions?limit=1', headers = {'Authorization' : access_token})
+    assert [user['id'] for user in json.loads(resp.data.decode('UTF-8'))['suggestions']] == [2]
+
+# 로그인 후 트윗을 여러개 작성하고, 타임라인을 최신순으로 한 페이지씩 가져오는지 테스트
+def test_timeline_page(api):
+    ##로그인
+    resp = api.post(
+        '/login',
+        data = json.dumps({'email' : 'songew@gmail.com',
+        'password' : 'test password'}),
+        content_type = 'application/json'
+    )
+    resp_json = json.loads(resp.data.decode('UTF-8'))
+    access_token = resp_json['access_token']
+
+    ## tweet 3개 작성
+    for tweet in ['tweet 1', 'tweet 2', 'tweet 3']:
+        resp = api.post(
+            '/tweet',
+            data = json.dumps({'tweet' : tweet}),
+            content_type = 'application/json',
+            headers = {'Authorization' : access_token}
+        )
+        assert resp.status_code == 200
+
+    ## 첫 페이지는 최신 트윗 2개와 다음 페이지 cursor를 리턴한다.
+    resp = api.get('/timeline?limit=2', headers = {'Authorization' : access_token})
+    page = json.loads(resp.data.decode('UTF-8'))
+
+    assert resp.status_code == 200
+    assert [tweet['tweet'] for tweet in page['timeline']] == ['tweet 3', 'tweet 2']
+    assert page['next_cursor'] is not None
+
+    ## 다음 페이지는 남은 트윗 1개를 리턴하고, 더 이상 cursor가 없다.
+    resp = api.get(f"/timeline?limit=2&before={page['next_cursor']}", headers = {'Authorization' : access_token})
+    page = json.loads(resp.data.decode('UTF-8'))
+
+    assert resp.status_code == 200
+    assert [tweet['tweet'] for tweet in page['timeline']] == ['tweet 1']
+    assert page['next_cursor'] is None
+
+# 로그인 후 한글과 영어 트윗을 작성하고, 검색어가 들어있는 트윗을 최신순으로 한 페이지씩 찾는지 테스트
+def test_search(api):
+    ##로그인
+    resp = api.post(
+        '/login',
+        data = json.dumps({'email' : 'songew@gmail.com',
+        'password' : 'test password'}),
+        content_type = 'application/json'
+    )
+    resp_json = json.loads(resp.data.decode('UTF-8'))
+    access_token = resp_json['access_token']
+
+    ## tweet 3개 작성
+    for tweet in ['서울에서 파이썬 스터디', 'Flask 서버 만들기', '파이썬 flask 공부']:
+        resp = api.post(
+            '/tweet',
+            data = json.dumps({'tweet' : tweet}),
+            content_type = 'application/json',
+            headers = {'Authorization' : access_token}
+        )
+        assert resp.status_code == 200
+
+    ## 검색어의 단어가 모두 들어있는 트윗을 최신순으로 리턴한다. 영어는 대소문자를 구분하지 않는다.
+    resp = api.get('/search?q=파이썬 FLASK', headers = {'Authorization' : access_token})
+    page = json.loads(resp.data.decode('UTF-8'))
+
+    assert resp.status_code == 200
+    assert [tweet['tweet'] for tweet in page['tweets']] == ['파이썬 flask 공부']
+
+    ## 한글은 조사가 붙어 있어도 찾고, 다음 페이지 cursor 로 나머지 트윗을 가져온다.
+    resp = api.get('/search?q=서울&limit=1', headers = {'Authorization' : access_token})
+    page = json.loads(resp.data.decode('UTF-8'))
+
+    assert [tweet['tweet'] for tweet in page['tweets']] == ['서울에서 파이썬 스터디']
+    assert page['next_cursor'] is None
+
+    resp = api.get('/search?q=flask&limit=1', headers = {'Authorization' : access_token})
+    page = json.loads(resp.data.decode('UTF-8'))
+    resp = api.get(f"/search?q=flask&limit=1&before={page['next_cursor']}", headers = {'Authorization' : access_token})
+    next_page = json.loads(resp.data.decode('UTF-8'))
+
+    assert [tweet['tweet'] for tweet in page['tweets'] + next_page['tweets']] == ['파이썬 flask 공부', 'Flask 서버 만들기']
+
+    ## 다른 경로로 저장된 트윗(setup_function 의 트윗)도 DB 에서 가져와서 찾는다.
+    resp = api.get('/search?q=hello', headers = {'Authorization' : access_token})
+    page = json.loads(resp.data.decode('UTF-8'))
+
+    assert [tweet['tweet'] for tweet in page['tweets']] == ['Hello World!']
+
+    ## 검색어가 없으면 400 에러를 리턴한다.
+    assert api.get('/search?q=', headers = {'Authorization' : access_token}).status_code == 400
+
+# 로그인 후 해시태그와 멘션이 들어있는 트윗들을 작성하고, 많이 쓰인 순서로 가져오는지 테스트
+def test_trending(api):
+    ##로그인
+    resp = api.post(
+        '/login',
+        data = json.dumps({'email' : 'songew@gmail.com',
+        'password' : 'test password'}),
+        content_type = 'application/json'
+    )
+    resp_json = json.loads(resp.data.decode('UTF-8'))
+    access_token = resp_json['access_token']
+
+    ## tweet 3개 작성. 해시태그와 멘션은 대소문자를 구분하지 않는다.
+    for tweet in ['#Python 공부 @kim', '#python #flask', '#파이썬 #python @Kim @lee']:
+        resp = api.post(
+            '/tweet',
+            data = json.dumps({'tweet' : tweet}),
+            content_type = 'application/json',
+            headers = {'Authorization' : access_token}
+        )
+        assert resp.status_code == 200
+
+    resp = api.get('/trending?limit=2', headers = {'Authorization' : access_token})
+    trending = json.loads(resp.data.decode('UTF-8'))
+
+    assert resp.status_code == 200
+    assert trending['hashtags'][0] == {'tag' : 'python', 'count' : 3}
+    assert len(trending['hashtags']) == 2
+    assert trending['mentions'] == [{'name' : 'kim', 'count' : 2}, {'name' : 'lee', 'count' : 1}]
+
+    assert api.get('/trending?limit=a', headers = {'Authorization' : access_token}).status_code == 400
+
+def test_timeline_stream(api):
+    ##로그인
+    resp = api.post(
+        '/login',
+        data = json.dumps({'email' : 'songew@gmail.com',
+        'password' : 'test password'}),
+        content_type = 'application/json'
+    )
+    resp_json = json.loads(resp.data.decode('UTF-8'))
+    access_token = resp_json['access_token']
+
+    ## tweet 3개 작성
+    for tweet in ['tweet 1', 'tweet 2', 'tweet 3']:
+        resp = api.post(
+            '/tweet',
+            data = json.dumps({'tweet' : tweet}),
+            content_type = 'application/json',
+            headers = {'Authorization' : access_token}
+        )
+        assert resp.status_code == 200
+
+    ## stream 으로 받은 타임라인은 기존 /timeline 과 같은 json 을 리턴한다.
+    resp = api.get('/timeline?stream=1', headers = {'Authorization' : access_token})
+    streamed = json.loads(resp.data.decode('UTF-8'))
+
+    resp = api.get('/timeline', headers = {'Authorization' : access_token})
+    timeline = json.loads(resp.data.decode('UTF-8'))
+
+    assert resp.status_code == 200
+    assert streamed == timeline
+    assert [tweet['tweet'] for tweet in streamed['timeline']] == ['tweet 1', 'tweet 2', 'tweet 3']
+
+# ASGI 앱의 스레드 풀이 하나의 스레드만 가져도 service 함수와 타임라인 stream 이 같은 스레드 풀에서 실행되는지 테스트
+def test_asgi_threads():
+    api = create_client('asgi', dict(config.test_config, ASGI_THREADS = 1))
+
+    resp = api.post(
+        '/login',
+        data = json.dumps({'email' : 'tet@gmail.com', 'password' : 'test password'}),
+        content_type = 'application/json'
+    )
+    access_token = json.loads(resp.data.decode('UTF-8'))['access_token']
+
+    resp = api.get('/timeline?stream=1', headers = {'Authorization' : access_token})
+    streamed = json.loads(resp.data.decode('UTF-8'))
+
+    resp = api.get('/timeline', headers = {'Authorization' : access_token})
+    timeline = json.loads(resp.data.decode('UTF-8'))
+
+    assert resp.status_code == 200
+    assert streamed == timeline == {
+        'user_id' : 2,
+        'timeline' : [{'user_id' : 2, 'tweet' : 'Hello World!'}]
+    }
@@ -0,0 +1,100 @@
+# 트윗 write-behind 큐(SegmentQueue)와 백그라운드 저장(TweetWriter)을 확인하는 TEST unit 파일.
+# DB 대신 저장된 트윗을 리스트에 모으는 TweetService 를 사용한다.
+
+import os
+# 테스트할 디스크 큐와 write-behind writer
+from model.segment_queue import SegmentQueue
+from service import TweetWriter
+
+# 저장한 트윗들을 리스트에 모으는 TweetService. fail 에 해당하는 트윗이 batch 에 있으면 저장에 실패한다.
+class RecordingTweetService:
+    def __init__(self, fail = lambda record: False, failures = 0):
+        self.tweets = []
+        self.fail = fail
+        self.failures = failures
+
+    def write_tweets(self, records):
+        if self.failures > 0:
+            self.failures -= 1
+            raise ConnectionError('db is down')
+
+        if any(self.fail(record) for record in records):
+            raise ValueError('invalid tweet')
+
+        self.tweets.extend(records)
+
+def tweets(count, start = 0):
+    return [{'user_id' : 1, 'tweet' : f'tweet {index}'} for index in range(start, start + count)]
+
+def test_segment_queue_recovery(tmp_path):
+    queue = SegmentQueue(str(tmp_path))
+    for record in tweets(3):
+        queue.append(record)
+    queue.close()
+
+    ## 마지막 레코드를 쓰다가 죽은 것처럼 segment 파일 끝에 일부만 쓰인 레코드를 붙인다.
+    with open(queue.segment_path(1), 'ab') as f:
+        f.write(b'\x00\x00\x00\x10\x00')
+
+    ## 다시 열면 잘린 레코드는 버리고, 이어서 쓴 레코드까지 읽는다.
+    queue = SegmentQueue(str(tmp_path))
+    queue.append(tweets(1, 3)[0])
+    records, position = queue.read_batch(10)
+
+    assert records == tweets(4)
+
+    ## 처리한 위치를 commit 하면 다시 열었을 때 처리한 레코드를 읽지 않는다.
+    queue.commit(position)
+    queue.close()
+
+    queue = SegmentQueue(str(tmp_path))
+
+    assert queue.read_batch(10) == ([ ], position)
+    assert queue.backlog_bytes() == 0
+
+def test_segment_queue_roll(tmp_path):
+    queue = SegmentQueue(str(tmp_path), segment_bytes = 100)
+    for record in tweets(10):
+        queue.append(record)
+
+    assert len(queue.segment_numbers()) > 1
+
+    ## segment 파일들을 이어서 읽고, 다 처리한 segment 파일은 지운다.
+    first, position = queue.read_batch(4)
+    queue.commit(position)
+    rest, position = queue.read_batch(10)
+    queue.commit(position)
+
+    assert first + rest == tweets(10)
+    assert queue.segment_numbers() == [queue.write_segment]
+
+# 죽은 worker 가 남긴 큐와 새로 기록한 트윗들을 모두 순서대로 저장하는지 테스트
+def test_writer_recovery(tmp_path):
+    dead_queue = SegmentQueue(str(tmp_path / 'queue-1'))
+    for record in tweets(3):
+        dead_queue.append(record)
+    dead_queue.close()
+
+    tweet_service = RecordingTweetService()
+    writer = TweetWriter(tweet_service, str(tmp_path), batch_size = 2, interval = 0.01)
+    writer.start()
+    for record in tweets(3, 3):
+        writer.append(record['user_id'], record['tweet'])
+    writer.stop()
+
+    assert writer.queue.directory == str(tmp_path / 'queue-0')
+    assert sorted(tweet_service.tweets, key = lambda record: record['tweet']) == tweets(6)
+    assert writer.stats()['backlog_bytes'] == 0
+
+# DB 저장에 실패하면 다시 시도하고, 계속 실패하는 트윗만 dead letter 파일로 옮기는지 테스트
+def test_writer_retry(tmp_path):
+    tweet_service = RecordingTweetService(fail = lambda record: record['tweet'] == 'tweet 1', failures = 2)
+    writer = TweetWriter(tweet_service, str(tmp_path), batch_size = 10, interval = 0.01, max_retries = 3, max_backoff = 0.01)
+    writer.start()
+    for record in tweets(3):
+        writer.append(record['user_id'], record['tweet'])
+    writer.stop()
+
+    assert tweet_service.tweets == [tweets(3)[0], tweets(3)[2]]
+    assert writer.stats()['dead_letters'] == 1
+    assert os.path.exists(tmp_path / 'queue-0' / 'dead-letter.log')
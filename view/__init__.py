@@ -7,19 +7,45 @@ import jwt
 # 플라스크의 모듈들을 불러온다. flask 로 서버를 만들고, jsonify로 데이터를 json로 쉽게 매핑해서 클라이언트에 전달,
 # request 를 통해 클라이언트에서 보낸 데이터를 json 데이터로 받는다.
 from flask import jsonify, request, Response, current_app, g
-# JSONEncoder 를 통해서, 클라이언트가 보낸 json이 아닌 데이터들도 json인코더를 통해 json 데이터로 받는다. 
-from flask.json import JSONEncoder
 # decorator 함수를 만들 때, 부차적으로 생기는 이슈를 해결해주는 wraps decorator 함수를 추가한다.
-from functools import wraps
+from functools import wraps, partial
+# 타임라인을 나눠서 보낼 때 트윗들을 json 으로 인코딩하는 json 모듈
+import json
+# 액세스토큰을 캐시의 키로 사용하기 위해 해시값(digest)으로 바꿔주는 hashlib
+import hashlib
+import time
+# 복호화한 액세스토큰을 만료시간까지 저장해두는 메모리 캐시
+from cache import TTLCache
+# 비밀번호 해시 작업이 밀려서 더 이상 받을 수 없을 때 발생하는 예외
+from service import PasswordHasherBusy
+# 응답을 json 으로 인코딩하는 encoder. config 의 JSON_BACKEND 로 orjson 또는 json 모듈을 선택합니다.
+from .json_encoder import CustomJSONEncoder, get_json_encoder
 
-# 해당 함수는 flask에서 Json으로 인코딩을 할 때, json이 아닌 set을 클라이언트에서 받아도,
-# json으로 인식할 수 있도록 set을 list로 변경해주는 함수.
-class CustomJSONEncoder (JSONEncoder):
-    def default(self, obj):
-        if isinstance(obj, set):
-            return list(obj)
+# 액세스토큰을 복호화해서 payload 를 반환합니다. 토큰이 올바르지 않으면 None 을 반환합니다.
+# 한 번 검증한 토큰은 토큰의 해시값을 키로 토큰의 만료시간(exp)까지 캐시에 저장해두고,
+# 같은 토큰으로 다시 요청하면 jwt 복호화(HMAC 검증) 없이 캐시에서 payload 를 가져옵니다.
+def decode_access_token(access_token, secret_key, token_cache):
+    if isinstance(access_token, str):
+        access_token = access_token.encode('UTF-8')
 
-        return JSONEncoder.default(self, obj)
+    token_key = hashlib.sha256(access_token).digest()
+    payload = token_cache.get(token_key)
+    if payload is not None:
+        return payload
+
+    try: #토큰을 복호화할 때 사용한 secret키와 해시값을 적용한다.
+        payload = jwt.decode(access_token, secret_key, algorithms = ['HS256'])
+    # 토큰을 복호화하다가 오류나면, None 을 반환한다.
+    except jwt.InvalidTokenError:
+        return None
+
+    # 토큰이 만료되는 시간까지만 캐시에 저장합니다.
+    if 'exp' in payload:
+        ttl = payload['exp'] - time.time()
+        if ttl > 0:
+            token_cache.set(token_key, payload, ttl)
+
+    return payload
 
 # 로그인확인 decorator 함수를 지정한다.
 # 해당 login_required decorator함수가 지정된 함수는 해당 사용자가 로그인이 되어있어야 실행된다.
@@ -31,43 +57,156 @@ def login_required (f):
     def decorated_function(*args, **kwargs):
         # 액세스토큰을 클라이언트의 요청값의 헤더부분의 Authorization에서 가져온다.
         access_token = request.headers.get('Authorization')
-        print(access_token)
-        # 액세스토큰이 있으면, 해당 토큰을 jwt로 복호화해서 유저아이디를 구한다.
-        if access_token is not None:
-            try: #토큰을 복호화할 때 사용한 secret키와 해시값을 적용한다.
-                payload = jwt.decode(access_token, current_app.config['JWT_SECRET_KEY'], 'HS256')
-            # 토큰을 복호화하다가 오류나면, payload를 None으로 적용시킨다.
-            except jwt.InvalidTokenError:
-                payload = None
-            # payload가 None일 때, 클라이언트에 인증 오류를 전달한다.
-            if payload is None : 
-                print('인증오류') 
-                return Response(status=401)
-
-            # 토큰을 통해 얻음 유저아이디로 DB에서 유저정보를 가져오고, 글로벌하게 유저정보를 넣어준다.
-            user_id = payload['user_id']
-            g.user_id = user_id
         # 토큰이 없으면 인증 오류를 날린다.
-        else: 
-            print('인증 오류2')
+        if access_token is None:
+            return Response(status = 401)
+
+        # 액세스토큰이 있으면, 해당 토큰을 jwt로 복호화해서 유저아이디를 구한다.
+        payload = decode_access_token(access_token, current_app.config['JWT_SECRET_KEY'], current_app.extensions['token_cache'])
+        # payload가 None일 때, 클라이언트에 인증 오류를 전달한다.
+        if payload is None:
             return Response(status = 401)
+
+        # 토큰을 통해 얻음 유저아이디를 글로벌하게 넣어준다.
+        g.user_id = payload['user_id']
         #마지막으로 decorated_function 을 적용한 함수를 실행시킨다.
         return f(*args, **kwargs)
     return decorated_function
 
+# 요청 json 의 key 에 담긴 유저 id 리스트를 가져옵니다.
+# 리스트가 아니거나, 숫자가 아닌 값이 있거나, 최대 개수(max_count)를 넘으면 None 을 반환합니다.
+def get_user_ids(payload, key, max_count):
+    user_ids = payload.get(key) if isinstance(payload, dict) else None
+    if not isinstance(user_ids, list) or len(user_ids) > max_count:
+        return None
+
+    if not all(isinstance(user_id, int) and not isinstance(user_id, bool) for user_id in user_ids):
+        return None
+
+    return user_ids
+
+# 타임라인 페이지네이션의 before 와 limit 값을 쿼리스트링에서 가져옵니다. 숫자가 아니면 ValueError 가 발생합니다.
+def get_timeline_page_args(args):
+    before = args.get('before')
+    before = int(before) if before is not None else None
+    limit = int(args.get('limit', 50))
+
+    return before, limit
+
+# 팔로워/팔로잉 목록 페이지네이션의 after 와 limit 값을 쿼리스트링에서 가져옵니다. 숫자가 아니면 ValueError 가 발생합니다.
+def get_follow_page_args(args):
+    after = args.get('after')
+    after = int(after) if after is not None else None
+    limit = int(args.get('limit', 50))
+
+    return after, limit
+
+# 검색어와 검색 결과 페이지네이션의 before, limit 값을 쿼리스트링에서 가져옵니다. before 나 limit 이 숫자가 아니면 ValueError 가 발생합니다.
+def get_search_args(args):
+    query = args.get('q', '').strip()
+    before = args.get('before')
+    before = int(before) if before is not None else None
+    limit = int(args.get('limit', 20))
+
+    return query, before, limit
+
+# 타임라인을 {"user_id": .., "timeline": [..]} json 으로 조금씩 나눠서 만드는 generator 함수
+# 트윗을 batch_size 개씩 인코딩해서 보내기 때문에, 전체 타임라인 리스트나 전체 json 문자열을 메모리에 만들지 않습니다.
+def stream_timeline(user_id, tweets, dumps, batch_size = 100):
+    yield '{"user_id":' + dumps(user_id) + ',"timeline":['
+
+    chunk = []
+    separator = ''
+    for tweet in tweets:
+        chunk.append(separator + dumps(tweet))
+        separator = ','
+
+        if len(chunk) >= batch_size:
+            yield ''.join(chunk)
+            chunk = []
+
+    yield ''.join(chunk) + ']}\n'
+
+# instrumentation 이 켜져 있으면 요청마다 처리시간과 구간별 시간을 기록하고, 응답에 Server-Timing 헤더를 붙입니다.
+# (/timeline?stream=1 처럼 나눠서 보내는 응답은 첫 응답을 보내기 전까지의 시간만 기록합니다.)
+def register_instrumentation(app, instrumentation):
+    app.json_encoder = instrumentation.timed_json_encoder(app.json_encoder)
+
+    @app.before_request
+    def begin_request():
+        g.request_timing = instrumentation.begin_request()
+
+    @app.after_request
+    def end_request(response):
+        timing, token = g.pop('request_timing', (None, None))
+        if timing is None:
+            return response
+
+        response.headers['Server-Timing'] = timing.server_timing()
+        route = request.url_rule.rule if request.url_rule is not None else 'unmatched'
+        instrumentation.end_request(timing, token, request.method, route, response.status_code)
+
+        return response
+
+    # Prometheus 형식으로 요청 수, 처리시간, SQL 실행 수와 시간, 커넥션 풀과 캐시 상태를 반환합니다.
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        return Response(instrumentation.render(), mimetype = 'text/plain; version=0.0.4; charset=utf-8')
+
+# query inspector 가 켜져 있으면 요청마다 실행한 SQL 을 검사하고, 응답에 실행한 SQL 수(X-Query-Count)를 붙입니다.
+# strict 모드에서 쿼리 예산을 넘으면 QueryBudgetExceeded 가 발생합니다. (테스트에서는 테스트가 실패합니다.)
+def register_query_inspector(app, query_inspector):
+    @app.before_request
+    def begin_query_log():
+        g.query_log = query_inspector.begin_request()
+
+    @app.after_request
+    def end_query_log(response):
+        log, token = g.pop('query_log', (None, None))
+        if log is None:
+            return response
+
+        response.headers['X-Query-Count'] = str(len(log.statements))
+        query_inspector.end_request(log, token, request.endpoint or 'unmatched')
+
+        return response
+
 # 해당 View layer를 실행시키는 함수입니다.
 # 상속받은 flask app을 통해 라우터 기능을 사용하며
 # 비즈니스 로직을 담당하는 user, tweet 서비스를 사용합니다.
 def create_endpoints(app, services):
-    app.json_encoder = CustomJSONEncoder
+    app.json_encoder = get_json_encoder(app.config.get('JSON_BACKEND', 'auto'))
+
+    if services.instrumentation is not None:
+        register_instrumentation(app, services.instrumentation)
+    if services.query_inspector is not None:
+        register_query_inspector(app, services.query_inspector)
+
+    # 검증한 액세스토큰의 payload 를 저장하는 캐시. 각 토큰은 토큰의 만료시간까지만 저장됩니다.
+    app.extensions['token_cache'] = TTLCache(max_size = app.config.get('TOKEN_CACHE_SIZE', 100000))
 
     user_service = services.user_service
     tweet_service = services.tweet_service
 
+    # 로그인/회원가입이 몰려 비밀번호 해시 작업이 밀려있으면, 기다리지 않고 503 으로 응답합니다.
+    @app.errorhandler(PasswordHasherBusy)
+    def password_hasher_busy(error):
+        return Response('요청이 많아 잠시 후 다시 시도해주세요.', status = 503, headers = {'Retry-After' : '1'})
+
     @app.route("/ping", methods=['GET'])
     def ping():
         return "pong"
 
+    # DB 커넥션 풀의 상태와 커넥션을 빌리기까지 기다린 시간을 반환합니다.
+    @app.route("/stats/pool", methods=['GET'])
+    def pool_stats():
+        return jsonify(current_app.extensions['database'].pool_status())
+
+    # 액세스토큰 캐시의 적중 횟수와 적중률을 반환합니다.
+    @app.route("/stats/auth", methods=['GET'])
+    def auth_stats():
+        return jsonify(current_app.extensions['token_cache'].stats())
+
     # 회원가입을 할 때 사용하는 함수
     @app.route("/sign-up", methods=['POST'])
     def sign_up():
@@ -86,19 +225,14 @@ def create_endpoints(app, services):
     def login():
         # 사용자의 로그인데이터를 받는다. email이 아이디입니다. Unique key를 설정했기에, 중복X.
         credential = request.json
-        email = credential['email']
-        password = credential['password']
 
-        #print(f"유저가 입력한 {email} 과 {password}")
+        # 사용자가 입력한 로그인 데이터를 통해, DB에서 해당 유저가 있는지 확인합니다.
+        # 로그인 결과(LoginResult)에는 성공 여부와 해당 유저의 pk 값인 id가 담겨있습니다.
+        login_result = user_service.login(credential)
 
-        # 사용자가 입력한 로그인 데이터를 통해, DB에서 해당 유저가 있는지 확인합니다. Boolean
-        authorized = user_service.login(credential)
-
-        # 사용자가 있다면, 해당 유저의 아이디로 pk 값인 id를 가져오며,
-        # id 값을 통해 액세스토큰을 만듭니다.
-        if authorized:
-            user_credential = user_service.get_user_id_and_password(credential['email'])
-            user_id = user_credential['id']
+        # 사용자가 있다면, 로그인 결과의 id 값을 통해 액세스토큰을 만듭니다.
+        if login_result:
+            user_id = login_result.user_id
             token = user_service.generate_access_token(user_id)
             # 유저의 아이디와 토큰을 클라이언트에 반환.
             return jsonify({
@@ -118,6 +252,13 @@ def create_endpoints(app, services):
         user_id = g.user_id
         tweet = user_tweet['tweet']
 
+        # write-behind 모드이면 트윗을 디스크 큐에 기록하고, DB 에 저장되기 전에 202(Accepted)로 응답합니다.
+        if tweet_service.writer is not None:
+            if tweet_service.queue_tweet(user_id, tweet) is None:
+                return '300자를 초과했습니다', 400
+
+            return '', 202
+
         # 트윗을 저장합니다. 만약 300자를 초과해 저장했다면
         # 유저에게 400 에러 메세지를 보냅니다.
         result = tweet_service.tweet(user_id, tweet)
@@ -126,6 +267,24 @@ def create_endpoints(app, services):
 
         return '', 200
 
+    # 여러 트윗을 한 번에 저장하는 라우트데코레이션
+    # 예) {"tweets" : ["첫번째 트윗", "두번째 트윗"]}
+    # 300자를 넘는 트윗은 저장하지 않고, 각 트윗의 저장 결과를 리스트로 반환합니다.
+    @app.route('/tweets/bulk', methods=['POST'])
+    @login_required
+    def bulk_tweet():
+        payload = request.json
+        tweets = payload.get('tweets') if isinstance(payload, dict) else None
+        if not isinstance(tweets, list) or len(tweets) > current_app.config.get('TWEET_BULK_MAX', 5000):
+            return '트윗 리스트가 올바르지 않습니다.', 400
+
+        results = tweet_service.bulk_tweet(g.user_id, tweets)
+
+        return jsonify({
+            'created' : sum(1 for result in results if result['status'] == 'created'),
+            'results' : results
+        })
+
     # 특정 유저를 팔로우하는 라우트데코레이션
     @app.route('/follow', methods=['POST'])
     @login_required
@@ -150,12 +309,125 @@ def create_endpoints(app, services):
         if user_service.unfollow(user_id,unfollow_id) is True: return '', 200
         else: return '해당 사용자가 없습니다.', 400
 
+    # 여러 유저를 한 번에 팔로우하는 라우트데코레이션
+    # 예) {"follow" : [2, 3, 4]}
+    @app.route('/follow/batch', methods=['POST'])
+    @login_required
+    def follow_batch():
+        follow_ids = get_user_ids(request.json, 'follow', current_app.config.get('FOLLOW_BATCH_MAX', 100))
+        if follow_ids is None:
+            return '팔로우할 유저 id 리스트가 올바르지 않습니다.', 400
+
+        return jsonify({
+            'followed' : user_service.follow_many(g.user_id, follow_ids)
+        })
+
+    # 여러 유저를 한 번에 언팔로우하는 라우트데코레이션
+    # 예) {"unfollow" : [2, 3, 4]}
+    @app.route('/unfollow/batch', methods=['POST'])
+    @login_required
+    def unfollow_batch():
+        unfollow_ids = get_user_ids(request.json, 'unfollow', current_app.config.get('FOLLOW_BATCH_MAX', 100))
+        if unfollow_ids is None:
+            return '언팔로우할 유저 id 리스트가 올바르지 않습니다.', 400
+
+        return jsonify({
+            'unfollowed' : user_service.unfollow_many(g.user_id, unfollow_ids)
+        })
+
+    # 유저의 프로필과 팔로워/팔로잉 수를 가져오는 라우트데코레이션
+    @app.route('/users/<int:user_id>', methods=['GET'])
+    @login_required
+    def user_profile(user_id):
+        user = user_service.get_user(user_id)
+        if user is None:
+            return '해당 사용자가 없습니다.', 404
+
+        return jsonify(user)
+
+    # 해당 유저를 팔로우하는 유저들을 유저 id 순서로 한 페이지씩 가져오는 라우트데코레이션 (keyset 페이지네이션)
+    # 예) /users/1/followers?limit=50 다음 /users/1/followers?after=<next_cursor>&limit=50
+    @app.route('/users/<int:user_id>/followers', methods=['GET'])
+    @login_required
+    def followers(user_id):
+        try:
+            after, limit = get_follow_page_args(request.args)
+        except ValueError:
+            return 'after 와 limit 은 숫자여야 합니다.', 400
+
+        users, next_cursor = user_service.get_followers(user_id, after, limit, current_app.config.get('FOLLOW_PAGE_MAX', 100))
+
+        return jsonify({
+            'user_id' : user_id,
+            'followers' : users,
+            'next_cursor' : next_cursor
+        })
+
+    # 해당 유저가 팔로우하는 유저들을 유저 id 순서로 한 페이지씩 가져오는 라우트데코레이션
+    @app.route('/users/<int:user_id>/following', methods=['GET'])
+    @login_required
+    def following(user_id):
+        try:
+            after, limit = get_follow_page_args(request.args)
+        except ValueError:
+            return 'after 와 limit 은 숫자여야 합니다.', 400
+
+        users, next_cursor = user_service.get_following(user_id, after, limit, current_app.config.get('FOLLOW_PAGE_MAX', 100))
+
+        return jsonify({
+            'user_id' : user_id,
+            'following' : users,
+            'next_cursor' : next_cursor
+        })
+
+    # 팔로우할 만한 유저(친구의 친구)들을 추천 순위대로 가져오는 라우트데코레이션
+    # 예) /suggestions?limit=20
+    @app.route('/suggestions', methods=['GET'])
+    @login_required
+    def suggestions():
+        try:
+            limit = int(request.args.get('limit', 20))
+        except ValueError:
+            return 'limit 은 숫자여야 합니다.', 400
+
+        return jsonify({
+            'user_id' : g.user_id,
+            'suggestions' : user_service.get_suggestions(g.user_id, limit, current_app.config.get('SUGGESTIONS_PAGE_MAX', 50))
+        })
+
     # 타임라인을 가져오는 라우트데코레이션
     # 사용자의 로그인 유무를 확인하는 login_required 데코레이션
     @app.route('/timeline', methods=['GET'])
     @login_required
     def timeline():
         user_id = g.user_id
+
+        # before 나 limit 이 주어지면 최신 트윗부터 한 페이지씩 가져옵니다. (keyset 페이지네이션)
+        # 예) /timeline?limit=50 다음 /timeline?before=<next_cursor>&limit=50
+        if 'before' in request.args or 'limit' in request.args:
+            try:
+                before, limit = get_timeline_page_args(request.args)
+            except ValueError:
+                return 'before 와 limit 은 숫자여야 합니다.', 400
+
+            timeline, next_cursor = tweet_service.get_timeline_page(
+                user_id, before, limit, current_app.config.get('TIMELINE_PAGE_MAX', 100)
+            )
+
+            return jsonify({
+                'user_id' : user_id,
+                'timeline' : timeline,
+                'next_cursor' : next_cursor
+            })
+
+        # stream 이 주어지면 타임라인을 DB 에서 조금씩 가져와서 json 으로 나눠서 보냅니다.
+        # 예) /timeline?stream=1
+        if request.args.get('stream'):
+            dumps = partial(json.dumps, cls = app.json_encoder, separators = (',', ':'))
+            tweets = tweet_service.iter_timeline(user_id, current_app.config.get('TIMELINE_STREAM_BATCH_SIZE', 1000))
+
+            return Response(stream_timeline(user_id, tweets, dumps), mimetype = 'application/json')
+
         timeline = tweet_service.get_timeline(user_id)
 
         # 가져온 트윗 데이터를 타임라인배열로 매핑한 뒤, 클라이언트에 반환해줍니다.
@@ -164,5 +436,40 @@ def create_endpoints(app, services):
             'timeline' : timeline
         })
 
+    # 검색어로 트윗을 찾는 라우트데코레이션. 검색어의 단어들이 모두 들어있는 트윗을 최신 트윗부터 한 페이지씩 가져옵니다.
+    # 예) /search?q=파이썬&limit=20 다음 /search?q=파이썬&before=<next_cursor>&limit=20
+    if tweet_service.search_index is not None:
+        @app.route('/search', methods=['GET'])
+        @login_required
+        def search():
+            try:
+                query, before, limit = get_search_args(request.args)
+            except ValueError:
+                return 'before 와 limit 은 숫자여야 합니다.', 400
+
+            if not query:
+                return '검색어(q)가 필요합니다.', 400
+
+            tweets, next_cursor = tweet_service.search(query, before, limit, current_app.config.get('SEARCH_PAGE_MAX', 100))
+
+            return jsonify({
+                'query' : query,
+                'tweets' : tweets,
+                'next_cursor' : next_cursor
+            })
+
+    # 최근 많이 쓰인 해시태그와 멘션을 가져오는 라우트데코레이션. 메모리에 만들어둔 순위의 앞 limit 개를 반환합니다.
+    # 예) /trending?limit=10
+    if tweet_service.trending is not None:
+        @app.route('/trending', methods=['GET'])
+        @login_required
+        def trending():
+            try:
+                limit = int(request.args.get('limit', 10))
+            except ValueError:
+                return 'limit 은 숫자여야 합니다.', 400
+
+            return jsonify(tweet_service.get_trending(limit, current_app.config.get('TRENDING_MAX', 50)))
+
     return app
 
@@ -0,0 +1,427 @@
+# ASGI(비동기) 서버에서 클라이언트의 요청을 받는 View layer입니다.
+# flask 의 create_endpoints 와 같은 엔드포인트들을 starlette 로 만들며, 같은 service layer 를 사용합니다.
+#
+# service layer 와 DB 호출(SQLAlchemy 1.3)은 동기식이기 때문에, 이벤트 루프를 막지 않도록
+# ASGI_THREADS 개의 스레드를 가진 스레드 풀에서 실행합니다. bcrypt 는 service 의 PasswordHasher 프로세스 풀에서 실행됩니다.
+# 이벤트 루프는 DB 를 기다리는 동안 다른 요청들을 계속 받을 수 있습니다.
+
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import contextvars
+import json
+from functools import wraps, partial
+
+from starlette.datastructures import MutableHeaders
+from starlette.responses import Response, StreamingResponse
+from starlette.routing import Route
+
+# flask view 와 같은 토큰 검증, 요청값 검사 함수와 json 인코더를 사용합니다.
+from . import CustomJSONEncoder, get_json_encoder, decode_access_token, get_user_ids, get_timeline_page_args, get_follow_page_args, get_search_args, stream_timeline
+from cache import TTLCache
+from service import PasswordHasherBusy
+from metrics import current_timing
+
+# flask 의 jsonify 처럼 CustomJSONEncoder(set 을 list 로 변환)로 json 응답을 만듭니다.
+def jsonify(data, status = 200, cls = CustomJSONEncoder):
+    body = json.dumps(data, cls = cls, separators = (',', ':')) + '\n'
+
+    return Response(body, status_code = status, media_type = 'application/json')
+
+# flask view 의 (문자열, 상태코드) 응답과 같은 텍스트 응답을 만듭니다.
+def text(body, status = 200):
+    return Response(body, status_code = status, media_type = 'text/html; charset=utf-8')
+
+# 요청 body 를 json 으로 읽습니다. json 이 아니면 None 을 반환합니다.
+async def read_json(request):
+    try:
+        return await request.json()
+    except ValueError:
+        return None
+
+# 비밀번호 해시 작업이 밀려있으면, 기다리지 않고 503 으로 응답합니다.
+async def password_hasher_busy(request, error):
+    return Response('요청이 많아 잠시 후 다시 시도해주세요.', status_code = 503, headers = {'Retry-After' : '1'})
+
+EXCEPTION_HANDLERS = {
+    PasswordHasherBusy : password_hasher_busy
+}
+
+# instrumentation 이 켜져 있으면 요청마다 처리시간과 구간별 시간을 기록하고, 응답에 Server-Timing 헤더를 붙이는 미들웨어
+# 응답을 그대로 흘려보내는 ASGI 미들웨어라서 StreamingResponse 도 body 를 모으지 않고 보냅니다.
+class InstrumentationMiddleware:
+    def __init__(self, app, instrumentation):
+        self.app = app
+        self.instrumentation = instrumentation
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        # 이벤트 루프 스레드는 여러 요청을 함께 처리하므로, profiler 는 run_sync 의 스레드에서만 스택을 읽습니다.
+        timing, token = self.instrumentation.begin_request(thread = False)
+        status = 500
+
+        async def send_with_timing(message):
+            nonlocal status
+            if message['type'] == 'http.response.start':
+                status = message['status']
+                MutableHeaders(scope = message).append('Server-Timing', timing.server_timing())
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_timing)
+        finally:
+            # 라우터가 찾은 route 의 path 를 사용해서, /users/1 과 /users/2 가 같은 label 로 기록되게 합니다.
+            route = scope.get('route')
+            self.instrumentation.end_request(timing, token, scope['method'], getattr(route, 'path', 'unmatched'), status)
+
+# query inspector 가 켜져 있으면 요청마다 실행한 SQL 을 검사하고, 응답에 실행한 SQL 수(X-Query-Count)를 붙이는 미들웨어
+# 엔드포인트 이름은 라우터가 찾은 route 의 이름(flask 와 같은 엔드포인트 함수 이름)을 사용합니다.
+class QueryInspectorMiddleware:
+    def __init__(self, app, query_inspector):
+        self.app = app
+        self.query_inspector = query_inspector
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http':
+            return await self.app(scope, receive, send)
+
+        log, token = self.query_inspector.begin_request()
+
+        async def send_with_query_count(message):
+            if message['type'] == 'http.response.start':
+                MutableHeaders(scope = message).append('X-Query-Count', str(len(log.statements)))
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_query_count)
+        finally:
+            route = scope.get('route')
+            self.query_inspector.end_request(log, token, getattr(route, 'name', None) or 'unmatched')
+
+# ASGI 앱의 라우트들을 만드는 함수입니다.
+def create_asgi_endpoints(services, config):
+    user_service = services.user_service
+    tweet_service = services.tweet_service
+    database = services.database
+
+    # 검증한 액세스토큰의 payload 를 저장하는 캐시. 각 토큰은 토큰의 만료시간까지만 저장됩니다.
+    token_cache = TTLCache(max_size = config.get('TOKEN_CACHE_SIZE', 100000))
+
+    # config 의 JSON_BACKEND 에 해당하는 encoder 로 json 응답을 만듭니다.
+    json_encoder = get_json_encoder(config.get('JSON_BACKEND', 'auto'))
+
+    instrumentation = services.instrumentation
+    if instrumentation is not None:
+        json_encoder = instrumentation.timed_json_encoder(json_encoder)
+
+    def json_response(data, status = 200):
+        return jsonify(data, status, json_encoder)
+
+    # 동기식 service 함수와 타임라인 stream 을 실행하는 스레드 풀.
+    # 스레드마다 DB 커넥션을 하나씩 빌리기 때문에, 스레드 수가 커넥션 풀보다 많으면 남는 스레드는 커넥션을 기다리다가
+    # DB_POOL_TIMEOUT 에 실패합니다. 그래서 ASGI_THREADS 가 없으면 커넥션 풀의 최대 커넥션 수(DB_POOL_SIZE + DB_MAX_OVERFLOW)로 만들고,
+    # 나머지 요청은 이벤트 루프에서 스레드가 날 때까지 기다립니다. (스레드는 처음 사용할 때 만들어지므로 fork 전에 만들어도 됩니다.)
+    executor = ThreadPoolExecutor(
+        max_workers = config.get('ASGI_THREADS') or config.get('DB_POOL_SIZE', 10) + config.get('DB_MAX_OVERFLOW', 10),
+        thread_name_prefix = 'asgi'
+    )
+
+    # call 을 스레드 풀에서 실행합니다. 현재 요청의 contextvar 들을 복사해서 스레드에서도 그대로 사용합니다.
+    async def run_in_executor(call):
+        context = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(executor, partial(context.run, call))
+
+    # 동기식 generator 를 스레드 풀에서 하나씩 읽는 async generator.
+    # (StopIteration 은 future 로 전달할 수 없어서, 끝나면 iterator 대신 executor 를 반환받습니다.)
+    async def iterate_in_executor(iterator):
+        while True:
+            item = await run_in_executor(partial(next, iterator, executor))
+            if item is executor:
+                break
+
+            yield item
+
+    # 동기식 service 함수를 스레드 풀에서 실행하고, 끝나면 해당 스레드의 세션을 정리합니다.
+    # 현재 요청의 처리시간 기록(contextvar)은 스레드 풀에서도 그대로 사용하며,
+    # profiler 가 켜져 있으면 함수를 실행하는 동안 해당 스레드의 스택을 읽습니다.
+    async def run_sync(function, *args):
+        def call():
+            timing = current_timing.get()
+            if instrumentation is not None:
+                instrumentation.attach_thread(timing)
+            try:
+                return function(*args)
+            finally:
+                if instrumentation is not None:
+                    instrumentation.detach_thread(timing)
+                database.remove_session()
+
+        return await run_in_executor(call)
+
+    # 로그인확인 decorator. 토큰을 검증한 뒤 유저아이디를 request.state.user_id 에 넣어줍니다.
+    def login_required(f):
+        @wraps(f)
+        async def decorated_function(request):
+            access_token = request.headers.get('Authorization')
+            if access_token is None:
+                return Response(status_code = 401)
+
+            payload = decode_access_token(access_token, config['JWT_SECRET_KEY'], token_cache)
+            if payload is None:
+                return Response(status_code = 401)
+
+            request.state.user_id = payload['user_id']
+            return await f(request)
+        return decorated_function
+
+    async def ping(request):
+        return text('pong')
+
+    # DB 커넥션 풀의 상태와 커넥션을 빌리기까지 기다린 시간을 반환합니다.
+    async def pool_stats(request):
+        return json_response(database.pool_status())
+
+    # 액세스토큰 캐시의 적중 횟수와 적중률을 반환합니다.
+    async def auth_stats(request):
+        return json_response(token_cache.stats())
+
+    # 회원가입
+    async def sign_up(request):
+        new_user = await run_sync(user_service.create_new_user, await read_json(request))
+
+        if new_user : return json_response(new_user)
+        elif new_user is None : return text('해당 유저가 존재하지 않습니다.', 400)
+        else : return text('유저를 찾아오던 중 오류가 발생했습니다.', 500)
+
+    # 로그인. 로그인 결과의 id 값을 통해 액세스토큰을 만듭니다.
+    async def login(request):
+        login_result = await run_sync(user_service.login, await read_json(request))
+
+        if login_result:
+            user_id = login_result.user_id
+            return json_response({
+                'user_id' : user_id,
+                'access_token' : user_service.generate_access_token(user_id)
+            })
+        else:
+            return text('', 401)
+
+    # 트윗 작성. 300자를 초과하면 400 에러를 보냅니다.
+    @login_required
+    async def tweet(request):
+        payload = await read_json(request)
+
+        # write-behind 모드이면 트윗을 디스크 큐에 기록하고, DB 에 저장되기 전에 202(Accepted)로 응답합니다.
+        if tweet_service.writer is not None:
+            if await run_sync(tweet_service.queue_tweet, request.state.user_id, payload['tweet']) is None:
+                return text('300자를 초과했습니다', 400)
+
+            return text('', 202)
+
+        result = await run_sync(tweet_service.tweet, request.state.user_id, payload['tweet'])
+        if result is None:
+            return text('300자를 초과했습니다', 400)
+
+        return text('', 200)
+
+    # 여러 트윗을 한 번에 저장합니다.
+    @login_required
+    async def bulk_tweet(request):
+        payload = await read_json(request)
+        tweets = payload.get('tweets') if isinstance(payload, dict) else None
+        if not isinstance(tweets, list) or len(tweets) > config.get('TWEET_BULK_MAX', 5000):
+            return text('트윗 리스트가 올바르지 않습니다.', 400)
+
+        results = await run_sync(tweet_service.bulk_tweet, request.state.user_id, tweets)
+
+        return json_response({
+            'created' : sum(1 for result in results if result['status'] == 'created'),
+            'results' : results
+        })
+
+    @login_required
+    async def follow(request):
+        payload = await read_json(request)
+
+        if await run_sync(user_service.follow, request.state.user_id, payload['follow']) is True: return text('', 200)
+        else: return text('저장중 에러발생 [follow_user_id]', 500)
+
+    @login_required
+    async def unfollow(request):
+        payload = await read_json(request)
+
+        if await run_sync(user_service.unfollow, request.state.user_id, payload['unfollow']) is True: return text('', 200)
+        else: return text('해당 사용자가 없습니다.', 400)
+
+    @login_required
+    async def follow_batch(request):
+        follow_ids = get_user_ids(await read_json(request), 'follow', config.get('FOLLOW_BATCH_MAX', 100))
+        if follow_ids is None:
+            return text('팔로우할 유저 id 리스트가 올바르지 않습니다.', 400)
+
+        return json_response({
+            'followed' : await run_sync(user_service.follow_many, request.state.user_id, follow_ids)
+        })
+
+    @login_required
+    async def unfollow_batch(request):
+        unfollow_ids = get_user_ids(await read_json(request), 'unfollow', config.get('FOLLOW_BATCH_MAX', 100))
+        if unfollow_ids is None:
+            return text('언팔로우할 유저 id 리스트가 올바르지 않습니다.', 400)
+
+        return json_response({
+            'unfollowed' : await run_sync(user_service.unfollow_many, request.state.user_id, unfollow_ids)
+        })
+
+    # 유저의 프로필과 팔로워/팔로잉 수
+    @login_required
+    async def user_profile(request):
+        user = await run_sync(user_service.get_user, request.path_params['user_id'])
+        if user is None:
+            return text('해당 사용자가 없습니다.', 404)
+
+        return json_response(user)
+
+    # 해당 유저를 팔로우하는 유저들. after 와 limit 으로 유저 id 순서로 한 페이지씩 가져옵니다.
+    @login_required
+    async def followers(request):
+        user_id = request.path_params['user_id']
+        try:
+            after, limit = get_follow_page_args(request.query_params)
+        except ValueError:
+            return text('after 와 limit 은 숫자여야 합니다.', 400)
+
+        users, next_cursor = await run_sync(user_service.get_followers, user_id, after, limit, config.get('FOLLOW_PAGE_MAX', 100))
+
+        return json_response({
+            'user_id' : user_id,
+            'followers' : users,
+            'next_cursor' : next_cursor
+        })
+
+    # 해당 유저가 팔로우하는 유저들
+    @login_required
+    async def following(request):
+        user_id = request.path_params['user_id']
+        try:
+            after, limit = get_follow_page_args(request.query_params)
+        except ValueError:
+            return text('after 와 limit 은 숫자여야 합니다.', 400)
+
+        users, next_cursor = await run_sync(user_service.get_following, user_id, after, limit, config.get('FOLLOW_PAGE_MAX', 100))
+
+        return json_response({
+            'user_id' : user_id,
+            'following' : users,
+            'next_cursor' : next_cursor
+        })
+
+    # 팔로우할 만한 유저(친구의 친구)들을 추천 순위대로 가져옵니다.
+    @login_required
+    async def suggestions(request):
+        user_id = request.state.user_id
+        try:
+            limit = int(request.query_params.get('limit', 20))
+        except ValueError:
+            return text('limit 은 숫자여야 합니다.', 400)
+
+        return json_response({
+            'user_id' : user_id,
+            'suggestions' : await run_sync(user_service.get_suggestions, user_id, limit, config.get('SUGGESTIONS_PAGE_MAX', 50))
+        })
+
+    # 타임라인. before 나 limit 이 주어지면 최신 트윗부터 한 페이지씩 가져옵니다.
+    @login_required
+    async def timeline(request):
+        user_id = request.state.user_id
+        args = request.query_params
+
+        if 'before' in args or 'limit' in args:
+            try:
+                before, limit = get_timeline_page_args(args)
+            except ValueError:
+                return text('before 와 limit 은 숫자여야 합니다.', 400)
+
+            timeline, next_cursor = await run_sync(
+                tweet_service.get_timeline_page, user_id, before, limit, config.get('TIMELINE_PAGE_MAX', 100)
+            )
+
+            return json_response({
+                'user_id' : user_id,
+                'timeline' : timeline,
+                'next_cursor' : next_cursor
+            })
+
+        # stream 이 주어지면 타임라인을 DB 에서 조금씩 가져와서 json 으로 나눠서 보냅니다.
+        # 동기식 generator 는 run_sync 와 같은 스레드 풀에서 읽으며, 스레드의 세션 대신 generator 만 사용하는 세션으로 읽습니다.
+        if args.get('stream'):
+            dumps = partial(json.dumps, cls = json_encoder, separators = (',', ':'))
+            tweets = tweet_service.iter_timeline(user_id, config.get('TIMELINE_STREAM_BATCH_SIZE', 1000))
+
+            return StreamingResponse(iterate_in_executor(stream_timeline(user_id, tweets, dumps)), media_type = 'application/json')
+
+        return json_response({
+            'user_id' : user_id,
+            'timeline' : await run_sync(tweet_service.get_timeline, user_id)
+        })
+
+    # 검색어의 단어들이 모두 들어있는 트윗을 최신 트윗부터 한 페이지씩 가져옵니다.
+    @login_required
+    async def search(request):
+        try:
+            query, before, limit = get_search_args(request.query_params)
+        except ValueError:
+            return text('before 와 limit 은 숫자여야 합니다.', 400)
+
+        if not query:
+            return text('검색어(q)가 필요합니다.', 400)
+
+        tweets, next_cursor = await run_sync(tweet_service.search, query, before, limit, config.get('SEARCH_PAGE_MAX', 100))
+
+        return json_response({
+            'query' : query,
+            'tweets' : tweets,
+            'next_cursor' : next_cursor
+        })
+
+    # 최근 많이 쓰인 해시태그와 멘션. 메모리에 만들어둔 순위의 앞 limit 개를 반환합니다.
+    @login_required
+    async def trending(request):
+        try:
+            limit = int(request.query_params.get('limit', 10))
+        except ValueError:
+            return text('limit 은 숫자여야 합니다.', 400)
+
+        return json_response(await run_sync(tweet_service.get_trending, limit, config.get('TRENDING_MAX', 50)))
+
+    # Prometheus 형식으로 요청 수, 처리시간, SQL 실행 수와 시간, 커넥션 풀과 캐시 상태를 반환합니다.
+    async def metrics(request):
+        return Response(instrumentation.render(), media_type = 'text/plain; version=0.0.4; charset=utf-8')
+
+    routes = [
+        Route('/ping', ping, methods = ['GET']),
+        Route('/stats/pool', pool_stats, methods = ['GET']),
+        Route('/stats/auth', auth_stats, methods = ['GET']),
+        Route('/sign-up', sign_up, methods = ['POST']),
+        Route('/login', login, methods = ['POST']),
+        Route('/tweet', tweet, methods = ['POST']),
+        Route('/tweets/bulk', bulk_tweet, methods = ['POST']),
+        Route('/follow', follow, methods = ['POST']),
+        Route('/unfollow', unfollow, methods = ['POST']),
+        Route('/follow/batch', follow_batch, methods = ['POST']),
+        Route('/unfollow/batch', unfollow_batch, methods = ['POST']),
+        Route('/users/{user_id:int}', user_profile, methods = ['GET']),
+        Route('/users/{user_id:int}/followers', followers, methods = ['GET']),
+        Route('/users/{user_id:int}/following', following, methods = ['GET']),
+        Route('/suggestions', suggestions, methods = ['GET']),
+        Route('/timeline', timeline, methods = ['GET'])
+    ]
+    if tweet_service.search_index is not None:
+        routes.append(Route('/search', search, methods = ['GET']))
+    if tweet_service.trending is not None:
+        routes.append(Route('/trending', trending, methods = ['GET']))
+    if instrumentation is not None:
+        routes.append(Route('/metrics', metrics, methods = ['GET']))
+
+    return routes
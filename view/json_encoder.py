@@ -0,0 +1,61 @@
+# 응답 데이터를 json 으로 인코딩하는 encoder 들입니다.
+# orjson(C/Rust 로 구현된 json 라이브러리)이 설치되어 있으면 orjson 으로 인코딩하고,
+# 설치되어 있지 않으면 기존처럼 파이썬 json 모듈(flask 의 JSONEncoder)로 인코딩합니다.
+# 사용할 encoder 는 config 의 JSON_BACKEND ('auto', 'orjson', 'json') 로 선택합니다.
+
+# JSONEncoder 를 통해서, 클라이언트가 보낸 json이 아닌 데이터들도 json인코더를 통해 json 데이터로 받는다.
+from flask.json import JSONEncoder
+
+# orjson 은 선택 사항입니다. 없으면 파이썬 json 모듈을 사용합니다.
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+# 해당 함수는 flask에서 Json으로 인코딩을 할 때, json이 아닌 set을 클라이언트에서 받아도,
+# json으로 인식할 수 있도록 set을 list로 변경해주는 함수.
+class CustomJSONEncoder (JSONEncoder):
+    def default(self, obj):
+        if isinstance(obj, set):
+            return list(obj)
+
+        return JSONEncoder.default(self, obj)
+
+# orjson 으로 인코딩하는 encoder 입니다.
+# orjson 이 모르는 타입(set 등)과 datetime, dataclass 는 CustomJSONEncoder.default 로 넘겨서
+# 기존과 같은 값(set 은 list, datetime 은 http date 문자열)으로 인코딩합니다.
+# orjson 은 한글 같은 문자를 \uXXXX 로 바꾸지 않고 UTF-8 그대로 인코딩합니다. (json 으로 읽으면 같은 값입니다.)
+class OrjsonEncoder (CustomJSONEncoder):
+    def encode(self, obj):
+        # 들여쓰기(pretty print)나 공백이 있는 구분자를 쓰는 경우는 orjson 이 지원하지 않으므로 json 모듈을 사용합니다.
+        if self.indent is not None or self.item_separator != ',' or self.key_separator != ':':
+            return CustomJSONEncoder.encode(self, obj)
+
+        option = orjson.OPT_NON_STR_KEYS | orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_PASSTHROUGH_DATACLASS
+        if self.sort_keys:
+            option |= orjson.OPT_SORT_KEYS
+
+        try:
+            return orjson.dumps(obj, default = self.default, option = option).decode('UTF-8')
+        # 64bit 를 넘는 정수처럼 orjson 이 인코딩하지 못하는 값은 json 모듈로 다시 인코딩합니다.
+        except orjson.JSONEncodeError:
+            return CustomJSONEncoder.encode(self, obj)
+
+JSON_ENCODERS = {
+    'json' : CustomJSONEncoder,
+    'orjson' : OrjsonEncoder
+}
+
+# config 의 JSON_BACKEND 에 해당하는 encoder 클래스를 반환합니다.
+# 'auto' 는 orjson 이 설치되어 있으면 orjson, 없으면 json 모듈을 사용합니다.
+def get_json_encoder(backend = 'auto'):
+    if backend == 'auto':
+        backend = 'orjson' if orjson is not None else 'json'
+
+    if backend not in JSON_ENCODERS:
+        raise ValueError(f'unknown JSON_BACKEND: {backend}')
+
+    if backend == 'orjson' and orjson is None:
+        raise ImportError('JSON_BACKEND is orjson but orjson is not installed')
+
+    return JSON_ENCODERS[backend]